@@ -15,7 +15,8 @@ from lada.cli import utils
 from lada.utils import audio_utils
 from lada.restorationpipeline.frame_restorer import FrameRestorer
 from lada.restorationpipeline import load_models
-from lada.utils.video_utils import get_video_meta_data, VideoWriter
+from lada.utils.segmented_video_writer import SegmentedVideoWriter, get_temp_output_path
+from lada.utils.video_utils import get_video_meta_data
 
 def setup_argparser() -> argparse.ArgumentParser:
     examples_header_text = _("Examples:")
@@ -60,6 +61,8 @@ def setup_argparser() -> argparse.ArgumentParser:
     export.add_argument('--crf', type=int, default=None, help=_('Constant rate factor (CRF). Quality setting of the video encoder. Lower values will result in higher quality but larger file sizes. If you have selected GPU codecs "h264_nvenc" or "hevc_nvenc" then the option "qp" will be used instead as those encoders don\'t support the "crf" option. (default: %(default)s)'))
     export.add_argument('--preset', type=str, default=None, help=_('Encoder preset. Mostly affects file-size and speed. (default: %(default)s)'))
     export.add_argument('--moov-front',  default=False, action=argparse.BooleanOptionalAction, help=_("Sets ffmpeg mov flags 'frag_keyframe+empty_moov+faststart'. Enables playing the output video while it's being written (default: %(default)s)"))
+    export.add_argument('--segment-duration', type=float, default=60., help=_("Restored video is encoded in segments of about this many seconds. Completed segments are kept until the export finishes, so an interrupted export can continue at the last completed segment. Set to 0 to encode a single segment (default: %(default)s)"))
+    export.add_argument('--resume', default=True, action=argparse.BooleanOptionalAction, help=_("Continue an interrupted export of the same file and settings at the last completed segment instead of starting over (default: %(default)s)"))
     export.add_argument('--custom-encoder-options', type=str, help=_("Pass arbitrary encoder options. Pass it like you'd specify them using ffmpeg. For example: --custom-encoder-options \"-rc-lookahead 32 -rc vbr_hq\". Official FFmpeg Codecs Documentation: https://ffmpeg.org/ffmpeg-codecs.html"))
 
     group_restoration = parser.add_argument_group(_('Mosaic Restoration'))
@@ -76,22 +79,27 @@ def setup_argparser() -> argparse.ArgumentParser:
     return parser
 
 def process_video_file(input_path: str, output_path: str, device: torch.device, mosaic_restoration_model, mosaic_detection_model,
-                       mosaic_restoration_model_name, preferred_pad_mode, max_clip_length, codec, crf, moov_front, preset, custom_encoder_options):
+                       mosaic_restoration_model_name, preferred_pad_mode, max_clip_length, codec, crf, moov_front, preset, custom_encoder_options,
+                       segment_duration, resume, resume_settings: dict):
     video_metadata = get_video_meta_data(input_path)
 
-    frame_restorer = FrameRestorer(device, input_path, max_clip_length, mosaic_restoration_model_name,
-                 mosaic_detection_model, mosaic_restoration_model, preferred_pad_mode)
+    # only created if there is anything left to restore, an interrupted export could have completed all segments already
+    frame_restorer: FrameRestorer | None = None
     success = True
-    video_tmp_file_output_path = os.path.join(tempfile.gettempdir(), f"{os.path.basename(os.path.splitext(output_path)[0])}.tmp{os.path.splitext(output_path)[1]}")
+    video_tmp_file_output_path = get_temp_output_path(output_path, tempfile.gettempdir())
     pathlib.Path(output_path).parent.mkdir(exist_ok=True, parents=True)
+    video_writer = SegmentedVideoWriter(video_metadata, output_path, codec=codec, crf=crf, preset=preset, custom_encoder_options=custom_encoder_options,
+                                        settings=resume_settings, segment_duration_s=segment_duration, resume=resume)
     try:
-        frame_restorer.start()
-
-        with VideoWriter(video_tmp_file_output_path, video_metadata.video_width, video_metadata.video_height,
-                         video_metadata.video_fps_exact, codec=codec, crf=crf, moov_front=moov_front,
-                         time_base=video_metadata.time_base, preset=preset,
-                         custom_encoder_options=custom_encoder_options) as video_writer:
-            frame_restorer_progressbar = utils.Progressbar(video_metadata, frame_restorer)
+        resume_frame_num = video_writer.get_resume_frame_num()
+        if resume_frame_num > 0:
+            print(_("Continuing interrupted export at frame {frame_num}").format(frame_num=resume_frame_num))
+        if not video_writer.is_complete():
+            frame_restorer = FrameRestorer(device, input_path, max_clip_length, mosaic_restoration_model_name,
+                                           mosaic_detection_model, mosaic_restoration_model, preferred_pad_mode)
+            frame_restorer.start(start_ns=video_writer.get_resume_timestamp_ns())
+
+            frame_restorer_progressbar = utils.Progressbar(video_metadata, frame_restorer, initial_frames=resume_frame_num)
             for elem in frame_restorer_progressbar:
                 if elem is None:
                     success = False
@@ -101,6 +109,8 @@ def process_video_file(input_path: str, output_path: str, device: torch.device,
                 video_writer.write(restored_frame, restored_frame_pts, bgr2rgb=True)
                 frame_restorer_progressbar.update()
                 frame_restorer_progressbar.update_time_remaining_and_speed()
+        if success:
+            video_writer.release()
     except (Exception, KeyboardInterrupt) as e:
         success = False
         if isinstance(e, KeyboardInterrupt):
@@ -108,14 +118,16 @@ def process_video_file(input_path: str, output_path: str, device: torch.device,
         else:
             print("Error on export", e)
     finally:
-        frame_restorer.stop()
+        if not success:
+            video_writer.abort()
+        if frame_restorer is not None:
+            frame_restorer.stop()
 
     if success:
         print(_("Processing audio"))
+        video_writer.concat(video_tmp_file_output_path, moov_front=moov_front)
         audio_utils.combine_audio_video_files(video_metadata, video_tmp_file_output_path, output_path)
-    else:
-        if os.path.exists(video_tmp_file_output_path):
-            os.remove(video_tmp_file_output_path)
+        video_writer.remove_work_directory()
 
 def main():
     argparser = setup_argparser()
@@ -159,6 +171,10 @@ def main():
 
     input_files, output_files = utils.setup_input_and_output_paths(args.input, args.output, args.output_file_pattern)
 
+    # segments of an interrupted export are only reused if they have been restored with the same models and settings
+    resume_settings = dict(mosaic_restoration_model=args.mosaic_restoration_model, mosaic_restoration_model_path=os.path.abspath(args.mosaic_restoration_model_path),
+                           mosaic_detection_model_path=os.path.abspath(args.mosaic_detection_model_path), max_clip_length=args.max_clip_length, fp16=args.fp16)
+
     single_file_input = len(input_files) == 1
 
     for input_path, output_path in zip(input_files, output_files):
@@ -167,7 +183,8 @@ def main():
         try:
             process_video_file(input_path=input_path, output_path=output_path, device=device, mosaic_restoration_model=mosaic_restoration_model, mosaic_detection_model=mosaic_detection_model,
                                mosaic_restoration_model_name=args.mosaic_restoration_model, preferred_pad_mode=preferred_pad_mode, max_clip_length=args.max_clip_length,
-                               codec=args.codec, crf=args.crf, moov_front=args.moov_front, preset=args.preset, custom_encoder_options=args.custom_encoder_options)
+                               codec=args.codec, crf=args.crf, moov_front=args.moov_front, preset=args.preset, custom_encoder_options=args.custom_encoder_options,
+                               segment_duration=args.segment_duration, resume=args.resume, resume_settings=resume_settings)
         except KeyboardInterrupt:
             print(_("Received Ctrl-C, stopping restoration."))
             break
@@ -0,0 +1,148 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import concurrent.futures as concurrent_futures
+import logging
+import os
+import pathlib
+import queue
+import sys
+import threading
+from fractions import Fraction
+
+import cv2
+
+from lada import LOG_LEVEL
+from lada.datasetcreation import restoration_dataset_metadata, restoration_dataset_index
+from lada.utils import Image, Mask, threading_utils, video_utils
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=LOG_LEVEL)
+
+class DatasetWriter:
+    """
+    Writes dataset clips, image sequences and metadata files in a pool of worker threads.
+
+    Videos are encoded in-process via PyAV so there is no per-clip ffmpeg process spawn. The job queue is bounded:
+    Once it's full, writing methods block which limits the number of scenes held in memory waiting to be written.
+    Metadata files are added to the index of their directory in batches of index_batch_size, the rest is added on stop().
+    Workers run at lower priority (nice -n worker_nice_increment, Linux only) as the ffmpeg processes previously used for encoding did, so they don't slow down detection.
+    """
+    def __init__(self, workers=4, max_queued_jobs=32, jpeg_quality_level=95, index_batch_size=64, worker_nice_increment=19):
+        self.workers = workers
+        self.worker_nice_increment = worker_nice_increment
+        self.jpeg_quality_level = jpeg_quality_level
+        self.index_batch_size = index_batch_size
+        self.job_queue = queue.Queue(max_queued_jobs)
+        self.worker_threads: list[threading.Thread] = []
+        self.index_lock = threading.Lock()
+        self.indexes: dict[pathlib.Path, restoration_dataset_index.RestorationDatasetIndex] = {}
+        self.pending_index_entries: dict[pathlib.Path, list[tuple[pathlib.Path, restoration_dataset_metadata.RestorationDatasetMetadataV2]]] = {}
+
+    def start(self):
+        for _ in range(self.workers):
+            worker_thread = threading.Thread(target=self._worker, daemon=True)
+            worker_thread.start()
+            self.worker_threads.append(worker_thread)
+
+    def stop(self):
+        """
+        Waits until all queued jobs have been written and stops the workers.
+        """
+        logger.debug("DatasetWriter: stopping...")
+        for _ in self.worker_threads:
+            self.job_queue.put(None)
+        for worker_thread in self.worker_threads:
+            worker_thread.join()
+        self.worker_threads = []
+        threading_utils.empty_out_queue(self.job_queue, "job_queue")
+        with self.index_lock:
+            for metadata_root_dir in list(self.pending_index_entries):
+                self._flush_index_entries(metadata_root_dir)
+            for index in self.indexes.values():
+                index.close()
+            self.indexes = {}
+        logger.debug("DatasetWriter: stopped")
+
+    def write_video(self, file_path: pathlib.Path, frames: list[Image], fps: int | float | Fraction) -> concurrent_futures.Future:
+        return self._submit(self._write_video, file_path, frames, fps)
+
+    def write_mask_video(self, file_path: pathlib.Path, masks: list[Mask], fps: int | float | Fraction) -> concurrent_futures.Future:
+        return self._submit(self._write_mask_video, file_path, masks, fps)
+
+    def write_images(self, file_path_template_format_string: pathlib.Path, images: list[Image] | list[Mask]) -> concurrent_futures.Future:
+        return self._submit(self._write_images, file_path_template_format_string, images)
+
+    def write_metadata(self, file_path: pathlib.Path, meta: restoration_dataset_metadata.RestorationDatasetMetadataV2) -> concurrent_futures.Future:
+        return self._submit(self._write_metadata, file_path, meta)
+
+    def _submit(self, fn, *args) -> concurrent_futures.Future:
+        assert len(self.worker_threads) > 0, "DatasetWriter has not been started"
+        future = concurrent_futures.Future()
+        self.job_queue.put((fn, args, future))
+        return future
+
+    def _write_video(self, file_path: pathlib.Path, frames: list[Image], fps):
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        video_utils.write_frames_to_video_file(frames, str(file_path.absolute()), fps)
+
+    def _write_mask_video(self, file_path: pathlib.Path, masks: list[Mask], fps):
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        video_utils.write_masks_to_video_file(masks, str(file_path.absolute()), fps)
+
+    def _write_images(self, file_path_template_format_string: pathlib.Path, images: list[Image] | list[Mask]):
+        file_path_template_format_string.parent.mkdir(parents=True, exist_ok=True)
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality_level] if file_path_template_format_string.suffix == ".jpg" else []
+        for i in range(len(images)):
+            path = str(pathlib.Path(str(file_path_template_format_string).format(i)).absolute())
+            if not cv2.imwrite(path, images[i], params):
+                logger.error(f"DatasetWriter: failed to write image {path}")
+
+    def _write_metadata(self, file_path: pathlib.Path, meta: restoration_dataset_metadata.RestorationDatasetMetadataV2):
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        path = str(file_path.absolute())
+        meta.to_json_file(path)
+        metadata_root_dir = file_path.absolute().parent
+        with self.index_lock:
+            pending_index_entries = self.pending_index_entries.setdefault(metadata_root_dir, [])
+            pending_index_entries.append((file_path.absolute(), meta))
+            if len(pending_index_entries) >= self.index_batch_size:
+                self._flush_index_entries(metadata_root_dir)
+
+    def _flush_index_entries(self, metadata_root_dir: pathlib.Path):
+        # expects index_lock to be held
+        pending_index_entries = self.pending_index_entries.pop(metadata_root_dir)
+        if metadata_root_dir not in self.indexes:
+            self.indexes[metadata_root_dir] = restoration_dataset_index.RestorationDatasetIndex(metadata_root_dir)
+        try:
+            self.indexes[metadata_root_dir].add_all(pending_index_entries)
+        except Exception as e:
+            # metadata files have been written already, missing entries will be picked up by the next index sync
+            logger.error(f"DatasetWriter: failed to add {len(pending_index_entries)} metadata files to index of {metadata_root_dir}: {e}")
+
+    def _lower_worker_priority(self):
+        # only Linux sets the niceness per thread, on other platforms it would lower the priority of the whole process
+        if sys.platform != 'linux' or self.worker_nice_increment <= 0:
+            return
+        try:
+            thread_id = threading.get_native_id()
+            os.setpriority(os.PRIO_PROCESS, thread_id, min(19, os.getpriority(os.PRIO_PROCESS, thread_id) + self.worker_nice_increment))
+        except OSError as e:
+            logger.warning(f"DatasetWriter: failed to lower priority of worker: {e}")
+
+    def _worker(self):
+        logger.debug("DatasetWriter: worker started")
+        self._lower_worker_priority()
+        while True:
+            job = self.job_queue.get()
+            if job is None:
+                break
+            fn, args, future = job
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args))
+                except Exception as e:
+                    logger.error(f"DatasetWriter: failed to write {args[0]}: {e}")
+                    future.set_exception(e)
+            self.job_queue.task_done()
+        logger.debug("DatasetWriter: worker stopped")
@@ -0,0 +1,99 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+"""
+Cache of pre-rendered low-quality (mosaic + degraded) variants of the clips of a mosaic restoration dataset.
+
+Creating the low-quality input on-the-fly (especially the video compression round trip of the degradation pipeline) is expensive
+so scripts/dataset_creation/create-degradation-cache.py renders K variants per clip upfront. The dataset then samples one of those variants
+instead of degrading GT frames itself. Variants are stored as lossless ffv1 videos, the seed used to render each variant is recorded in the index.
+
+Layout of a cache directory:
+  index.json                  - lq_size and list of variants (file name and seed) per clip
+  <clip hash>-<variant>.mkv
+  ...
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from lada.utils import random_utils, video_utils
+
+DEGRADATION_CACHE_VERSION = 1
+DEGRADATION_CACHE_INDEX_FILENAME = 'index.json'
+
+@dataclass
+class DegradedVariant:
+    file_name: str
+    seed: int
+
+def get_variant_seed(clip_key: str, variant_idx: int, base_seed: int) -> int:
+    return int.from_bytes(hashlib.sha1(f"{base_seed}-{clip_key}-{variant_idx}".encode()).digest()[:4], 'little')
+
+def get_variant_file_name(clip_key: str, variant_idx: int) -> str:
+    return f"{hashlib.sha1(clip_key.encode()).hexdigest()[:16]}-{variant_idx:02d}.mkv"
+
+class DegradationCache:
+    def __init__(self, root_dir: str | Path, lq_size: int | None = None):
+        """
+        clip keys are the relative_nsfw_video_path of the clip metadata as this is unique per clip.
+        lq_size: needs to be set when creating a new cache, for an existing cache it's read from the index
+        """
+        self.root_dir = Path(root_dir)
+        index_path = self.root_dir / DEGRADATION_CACHE_INDEX_FILENAME
+        self.variants: dict[str, list[DegradedVariant]] = {}
+        if index_path.exists():
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            assert index.get('version') == DEGRADATION_CACHE_VERSION, f"Cannot read degradation cache version {index.get('version')}"
+            assert lq_size is None or lq_size == index['lq_size'], f"lq_size of degradation cache ({index['lq_size']}) doesn't match requested lq_size ({lq_size})"
+            self.lq_size = index['lq_size']
+            for clip_key, variants in index['variants'].items():
+                self.variants[clip_key] = [DegradedVariant(**variant) for variant in variants]
+        else:
+            assert lq_size is not None, f"Degradation cache {self.root_dir} does not exist"
+            self.lq_size = lq_size
+
+    def get_variants(self, clip_key: str) -> list[DegradedVariant]:
+        return self.variants.get(clip_key, [])
+
+    def add_variant(self, clip_key: str, variant: DegradedVariant):
+        self.variants.setdefault(clip_key, []).append(variant)
+
+    def get_missing_variant_indices(self, clip_key: str, variants_count: int) -> list[int]:
+        existing_file_names = set(variant.file_name for variant in self.get_variants(clip_key))
+        return [variant_idx for variant_idx in range(variants_count) if get_variant_file_name(clip_key, variant_idx) not in existing_file_names]
+
+    def render_variant(self, clip_key: str, variant_idx: int, seed: int, create_lq_frames: Callable[[], list[np.ndarray]], fps) -> DegradedVariant:
+        """
+        Writes the frames returned by create_lq_frames as a new variant. Mosaic and degradation pipeline use the global random generators,
+        they are seeded while creating the frames so the variant can be rendered again from its seed.
+        """
+        with random_utils.seeded_global_rngs(seed):
+            img_lqs = create_lq_frames()
+        variant = DegradedVariant(file_name=get_variant_file_name(clip_key, variant_idx), seed=seed)
+        self.write_variant_frames(variant, img_lqs, fps)
+        return variant
+
+    def write_variant_frames(self, variant: DegradedVariant, frames: list[np.ndarray], fps):
+        video_utils.write_frames_to_lossless_video_file(frames, str(self.root_dir / variant.file_name), fps)
+
+    def read_variant_frames(self, variant: DegradedVariant, start_idx: int = 0, end_idx: int | None = None) -> list[np.ndarray]:
+        return video_utils.read_video_frames(str(self.root_dir / variant.file_name), float32=False, start_idx=start_idx, end_idx=end_idx)
+
+    def save(self):
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        index = dict(version=DEGRADATION_CACHE_VERSION,
+                     lq_size=self.lq_size,
+                     variants={clip_key: [asdict(variant) for variant in variants] for clip_key, variants in self.variants.items()})
+        index_path = self.root_dir / DEGRADATION_CACHE_INDEX_FILENAME
+        tmp_index_path = index_path.with_suffix('.tmp')
+        with open(tmp_index_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_index_path, index_path)
@@ -3,7 +3,7 @@
 
 from typing import Optional
 
-from lada.utils.ultralytics_utils import convert_yolo_boxes
+from lada.utils.ultralytics_utils import convert_yolo_detections
 from lada.utils.box_utils import box_overlap
 from lada.utils import Image, Box
 from lada.models.yolo.yolo import Yolo
@@ -17,28 +17,34 @@ class WatermarkDetector:
         self.min_positive_detections = 4
         self.sampling_rate = 0.3
 
+    def get_sample_indices(self, num_images: int) -> list[int]:
+        num_samples = min(num_images, max(1, int(num_images * self.sampling_rate)))
+        indices_step_size = num_images // num_samples
+        return list(range(0, num_samples*indices_step_size, indices_step_size))
+
     def detect(self, images:list[Image], boxes:Optional[list[Box]]=None) -> bool:
-        num_samples = min(len(images), max(1, int(len(images) * self.sampling_rate)))
-        indices_step_size = len(images) // num_samples
-        indices = list(range(0, num_samples*indices_step_size, indices_step_size))
+        indices = self.get_sample_indices(len(images))
         samples = [images[i] for i in indices]
         samples_boxes = [boxes[i] for i in indices] if boxes else None
 
         batches = [samples[i:i + self.batch_size] for i in range(0, len(samples), self.batch_size)]
-        positive_detections = 0
-        for batch_idx, batch in enumerate(batches):
+        detections = []
+        for batch in batches:
             # not exactly sure why but prediction accuracy is horrible if not setting imgsz to 640 even though model was trained with 512 in train-yolo-watermark-detector.py.
             batch_prediction_results = self.model.predict(source=batch, stream=False, verbose=False, device=self.device, conf=self.min_confidence, imgsz=640)
-            for result_idx, results in enumerate(batch_prediction_results):
-                sample_idx = batch_idx * self.batch_size + result_idx
-                detections = results.boxes.conf.size(dim=0)
-                if detections == 0:
-                    continue
-                detection_confidences = results.boxes.conf.tolist()
-                detection_boxes = convert_yolo_boxes(results.boxes, results.orig_shape)
-                single_image_watermark_detected = any(conf > self.min_confidence and (not samples_boxes or box_overlap(detection_boxes[i], samples_boxes[sample_idx])) for i, conf in enumerate(detection_confidences))
-                if single_image_watermark_detected:
-                    positive_detections += 1
+            for results in batch_prediction_results:
+                detections.append(convert_yolo_detections(results.boxes, results.orig_shape))
+        return self.evaluate(detections, samples_boxes)
+
+    def evaluate(self, detections: list[list[tuple[float, int, Box]]], samples_boxes:Optional[list[Box]]=None) -> bool:
+        """
+        detections: confidence, class id and box of each detection for each of the samples selected by get_sample_indices()
+        """
+        positive_detections = 0
+        for sample_idx, sample_detections in enumerate(detections):
+            single_image_watermark_detected = any(conf > self.min_confidence and (not samples_boxes or box_overlap(detection_box, samples_boxes[sample_idx])) for conf, _, detection_box in sample_detections)
+            if single_image_watermark_detected:
+                positive_detections += 1
         watermark_detected = positive_detections >= self.min_positive_detections
-        #print(f"watermark detector: watermark {watermark_detected}, detected {positive_detections}/{len(samples)}")
-        return watermark_detected
\ No newline at end of file
+        #print(f"watermark detector: watermark {watermark_detected}, detected {positive_detections}/{len(detections)}")
+        return watermark_detected
@@ -7,20 +7,31 @@ import os.path
 import pathlib
 import queue
 import concurrent.futures as concurrent_futures
+import dataclasses
+import itertools
+import shutil
+import tempfile
 from dataclasses import dataclass
-from typing import Generator, Optional, Dict
+from typing import Callable, Generator, Optional, Dict
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import torch
-import ultralytics.models
+import ultralytics.engine.results
+from ultralytics.trackers import BYTETracker
+from ultralytics.utils import YAML, IterableSimpleNamespace
+from ultralytics.utils.checks import check_yaml
 
 from lada import LOG_LEVEL
 from lada.utils import Mask, Image, Box, VideoMetadata, threading_utils, video_utils
 from lada.utils import mask_utils
-from lada.utils.scene_utils import crop_to_box_v3
+from lada.utils.scene_utils import get_crop_boxes_v3
 from lada.utils.threading_utils import wait_until_completed
 from lada.utils.ultralytics_utils import choose_biggest_detection, convert_yolo_mask, convert_yolo_box
-from lada.models.yolo.yolo import Yolo
+from lada.models.yolo.yolo11_segmentation_model import Yolo11SegmentationModel
+from lada.datasetcreation.scene_buffer import SceneBuffer
+from lada.datasetcreation.perceptual_hash_index import PerceptualHashIndex, hash_frames, hash_video_file
+from lada.datasetcreation.progress_journal import ProgressJournal
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=LOG_LEVEL)
@@ -33,9 +44,14 @@ class FileProcessingOptions:
     stride_length: int
     scene_min_length: int
     scene_max_length: int
-    scene_max_memory: int
+    scene_max_memory: int # RAM budget of a single scene in MB. Frames and masks exceeding it will be spilled to memory-mapped temporary files
     random_extend_masks: bool
     skip4k: bool
+    frame_stride: int = 1 # only every n-th frame will be decoded and analyzed, scenes will be made up of those frames only
+    parallel_files: int = 1 # number of files analyzed concurrently. Each of them will use its own instance of the NSFW detection model
+    spill_dir: Optional[pathlib.Path] = None # directory of temporary files used by scenes exceeding scene_max_memory. Uses .scene_spill in output_dir if not set
+    deduplicate: bool = False # skip files and scenes which are near-duplicates of already processed ones based on perceptual hashes of sampled frames
+    deduplicate_max_distance: int = 6 # maximum hamming distance of two 64-bit frame hashes to be considered equal
 
 @dataclass
 class NsfwFrame:
@@ -61,59 +77,54 @@ class NsfwFrame:
 
 class Scene:
 
-    def __init__(self, video_meta_data, id, scene_min_length, scene_max_length):
+    def __init__(self, video_meta_data, id, scene_min_length, scene_max_length, frame_stride=1, ram_budget: int | None = None, spill_dir: str | None = None):
         self.video_meta_data: VideoMetadata = video_meta_data
         self.id: int = id
         self.data: Optional[list] = None # will be set when complete() is called
-        self._tmp_data: list[NsfwFrame] = []
+        self._tmp_data: list[tuple[Image, Mask, Box]] = []
+        self._buffer = SceneBuffer(scene_max_length, ram_budget, spill_dir)
         self.realized = False
         self.frame_start: int | None = None
         self.frame_end: int | None = None
         self._index: int = 0
         self.scene_max_length: int = scene_max_length
         self.scene_min_length: int = scene_min_length
+        self.frame_stride: int = frame_stride
+        self.perceptual_hashes: Optional[list[int]] = None # only set if deduplication is enabled
 
     def __len__(self):
         return len(self.data) if self.data else len(self._tmp_data)
 
+    @property
+    def key(self) -> str:
+        # unlike id this is unique across files and runs
+        return f"{self.video_meta_data.video_file}:{self.frame_start}"
+
     def min_length_reached(self):
         return len(self) >= self.scene_min_length
 
     def max_length_reached(self):
         return len(self) >= self.scene_max_length
 
+    def _append(self, nsfw_frame: NsfwFrame):
+        # convert YOLO results right away so we don't hold on to them (and their masks on the GPU) until the scene is complete
+        frame, mask = self._buffer.append(nsfw_frame.frame, nsfw_frame.mask)
+        self._tmp_data.append((frame, mask, nsfw_frame.box))
+
     def add_frame(self, nsfw_frame: NsfwFrame):
         if self.frame_start is None:
             self.frame_start = nsfw_frame.frame_number
             self.frame_end = nsfw_frame.frame_number
-            self._tmp_data.append(nsfw_frame)
+            self._append(nsfw_frame)
         else:
-            assert nsfw_frame.frame_number == self.frame_end + 1
+            assert nsfw_frame.frame_number == self.frame_end + self.frame_stride
             self.frame_end = nsfw_frame.frame_number
             if not self.max_length_reached():
-                self._tmp_data.append(nsfw_frame)
+                self._append(nsfw_frame)
 
     def complete(self):
-        worker_count = 6
-        def _convert_data_from_yolo(chunk, chunk_idx_start, chunk_idx_exclusive_end):
-            for i, nsfw_frame in enumerate(self._tmp_data[chunk_idx_start:chunk_idx_exclusive_end], start=chunk_idx_start):
-                chunk.append((nsfw_frame.frame, nsfw_frame.mask, nsfw_frame.box))
-
-        with concurrent_futures.ThreadPoolExecutor(max_workers=worker_count) as executor:
-            chunk_indices = list(np.linspace(0, len(self), num=worker_count, dtype=int, endpoint=False))
-            futures = []
-            chunks = []
-            for j, chunk_idx_start in enumerate(chunk_indices):
-                chunk_idx_exclusive_end = chunk_indices[j+1] if chunk_idx_start != chunk_indices[-1] else len(self)
-                chunk = []
-                chunks.append(chunk)
-                futures.append(executor.submit(_convert_data_from_yolo, chunk, chunk_idx_start, chunk_idx_exclusive_end))
-            wait_until_completed(futures)
-            self.data = []
-            for chunk in chunks:
-                self.data.extend(chunk)
-            assert len(self.data) == len(self._tmp_data)
-            self._tmp_data = None
+        self.data = self._tmp_data
+        self._tmp_data = None
 
     def get_images(self) -> list[Image]:
         return [img for img, _, _ in self.data]
@@ -154,10 +165,10 @@ class CroppedScene:
         scene_images = scene.get_images()
         scene_mask_images = scene.get_masks()
 
-        for i, smoothed_box in enumerate(smoothed_boxes):
-            cropped_image, cropped_mask_image, cropped_box, scale_factor = crop_to_box_v3(smoothed_box, scene_images[i],
-                                                                         scene_mask_images[i], target_size, border_size=border_size)
-            self.data.append((cropped_image, cropped_mask_image, cropped_box))
+        cropped_boxes, _ = get_crop_boxes_v3(smoothed_boxes, scene_images[0].shape, target_size, border_size=border_size)
+        for image, mask_image, cropped_box in zip(scene_images, scene_mask_images, cropped_boxes.tolist()):
+            t, l, b, r = cropped_box
+            self.data.append((image[t:b + 1, l:r + 1], mask_image[t:b + 1, l:r + 1], tuple(cropped_box)))
 
     def __len__(self):
         return len(self.data)
@@ -204,41 +215,28 @@ class CroppedScene:
 class SmoothSceneBoxes:
 
     @staticmethod
-    def median_filter(data, window=11):
+    def _sliding_windows(data: np.ndarray, window: int) -> np.ndarray:
+        # windows along first axis, edge-padded so there is a window centered at each element. Shape: (*data.shape, window)
         assert window % 2 != 0
         pad_size = int((window - 1) / 2)
-        data_size = len(data)
-        data_type = data[0]
+        padded_data = np.pad(data, [(pad_size, pad_size)] + [(0, 0)] * (data.ndim - 1), 'edge')
+        return sliding_window_view(padded_data, window, axis=0)
 
-        padded_data = np.pad(data, pad_size, 'edge')
-        filtered_data = np.zeros(data_size, dtype=data_type)
-        for i in range(data_size):
-            filtered_data[i] = np.median(padded_data[i:i + window])
-        return filtered_data
+    @staticmethod
+    def median_filter(data, window=11):
+        data = np.asarray(data)
+        return np.median(SmoothSceneBoxes._sliding_windows(data, window), axis=-1).astype(data.dtype)
 
     @staticmethod
     def mean_filter(data, window=11):
-        assert window % 2 != 0
-        pad_size = int((window - 1) / 2)
-        data_size = len(data)
-        data_type = data[0]
-        padded_data = np.pad(data, pad_size, 'edge')
-        filtered_data = np.zeros(data_size, dtype=data_type)
-        for i in range(data_size):
-            filtered_data[i] = np.mean(padded_data[i:i + window])
-        return filtered_data
+        data = np.asarray(data)
+        return np.mean(SmoothSceneBoxes._sliding_windows(data, window), axis=-1).astype(data.dtype)
 
     @staticmethod
     def min_max_filter(data, window, mode):
-        assert window % 2 != 0
+        data = np.asarray(data)
         func = np.max if mode == 'max' else np.min
-        pad_size = int((window - 1) / 2)
-        data_size = len(data)
-        padded_data = np.pad(data, pad_size, 'edge')
-        filtered_data = np.zeros_like(data)
-        for i in range(data_size):
-            filtered_data[i] = func(padded_data[i:i + window])
-        return filtered_data
+        return func(SmoothSceneBoxes._sliding_windows(data, window), axis=-1)
 
     @staticmethod
     def smooth_boxes(scene: Scene, window_in_seconds: float, smooth_function='median'):
@@ -249,15 +247,16 @@ class SmoothSceneBoxes:
         if window_in_frames < 1:
             return _scene_boxes.tolist()
 
-        for i, position in zip(range(4),('t','l','b','r')):
-            if smooth_function == 'median':
-                _scene_boxes[:, i] = SmoothSceneBoxes.median_filter(_scene_boxes[:, i], window_in_frames)
-            elif smooth_function == 'min_max':
-                _scene_boxes[:, i] = SmoothSceneBoxes.min_max_filter(_scene_boxes[:, i], window_in_frames, 'max' if position in ('b', 'r') else 'min')
-            elif smooth_function == 'mean':
-                _scene_boxes[:, i] = SmoothSceneBoxes.mean_filter(_scene_boxes[:, i], window_in_frames)
-            else:
-                raise NotImplementedError()
+        if smooth_function == 'median':
+            _scene_boxes = SmoothSceneBoxes.median_filter(_scene_boxes, window_in_frames)
+        elif smooth_function == 'min_max':
+            # t, l: min, b, r: max
+            _scene_boxes = np.concatenate((SmoothSceneBoxes.min_max_filter(_scene_boxes[:, :2], window_in_frames, 'min'),
+                                           SmoothSceneBoxes.min_max_filter(_scene_boxes[:, 2:], window_in_frames, 'max')), axis=1)
+        elif smooth_function == 'mean':
+            _scene_boxes = SmoothSceneBoxes.mean_filter(_scene_boxes, window_in_frames)
+        else:
+            raise NotImplementedError()
 
         return _scene_boxes.tolist()
 
@@ -310,7 +309,9 @@ def apply_random_mask_extensions(scene: Scene):
         for i, (img, mask, _) in enumerate(scene.data[chunk_idx_start:chunk_idx_exclusive_end], start=chunk_idx_start):
             mask_extended = mask_utils.extend_mask(mask, value)
             box_extended = mask_utils.get_box(mask_extended)
-            scene.data[i] = img, mask_extended, box_extended
+            # write back into scene buffer instead of replacing the mask as it may be memory-mapped
+            mask[:] = mask_extended
+            scene.data[i] = img, mask, box_extended
 
     with concurrent_futures.ThreadPoolExecutor(max_workers=worker_count) as executor:
         chunk_indices = list(np.linspace(0, len(scene), num=worker_count, dtype=int, endpoint=False))
@@ -320,28 +321,52 @@ def apply_random_mask_extensions(scene: Scene):
             futures.append(executor.submit(_apply_random_mask_extensions, chunk_idx_start, chunk_idx_exclusive_end))
         wait_until_completed(futures)
 
+def create_tracker(frame_rate: float, tracker_config="bytetrack.yaml") -> BYTETracker:
+    cfg = IterableSimpleNamespace(**YAML.load(check_yaml(tracker_config)))
+    return BYTETracker(args=cfg, frame_rate=max(1, round(frame_rate)))
+
+def update_tracker(tracker: BYTETracker, results: ultralytics.engine.results.Results) -> ultralytics.engine.results.Results:
+    """
+    Assigns track IDs to detections of a single frame. Same as ultralytics.trackers.track.on_predict_postprocess_end
+    but works with results which haven't been created by an ultralytics predictor.
+    """
+    tracks = tracker.update(results.boxes.cpu().numpy(), results.orig_img)
+    if len(tracks) == 0:
+        return results
+    idx = tracks[:, -1].astype(int)
+    results = results[idx]
+    results.update(boxes=torch.as_tensor(tracks[:, :-1]))
+    return results
 
 class NsfwDetector:
-    def __init__(self, nsfw_detection_model: Yolo, device: str, file_queue: queue.Queue, frame_queue: queue.Queue, scene_queue: queue.Queue, file_processing_options: FileProcessingOptions, random_extend_masks=True):
-        self.nsfw_detection_model: Yolo = nsfw_detection_model
-        self.device = torch.device(device) if device is not None else device
+    def __init__(self, nsfw_detection_model_factory: Callable[[], Yolo11SegmentationModel], file_queue: queue.Queue, frame_queue: queue.Queue, scene_queue: queue.Queue, file_processing_options: FileProcessingOptions, random_extend_masks=True, batch_size=4,
+                 progress_journal: Optional[ProgressJournal] = None):
+        self.batch_size = batch_size
         self.file_queue: queue.Queue = file_queue
         self.frame_queue: queue.Queue = frame_queue
         self.scene_queue: queue.Queue = scene_queue
         self.file_processing_options = file_processing_options
+        self.progress_journal = progress_journal
 
+        # all per-file state is keyed by video file path as frames of multiple files are processed concurrently
         self.metadata: Dict[str, VideoMetadata] = {}
         self.previous_completed_scene_frame_end: Dict[str, Optional[int]] = {}
         self.scenes_counter: Dict[str, int] = {}
+        self.scene_min_length: Dict[str, int] = {}
+        self.scene_max_length: Dict[str, int] = {}
+        self.stride_length_frames: Dict[str, int] = {}
+        self.start_frame: Dict[str, int] = {}
         self.random_extend_masks = random_extend_masks
+        self.frame_stride = max(1, file_processing_options.frame_stride)
 
         self.stop_requested = False
         self.thread_pool = concurrent_futures.ThreadPoolExecutor()
         self.frame_detector_thread_futures: list[concurrent_futures.Future] = []
         self.scene_detector_thread_futures: list[concurrent_futures.Future] = []
-        # todo: frame thread is faster than scene thread so ideally we could scale it up to multiple consumers. Needs some refactoring first to preserve order of frames
-        #  also, more frame threads (processing more than a single file) could be an improvement when NSFW detection becomes a bottleneck when running dataset creation script.
-        self.frame_detector_thread_count = 1
+        # Each frame detector thread processes a different file. Frames of a single file are produced by a single thread so their order is preserved.
+        # Inference of a model instance is serialized so each thread loads its own instance of the model to run inference concurrently
+        self.frame_detector_thread_count = max(1, file_processing_options.parallel_files)
+        self.nsfw_detection_models: list[Yolo11SegmentationModel] = [nsfw_detection_model_factory() for _ in range(self.frame_detector_thread_count)]
         self.scene_detector_thread_count = 1
         self.frame_detector_thread_should_be_running = False
         self.scene_detector_thread_should_be_running = False
@@ -354,6 +379,11 @@ class NsfwDetector:
                 with open(file, 'r', encoding='utf-8') as f:
                     for file_path in f:
                         self.files_already_processed.add(file_path.strip())
+        # system temp directory is often a small tmpfs (so in RAM as well), by default spill next to the output instead
+        self.spill_root_dir: pathlib.Path = file_processing_options.spill_dir or file_processing_options.output_dir.joinpath(".scene_spill")
+        self.spill_dir: Optional[pathlib.Path] = None # temporary directory within spill_root_dir while running
+        self.perceptual_hash_index = PerceptualHashIndex(file_processing_options.output_dir.joinpath("perceptual_hashes.txt"),
+                                                         max_distance=file_processing_options.deduplicate_max_distance) if file_processing_options.deduplicate else None
 
     def _mark_file_as_processed(self, text_file: pathlib.Path, path_to_save: str):
         if not text_file.exists():
@@ -367,13 +397,19 @@ class NsfwDetector:
 
     def _process_completed_scene(self, completed_scene: Scene) -> Optional[Scene]:
         """returns Scene if it fits the criteria for a valid completed scene like min/max length"""
-        # todo: implementing video strides / discarding frames here is inefficient as we still pass every frame through YOLO / nsfw frames generator.
-        #  We'd need to read and pass only the frames we want to be processed to YOLO instead of passing the video file.
         video_file = completed_scene.video_meta_data.video_file
-        skip_scene = not (completed_scene.min_length_reached() and (self.previous_completed_scene_frame_end[video_file] is None or (completed_scene.frame_start - self.previous_completed_scene_frame_end[video_file]) > self.stride_length_frames))
+        skip_scene = not (completed_scene.min_length_reached() and (self.previous_completed_scene_frame_end[video_file] is None or (completed_scene.frame_start - self.previous_completed_scene_frame_end[video_file]) > self.stride_length_frames[video_file]))
         if skip_scene:
             return None
         completed_scene.complete()
+        if self.perceptual_hash_index:
+            # hashes will be added to the index by SceneProcessor once the scene has been saved.
+            # Scenes of the same file are not compared to each other, consecutive chunks of the same shot would look alike
+            completed_scene.perceptual_hashes = hash_frames(completed_scene.get_images())
+            duplicate_scene = self.perceptual_hash_index.find_duplicate('scene', completed_scene.key, completed_scene.perceptual_hashes, group=video_file)
+            if duplicate_scene:
+                print(f"Skipping scene (frames {completed_scene.frame_start:06d}-{completed_scene.frame_end:06d}) of {pathlib.Path(video_file).name}: Near-duplicate of scene {duplicate_scene}")
+                return None
         self.scenes_counter[video_file] += 1
         completed_scene.id = self.scenes_counter[video_file]
         self.previous_completed_scene_frame_end[video_file] = completed_scene.frame_end
@@ -381,15 +417,37 @@ class NsfwDetector:
             apply_random_mask_extensions(completed_scene)
         return completed_scene
 
-    def _init_new_file(self, metadata: VideoMetadata):
+    def _create_scene(self, nsfw_frame: NsfwFrame) -> Scene:
+        video_file = nsfw_frame.video_metadata.video_file
+        scene_max_memory = self.file_processing_options.scene_max_memory
+        return Scene(nsfw_frame.video_metadata, nsfw_frame.object_id, self.scene_min_length[video_file], self.scene_max_length[video_file], self.frame_stride,
+                     ram_budget=scene_max_memory * 1024 * 1024 if scene_max_memory else None, spill_dir=self.spill_dir)
+
+    def _init_new_file(self, metadata: VideoMetadata) -> VideoMetadata:
         file_path = metadata.video_file
+        if self.frame_stride > 1:
+            # scenes only contain every n-th frame so from here on we treat the file as if it would have been recorded with a lower frame rate
+            metadata = dataclasses.replace(metadata,
+                                           video_fps=metadata.video_fps / self.frame_stride,
+                                           average_fps=metadata.average_fps / self.frame_stride,
+                                           video_fps_exact=metadata.video_fps_exact / self.frame_stride,
+                                           frames_count=math.ceil(metadata.frames_count / self.frame_stride))
         self.metadata[file_path] = metadata
-        self.scene_min_length =  math.ceil(self.file_processing_options.scene_min_length * metadata.video_fps)
-        scene_max_length = determine_max_scene_length (metadata, self.file_processing_options.scene_max_length, self.file_processing_options.scene_max_memory)
-        self.scene_max_length = math.ceil(scene_max_length * metadata.video_fps)
-        self.stride_length_frames = math.ceil(self.file_processing_options.stride_length * metadata.video_fps)
+        self.scene_min_length[file_path] = math.ceil(self.file_processing_options.scene_min_length * metadata.video_fps)
+        scene_max_length = determine_max_scene_length (metadata, self.file_processing_options.scene_max_length, None)
+        self.scene_max_length[file_path] = math.ceil(scene_max_length * metadata.video_fps)
+        # frame numbers are counted in frames of the original file
+        self.stride_length_frames[file_path] = math.ceil(self.file_processing_options.stride_length * metadata.video_fps * self.frame_stride)
         self.previous_completed_scene_frame_end[file_path] = None
         self.scenes_counter[file_path] = 0
+        self.start_frame[file_path] = 0
+        resume_point = self.progress_journal.get_resume_point(file_path) if self.progress_journal else None
+        if resume_point:
+            # scenes up to and including this one have already been saved, continue detection right after it
+            self.previous_completed_scene_frame_end[file_path] = resume_point.frame_end
+            self.scenes_counter[file_path] = resume_point.scene_id
+            self.start_frame[file_path] = resume_point.frame_end + self.frame_stride
+        return metadata
 
     def _check_file(self, file_index: 0, file_path: str) -> Optional[VideoMetadata]:
         file_name = pathlib.Path(file_path)
@@ -403,10 +461,16 @@ class NsfwDetector:
         if max(video_metadata.video_width, video_metadata.video_height) > 2_000:
             print(f"{file_index}, Skipping {file_name}: 4K")
             return None
-        scene_max_length = determine_max_scene_length (video_metadata, self.file_processing_options.scene_max_length, self.file_processing_options.scene_max_memory)
+        scene_max_length = determine_max_scene_length (video_metadata, self.file_processing_options.scene_max_length, None)
         if scene_max_length < self.file_processing_options.scene_min_length:
             print(f"{file_index}, Skipping {file_name}: Scene maximum length is less than minimum length")
             return None
+        if self.perceptual_hash_index:
+            duplicate_file = self.perceptual_hash_index.check_and_add('file', str(file_path), hash_video_file(file_path, video_metadata.duration))
+            if duplicate_file:
+                print(f"{file_index}, Skipping {file_name}: Near-duplicate of {duplicate_file}")
+                self._mark_file_as_processed(self.done_processing_file, file_path)
+                return None
         return video_metadata
 
     def add_files(self, video_files):
@@ -414,7 +478,7 @@ class NsfwDetector:
             self.file_queue.put((file_index, file_path))
         self.file_queue.put(None)
 
-    def _frame_detector_worker(self):
+    def _frame_detector_worker(self, nsfw_detection_model: Yolo11SegmentationModel):
         logger.debug("NsfwDetector: frame detector worker: started")
         while self.frame_detector_thread_should_be_running:
             item: tuple[int, str] | None = self.file_queue.get()
@@ -423,39 +487,63 @@ class NsfwDetector:
             if self.stop_requested:
                 break
             if not item:
+                # let the other frame detector threads know that there are no more files
+                self.file_queue.put(None)
                 self.frame_queue.put(None)
                 break
             video_file_index, video_file_path = item
             video_metadata = self._check_file(video_file_index, video_file_path)
             if not video_metadata:
                 continue
-            if video_file_path not in self.metadata:
-                self._init_new_file(video_metadata)
+            video_metadata = self._init_new_file(video_metadata)
+            tracker = create_tracker(video_metadata.video_fps)
             nsfw_frame = None
-            print(f"{video_file_index}, Processing {pathlib.Path(video_file_path).name}")
-            for frame_num, results in enumerate(self.nsfw_detection_model.track(source=video_metadata.video_file, stream=True, verbose=False, tracker="bytetrack.yaml", device=self.device)):
-                if nsfw_frame:
-                    self.frame_queue.put(nsfw_frame)
-                    if self.stop_requested:
-                        logger.debug("NsfwDetector: frame detector worker: frame_queue producer unblocked")
-                    if self.stop_requested:
+            start_frame = self.start_frame[video_metadata.video_file]
+            if start_frame > 0:
+                print(f"{video_file_index}, Resuming {pathlib.Path(video_file_path).name} after scene {self.scenes_counter[video_metadata.video_file]} at frame {start_frame}")
+            else:
+                print(f"{video_file_index}, Processing {pathlib.Path(video_file_path).name}")
+            with video_utils.VideoReader(video_metadata.video_file) as video_reader:
+                # skipped frames still need to be decoded by the video codec but will not be converted to RGB or passed to YOLO
+                video_frames_generator = video_reader.frames(stride=self.frame_stride, start_frame=start_frame)
+                frame_num = start_frame
+                while not self.stop_requested:
+                    frames = [frame for frame, _ in itertools.islice(video_frames_generator, self.batch_size)]
+                    if len(frames) == 0:
                         break
-                yolo_box, yolo_mask = choose_biggest_detection(results, tracking_mode=True)
-                object_detected = yolo_box is not None
-                nsfw_frame = NsfwFrame(video_metadata, frame_num, False, results.orig_img, yolo_box, yolo_mask, object_detected, int(yolo_box.id.item()) if object_detected else None)
+                    frames_batch = nsfw_detection_model.preprocess(frames)
+                    batch_prediction_results = nsfw_detection_model.inference_and_postprocess(frames_batch, [frame.numpy() for frame in frames])
+                    for results in batch_prediction_results:
+                        if nsfw_frame:
+                            self.frame_queue.put(nsfw_frame)
+                            if self.stop_requested:
+                                logger.debug("NsfwDetector: frame detector worker: frame_queue producer unblocked")
+                            if self.stop_requested:
+                                break
+                        results = update_tracker(tracker, results)
+                        yolo_box, yolo_mask = choose_biggest_detection(results, tracking_mode=True)
+                        object_detected = yolo_box is not None
+                        nsfw_frame = NsfwFrame(video_metadata, frame_num, False, results.orig_img, yolo_box, yolo_mask, object_detected, int(yolo_box.id.item()) if object_detected else None)
+                        frame_num += self.frame_stride
             if nsfw_frame and not self.stop_requested:
                 nsfw_frame.last_frame = True
                 self.frame_queue.put(nsfw_frame)
                 if self.stop_requested:
                     logger.debug("NsfwDetector: frame detector worker: frame_queue producer unblocked")
+            elif not nsfw_frame and not self.stop_requested:
+                # no frames left to analyze, e.g. because the last completed scene ended at the end of the file
+                if self.scenes_counter[video_metadata.video_file] == 0:
+                    self._mark_file_as_processed(self.no_nsfw_scenes_found_file, video_metadata.video_file)
+                self._mark_file_as_processed(self.done_processing_file, video_metadata.video_file)
 
     def _scene_detector_worker(self):
         logger.debug("NsfwDetector: scene detector worker: started")
 
-        scene: Scene | None = None
+        # frames of different files are interleaved in frame_queue, frames of the same file arrive in order
+        scenes: Dict[str, Scene | None] = {}
+        files_with_completed_scenes: set[str] = set()
         nsfw_frame: NsfwFrame
-        previous_file: str = None
-        previous_file_no_completed_scenes = True
+        finished_frame_detector_threads = 0
 
         while self.scene_detector_thread_should_be_running:
             nsfw_frame: NsfwFrame | None = self.frame_queue.get()
@@ -464,48 +552,50 @@ class NsfwDetector:
             if self.stop_requested:
                 break
             if not nsfw_frame:
+                finished_frame_detector_threads += 1
+                if finished_frame_detector_threads < self.frame_detector_thread_count:
+                    continue
                 self.scene_queue.put(None)
                 if self.stop_requested:
                     logger.debug("NsfwDetector: frame detector worker: scene_queue producer unblocked")
                 break
 
-            if not previous_file:
-                previous_file = nsfw_frame.video_metadata.video_file
-            new_file = previous_file != nsfw_frame.video_metadata.video_file
-            if new_file:
-                if previous_file_no_completed_scenes:
-                    self._mark_file_as_processed(self.no_nsfw_scenes_found_file, previous_file)
-                previous_file = nsfw_frame.video_metadata.video_file
-                previous_file_no_completed_scenes = True
+            video_file = nsfw_frame.video_metadata.video_file
+            scene = scenes.get(video_file)
 
             if nsfw_frame.object_detected:
                 if scene is None:
-                    scene = Scene(nsfw_frame.video_metadata, nsfw_frame.object_id, self.scene_min_length, self.scene_max_length)
+                    scene = self._create_scene(nsfw_frame)
                     scene.add_frame(nsfw_frame)
                 else:
-                    if scene.id == nsfw_frame.object_id and scene.frame_end + 1 == nsfw_frame.frame_number:
+                    if scene.id == nsfw_frame.object_id and scene.frame_end + self.frame_stride == nsfw_frame.frame_number:
                         scene.add_frame(nsfw_frame)
                     else:
                         completed_scene = self._process_completed_scene(scene)
                         if completed_scene:
-                            previous_file_no_completed_scenes = False
+                            files_with_completed_scenes.add(video_file)
                             self.scene_queue.put(completed_scene)
                             if self.stop_requested:
                                 logger.debug("NsfwDetector: frame detector worker: scene_queue producer unblocked")
-                        scene = Scene(nsfw_frame.video_metadata, nsfw_frame.object_id, self.scene_min_length, self.scene_max_length)
+                        scene = self._create_scene(nsfw_frame)
                         scene.add_frame(nsfw_frame)
 
             if scene is not None and (nsfw_frame.last_frame or not nsfw_frame.object_detected):
                 completed_scene = self._process_completed_scene(scene)
                 if completed_scene and not self.stop_requested:
-                    previous_file_no_completed_scenes = False
+                    files_with_completed_scenes.add(video_file)
                     self.scene_queue.put(completed_scene)
                     if self.stop_requested:
                         logger.debug("NsfwDetector: frame detector worker: scene_queue producer unblocked")
                 scene = None
+            scenes[video_file] = scene
 
             if nsfw_frame.last_frame:
-                self._mark_file_as_processed(self.done_processing_file, nsfw_frame.video_metadata.video_file)
+                if video_file not in files_with_completed_scenes and self.scenes_counter[video_file] == 0:
+                    self._mark_file_as_processed(self.no_nsfw_scenes_found_file, video_file)
+                self._mark_file_as_processed(self.done_processing_file, video_file)
+                scenes.pop(video_file, None)
+                files_with_completed_scenes.discard(video_file)
 
     def __call__(self) -> Generator[Scene, None, None]:
         while not self.stop_requested:
@@ -519,11 +609,14 @@ class NsfwDetector:
 
     def start(self):
         self.stop_requested = False
+        if self.file_processing_options.scene_max_memory:
+            self.spill_root_dir.mkdir(parents=True, exist_ok=True)
+            self.spill_dir = pathlib.Path(tempfile.mkdtemp(prefix="lada_scenes_", dir=self.spill_root_dir))
         self.frame_detector_thread_should_be_running = True
         self.scene_detector_thread_should_be_running = True
 
         for i in range(self.frame_detector_thread_count):
-            self.frame_detector_thread_futures.append(self.thread_pool.submit(self._frame_detector_worker))
+            self.frame_detector_thread_futures.append(self.thread_pool.submit(self._frame_detector_worker, self.nsfw_detection_models[i]))
         for i in range(self.scene_detector_thread_count):
             self.scene_detector_thread_futures.append(self.thread_pool.submit(self._scene_detector_worker))
 
@@ -534,9 +627,9 @@ class NsfwDetector:
         self.scene_detector_thread_should_be_running = False
 
         # unblock consumer
-        for i in range(self.frame_detector_thread_count): threading_utils.put_closing_queue_marker(self.frame_queue, "file_queue")
+        for i in range(self.frame_detector_thread_count): threading_utils.put_closing_queue_marker(self.file_queue, "file_queue")
         # unblock producer
-        threading_utils.empty_out_queue_until_futures_are_done(self.scene_queue, "frame_queue", self.frame_detector_thread_futures)
+        threading_utils.empty_out_queue_until_futures_are_done(self.frame_queue, "frame_queue", self.frame_detector_thread_futures)
         concurrent_futures.wait(self.frame_detector_thread_futures, return_when=concurrent_futures.ALL_COMPLETED)
         logger.debug("NsfwDetector: frame detector worker: stopped")
         self.frame_detector_thread_futures = []
@@ -553,7 +646,20 @@ class NsfwDetector:
 
         # garbage collection
         threading_utils.empty_out_queue(self.file_queue, "file_queue")
-        threading_utils.empty_out_queue(self.file_queue, "frame_queue")
+        threading_utils.empty_out_queue(self.frame_queue, "frame_queue")
         threading_utils.empty_out_queue(self.scene_queue, "scene_queue")
 
-        logger.debug(f"NsfwDetector: stopped")
\ No newline at end of file
+        self._remove_spill_dir()
+        logger.debug(f"NsfwDetector: stopped")
+
+    def _remove_spill_dir(self):
+        if self.spill_dir is None:
+            return
+        # spill files are unlinked right after creation on POSIX, memory-mappings of scenes still being processed stay valid
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+        self.spill_dir = None
+        if not self.file_processing_options.spill_dir:
+            try:
+                self.spill_root_dir.rmdir()
+            except OSError:
+                pass # not empty, e.g. used by another run
@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: AGPL-3.0
 
 import pathlib
+import threading
 import concurrent.futures as concurrent_futures
 from dataclasses import dataclass
 from typing import Callable
@@ -14,16 +15,17 @@ import numpy as np
 from lada.models.basicvsrpp.mosaic_video_dataset import create_degradation_pipeline
 from lada.utils import mask_utils, Pad, Mask, Image
 from lada.datasetcreation import restoration_dataset_metadata
-from lada.utils import video_utils, image_utils
+from lada.utils import image_utils
 from lada.models.dover.evaluate import VideoQualityEvaluator
 from lada.utils.image_utils import pad_image
-from lada.datasetcreation.detectors.mosaic_classifier import MosaicClassifier
 from lada.utils.mosaic_utils import get_random_parameter, addmosaic_base, get_mosaic_block_size_v1, \
     get_mosaic_block_size_v2, get_mosaic_block_size_v3
 from lada.datasetcreation.nsfw_scene_detector import Scene, CroppedScene
-from lada.datasetcreation.detectors.nudenet_nsfw_detector import NudeNetNsfwDetector
+from lada.datasetcreation.scene_analyzer_scheduler import SceneAnalyzerScheduler
+from lada.datasetcreation.dataset_writer import DatasetWriter
+from lada.datasetcreation.progress_journal import ProgressJournal, CompletedScene
+from lada.datasetcreation.perceptual_hash_index import PerceptualHashIndex
 from lada.utils.threading_utils import wait_until_completed
-from lada.datasetcreation.detectors.watermark_detector import WatermarkDetector
 
 
 @dataclass
@@ -203,33 +205,6 @@ class DatasetItem:
 
         assert len(cropped_scene) == len(self._images) == len(self._masks) == len(self._pads), f"number of images, masks and pads are not the same: {len(cropped_scene)} == {len(self._images)} == {len(self._masks)} == {len(self._pads)}"
 
-    def _save_vid(self, file_path: pathlib.Path, imgs: list[np.ndarray[np.uint8]], fps=30, gray=False):
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        path = str(file_path.absolute())
-        if gray:
-            video_utils.write_masks_to_video_file(imgs, path, fps)
-        else:
-            video_utils.write_frames_to_video_file(imgs, path, fps)
-
-    def _save_meta(self, file_path: pathlib.Path, meta: restoration_dataset_metadata.RestorationDatasetMetadataV2):
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        path = str(file_path.absolute())
-        meta.to_json_file(path)
-
-    def _save_imgs(self, file_path_template_format_string: pathlib.Path, imgs: np.ndarray, jpeg_quality_level=95):
-        file_path_template_format_string.parent.mkdir(parents=True, exist_ok=True)
-        file_ext = file_path_template_format_string
-        for i in range(len(imgs)):
-            path = str(Path(str(file_path_template_format_string).format(i)).absolute())
-            try:
-                if file_ext == ".jpg":
-                    cv2.imwrite(path, imgs[i], [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality_level])
-                else:
-                    cv2.imwrite(path, imgs[i])
-                    cv2.imwrite(path, imgs[i])
-            except Exception as e:
-                print(e)
-
     def _get_base_mosaic_block_size(self, scene: Scene) -> restoration_dataset_metadata.MosaicBlockSizeV2:
         box_sizes = [(r - l + 1) * (b - t + 1) for t, l, b, r in scene.get_boxes()]
         median_idx = np.argsort(box_sizes)[len(box_sizes) // 2]
@@ -270,7 +245,7 @@ class DatasetItem:
         if file_type == 'img':
             if save_as_images:
                 file_extension = ".jpg"
-                file_name_format_string = file_prefix + '{%06d}' + file_extension
+                file_name_format_string = file_prefix + '{:06d}' + file_extension
                 file_name = file_name_format_string
             else:
                 file_extension = ".mp4"
@@ -278,7 +253,7 @@ class DatasetItem:
         elif file_type == 'mask':
             if save_as_images:
                 file_extension = ".png"
-                file_name_format_string = file_prefix + '{%06d}' + file_extension
+                file_name_format_string = file_prefix + '{:06d}' + file_extension
                 file_name = file_name_format_string
             else:
                 file_extension = ".mkv"
@@ -324,19 +299,19 @@ class DatasetItem:
             censoring_detected=self._censoring_detected,
         )
 
-    def save(self, output_dir, scene, mosaic, save_as_images, save_flat, target_fps, io_executor) -> list[concurrent_futures.Future]:
+    def save(self, output_dir, scene, mosaic, save_as_images, save_flat, target_fps, dataset_writer: DatasetWriter) -> list[tuple[pathlib.Path, concurrent_futures.Future]]:
         io_futures = []
 
         def _save(data, file_type: Literal['mask', 'img', 'meta'], mosaic):
             file_path = self._get_io_path(output_dir, self._scene_type, scene, save_as_images, save_flat, file_type, mosaic)
             if file_type == 'meta':
-                io_futures.append(io_executor.submit(self._save_meta, file_path, data))
+                io_futures.append((file_path, dataset_writer.write_metadata(file_path, data)))
+            elif save_as_images:
+                io_futures.append((file_path, dataset_writer.write_images(file_path, data)))
+            elif file_type == 'mask':
+                io_futures.append((file_path, dataset_writer.write_mask_video(file_path, data, target_fps)))
             else:
-                if save_as_images:
-                    io_futures.append(io_executor.submit(self._save_imgs, file_path, data))
-                else:
-                    gray = file_type == 'mask'
-                    io_futures.append(io_executor.submit(self._save_vid, file_path, data, target_fps, gray))
+                io_futures.append((file_path, dataset_writer.write_video(file_path, data, target_fps)))
         if self._meta:
             _save(self._meta, 'meta', mosaic)
         _save(self._images, 'img', mosaic)
@@ -344,11 +319,47 @@ class DatasetItem:
         return io_futures
 
 class SceneProcessor:
-    def __init__(self,  video_quality_evaluator: VideoQualityEvaluator, watermark_detector: WatermarkDetector, nudenet_nsfw_detector: NudeNetNsfwDetector, censoring_detector: MosaicClassifier):
+    def __init__(self,  video_quality_evaluator: VideoQualityEvaluator, scene_analyzer_scheduler: SceneAnalyzerScheduler, dataset_writer: DatasetWriter,
+                 progress_journal: Optional[ProgressJournal] = None, perceptual_hash_index: Optional[PerceptualHashIndex] = None):
         self.video_quality_evaluator = video_quality_evaluator
-        self.watermark_detector = watermark_detector
-        self.nudenet_nsfw_detector = nudenet_nsfw_detector
-        self.censor_detector = censoring_detector
+        self.scene_analyzer_scheduler = scene_analyzer_scheduler
+        self.dataset_writer = dataset_writer
+        self.progress_journal = progress_journal
+        self.perceptual_hash_index = perceptual_hash_index
+
+    def _record_scene(self, scene: Scene, artifacts: list[str]):
+        if self.progress_journal:
+            self.progress_journal.record_scene(CompletedScene(scene.video_meta_data.video_file, scene.id, scene.frame_start, scene.frame_end, artifacts))
+
+    def _on_scene_saved(self, scene: Scene, artifacts: list[str]):
+        self._record_scene(scene, artifacts)
+        if self.perceptual_hash_index and scene.perceptual_hashes:
+            # only scenes which made it into the dataset are relevant for deduplication of later scenes
+            self.perceptual_hash_index.add('scene', scene.key, scene.perceptual_hashes, group=scene.video_meta_data.video_file)
+
+    def _record_scene_once_written(self, scene: Scene, output_dir: Path, io_futures: list[tuple[pathlib.Path, concurrent_futures.Future]]):
+        if not (self.progress_journal or self.perceptual_hash_index):
+            return
+        if len(io_futures) == 0:
+            self._record_scene(scene, [])
+            return
+        artifacts = [str(file_path.relative_to(output_dir)) for file_path, _ in io_futures]
+        futures = [future for _, future in io_futures]
+        pending_futures_count = len(futures)
+        lock = threading.Lock()
+
+        def _on_written(_):
+            nonlocal pending_futures_count
+            with lock:
+                pending_futures_count -= 1
+                if pending_futures_count > 0:
+                    return
+            # scenes which could not be written completely will be processed again on the next run
+            if all(not future.cancelled() and future.exception() is None for future in futures):
+                self._on_scene_saved(scene, artifacts)
+
+        for future in futures:
+            future.add_done_callback(_on_written)
 
     def process_scene(self, scene: Scene, output_dir: Path, scene_processing_options: SceneProcessingOptions):
         print("Started processing scene", scene.id)
@@ -392,63 +403,46 @@ class SceneProcessor:
             #########
             def _run_video_quality_evaluation():
                 if scene_processing_options.quality_evaluation.filter or scene_processing_options.quality_evaluation.add_metadata:
+                    dataset_items = []
                     if scene_processing_options.save_cropped:
                         if scene_processing_options.resize_crops:
-                            score = self.video_quality_evaluator.evaluate(dataset_item_crop_scaled.images)
-                            dataset_item_crop_scaled.quality_score = restoration_dataset_metadata.VisualQualityScoreV1(**score)
+                            dataset_items.append(dataset_item_crop_scaled)
                         if scene_processing_options.preserve_crops:
-                            score = self.video_quality_evaluator.evaluate(dataset_item_crop_unscaled.images)
-                            dataset_item_crop_unscaled.quality_score = restoration_dataset_metadata.VisualQualityScoreV1(**score)
+                            dataset_items.append(dataset_item_crop_unscaled)
                     if scene_processing_options.save_uncropped:
-                        score = self.video_quality_evaluator.evaluate(dataset_item_uncropped.images)
-                        dataset_item_uncropped.quality_score = restoration_dataset_metadata.VisualQualityScoreV1(**score)
+                        dataset_items.append(dataset_item_uncropped)
+                    if len(dataset_items) == 0:
+                        return
+                    scores = self.video_quality_evaluator.evaluate_batch([dataset_item.images for dataset_item in dataset_items])
+                    for dataset_item, score in zip(dataset_items, scores):
+                        dataset_item.quality_score = restoration_dataset_metadata.VisualQualityScoreV1(**score)
             scene_analyzers_futures.append(scene_analyzers_executor.submit(_run_video_quality_evaluation))
 
             #########
-            ## Watermark detection
+            ## Watermark, NudeNet NSFW and Censor detection
             #########
-            def _run_watermark_detection():
-                if scene_processing_options.watermark_detection.filter or scene_processing_options.watermark_detection.add_metadata:
-                    if scene_processing_options.save_cropped:
-                        _watermark_detected = self.watermark_detector.detect(scene.get_images(), cropped_scene.get_boxes())
-                        if scene_processing_options.resize_crops:
-                            dataset_item_crop_scaled.watermark_detected = _watermark_detected
-                        if scene_processing_options.preserve_crops:
-                            dataset_item_crop_unscaled.watermark_detected = _watermark_detected
-                    if scene_processing_options.save_uncropped:
-                        dataset_item_uncropped.watermark_detected = self.watermark_detector.detect(scene.get_images())
-            scene_analyzers_futures.append(scene_analyzers_executor.submit(_run_watermark_detection))
-
-            #########
-            ## NudeNet NSFW detection
-            #########
-            def _run_nudenet_nsfw_detection():
-                if scene_processing_options.nudenet_nsfw_detection.filter or scene_processing_options.nudenet_nsfw_detection.add_metadata:
-                    if scene_processing_options.save_cropped:
-                        _nudenet_nsfw_detected, _nsfw_male_detected, _nsfw_female_detected = self.nudenet_nsfw_detector.detect(scene.get_images(), cropped_scene.get_boxes())
-                        if scene_processing_options.resize_crops:
-                            dataset_item_crop_scaled.nudenet_nsfw_detected, dataset_item_crop_scaled.nudenet_nsfw_detected_classes = _nudenet_nsfw_detected, restoration_dataset_metadata.NudeNetNsfwClassDetectionsV1(_nsfw_male_detected, _nsfw_female_detected)
-                        if scene_processing_options.preserve_crops:
-                            dataset_item_crop_unscaled.nudenet_nsfw_detected, dataset_item_crop_unscaled.nudenet_nsfw_detected_classes = _nudenet_nsfw_detected, restoration_dataset_metadata.NudeNetNsfwClassDetectionsV1(_nsfw_male_detected, _nsfw_female_detected)
-                    if scene_processing_options.save_uncropped:
-                        _nudenet_nsfw_detected, _nsfw_male_detected, _nsfw_female_detected = self.nudenet_nsfw_detector.detect(scene.get_images())
-                        dataset_item_uncropped.nudenet_nsfw_detected, dataset_item_uncropped.nudenet_nsfw_detected_classes = _nudenet_nsfw_detected, restoration_dataset_metadata.NudeNetNsfwClassDetectionsV1(_nsfw_male_detected, _nsfw_female_detected)
-            scene_analyzers_futures.append(scene_analyzers_executor.submit(_run_nudenet_nsfw_detection))
-
-            #########
-            ## Censor detection
-            #########
-            def _run_censor_detection():
-                if scene_processing_options.censor_detection.filter or scene_processing_options.censor_detection.add_metadata:
-                    if scene_processing_options.save_cropped:
-                        _censoring_detected = self.censor_detector.detect(scene.get_images(), cropped_scene.get_boxes())
-                        if scene_processing_options.resize_crops:
-                            dataset_item_crop_scaled.censoring_detected = _censoring_detected
-                        if scene_processing_options.preserve_crops:
-                            dataset_item_crop_unscaled.censoring_detected = _censoring_detected
-                    if scene_processing_options.save_uncropped:
-                        dataset_item_uncropped.censoring_detected = self.censor_detector.detect(scene.get_images())
-            scene_analyzers_futures.append(scene_analyzers_executor.submit(_run_censor_detection))
+            def _run_scene_analyzers():
+                run_watermark_detection = scene_processing_options.watermark_detection.filter or scene_processing_options.watermark_detection.add_metadata
+                run_nudenet_nsfw_detection = scene_processing_options.nudenet_nsfw_detection.filter or scene_processing_options.nudenet_nsfw_detection.add_metadata
+                run_censor_detection = scene_processing_options.censor_detection.filter or scene_processing_options.censor_detection.add_metadata
+                if not (run_watermark_detection or run_nudenet_nsfw_detection or run_censor_detection):
+                    return
+                dataset_items_by_boxes = []
+                if scene_processing_options.save_cropped:
+                    dataset_items_by_boxes.append(([item for item in (dataset_item_crop_scaled, dataset_item_crop_unscaled) if item is not None], cropped_scene.get_boxes()))
+                if scene_processing_options.save_uncropped:
+                    dataset_items_by_boxes.append(([dataset_item_uncropped], None))
+                scene_analyses = self.scene_analyzer_scheduler.analyze(scene.get_images(), [boxes for _, boxes in dataset_items_by_boxes]).result()
+                for (dataset_items, _), scene_analysis in zip(dataset_items_by_boxes, scene_analyses):
+                    for dataset_item in dataset_items:
+                        if run_watermark_detection:
+                            dataset_item.watermark_detected = scene_analysis.watermark_detected
+                        if run_nudenet_nsfw_detection:
+                            _nudenet_nsfw_detected, _nsfw_male_detected, _nsfw_female_detected = scene_analysis.nudenet_nsfw_detected
+                            dataset_item.nudenet_nsfw_detected, dataset_item.nudenet_nsfw_detected_classes = _nudenet_nsfw_detected, restoration_dataset_metadata.NudeNetNsfwClassDetectionsV1(_nsfw_male_detected, _nsfw_female_detected)
+                        if run_censor_detection:
+                            dataset_item.censoring_detected = scene_analysis.censoring_detected
+            scene_analyzers_futures.append(scene_analyzers_executor.submit(_run_scene_analyzers))
 
         wait_until_completed(scene_analyzers_futures)
 
@@ -477,36 +471,40 @@ class SceneProcessor:
 
         if scene_processing_options.quality_evaluation.filter and _filtering_dataset_item and _filtering_dataset_item.quality_score.overall < scene_processing_options.quality_evaluation.min_quality:
             print(f"Skipped scene {scene.id} because of low visual video quality ({_filtering_dataset_item.quality_score.overall:.4f} < {scene_processing_options.quality_evaluation.min_quality})")
+            self._record_scene(scene, [])
             return
         elif scene_processing_options.watermark_detection.filter and _filtering_dataset_item and _filtering_dataset_item.watermark_detected:
             print(f"Skipped scene {scene.id} because watermark(s) have been detected")
+            self._record_scene(scene, [])
             return
         elif scene_processing_options.nudenet_nsfw_detection.filter and _filtering_dataset_item and not _filtering_dataset_item.nudenet_nsfw_detected:
             print(f"Skipped scene {scene.id} because not NSFW according to NudeNetNsfwDetector")
+            self._record_scene(scene, [])
             return
         elif scene_processing_options.censor_detection.filter and _filtering_dataset_item and _filtering_dataset_item.censoring_detected:
             print(f"Skipped scene {scene.id} because censoring has been detected")
+            self._record_scene(scene, [])
             return
 
         #########
         ## Save
         #########
+        # writing happens asynchronously in DatasetWriter, we only block here if its queue is full
         io_futures = []
-        with concurrent_futures.ThreadPoolExecutor() as io_executor:
-            if scene_processing_options.save_mosaic:
-                if scene_processing_options.save_cropped:
-                    if scene_processing_options.preserve_crops:
-                        io_futures.extend(dataset_item_mosaic_crop_unscaled.save(output_dir, scene, True, scene_processing_options.save_as_images, scene_processing_options.save_flat, scene.video_meta_data.video_fps, io_executor))
-                    if scene_processing_options.resize_crops:
-                        io_futures.extend(dataset_item_mosaic_crop_scaled.save(output_dir, scene, True, scene_processing_options.save_as_images, scene_processing_options.save_flat,  scene.video_meta_data.video_fps, io_executor))
-                if scene_processing_options.save_uncropped:
-                    io_futures.extend(dataset_item_mosaic_uncropped.save(output_dir, scene, True, scene_processing_options.save_as_images, scene_processing_options.save_flat,  scene.video_meta_data.video_fps, io_executor))
+        if scene_processing_options.save_mosaic:
             if scene_processing_options.save_cropped:
                 if scene_processing_options.preserve_crops:
-                    io_futures.extend(dataset_item_crop_unscaled.save(output_dir, scene, False, scene_processing_options.save_as_images, scene_processing_options.save_flat,  scene.video_meta_data.video_fps, io_executor))
+                    io_futures.extend(dataset_item_mosaic_crop_unscaled.save(output_dir, scene, True, scene_processing_options.save_as_images, scene_processing_options.save_flat, scene.video_meta_data.video_fps, self.dataset_writer))
                 if scene_processing_options.resize_crops:
-                    io_futures.extend(dataset_item_crop_scaled.save(output_dir, scene, False, scene_processing_options.save_as_images, scene_processing_options.save_flat,  scene.video_meta_data.video_fps, io_executor))
+                    io_futures.extend(dataset_item_mosaic_crop_scaled.save(output_dir, scene, True, scene_processing_options.save_as_images, scene_processing_options.save_flat,  scene.video_meta_data.video_fps, self.dataset_writer))
             if scene_processing_options.save_uncropped:
-                io_futures.extend(dataset_item_uncropped.save(output_dir, scene, False, scene_processing_options.save_as_images, scene_processing_options.save_flat,  scene.video_meta_data.video_fps, io_executor))
-        wait_until_completed(io_futures)
+                io_futures.extend(dataset_item_mosaic_uncropped.save(output_dir, scene, True, scene_processing_options.save_as_images, scene_processing_options.save_flat,  scene.video_meta_data.video_fps, self.dataset_writer))
+        if scene_processing_options.save_cropped:
+            if scene_processing_options.preserve_crops:
+                io_futures.extend(dataset_item_crop_unscaled.save(output_dir, scene, False, scene_processing_options.save_as_images, scene_processing_options.save_flat,  scene.video_meta_data.video_fps, self.dataset_writer))
+            if scene_processing_options.resize_crops:
+                io_futures.extend(dataset_item_crop_scaled.save(output_dir, scene, False, scene_processing_options.save_as_images, scene_processing_options.save_flat,  scene.video_meta_data.video_fps, self.dataset_writer))
+        if scene_processing_options.save_uncropped:
+            io_futures.extend(dataset_item_uncropped.save(output_dir, scene, False, scene_processing_options.save_as_images, scene_processing_options.save_flat,  scene.video_meta_data.video_fps, self.dataset_writer))
+        self._record_scene_once_written(scene, output_dir, io_futures)
         print("Finished processing scene", scene.id)
\ No newline at end of file
@@ -0,0 +1,153 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+"""
+Packed dataset format for video restoration training.
+
+Decoded uint8 frames of all clips are stored back-to-back in raw shard files which are memory-mapped when reading,
+so selecting a window of frames is a simple slice instead of a video decode.
+
+Layout of a packed dataset directory:
+  index.json         - list of clips with offsets of their streams into the shard files as well as arbitrary per-clip metadata
+  shard_00000.bin    - raw frame data (uint8), each stream stored as contiguous (T, H, W, C) array
+  shard_00001.bin
+  ...
+"""
+
+import json
+import os
+from dataclasses import dataclass, asdict
+from pathlib import Path
+
+import numpy as np
+
+PACKED_DATASET_VERSION = 1
+PACKED_DATASET_INDEX_FILENAME = 'index.json'
+
+@dataclass
+class PackedStream:
+    shard: int
+    offset: int
+    shape: tuple[int, int, int, int] # (T, H, W, C)
+
+@dataclass
+class PackedClip:
+    name: str
+    frames_count: int
+    streams: dict[str, PackedStream]
+    metadata: dict
+
+def _get_shard_filename(shard_idx: int) -> str:
+    return f"shard_{shard_idx:05d}.bin"
+
+class PackedDatasetWriter:
+    def __init__(self, output_dir: Path, shard_size_mb: int = 4096):
+        self.output_dir = Path(output_dir)
+        self.shard_size = shard_size_mb * 1024 * 1024
+        self.clips: list[PackedClip] = []
+        self.shard_idx = -1
+        self.shard_file = None
+        self.shard_offset = 0
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _open_next_shard(self):
+        if self.shard_file:
+            self.shard_file.close()
+        self.shard_idx += 1
+        self.shard_file = open(self.output_dir / _get_shard_filename(self.shard_idx), 'wb')
+        self.shard_offset = 0
+
+    def add_clip(self, name: str, streams: dict[str, list[np.ndarray] | np.ndarray], metadata: dict):
+        """
+        streams: mapping of stream name to frames of the clip. All frames of a stream must be uint8 and of the same shape (H, W, C).
+        metadata: JSON-serializable dict stored alongside the clip in the index
+        """
+        frames_count = None
+        arrays = {}
+        for stream_name, frames in streams.items():
+            array = np.ascontiguousarray(np.stack(frames) if isinstance(frames, list) else frames)
+            assert array.dtype == np.uint8 and array.ndim == 4, f"stream {stream_name} of clip {name} must be of type uint8 and shape (T, H, W, C)"
+            assert frames_count is None or frames_count == array.shape[0], f"streams of clip {name} differ in length"
+            frames_count = array.shape[0]
+            arrays[stream_name] = array
+
+        # all streams of a clip go into the same shard so reading a clip only needs to touch a single file
+        clip_size = sum(array.nbytes for array in arrays.values())
+        if self.shard_file is None or (self.shard_offset > 0 and self.shard_offset + clip_size > self.shard_size):
+            self._open_next_shard()
+
+        packed_streams = {}
+        for stream_name, array in arrays.items():
+            self.shard_file.write(array.data)
+            packed_streams[stream_name] = PackedStream(shard=self.shard_idx, offset=self.shard_offset, shape=array.shape)
+            self.shard_offset += array.nbytes
+        self.clips.append(PackedClip(name=name, frames_count=frames_count, streams=packed_streams, metadata=metadata))
+
+    def close(self):
+        if self.shard_file:
+            self.shard_file.close()
+            self.shard_file = None
+        index = dict(version=PACKED_DATASET_VERSION,
+                     shards=[_get_shard_filename(i) for i in range(self.shard_idx + 1)],
+                     clips=[asdict(clip) for clip in self.clips])
+        index_path = self.output_dir / PACKED_DATASET_INDEX_FILENAME
+        tmp_index_path = index_path.with_suffix('.tmp')
+        with open(tmp_index_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_index_path, index_path)
+
+class PackedDataset:
+    def __init__(self, root_dir: str | Path):
+        self.root_dir = Path(root_dir)
+        with open(self.root_dir / PACKED_DATASET_INDEX_FILENAME, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        assert index.get('version') == PACKED_DATASET_VERSION, f"Cannot read packed dataset version {index.get('version')}"
+        self.shard_filenames: list[str] = index['shards']
+        self.clips: list[PackedClip] = []
+        for clip in index['clips']:
+            streams = {stream_name: PackedStream(shard=stream['shard'], offset=stream['offset'], shape=tuple(stream['shape'])) for stream_name, stream in clip['streams'].items()}
+            self.clips.append(PackedClip(name=clip['name'], frames_count=clip['frames_count'], streams=streams, metadata=clip['metadata']))
+        self._shards: dict[int, np.memmap] = {}
+
+    def __len__(self):
+        return len(self.clips)
+
+    def __getstate__(self):
+        # Don't pickle memory maps (pickling would copy their content), each dataloader worker opens its own
+        state = self.__dict__.copy()
+        state['_shards'] = {}
+        return state
+
+    def _get_shard(self, shard_idx: int) -> np.memmap:
+        shard = self._shards.get(shard_idx)
+        if shard is None:
+            shard = np.memmap(self.root_dir / self.shard_filenames[shard_idx], dtype=np.uint8, mode='r')
+            self._shards[shard_idx] = shard
+        return shard
+
+    def has_stream(self, clip_idx: int, stream_name: str) -> bool:
+        return stream_name in self.clips[clip_idx].streams
+
+    def get_frames(self, clip_idx: int, stream_name: str, start_idx: int = 0, end_idx: int | None = None) -> np.ndarray:
+        """
+        Returns a read-only view of frames [start_idx, end_idx) of the given stream as array of shape (T, H, W, C)
+        """
+        stream = self.clips[clip_idx].streams[stream_name]
+        t, h, w, c = stream.shape
+        frame_size = h * w * c
+        end_idx = t if end_idx is None else min(end_idx, t)
+        start_offset = stream.offset + start_idx * frame_size
+        end_offset = stream.offset + max(start_idx, end_idx) * frame_size
+        return self._get_shard(stream.shard)[start_offset:end_offset].reshape(-1, h, w, c)
+
+    def read_frames(self, clip_idx: int, stream_name: str, start_idx: int = 0, end_idx: int | None = None) -> list[np.ndarray]:
+        """
+        Same as get_frames but returns a list of writable copies of each frame, like video_utils.read_video_frames
+        """
+        return list(np.array(self.get_frames(clip_idx, stream_name, start_idx, end_idx)))
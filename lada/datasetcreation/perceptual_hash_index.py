@@ -0,0 +1,152 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import pathlib
+import threading
+from typing import Literal, Optional
+
+import av
+import cv2
+import numpy as np
+
+from lada.utils import Image
+
+def dhash(image: Image) -> Optional[int]:
+    """
+    64-bit difference hash of a BGR image. Robust against re-encoding, rescaling and small color changes.
+    Returns None for (almost) flat images like black frames as they would match each other regardless of their source.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    resized = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    if resized.std() < 4.:
+        return None
+    bits = resized[:, 1:] > resized[:, :-1]
+    return int(np.packbits(bits).view('>u8')[0])
+
+def hash_frames(frames: list[Image], num_samples=8) -> list[int]:
+    if len(frames) == 0:
+        return []
+    indices = np.unique(np.linspace(0, len(frames) - 1, num=min(num_samples, len(frames)), dtype=int))
+    hashes = [dhash(frames[i]) for i in indices]
+    return [h for h in hashes if h is not None]
+
+def hash_video_file(path: str, duration: float, num_samples=16) -> list[int]:
+    """
+    Hashes frames sampled at evenly spaced timestamps of the video. Only the GOPs containing those timestamps will be decoded.
+    """
+    hashes = []
+    with av.open(path, metadata_errors='ignore') as container:
+        stream = container.streams.video[0]
+        # skip the very beginning and end as intros/outros are often shared between unrelated files
+        for timestamp in np.linspace(0, duration, num=num_samples + 2)[1:-1]:
+            container.seek(int(timestamp * av.time_base), backward=True)
+            for frame in container.decode(stream):
+                if frame.time is None or frame.time >= timestamp:
+                    hashes.append(dhash(frame.to_ndarray(format='bgr24')))
+                    break
+    return [h for h in hashes if h is not None]
+
+_COMPARE_CHUNK_SIZE = 1 << 16
+
+# number of set bits of each 16-bit value, hashes are looked up as four 16-bit parts
+_POPCOUNT_16 = np.array([bin(i).count('1') for i in range(1 << 16)], dtype=np.uint8)
+
+def _hamming_distances(hashes: np.ndarray, other_hashes: np.ndarray) -> np.ndarray:
+    xor = np.bitwise_xor(hashes[:, None], other_hashes[None, :])
+    return _POPCOUNT_16[xor.view(np.uint16)].reshape(*xor.shape, 4).sum(axis=-1, dtype=np.uint8)
+
+class _HashTable:
+    """
+    Hashes of all entries of a kind in a single array so they can be compared in one go, grown by doubling its capacity.
+    """
+    def __init__(self):
+        self.keys: list[str] = []
+        self.key_set: set[str] = set()
+        self.groups: list[Optional[str]] = []
+        self.hashes = np.zeros(1024, dtype=np.uint64)
+        self.entry_indices = np.zeros(1024, dtype=np.int64)
+        self.size = 0
+
+    def __contains__(self, key: str):
+        return key in self.key_set
+
+    def add(self, key: str, group: Optional[str], hashes: np.ndarray):
+        if self.size + len(hashes) > len(self.hashes):
+            capacity = max(2 * len(self.hashes), self.size + len(hashes))
+            self.hashes = np.resize(self.hashes, capacity)
+            self.entry_indices = np.resize(self.entry_indices, capacity)
+        self.hashes[self.size:self.size + len(hashes)] = hashes
+        self.entry_indices[self.size:self.size + len(hashes)] = len(self.keys)
+        self.size += len(hashes)
+        self.keys.append(key)
+        self.key_set.add(key)
+        self.groups.append(group)
+
+class PerceptualHashIndex:
+    """
+    Persistent index of perceptual hashes of frames sampled from already processed files and scenes.
+
+    An entry is considered a near-duplicate if at least min_match_ratio of the sampled frame hashes have a
+    counterpart in the entry within max_distance bits.
+    Entries can be assigned to a group (e.g. the file a scene belongs to), entries of the same group will not be matched against each other.
+    """
+    def __init__(self, index_file: pathlib.Path, max_distance=6, min_match_ratio=0.8):
+        self.index_file = index_file
+        self.max_distance = max_distance
+        self.min_match_ratio = min_match_ratio
+        self.lock = threading.Lock()
+        self.entries: dict[str, _HashTable] = {'file': _HashTable(), 'scene': _HashTable()}
+        if index_file.exists():
+            with open(index_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    kind, key, hashes, *group = line.rstrip('\n').split('\t')
+                    self.entries[kind].add(key, group[0] if group else None, np.array([int(h, 16) for h in hashes.split(',')], dtype=np.uint64))
+
+    def find_duplicate(self, kind: Literal['file', 'scene'], key: str, hashes: list[int], group: Optional[str] = None) -> Optional[str]:
+        """
+        Returns the key of a near-duplicate entry or None.
+        Entries with the same key or group are ignored so interrupted runs can be continued.
+        """
+        if len(hashes) == 0:
+            return None
+        hashes = np.array(hashes, dtype=np.uint64)
+        with self.lock:
+            table = self.entries[kind]
+            matched_entry_indices, matched_hash_indices = [], []
+            # compare in chunks so memory of the distance matrix stays bounded for large indices
+            for chunk_start in range(0, table.size, _COMPARE_CHUNK_SIZE):
+                chunk_end = min(chunk_start + _COMPARE_CHUNK_SIZE, table.size)
+                hash_indices, other_hash_indices = np.nonzero(_hamming_distances(hashes, table.hashes[chunk_start:chunk_end]) <= self.max_distance)
+                matched_entry_indices.append(table.entry_indices[chunk_start + other_hash_indices])
+                matched_hash_indices.append(hash_indices)
+            if table.size == 0:
+                return None
+            # number of hashes which have at least one counterpart, per entry
+            matches = np.unique(np.stack([np.concatenate(matched_entry_indices), np.concatenate(matched_hash_indices)]), axis=1)
+            entry_indices, match_counts = np.unique(matches[0], return_counts=True)
+            for entry_index in entry_indices[match_counts >= self.min_match_ratio * len(hashes)]:
+                if table.keys[entry_index] != key and (group is None or table.groups[entry_index] != group):
+                    return table.keys[entry_index]
+            return None
+
+    def add(self, kind: Literal['file', 'scene'], key: str, hashes: list[int], group: Optional[str] = None):
+        if len(hashes) == 0:
+            return
+        with self.lock:
+            table = self.entries[kind]
+            if key in table:
+                return
+            table.add(key, group, np.array(hashes, dtype=np.uint64))
+            self.index_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.index_file, 'a', encoding='utf-8') as f:
+                line = f"{kind}\t{key}\t{','.join(f'{h:016x}' for h in hashes)}"
+                f.write(f"{line}\t{group}\n" if group is not None else f"{line}\n")
+
+    def check_and_add(self, kind: Literal['file', 'scene'], key: str, hashes: list[int], group: Optional[str] = None) -> Optional[str]:
+        """
+        Returns the key of a near-duplicate entry. If there is none, the hashes will be added to the index and None is returned.
+        """
+        duplicate = self.find_duplicate(kind, key, hashes, group)
+        if duplicate is None:
+            self.add(kind, key, hashes, group)
+        return duplicate
@@ -0,0 +1,59 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import json
+import os
+import pathlib
+import threading
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+@dataclass
+class CompletedScene:
+    video_file: str
+    scene_id: int
+    frame_start: int
+    frame_end: int
+    artifacts: list[str] # empty if scene has been filtered out
+
+class ProgressJournal:
+    """
+    Append-only journal of scenes whose output files have been completely written (or which have been filtered out).
+
+    Each entry is flushed and synced to disk so that after a crash or interruption processing of a file can resume after the
+    last scene for which all preceding scenes of the same file have been completed as well.
+    """
+    def __init__(self, journal_file: pathlib.Path):
+        self.journal_file = journal_file
+        self.lock = threading.Lock()
+        self.completed_scenes: dict[str, dict[int, CompletedScene]] = {}
+        if journal_file.exists():
+            with open(journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        completed_scene = CompletedScene(**json.loads(line))
+                    except (json.JSONDecodeError, TypeError):
+                        # last line could be incomplete if we crashed while writing it
+                        continue
+                    self.completed_scenes.setdefault(completed_scene.video_file, {})[completed_scene.scene_id] = completed_scene
+
+    def record_scene(self, completed_scene: CompletedScene):
+        with self.lock:
+            self.completed_scenes.setdefault(completed_scene.video_file, {})[completed_scene.scene_id] = completed_scene
+            self.journal_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(asdict(completed_scene)) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def get_resume_point(self, video_file: str) -> Optional[CompletedScene]:
+        """
+        Returns the last scene of the given file for which it and all scenes before it have been completed.
+        Scenes are processed concurrently, so there could be completed scenes after a gap which will be processed again.
+        """
+        with self.lock:
+            completed_scenes = self.completed_scenes.get(video_file, {})
+            scene_id = 0
+            while scene_id + 1 in completed_scenes:
+                scene_id += 1
+            return completed_scenes[scene_id] if scene_id > 0 else None
@@ -0,0 +1,152 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+"""
+SQLite index of all restoration dataset metadata files (*.json) of a metadata directory.
+
+The index is stored as index.sqlite within the metadata directory. It is updated in batches by dataset creation when metadata files
+are written and can be (re-)built / synced incrementally for existing datasets via scripts/dataset_creation/create-restoration-dataset-index.py.
+Datasets sync it with the metadata files on disk when loading (only new or modified files are parsed) and can then load and filter
+clip metadata by a single query instead of parsing each JSON file.
+"""
+
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Optional
+
+from lada.datasetcreation.restoration_dataset_metadata import RestorationDatasetMetadataV2
+
+INDEX_FILENAME = 'index.sqlite'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS clips (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    fps REAL NOT NULL,
+    frames_count INTEGER NOT NULL,
+    orig_height INTEGER NOT NULL,
+    orig_width INTEGER NOT NULL,
+    scene_height INTEGER NOT NULL,
+    scene_width INTEGER NOT NULL,
+    quality_aesthetic REAL,
+    quality_technical REAL,
+    quality_overall REAL,
+    watermark_detected INTEGER,
+    nudenet_nsfw_detected INTEGER,
+    censoring_detected INTEGER,
+    metadata TEXT NOT NULL
+)
+"""
+
+def get_index_path(metadata_root_dir: str | Path) -> Path:
+    return Path(metadata_root_dir) / INDEX_FILENAME
+
+def has_index(metadata_root_dir: str | Path) -> bool:
+    return get_index_path(metadata_root_dir).is_file()
+
+def _to_row(relative_path: str, mtime_ns: int, meta: RestorationDatasetMetadataV2) -> tuple:
+    quality = meta.video_quality
+    return (relative_path, mtime_ns, meta.name, meta.fps, meta.frames_count,
+            meta.orig_shape[0], meta.orig_shape[1], meta.scene_shape[0], meta.scene_shape[1],
+            quality.aesthetic if quality else None, quality.technical if quality else None, quality.overall if quality else None,
+            meta.watermark_detected, meta.nudenet_nsfw_detected, meta.censoring_detected,
+            json.dumps(meta.to_dict()))
+
+class RestorationDatasetIndex:
+    def __init__(self, metadata_root_dir: str | Path, read_only: bool = False):
+        self.metadata_root_dir = Path(metadata_root_dir)
+        index_path = get_index_path(self.metadata_root_dir)
+        if read_only:
+            self.connection = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+        else:
+            # multiple scene processors (threads or processes) may write into the same index concurrently, let them wait for each other.
+            # The connection may be used by different threads as long as the caller serializes access
+            self.connection = sqlite3.connect(index_path, timeout=120, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(_SCHEMA)
+            self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def add(self, meta_path: str | Path, meta: RestorationDatasetMetadataV2):
+        self.add_all([(meta_path, meta)])
+
+    def add_all(self, entries: list[tuple[str | Path, RestorationDatasetMetadataV2]]):
+        """
+        Adds or replaces entries of the given metadata files in a single transaction.
+        """
+        rows = []
+        for meta_path, meta in entries:
+            meta_path = Path(meta_path)
+            relative_path = str(meta_path.relative_to(self.metadata_root_dir))
+            rows.append(_to_row(relative_path, os.stat(meta_path).st_mtime_ns, meta))
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO clips VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+
+    def update(self) -> tuple[int, int]:
+        """
+        Syncs index with metadata files on disk. Only new or modified files will be parsed.
+        Returns number of added/updated and number of removed entries.
+        """
+        indexed = dict(self.connection.execute("SELECT path, mtime_ns FROM clips"))
+        on_disk = {}
+        with os.scandir(self.metadata_root_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith('.json'):
+                    on_disk[entry.name] = entry.stat().st_mtime_ns
+
+        removed = [path for path in indexed if path not in on_disk]
+        changed = [path for path, mtime_ns in on_disk.items() if indexed.get(path) != mtime_ns]
+        with self.connection:
+            self.connection.executemany("DELETE FROM clips WHERE path = ?", [(path,) for path in removed])
+            for path in changed:
+                meta = RestorationDatasetMetadataV2.from_json_file(str(self.metadata_root_dir / path))
+                self.connection.execute("INSERT OR REPLACE INTO clips VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", _to_row(path, on_disk[path], meta))
+        return len(changed), len(removed)
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM clips").fetchone()[0]
+
+    def query(self, min_frames_count: Optional[int] = None, max_frames_count: Optional[int] = None, min_resolution: Optional[int] = None,
+              min_quality: Optional[float] = None, filter_watermark: bool = False, filter_nudenet_nsfw: bool = False, filter_censoring: bool = False) -> list[RestorationDatasetMetadataV2]:
+        """
+        min_resolution: minimum length of the shorter side of the source video
+        min_quality: minimum overall video quality score. Clips without quality score will not be filtered
+        filter_watermark, filter_censoring: exclude clips with detected watermarks / censoring
+        filter_nudenet_nsfw: exclude clips which were not detected as NSFW by NudeNet
+        """
+        conditions = []
+        params = []
+        if min_frames_count is not None:
+            conditions.append("frames_count >= ?")
+            params.append(min_frames_count)
+        if max_frames_count is not None:
+            conditions.append("frames_count <= ?")
+            params.append(max_frames_count)
+        if min_resolution is not None:
+            conditions.append("min(orig_height, orig_width) >= ?")
+            params.append(min_resolution)
+        if min_quality is not None:
+            conditions.append("(quality_overall IS NULL OR quality_overall >= ?)")
+            params.append(min_quality)
+        if filter_watermark:
+            conditions.append("NOT coalesce(watermark_detected, 0)")
+        if filter_nudenet_nsfw:
+            conditions.append("coalesce(nudenet_nsfw_detected, 0)")
+        if filter_censoring:
+            conditions.append("NOT coalesce(censoring_detected, 0)")
+        sql = "SELECT metadata FROM clips"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY path"
+        return [RestorationDatasetMetadataV2.from_dict(json.loads(metadata)) for (metadata,) in self.connection.execute(sql, params)]
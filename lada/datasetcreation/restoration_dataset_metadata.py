@@ -31,8 +31,9 @@ class MosaicBlockSizeV2:
 
 @dataclass
 class VisualQualityScoreV1:
-    aesthetic: float
-    technical: float
+    # aesthetic or technical are None if only the other DOVER branch has been evaluated
+    aesthetic: Optional[float]
+    technical: Optional[float]
     overall: float
 
 @dataclass
@@ -50,11 +51,14 @@ class AbstractRestorationDatasetMetadata(ABC):
             json_dict = json.load(f)
         return json_dict['version'] if 'version' in json_dict else 1
 
+    def to_dict(self) -> dict:
+        json_dict = asdict(self)
+        json_dict["version"] = self.version
+        return json_dict
+
     def to_json_file(self, path) -> None:
         with open(path, 'w', encoding='utf-8') as f:
-            json_dict = asdict(self)
-            json_dict["version"] = self.version
-            json.dump(json_dict, f)
+            json.dump(self.to_dict(), f)
 
     def from_json_file(path: str):
         raise NotImplementedError()
@@ -201,39 +205,43 @@ class RestorationDatasetMetadataV2(AbstractRestorationDatasetMetadata):
                 None,
             )
         elif version == 2:
-            return RestorationDatasetMetadataV2(
-                json_dict["name"],
-                json_dict["fps"],
-                json_dict["frames_count"],
-                json_dict["orig_shape"],
-                json_dict["scene_shape"],
-                MosaicBlockSizeV2(
-                    mosaic_size_v3=json_dict["base_mosaic_block_size"]["mosaic_size_v3"],
-                    mosaic_size_v2=json_dict["base_mosaic_block_size"]["mosaic_size_v2"],
-                    mosaic_size_v1_normal=json_dict["base_mosaic_block_size"]["mosaic_size_v1_normal"],
-                    mosaic_size_v1_bounding=json_dict["base_mosaic_block_size"]["mosaic_size_v1_bounding"],
-                ),
-                json_dict["pad"],
-                json_dict["relative_nsfw_video_path"],
-                json_dict["relative_mask_video_path"],
-                json_dict.get("relative_mosaic_nsfw_video_path"),
-                json_dict.get("relative_mosaic_mask_video_path"),
-                MosaicMetadataV1(
-                    mod=json_dict["mosaic"]["mod"],
-                    rect_ratio=json_dict["mosaic"]["rect_ratio"],
-                    mosaic_size=json_dict["mosaic"]["mosaic_size"],
-                    feather_size=json_dict["mosaic"]["feather_size"],
-                ) if json_dict.get("mosaic") else None,
-                VisualQualityScoreV1(
-                    json_dict["video_quality"]["aesthetic"],
-                    json_dict["video_quality"]["technical"],
-                    json_dict["video_quality"]["overall"],
-                ) if json_dict.get("video_quality") else None,
-                json_dict.get("watermark_detected"),
-                json_dict.get("nudenet_nsfw_detected"),
-                NudeNetNsfwClassDetectionsV1(
-                    MALE_GENITALIA_EXPOSED=json_dict["nudenet_nsfw_detected_classes"]["MALE_GENITALIA_EXPOSED"],
-                    FEMALE_GENITALIA_EXPOSED=json_dict["nudenet_nsfw_detected_classes"]["FEMALE_GENITALIA_EXPOSED"],
-                ) if json_dict.get("nudenet_nsfw_detected_classes") else None,
-                json_dict.get("censoring_detected"),
-            )
\ No newline at end of file
+            return RestorationDatasetMetadataV2.from_dict(json_dict)
+
+    def from_dict(json_dict: dict):
+        assert json_dict.get('version') == 2, "Cannot read metadata version " + str(json_dict.get('version'))
+        return RestorationDatasetMetadataV2(
+            json_dict["name"],
+            json_dict["fps"],
+            json_dict["frames_count"],
+            json_dict["orig_shape"],
+            json_dict["scene_shape"],
+            MosaicBlockSizeV2(
+                mosaic_size_v3=json_dict["base_mosaic_block_size"]["mosaic_size_v3"],
+                mosaic_size_v2=json_dict["base_mosaic_block_size"]["mosaic_size_v2"],
+                mosaic_size_v1_normal=json_dict["base_mosaic_block_size"]["mosaic_size_v1_normal"],
+                mosaic_size_v1_bounding=json_dict["base_mosaic_block_size"]["mosaic_size_v1_bounding"],
+            ),
+            json_dict["pad"],
+            json_dict["relative_nsfw_video_path"],
+            json_dict["relative_mask_video_path"],
+            json_dict.get("relative_mosaic_nsfw_video_path"),
+            json_dict.get("relative_mosaic_mask_video_path"),
+            MosaicMetadataV1(
+                mod=json_dict["mosaic"]["mod"],
+                rect_ratio=json_dict["mosaic"]["rect_ratio"],
+                mosaic_size=json_dict["mosaic"]["mosaic_size"],
+                feather_size=json_dict["mosaic"]["feather_size"],
+            ) if json_dict.get("mosaic") else None,
+            VisualQualityScoreV1(
+                json_dict["video_quality"]["aesthetic"],
+                json_dict["video_quality"]["technical"],
+                json_dict["video_quality"]["overall"],
+            ) if json_dict.get("video_quality") else None,
+            json_dict.get("watermark_detected"),
+            json_dict.get("nudenet_nsfw_detected"),
+            NudeNetNsfwClassDetectionsV1(
+                MALE_GENITALIA_EXPOSED=json_dict["nudenet_nsfw_detected_classes"]["MALE_GENITALIA_EXPOSED"],
+                FEMALE_GENITALIA_EXPOSED=json_dict["nudenet_nsfw_detected_classes"]["FEMALE_GENITALIA_EXPOSED"],
+            ) if json_dict.get("nudenet_nsfw_detected_classes") else None,
+            json_dict.get("censoring_detected"),
+        )
\ No newline at end of file
@@ -0,0 +1,155 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import concurrent.futures as concurrent_futures
+import logging
+import queue
+import threading
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+import torch
+from ultralytics.engine.results import Boxes as UltralyticsBoxes
+from ultralytics.utils import ops
+
+from lada import LOG_LEVEL
+from lada.datasetcreation.detectors.mosaic_classifier import MosaicClassifier
+from lada.datasetcreation.detectors.nudenet_nsfw_detector import NudeNetNsfwDetector
+from lada.datasetcreation.detectors.watermark_detector import WatermarkDetector
+from lada.utils import Image, Box, threading_utils
+from lada.utils.torch_letterbox import PyTorchLetterBox
+from lada.utils.ultralytics_utils import convert_yolo_detections
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=LOG_LEVEL)
+
+@dataclass
+class SceneAnalysis:
+    watermark_detected: Optional[bool] = None
+    nudenet_nsfw_detected: Optional[tuple[bool, bool, bool]] = None # nsfw, male, female
+    censoring_detected: Optional[bool] = None
+
+@dataclass
+class _SceneAnalysisRequest:
+    images: list[Image]
+    boxes: list[Optional[list[Box]]]
+    future: concurrent_futures.Future
+    letterboxed_images: dict[int, torch.Tensor] = field(default_factory=dict)
+
+class SceneAnalyzerScheduler:
+    """
+    Runs WatermarkDetector, NudeNetNsfwDetector and MosaicClassifier for scenes submitted by multiple SceneProcessor threads.
+
+    Frames are sampled and letterboxed once per scene and shared by all analyzers. Inference of each analyzer is batched
+    across all scenes pending at that time, and the model results of a scene are evaluated once for each of the requested box filters.
+    """
+    def __init__(self, watermark_detector: Optional[WatermarkDetector], nudenet_nsfw_detector: Optional[NudeNetNsfwDetector], censor_detector: Optional[MosaicClassifier],
+                 device, batch_size=16, imgsz=640, max_pending_scenes=8):
+        self.analyzers = {name: analyzer for name, analyzer in (('watermark_detected', watermark_detector),
+                                                                 ('nudenet_nsfw_detected', nudenet_nsfw_detector),
+                                                                 ('censoring_detected', censor_detector)) if analyzer is not None}
+        self.device = device
+        self.batch_size = batch_size
+        self.imgsz = imgsz
+        self.max_pending_scenes = max_pending_scenes
+        self.letterboxes: dict[tuple[int, int], PyTorchLetterBox] = {}
+        self.request_queue = queue.Queue()
+        self.worker_thread: threading.Thread | None = None
+        self.worker_thread_should_be_running = False
+
+    def start(self):
+        self.worker_thread_should_be_running = True
+        self.worker_thread = threading.Thread(target=self._worker, daemon=True)
+        self.worker_thread.start()
+
+    def stop(self):
+        logger.debug("SceneAnalyzerScheduler: stopping...")
+        self.worker_thread_should_be_running = False
+        threading_utils.put_closing_queue_marker(self.request_queue, "request_queue")
+        if self.worker_thread:
+            self.worker_thread.join()
+        self.worker_thread = None
+        while not self.request_queue.empty():
+            request = self.request_queue.get_nowait()
+            if request is not None:
+                request.future.cancel()
+        logger.debug("SceneAnalyzerScheduler: stopped")
+
+    def analyze(self, images: list[Image], boxes: list[Optional[list[Box]]]) -> concurrent_futures.Future:
+        """
+        Queues a scene for analysis. The returned future resolves to a list of SceneAnalysis, one for each entry of boxes.
+        Detections will only be considered if they overlap with the given box of the frame. Pass None to consider all detections.
+        """
+        future = concurrent_futures.Future()
+        self.request_queue.put(_SceneAnalysisRequest(images, boxes, future))
+        return future
+
+    def _letterbox(self, request: _SceneAnalysisRequest, idx: int) -> torch.Tensor:
+        letterboxed_image = request.letterboxed_images.get(idx)
+        if letterboxed_image is None:
+            image = request.images[idx]
+            shape = image.shape[:2]
+            if shape not in self.letterboxes:
+                # stride == imgsz pads every frame to a imgsz x imgsz square so frames of different scenes can be batched together
+                self.letterboxes[shape] = PyTorchLetterBox(self.imgsz, shape, stride=self.imgsz)
+            # images are BGR but ultralytics expects tensor inputs to be RGB.
+            # Normalized before letterboxing, the pad value of PyTorchLetterBox is meant for normalized images and would be truncated to 0 for uint8 images
+            rgb_image = torch.from_numpy(np.ascontiguousarray(image[..., ::-1])).permute(2, 0, 1).unsqueeze(0).float().div_(255.0)
+            letterboxed_image = self.letterboxes[shape](rgb_image).squeeze(0)
+            request.letterboxed_images[idx] = letterboxed_image
+        return letterboxed_image
+
+    def _predict(self, analyzer, samples: list[tuple[_SceneAnalysisRequest, int]]) -> list[list[tuple[float, int, Box]]]:
+        detections = []
+        for batch_start in range(0, len(samples), self.batch_size):
+            batch = samples[batch_start:batch_start + self.batch_size]
+            batch_tensor = torch.stack([self._letterbox(request, idx) for request, idx in batch]).to(self.device)
+            batch_prediction_results = analyzer.model.predict(source=batch_tensor, stream=False, verbose=False, device=self.device, conf=analyzer.min_confidence, imgsz=self.imgsz)
+            for (request, idx), results in zip(batch, batch_prediction_results):
+                # boxes are relative to the letterboxed image, scale them back to the original image
+                orig_shape = request.images[idx].shape[:2]
+                data = results.boxes.data.clone()
+                data[:, :4] = ops.scale_boxes(batch_tensor.shape[2:], data[:, :4], orig_shape)
+                detections.append(convert_yolo_detections(UltralyticsBoxes(data, orig_shape), orig_shape))
+        return detections
+
+    def _analyze(self, requests: list[_SceneAnalysisRequest]):
+        analyses = [[SceneAnalysis() for _ in request.boxes] for request in requests]
+        for name, analyzer in self.analyzers.items():
+            sample_indices = [analyzer.get_sample_indices(len(request.images)) for request in requests]
+            samples = [(request, idx) for request, indices in zip(requests, sample_indices) for idx in indices]
+            detections = self._predict(analyzer, samples)
+            offset = 0
+            for request, indices, request_analyses in zip(requests, sample_indices, analyses):
+                request_detections = detections[offset:offset + len(indices)]
+                offset += len(indices)
+                for boxes, analysis in zip(request.boxes, request_analyses):
+                    samples_boxes = [boxes[i] for i in indices] if boxes else None
+                    setattr(analysis, name, analyzer.evaluate(request_detections, samples_boxes))
+        for request, request_analyses in zip(requests, analyses):
+            request.letterboxed_images = None
+            request.future.set_result(request_analyses)
+
+    def _worker(self):
+        logger.debug("SceneAnalyzerScheduler: worker started")
+        while self.worker_thread_should_be_running:
+            request = self.request_queue.get()
+            if request is None:
+                break
+            requests = [request]
+            # batch all scenes which have been queued up while we were busy with the previous ones
+            while len(requests) < self.max_pending_scenes and not self.request_queue.empty():
+                request = self.request_queue.get_nowait()
+                if request is None:
+                    self.worker_thread_should_be_running = False
+                    break
+                requests.append(request)
+            try:
+                with torch.inference_mode():
+                    self._analyze(requests)
+            except Exception as e:
+                for request in requests:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+        logger.debug("SceneAnalyzerScheduler: worker stopped")
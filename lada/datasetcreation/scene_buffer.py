@@ -0,0 +1,54 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import tempfile
+
+import numpy as np
+
+from lada.utils import Image, Mask
+
+class SceneBuffer:
+    """
+    Storage for frames and masks of a scene.
+
+    Frames and masks are kept in RAM until ram_budget (in bytes) is used up. Following frames and masks are written
+    to memory-mapped temporary files so scenes can be longer than what would fit into memory.
+    append() returns the stored arrays (views into the memory-mapped file for spilled frames) so consumers can use them without copying.
+    Temporary files are deleted when the last view into them has been garbage collected.
+    """
+    def __init__(self, max_length: int, ram_budget: int | None, spill_dir: str | None = None):
+        self.max_length = max_length
+        self.ram_budget = ram_budget
+        self.spill_dir = spill_dir
+        self.ram_usage = 0
+        self.ram_frames_count = 0
+        self.spilled_frames_count = 0
+        self._spilled_frames: np.memmap | None = None
+        self._spilled_masks: np.memmap | None = None
+
+    def __len__(self):
+        return self.ram_frames_count + self.spilled_frames_count
+
+    def _create_memmap(self, shape: tuple, dtype) -> np.memmap:
+        # the file is unlinked right away (on Windows when it's closed) so it will be gone once the memory-mapping is released
+        with tempfile.TemporaryFile(dir=self.spill_dir) as f:
+            return np.memmap(f, dtype=dtype, mode='w+', shape=shape)
+
+    def append(self, frame: Image, mask: Mask) -> tuple[Image, Mask]:
+        assert len(self) < self.max_length
+        frame_size = frame.nbytes + mask.nbytes
+        if self._spilled_frames is None and (self.ram_budget is None or self.ram_usage + frame_size <= self.ram_budget):
+            self.ram_usage += frame_size
+            self.ram_frames_count += 1
+            return frame, mask
+
+        if self._spilled_frames is None:
+            # files are sparse, so sizing them for the remaining capacity does not allocate disk space for frames never written
+            capacity = self.max_length - self.ram_frames_count
+            self._spilled_frames = self._create_memmap((capacity, *frame.shape), frame.dtype)
+            self._spilled_masks = self._create_memmap((capacity, *mask.shape), mask.dtype)
+        idx = self.spilled_frames_count
+        self._spilled_frames[idx] = frame
+        self._spilled_masks[idx] = mask
+        self.spilled_frames_count += 1
+        return self._spilled_frames[idx], self._spilled_masks[idx]
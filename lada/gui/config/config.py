@@ -29,21 +29,29 @@ class PostExportAction(Enum):
 
 class Config(GObject.Object):
     _defaults = {
+        'adaptive_preview_quality': True,
         'color_scheme': ColorScheme.SYSTEM,
         'custom_ffmpeg_encoder_options': '',
         'device': 'cuda:0',
         'export_codec': 'libx264',
         'export_crf': 20,
         'export_directory': None,
+        'export_max_concurrent_exports': 2,
+        'export_memory_budget': 8192,
         'file_name_pattern': "{orig_file_name}.restored.mp4",
         'initial_view': 'preview',
         'max_clip_duration': 180,
+        'model_cache_size': 4096,
         'mosaic_detection_model': 'v3.1-fast',
         'mosaic_restoration_model': 'basicvsrpp-v1.2',
         'mute_audio': False,
         'post_export_action': PostExportAction.NONE,
         'post_export_custom_command': '',
         'preview_buffer_duration': 0,
+        'preview_cache_disk_size': 4096,
+        'preview_cache_size': 1024,
+        'preview_mosaic_scan': True,
+        'preview_pre_restoration': False,
         'seek_preview_enabled': True,
         'show_mosaic_detections': False,
         'temp_directory': tempfile.gettempdir(),
@@ -51,19 +59,27 @@ class Config(GObject.Object):
 
     def __init__(self, style_manager: Adw.StyleManager):
         super().__init__()
+        self._adaptive_preview_quality = self._defaults['adaptive_preview_quality']
         self._color_scheme = self._defaults['color_scheme']
         self._custom_ffmpeg_encoder_options = self._defaults['custom_ffmpeg_encoder_options']
         self._device = self._defaults['device']
         self._export_codec = self._defaults['export_codec']
         self._export_crf = self._defaults['export_crf']
         self._export_directory = self._defaults['export_directory']
+        self._export_max_concurrent_exports = self._defaults['export_max_concurrent_exports']
+        self._export_memory_budget = self._defaults['export_memory_budget']
         self._file_name_pattern = self._defaults['file_name_pattern']
         self._initial_view = self._defaults['initial_view']
         self._max_clip_duration: int = self._defaults['max_clip_duration']
+        self._model_cache_size = self._defaults['model_cache_size']
         self._mosaic_detection_model = self._defaults['mosaic_detection_model']
         self._mosaic_restoration_model = self._defaults['mosaic_restoration_model']
         self._mute_audio = self._defaults['mute_audio']
         self._preview_buffer_duration = self._defaults['preview_buffer_duration']
+        self._preview_cache_size = self._defaults['preview_cache_size']
+        self._preview_cache_disk_size = self._defaults['preview_cache_disk_size']
+        self._preview_mosaic_scan = self._defaults['preview_mosaic_scan']
+        self._preview_pre_restoration = self._defaults['preview_pre_restoration']
         self._seek_preview_enabled = self._defaults['seek_preview_enabled']
         self._show_mosaic_detections = self._defaults['show_mosaic_detections']
         self._post_export_action = self._defaults['post_export_action']
@@ -141,6 +157,61 @@ class Config(GObject.Object):
         self._preview_buffer_duration = value
         self.save()
 
+    @GObject.Property()
+    def preview_cache_size(self) -> int:
+        return int(self._preview_cache_size)
+
+    @preview_cache_size.setter
+    def preview_cache_size(self, value):
+        if value == self._preview_cache_size:
+            return
+        self._preview_cache_size = value
+        self.save()
+
+    @GObject.Property()
+    def preview_cache_disk_size(self) -> int:
+        return int(self._preview_cache_disk_size)
+
+    @preview_cache_disk_size.setter
+    def preview_cache_disk_size(self, value):
+        if value == self._preview_cache_disk_size:
+            return
+        self._preview_cache_disk_size = value
+        self.save()
+
+    @GObject.Property()
+    def adaptive_preview_quality(self):
+        return self._adaptive_preview_quality
+
+    @adaptive_preview_quality.setter
+    def adaptive_preview_quality(self, value):
+        if value == self._adaptive_preview_quality:
+            return
+        self._adaptive_preview_quality = value
+        self.save()
+
+    @GObject.Property()
+    def preview_mosaic_scan(self):
+        return self._preview_mosaic_scan
+
+    @preview_mosaic_scan.setter
+    def preview_mosaic_scan(self, value):
+        if value == self._preview_mosaic_scan:
+            return
+        self._preview_mosaic_scan = value
+        self.save()
+
+    @GObject.Property()
+    def preview_pre_restoration(self):
+        return self._preview_pre_restoration
+
+    @preview_pre_restoration.setter
+    def preview_pre_restoration(self, value):
+        if value == self._preview_pre_restoration:
+            return
+        self._preview_pre_restoration = value
+        self.save()
+
     @GObject.Property()
     def max_clip_duration(self) -> int:
         return int(self._max_clip_duration)
@@ -152,6 +223,17 @@ class Config(GObject.Object):
         self._max_clip_duration = value
         self.save()
 
+    @GObject.Property()
+    def model_cache_size(self) -> int:
+        return int(self._model_cache_size)
+
+    @model_cache_size.setter
+    def model_cache_size(self, value):
+        if value == self._model_cache_size:
+            return
+        self._model_cache_size = value
+        self.save()
+
     @GObject.Property()
     def mute_audio(self):
         return self._mute_audio
@@ -185,6 +267,28 @@ class Config(GObject.Object):
         self._export_codec = value
         self.save()
 
+    @GObject.Property()
+    def export_max_concurrent_exports(self) -> int:
+        return int(self._export_max_concurrent_exports)
+
+    @export_max_concurrent_exports.setter
+    def export_max_concurrent_exports(self, value):
+        if value == self._export_max_concurrent_exports:
+            return
+        self._export_max_concurrent_exports = value
+        self.save()
+
+    @GObject.Property()
+    def export_memory_budget(self) -> int:
+        return int(self._export_memory_budget)
+
+    @export_memory_budget.setter
+    def export_memory_budget(self, value):
+        if value == self._export_memory_budget:
+            return
+        self._export_memory_budget = value
+        self.save()
+
     @GObject.Property()
     def color_scheme(self):
         return self._color_scheme
@@ -306,20 +410,28 @@ class Config(GObject.Object):
         self._update_style(self._color_scheme)
 
     def reset_to_default_values(self):
+        self.adaptive_preview_quality = self._defaults['adaptive_preview_quality']
         self.color_scheme = self._defaults['color_scheme']
         self.custom_ffmpeg_encoder_options = self._defaults['custom_ffmpeg_encoder_options']
         self.export_codec = self._defaults['export_codec']
         self.export_crf = self._defaults['export_crf']
         self.export_directory = self._defaults['export_directory']
+        self.export_max_concurrent_exports = self._defaults['export_max_concurrent_exports']
+        self.export_memory_budget = self._defaults['export_memory_budget']
         self.file_name_pattern = self._defaults['file_name_pattern']
         self.initial_view = self._defaults['initial_view']
         self.max_clip_duration = self._defaults['max_clip_duration']
+        self.model_cache_size = self._defaults['model_cache_size']
         self.mosaic_detection_model = self._defaults['mosaic_detection_model']
         self.mosaic_restoration_model = self._defaults['mosaic_restoration_model']
         self.mute_audio = self._defaults['mute_audio']
         self.post_export_action = self._defaults['post_export_action']
         self.post_export_custom_command = self._defaults['post_export_custom_command']
         self.preview_buffer_duration = self._defaults['preview_buffer_duration']
+        self.preview_cache_size = self._defaults['preview_cache_size']
+        self.preview_cache_disk_size = self._defaults['preview_cache_disk_size']
+        self.preview_mosaic_scan = self._defaults['preview_mosaic_scan']
+        self.preview_pre_restoration = self._defaults['preview_pre_restoration']
         self.seek_preview_enabled = self._defaults['seek_preview_enabled']
         self.show_mosaic_detections = self._defaults['show_mosaic_detections']
         self.temp_directory = self._defaults['temp_directory']
@@ -335,21 +447,29 @@ class Config(GObject.Object):
 
     def _as_dict(self) -> dict:
         return {
+            'adaptive_preview_quality': self._adaptive_preview_quality,
             'color_scheme': self._color_scheme.value,
             'custom_ffmpeg_encoder_options': self._custom_ffmpeg_encoder_options,
             'device': self._device,
             'export_codec': self._export_codec,
             'export_crf': self._export_crf,
             'export_directory': self._export_directory,
+            'export_max_concurrent_exports': self._export_max_concurrent_exports,
+            'export_memory_budget': self._export_memory_budget,
             'file_name_pattern': self._file_name_pattern,
             'initial_view': self._initial_view,
             'max_clip_duration': self._max_clip_duration,
+            'model_cache_size': self._model_cache_size,
             'mosaic_detection_model': self._mosaic_detection_model,
             'mosaic_restoration_model': self._mosaic_restoration_model,
             'mute_audio': self._mute_audio,
             'post_export_action': self._post_export_action.value,
             'post_export_custom_command': self._post_export_custom_command,
             'preview_buffer_duration': self._preview_buffer_duration,
+            'preview_cache_disk_size': self._preview_cache_disk_size,
+            'preview_cache_size': self._preview_cache_size,
+            'preview_mosaic_scan': self._preview_mosaic_scan,
+            'preview_pre_restoration': self._preview_pre_restoration,
             'seek_preview_enabled': self._seek_preview_enabled,
             'show_mosaic_detections': self._show_mosaic_detections,
             'temp_directory': self._temp_directory,
@@ -24,10 +24,18 @@ class ConfigSidebar(Gtk.Box):
     combo_row_mosaic_removal_models = Gtk.Template.Child()
     combo_row_mosaic_detection_models = Gtk.Template.Child()
     spin_row_export_crf = Gtk.Template.Child()
+    spin_row_export_max_concurrent_exports = Gtk.Template.Child()
+    spin_row_export_memory_budget = Gtk.Template.Child()
     combo_row_export_codec = Gtk.Template.Child()
     spin_row_preview_buffer_duration = Gtk.Template.Child()
+    spin_row_preview_cache_size = Gtk.Template.Child()
+    spin_row_preview_cache_disk_size = Gtk.Template.Child()
+    switch_row_preview_pre_restoration = Gtk.Template.Child()
+    switch_row_preview_mosaic_scan = Gtk.Template.Child()
     spin_row_clip_max_duration = Gtk.Template.Child()
+    spin_row_model_cache_size = Gtk.Template.Child()
     switch_row_mute_audio = Gtk.Template.Child()
+    switch_row_adaptive_preview_quality = Gtk.Template.Child()
     preferences_page = Gtk.Template.Child()
     light_color_scheme_button = Gtk.Template.Child()
     dark_color_scheme_button = Gtk.Template.Child()
@@ -99,10 +107,18 @@ class ConfigSidebar(Gtk.Box):
         self.combo_row_export_codec.set_selected(idx)
 
         self.spin_row_export_crf.set_property('value', config.export_crf)
+        self.spin_row_export_max_concurrent_exports.set_value(config.export_max_concurrent_exports)
+        self.spin_row_export_memory_budget.set_value(config.export_memory_budget)
 
         self.spin_row_preview_buffer_duration.set_value(config.preview_buffer_duration)
+        self.spin_row_preview_cache_size.set_value(config.preview_cache_size)
+        self.spin_row_preview_cache_disk_size.set_value(config.preview_cache_disk_size)
+        self.switch_row_preview_pre_restoration.set_active(config.preview_pre_restoration)
+        self.switch_row_preview_mosaic_scan.set_active(config.preview_mosaic_scan)
         self.spin_row_clip_max_duration.set_value(config.max_clip_duration)
+        self.spin_row_model_cache_size.set_value(config.model_cache_size)
         self.switch_row_mute_audio.set_active(config.mute_audio)
+        self.switch_row_adaptive_preview_quality.set_active(config.adaptive_preview_quality)
 
         self.switch_row_seek_preview.set_active(config.seek_preview_enabled)
 
@@ -192,6 +208,16 @@ class ConfigSidebar(Gtk.Box):
     def spin_row_preview_export_crf_selected_callback(self, spin_row, value):
         self._config.export_crf = spin_row.get_property("value")
 
+    @Gtk.Template.Callback()
+    @skip_if_uninitialized
+    def spin_row_export_max_concurrent_exports_selected_callback(self, spin_row, value):
+        self._config.export_max_concurrent_exports = int(spin_row.get_property("value"))
+
+    @Gtk.Template.Callback()
+    @skip_if_uninitialized
+    def spin_row_export_memory_budget_selected_callback(self, spin_row, value):
+        self._config.export_memory_budget = int(spin_row.get_property("value"))
+
     @Gtk.Template.Callback()
     @skip_if_uninitialized
     def combo_row_gpu_selected_callback(self, combo_row, value):
@@ -206,16 +232,46 @@ class ConfigSidebar(Gtk.Box):
     def spin_row_preview_buffer_duration_selected_callback(self, spin_row, value):
         self._config.preview_buffer_duration = spin_row.get_property("value")
 
+    @Gtk.Template.Callback()
+    @skip_if_uninitialized
+    def spin_row_preview_cache_size_selected_callback(self, spin_row, value):
+        self._config.preview_cache_size = int(spin_row.get_property("value"))
+
+    @Gtk.Template.Callback()
+    @skip_if_uninitialized
+    def spin_row_preview_cache_disk_size_selected_callback(self, spin_row, value):
+        self._config.preview_cache_disk_size = int(spin_row.get_property("value"))
+
+    @Gtk.Template.Callback()
+    @skip_if_uninitialized
+    def switch_row_preview_pre_restoration_active_callback(self, switch_row, active):
+        self._config.preview_pre_restoration = switch_row.get_property("active")
+
+    @Gtk.Template.Callback()
+    @skip_if_uninitialized
+    def switch_row_preview_mosaic_scan_active_callback(self, switch_row, active):
+        self._config.preview_mosaic_scan = switch_row.get_property("active")
+
     @Gtk.Template.Callback()
     @skip_if_uninitialized
     def spin_row_clip_max_duration_selected_callback(self, spin_row, value):
         self._config.max_clip_duration = int(spin_row.get_property("value"))
 
+    @Gtk.Template.Callback()
+    @skip_if_uninitialized
+    def spin_row_model_cache_size_selected_callback(self, spin_row, value):
+        self._config.model_cache_size = int(spin_row.get_property("value"))
+
     @Gtk.Template.Callback()
     @skip_if_uninitialized
     def switch_row_mute_audio_active_callback(self, switch_row, active):
         self._config.mute_audio = switch_row.get_property("active")
 
+    @Gtk.Template.Callback()
+    @skip_if_uninitialized
+    def switch_row_adaptive_preview_quality_active_callback(self, switch_row, active):
+        self._config.adaptive_preview_quality = switch_row.get_property("active")
+
     @Gtk.Template.Callback()
     @skip_if_uninitialized
     def button_config_reset_callback(self, button_clicked):
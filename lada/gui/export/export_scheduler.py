@@ -0,0 +1,62 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import logging
+from typing import Hashable
+
+from lada import LOG_LEVEL
+from lada.utils import VideoMetadata
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=LOG_LEVEL)
+
+# FrameRestorer limits each of frame_restoration_queue, mosaic_clip_queue and restored_clip_queue to approx 512MB
+_FRAME_RESTORER_QUEUES_BYTES = 3 * 512 * 1024 * 1024
+# frame_feeder_queue and inference_queue of MosaicDetector hold up to 8 batches of 4 frames each
+_MOSAIC_DETECTOR_QUEUED_FRAMES = 2 * 8 * 4
+
+def estimate_export_memory_bytes(video_metadata: VideoMetadata, max_clip_length: int) -> int:
+    """
+    Upper bound of the memory used by the frames an export keeps in flight: full FrameRestorer queues, frames queued
+    for detection and the frames waiting for their clips to be restored.
+    """
+    frame_bytes = video_metadata.video_width * video_metadata.video_height * 3
+    return _FRAME_RESTORER_QUEUES_BYTES + (_MOSAIC_DETECTOR_QUEUED_FRAMES + max_clip_length) * frame_bytes
+
+class ExportScheduler:
+    """
+    Decides whether another export of the queue can start while others are running.
+
+    Each running export takes one of max_slots compute slots and reserves its estimated memory usage from the memory budget.
+    If nothing is running an export will always be started, even if its estimate exceeds the budget.
+    Not thread-safe, meant to be used from the main loop only.
+    """
+    def __init__(self, max_slots: int, memory_budget_bytes: int):
+        self.max_slots = max_slots
+        self.memory_budget_bytes = memory_budget_bytes
+        self.reservations: dict[Hashable, int] = {}
+
+    def set_limits(self, max_slots: int, memory_budget_bytes: int):
+        # applies to exports started from now on, running exports keep their slots
+        self.max_slots = max_slots
+        self.memory_budget_bytes = memory_budget_bytes
+
+    def try_acquire(self, key: Hashable, memory_bytes: int) -> bool:
+        assert key not in self.reservations, "Illegal State: Tried to acquire an export slot twice"
+        if len(self.reservations) > 0:
+            if len(self.reservations) >= self.max_slots:
+                return False
+            if self.get_reserved_memory_bytes() + memory_bytes > self.memory_budget_bytes:
+                logger.debug(f"export scheduler: not starting another export, estimated memory usage of {memory_bytes // (1024 * 1024)}MB would exceed budget")
+                return False
+        self.reservations[key] = memory_bytes
+        return True
+
+    def release(self, key: Hashable):
+        self.reservations.pop(key, None)
+
+    def get_reserved_memory_bytes(self) -> int:
+        return sum(self.reservations.values())
+
+    def is_idle(self) -> bool:
+        return len(self.reservations) == 0
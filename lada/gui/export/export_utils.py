@@ -6,9 +6,10 @@ from fractions import Fraction
 
 from gi.repository import Gtk, Adw, Gio
 
-from lada.gui.export.export_item_data import ExportItemDataProgress, ExportItemState
+from lada.gui.export.export_item_data import ExportItemData, ExportItemDataProgress, ExportItemState
 from lada.utils import VideoMetadata
 from lada.utils import video_utils
+from lada.utils.segmented_video_writer import SegmentedVideoWriter
 
 MIN_VISIBLE_PROGRESS_FRACTION = 0.01
 
@@ -99,10 +100,10 @@ def get_progressbar_text(state: ExportItemState, progress: ExportItemDataProgres
     return text
 
 class ProgressCalculator:
-    def __init__(self, video_metadata: VideoMetadata):
+    def __init__(self, video_metadata: VideoMetadata, frames_done=0):
         self.frame_processing_durations_buffer = []
         self.time_done_s = 0
-        self.frames_done = 0
+        self.frames_done = frames_done
         self.video_metadata = video_metadata
         self.frame_processing_durations_buffer_min_len = min(video_metadata.frames_count - 1, int(video_metadata.video_fps * 15))
         self.frame_processing_durations_buffer_max_len = min(video_metadata.frames_count - 1, int(video_metadata.video_fps * 120))
@@ -138,4 +139,18 @@ class ResumeInformation:
 
     def get_resume_timestamp_ns(self):
         SECOND = 1_000_000_000
-        return int((self.frame_pts * self.time_base) * SECOND)
\ No newline at end of file
+        return int((self.frame_pts * self.time_base) * SECOND)
+
+
+@dataclass
+class ExportJob:
+    """
+    State of an export of a single queued file while it's running or paused. Flags are set by the main loop and read by its exporter thread.
+    """
+    item: ExportItemData
+    memory_bytes: int
+    stop_requested: bool = False
+    pause_requested: bool = False
+    resume_info: ResumeInformation | None = None
+    video_writer: SegmentedVideoWriter | None = None
+    progress_calculator: ProgressCalculator | None = None
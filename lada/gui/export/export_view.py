@@ -17,12 +17,14 @@ from lada.gui.config.no_gpu_banner import NoGpuBanner
 from lada.gui.export import export_utils
 from lada.gui.export.export_item_data import ExportItemData, ExportItemDataProgress, ExportItemState
 from lada.gui.export.export_multiple_files_page import ExportMultipleFilesPage
+from lada.gui.export.export_scheduler import ExportScheduler, estimate_export_memory_bytes
 from lada.gui.export.export_single_file_page import ExportSingleFileStatusPage
-from lada.gui.export.export_utils import ResumeInformation
+from lada.gui.export.export_utils import ExportJob, ResumeInformation
 from lada.gui.export.shutdown_manager import ShutdownManager, ShutdownError
 from lada.gui.export.spinner_button import SpinnerButton
 from lada.gui.frame_restorer_provider import FrameRestorerOptions, FRAME_RESTORER_PROVIDER
 from lada.utils import audio_utils, video_utils
+from lada.utils.segmented_video_writer import SegmentedVideoWriter, get_temp_output_path
 
 here = pathlib.Path(__file__).parent.resolve()
 
@@ -50,13 +52,12 @@ class ExportView(Gtk.Widget):
 
         self._view_stack: Adw.ViewStack | None = None
         self._config: Config | None = None
-        self.in_progress_idx: int | None = None
         self.single_file = True
         self.stop_requested = False
         self.pause_requested = False
-        self.resume_info: ResumeInformation | None = None
-        self.video_writer: video_utils.VideoWriter | None = None
-        self.progress_calculator: export_utils.ProgressCalculator | None = None
+        # running and paused exports, in the order they have been started
+        self.jobs: list[ExportJob] = []
+        self.scheduler = ExportScheduler(max_slots=1, memory_budget_bytes=0)
 
         self.connect("video-export-finished", self.on_video_export_finished)
         self.connect("video-export-failed", self.on_video_export_failed)
@@ -136,36 +137,39 @@ class ExportView(Gtk.Widget):
         if self.single_file:
             return
         count_queued_items = sum([item.state == ExportItemState.QUEUED for item in self.model])
-        is_in_progress = self.in_progress_idx is not None
-        is_paused = self.resume_info is not None
+        is_in_progress = len(self.jobs) > 0
+        is_paused = self.is_paused()
         is_any_queued_items = count_queued_items > 0
         self.button_start_export.set_visible(not is_in_progress and is_any_queued_items)
         self.button_pause_export.set_visible(is_in_progress and not is_paused)
         self.button_resume_export.set_visible(is_paused)
         self.button_cancel_export.set_visible(is_in_progress)
 
-    @GObject.Signal(name="video-export-finished")
-    def video_export_finished_signal(self):
+    def is_paused(self) -> bool:
+        return len(self.jobs) > 0 and all(job.item.state == ExportItemState.PAUSED for job in self.jobs)
+
+    @GObject.Signal(name="video-export-finished", arg_types=(ExportItemData,))
+    def video_export_finished_signal(self, item: ExportItemData):
         pass
 
-    @GObject.Signal(name="video-export-failed", arg_types=(GObject.TYPE_STRING,))
-    def video_export_failed_signal(self, error_message: str):
+    @GObject.Signal(name="video-export-failed", arg_types=(ExportItemData, GObject.TYPE_STRING,))
+    def video_export_failed_signal(self, item: ExportItemData, error_message: str):
         pass
 
-    @GObject.Signal(name="video-export-paused",)
-    def video_export_paused_signal(self):
+    @GObject.Signal(name="video-export-paused", arg_types=(ExportItemData,))
+    def video_export_paused_signal(self, item: ExportItemData):
         pass
 
-    @GObject.Signal(name="video-export-resumed",)
-    def video_export_resumed_signal(self):
+    @GObject.Signal(name="video-export-resumed", arg_types=(ExportItemData,))
+    def video_export_resumed_signal(self, item: ExportItemData):
         pass
 
-    @GObject.Signal(name="video-export-stopped",)
-    def video_export_stopped_signal(self):
+    @GObject.Signal(name="video-export-stopped", arg_types=(ExportItemData,))
+    def video_export_stopped_signal(self, item: ExportItemData):
         pass
 
-    @GObject.Signal(name="video-export-progress", arg_types=(ExportItemDataProgress,))
-    def video_export_progress_signal(self, progress):
+    @GObject.Signal(name="video-export-progress", arg_types=(ExportItemData, ExportItemDataProgress,))
+    def video_export_progress_signal(self, item: ExportItemData, progress):
         pass
 
     @GObject.Signal(name="video-export-requested")
@@ -203,26 +207,36 @@ class ExportView(Gtk.Widget):
         self.button_pause_export.set_sensitive(False)
         self.button_cancel_export.set_sensitive(False)
         self.button_cancel_export.set_spinner_visible(True)
+        for job in list(self.jobs):
+            job.stop_requested = True
+            if job.item.state == ExportItemState.PAUSED:
+                # there is no exporter thread of a paused export which could notice the request
+                if job.video_writer:
+                    job.video_writer.abort()
+                self.emit('video-export-stopped', job.item)
 
     @Gtk.Template.Callback()
     def on_button_pause_export_clicked(self, button_clicked):
-        assert self.resume_info is None
+        assert not self.is_paused()
         self.pause_requested = True
+        for job in self.jobs:
+            job.pause_requested = True
         self.button_pause_export.set_sensitive(False)
         self.button_pause_export.set_spinner_visible(True)
         self.button_cancel_export.set_sensitive(False)
 
     @Gtk.Template.Callback()
     def on_button_resume_export_clicked(self, button_clicked):
-        assert self.resume_info is not None
+        assert self.is_paused()
         self.button_resume_export.set_sensitive(False)
         self.button_resume_export.set_spinner_visible(True)
         self.button_cancel_export.set_sensitive(False)
 
         self.pause_requested = False
-        assert self.in_progress_idx is not None
-        item = self.model[self.in_progress_idx]
-        self._start_export(item.original_file, item.restored_file)
+        for job in self.jobs:
+            assert job.resume_info is not None
+            job.pause_requested = False
+            self._start_export(job)
 
     def on_show_error_requested(self, obj, idx):
         model_item = self.model[idx]
@@ -252,128 +266,150 @@ class ExportView(Gtk.Widget):
                 return idx
         return None
 
+    def get_item_idx(self, item: ExportItemData) -> int:
+        found, idx = self.model.find(item)
+        assert found
+        return idx
+
+    def get_job(self, item: ExportItemData) -> ExportJob:
+        return next(job for job in self.jobs if job.item == item)
+
+    def schedule_exports(self):
+        # limits could have been changed via sidebar since the last export
+        self.scheduler.set_limits(self._config.export_max_concurrent_exports, self._config.export_memory_budget * 1024 * 1024)
+        for item in self.model:
+            if item.state != ExportItemState.QUEUED:
+                continue
+            video_metadata = video_utils.get_video_meta_data(item.original_file.get_path())
+            memory_bytes = estimate_export_memory_bytes(video_metadata, self._config.max_clip_duration)
+            if not self.scheduler.try_acquire(item, memory_bytes):
+                # keep queue order, later items will not overtake this one
+                break
+            job = ExportJob(item, memory_bytes)
+            self.jobs.append(job)
+            self._start_export(job)
+
     def continue_next_file(self):
-        next_idx = self.get_next_queued_item_idx()
-        if next_idx is None:
-            # done, all queued items processed
+        if not self.stop_requested and not self.pause_requested:
+            self.schedule_exports()
+
+        if self.pause_requested and self.is_paused():
+            # all running exports reached their pause position
+            self.pause_requested = False
+            self.button_pause_export.set_sensitive(True)
+            self.button_pause_export.set_spinner_visible(False)
+            self.button_cancel_export.set_sensitive(True)
+
+        if len(self.jobs) == 0:
             self.view_switcher.set_sensitive(True)
             self.config_sidebar.set_property("disabled", False)
-            self.in_progress_idx = None
-            self.update_export_buttons()
-            self.execute_post_export_action()
-        else:
-            # continue, queued items remaining
-            self._start_export(self.model[next_idx].original_file, self.model[next_idx].restored_file)
+            if self.stop_requested:
+                self.stop_requested = False
+                self.button_start_export.set_sensitive(True)
+                self.button_cancel_export.set_sensitive(True)
+                self.button_cancel_export.set_spinner_visible(False)
+                self.button_pause_export.set_sensitive(True)
+            elif self.pause_requested:
+                # all exports finished before they could be paused, remaining queued items can be started again
+                self.pause_requested = False
+                self.button_pause_export.set_sensitive(True)
+                self.button_pause_export.set_spinner_visible(False)
+                self.button_cancel_export.set_sensitive(True)
+            else:
+                # done, all queued items processed
+                self.update_export_buttons()
+                self.execute_post_export_action()
+                return
+        self.update_export_buttons()
 
-    def show_video_export_started(self, save_file: Gio.File):
+    def _finish_job(self, job: ExportJob):
+        self.jobs.remove(job)
+        self.scheduler.release(job.item)
+        self.continue_next_file()
+
+    def show_video_export_started(self, job: ExportJob):
         self.view_switcher.set_sensitive(False)
         self.config_sidebar.set_property("disabled", True)
 
-        idx = self.get_next_queued_item_idx()
-        if idx is None:
-            return
-
-        self.in_progress_idx = idx
+        idx = self.get_item_idx(job.item)
+        job.item.state = ExportItemState.PROCESSING
         self.update_export_buttons()
 
-        model_item = self.model[idx]
-        model_item.state = ExportItemState.PROCESSING
-
         if self.single_file:
-            self.single_file_page.show_video_export_started(save_file)
+            self.single_file_page.show_video_export_started(job.item.restored_file)
         self.multiple_files_page.show_video_export_started(idx)
 
-    def on_video_export_finished(self, obj):
-        assert self.in_progress_idx is not None
-
-        model_item = self.model[self.in_progress_idx]
-        model_item.progress.complete()
-        model_item.state = ExportItemState.FINISHED
+    def on_video_export_finished(self, obj, item: ExportItemData):
+        idx = self.get_item_idx(item)
+        item.progress.complete()
+        item.state = ExportItemState.FINISHED
 
         if self.single_file:
             self.single_file_page.on_video_export_finished()
-        self.multiple_files_page.on_video_export_finished(self.in_progress_idx)
+        self.multiple_files_page.on_video_export_finished(idx)
 
-        self.continue_next_file()
+        self._finish_job(self.get_job(item))
 
-    def on_video_export_progress(self, obj, progress: ExportItemDataProgress):
-        if self.in_progress_idx is None:
+    def on_video_export_progress(self, obj, item: ExportItemData, progress: ExportItemDataProgress):
+        if item.state != ExportItemState.PROCESSING:
             return
 
-        model_item = self.model[self.in_progress_idx]
-        model_item.progress = progress
+        idx = self.get_item_idx(item)
+        item.progress = progress
 
         if self.single_file:
             self.single_file_page.on_video_export_progress(progress)
-        self.multiple_files_page.on_video_export_progress(self.in_progress_idx, progress)
-
-    def on_video_export_stopped(self, obj):
-        assert self.in_progress_idx is not None
+        self.multiple_files_page.on_video_export_progress(idx, progress)
 
-        model_item = self.model[self.in_progress_idx]
-        model_item.state = ExportItemState.QUEUED
-        model_item.progress = ExportItemDataProgress()
+    def on_video_export_stopped(self, obj, item: ExportItemData):
+        idx = self.get_item_idx(item)
+        item.state = ExportItemState.QUEUED
+        item.progress = ExportItemDataProgress()
 
         if self.single_file:
             self.single_file_page.on_video_export_stopped()
-        self.multiple_files_page.on_video_export_stopped(self.in_progress_idx)
-
-        self.in_progress_idx = None
-        self.stop_requested = False
-        self.update_export_buttons()
-        self.view_switcher.set_sensitive(True)
-        self.config_sidebar.set_property("disabled", False)
-        self.button_start_export.set_sensitive(True)
-        self.button_cancel_export.set_sensitive(True)
-        self.button_cancel_export.set_spinner_visible(False)
-        self.button_pause_export.set_sensitive(True)
+        self.multiple_files_page.on_video_export_stopped(idx)
 
-    def on_video_export_paused(self, obj):
-        assert self.in_progress_idx is not None
+        self._finish_job(self.get_job(item))
 
-        model_item = self.model[self.in_progress_idx]
-        model_item.state = ExportItemState.PAUSED
+    def on_video_export_paused(self, obj, item: ExportItemData):
+        idx = self.get_item_idx(item)
+        item.state = ExportItemState.PAUSED
 
         if self.single_file:
             self.single_file_page.on_video_export_paused()
-        self.multiple_files_page.on_video_export_paused(self.in_progress_idx)
+        self.multiple_files_page.on_video_export_paused(idx)
 
-        self.update_export_buttons()
-        self.button_pause_export.set_sensitive(True)
-        self.button_pause_export.set_spinner_visible(False)
-        self.button_cancel_export.set_sensitive(True)
-        self.pause_requested = False
-
-    def on_video_export_resumed(self, obj):
-        assert self.in_progress_idx is not None
+        # paused exports keep their slot
+        self.continue_next_file()
 
-        model_item = self.model[self.in_progress_idx]
-        assert model_item.state == ExportItemState.PAUSED
-        model_item.state = ExportItemState.PROCESSING
+    def on_video_export_resumed(self, obj, item: ExportItemData):
+        idx = self.get_item_idx(item)
+        assert item.state == ExportItemState.PAUSED
+        item.state = ExportItemState.PROCESSING
 
         if self.single_file:
             self.single_file_page.on_video_export_resumed()
-        self.multiple_files_page.on_video_export_resumed(self.in_progress_idx)
+        self.multiple_files_page.on_video_export_resumed(idx)
 
+        if not any(job.item.state == ExportItemState.PAUSED for job in self.jobs):
+            self.button_resume_export.set_sensitive(True)
+            self.button_resume_export.set_spinner_visible(False)
+            self.button_cancel_export.set_sensitive(True)
         self.update_export_buttons()
-        self.button_resume_export.set_sensitive(True)
-        self.button_resume_export.set_spinner_visible(False)
-        self.button_cancel_export.set_sensitive(True)
-
-    def on_video_export_failed(self, obj, error_message):
-        assert self.in_progress_idx is not None
 
-        model_item = self.model[self.in_progress_idx]
-        model_item.state = ExportItemState.FAILED
-        model_item.error_details = error_message
+    def on_video_export_failed(self, obj, item: ExportItemData, error_message):
+        idx = self.get_item_idx(item)
+        item.state = ExportItemState.FAILED
+        item.error_details = error_message
 
         if self.single_file:
             self.single_file_page.on_video_export_failed()
-        self.multiple_files_page.on_video_export_failed(self.in_progress_idx)
+        self.multiple_files_page.on_video_export_failed(idx)
 
-        export_utils.open_error_dialog(self, model_item.original_file.get_basename(), error_message)
+        export_utils.open_error_dialog(self, item.original_file.get_basename(), error_message)
 
-        self.continue_next_file()
+        self._finish_job(self.get_job(item))
 
     def start_export(self, restore_directory_or_file: Gio.File):
         # Update initial guessed output restore directory/file now that the user has provided it via file/dir picker dialog
@@ -394,105 +430,134 @@ class ExportView(Gtk.Widget):
                     restored_files.append(restored_file)
             self.multiple_files_page.on_video_export_started(restored_files)
 
-        item = self.model[self.get_next_queued_item_idx()]
-        self._start_export(item.original_file, item.restored_file)
-
-    def _start_export(self, source_file: Gio.File, restore_file: Gio.File):
-        assert os.path.isfile(source_file.get_path())
-        if not self.resume_info:
-            self.show_video_export_started(restore_file)
-
-        def run_export():
-            frame_restorer_options = FrameRestorerOptions(self._config.mosaic_restoration_model, self._config.mosaic_detection_model, video_utils.get_video_meta_data(source_file.get_path()), self._config.device, self._config.max_clip_duration, False, False)
-            video_metadata = frame_restorer_options.video_metadata
-            frame_restorer_provider = FRAME_RESTORER_PROVIDER
-            frame_restorer_provider.init(frame_restorer_options)
-            frame_restorer = frame_restorer_provider.get()
-            restore_file_path = restore_file.get_path()
-
-            progress_update_step_size = 100
-            success = True
-            temp_dir = self._config.temp_directory
-            video_tmp_file_output_path = os.path.join(temp_dir, f"{os.path.basename(os.path.splitext(restore_file_path)[0])}.tmp{os.path.splitext(restore_file_path)[1]}")
-            try:
-                if self.resume_info:
-                    start_ns = self.resume_info.get_resume_timestamp_ns()
-                    start_frame_num = self.resume_info.frame_num
-                    logger.info(f"Resume requested: Starting FrameRestorer at timestamp {start_ns}ns")
-                else:
-                    start_ns = 0
-                    start_frame_num = 0
-                    self.video_writer = video_utils.VideoWriter(
-                        video_tmp_file_output_path, video_metadata.video_width,
-                        video_metadata.video_height, video_metadata.video_fps_exact,
-                        self._config.export_codec, time_base=video_metadata.time_base,
-                        crf=self._config.export_crf, custom_encoder_options=self._config.custom_ffmpeg_encoder_options)
-                    self.progress_calculator = export_utils.ProgressCalculator(video_metadata)
+        self.schedule_exports()
+
+    def _get_video_tmp_file_output_path(self, job: ExportJob) -> str:
+        return get_temp_output_path(job.item.restored_file.get_path(), self._config.temp_directory)
 
+    def _remove_video_tmp_file(self, job: ExportJob):
+        video_tmp_file_output_path = self._get_video_tmp_file_output_path(job)
+        if os.path.exists(video_tmp_file_output_path):
+            os.remove(video_tmp_file_output_path)
+
+    def _start_export(self, job: ExportJob):
+        assert os.path.isfile(job.item.original_file.get_path())
+        if not job.resume_info:
+            self.show_video_export_started(job)
+
+        exporter_thread = threading.Thread(target=self._run_export, args=(job,), daemon=True)
+        exporter_thread.start()
+
+    def _run_export(self, job: ExportJob):
+        source_file = job.item.original_file
+        restore_file_path = job.item.restored_file.get_path()
+        frame_restorer_options = FrameRestorerOptions(self._config.mosaic_restoration_model, self._config.mosaic_detection_model, video_utils.get_video_meta_data(source_file.get_path()), self._config.device, self._config.max_clip_duration, False, False)
+        video_metadata = frame_restorer_options.video_metadata
+        frame_restorer = None
+
+        progress_update_step_size = 100
+        success = True
+        paused = False
+        error_message: str | None = None
+        video_tmp_file_output_path = self._get_video_tmp_file_output_path(job)
+        try:
+            if job.resume_info:
+                start_ns = job.resume_info.get_resume_timestamp_ns()
+                start_frame_num = job.resume_info.frame_num
+                logger.info(f"Resume requested: Starting FrameRestorer at timestamp {start_ns}ns")
+            else:
+                # continues at the last completed segment if a previous export of this file got interrupted, e.g. by a crash
+                resume_settings = dict(mosaic_restoration_model=self._config.mosaic_restoration_model, mosaic_detection_model=self._config.mosaic_detection_model,
+                                       max_clip_length=self._config.max_clip_duration, device=self._config.device)
+                job.video_writer = SegmentedVideoWriter(
+                    video_metadata, restore_file_path, self._config.export_codec, crf=self._config.export_crf,
+                    custom_encoder_options=self._config.custom_ffmpeg_encoder_options, settings=resume_settings)
+                start_ns = job.video_writer.get_resume_timestamp_ns()
+                start_frame_num = job.video_writer.get_resume_frame_num()
+                if start_ns > 0:
+                    logger.info(f"Continuing interrupted export of {source_file.get_path()} at timestamp {start_ns}ns")
+                job.progress_calculator = export_utils.ProgressCalculator(video_metadata, frames_done=start_frame_num)
+
+            if not job.video_writer.is_complete():
+                # exports running in parallel share the models loaded by the provider, they don't change the options used by the preview
+                frame_restorer = FRAME_RESTORER_PROVIDER.get(frame_restorer_options)
                 frame_restorer.start(start_ns=start_ns)
 
                 duration_start = time.time()
                 for frame_num, elem in enumerate(frame_restorer, start=start_frame_num):
-                    if self.stop_requested:
+                    if job.stop_requested:
                         success = False
                         logger.warning("Stop requested: Stopping FrameRestorer")
                         break
                     if elem is None:
                         success = False
                         logger.error("Error on export: frame restorer stopped prematurely")
+                        error_message = "frame restorer stopped prematurely"
                         break
 
                     (restored_frame, restored_frame_pts) = elem
-                    if self.resume_info:
-                        if restored_frame_pts <= self.resume_info.frame_pts:
+                    if job.resume_info:
+                        if restored_frame_pts <= job.resume_info.frame_pts:
                             logging.debug("Received frame earlier than resume position, skipping frame...")
                             continue
                         else:
                             logger.debug("Received first frame after resume position, successful resume.")
-                            self.resume_info = None
-                            GLib.idle_add(lambda: self.emit('video-export-resumed'))
-                    self.video_writer.write(restored_frame, restored_frame_pts, bgr2rgb=True)
+                            job.resume_info = None
+                            GLib.idle_add(lambda: self.emit('video-export-resumed', job.item))
+                    job.video_writer.write(restored_frame, restored_frame_pts, bgr2rgb=True)
 
                     duration_end = time.time()
                     duration = duration_end - duration_start
                     duration_start = duration_end
-                    self.progress_calculator.update(duration)
+                    job.progress_calculator.update(duration)
                     if frame_num % progress_update_step_size == 0:
-                        GLib.idle_add(lambda: self.emit('video-export-progress', self.progress_calculator.get_progress()))
+                        progress = job.progress_calculator.get_progress()
+                        GLib.idle_add(lambda: self.emit('video-export-progress', job.item, progress))
 
-                    if self.pause_requested:
+                    if job.pause_requested:
                         logger.info("Pause requested: Pausing FrameRestorer")
-                        self.resume_info = ResumeInformation(restored_frame_pts, video_metadata.time_base, frame_num)
+                        job.resume_info = ResumeInformation(restored_frame_pts, video_metadata.time_base, frame_num)
+                        paused = True
                         break
 
-            except Exception as e:
-                success = False
-                err_msg = "".join(traceback.format_exception_only(e))
-                GLib.idle_add(lambda: self.emit('video-export-failed', err_msg))
-            finally:
-                if not self.pause_requested:
-                    self.video_writer.release()
+            if success and not paused:
+                job.video_writer.release()
+        except Exception as e:
+            success = False
+            paused = False
+            error_message = "".join(traceback.format_exception_only(e))
+        finally:
+            if not success and job.video_writer:
+                # completed segments are kept, restoring the file again will continue where it stopped
+                job.video_writer.abort()
+            if frame_restorer:
                 frame_restorer.stop()
 
-            if self.pause_requested:
-                GLib.idle_add(lambda: self.emit('video-export-paused'))
-            else:
-                if success:
-                    audio_utils.combine_audio_video_files(video_metadata, video_tmp_file_output_path, restore_file_path)
-                    def on_success():
-                        progress = self.progress_calculator.get_progress()
-                        progress.complete()
-                        self.emit('video-export-progress', progress)
-                        self.emit('video-export-finished')
-                    GLib.idle_add(on_success)
-                else:
-                    if os.path.exists(video_tmp_file_output_path):
-                        os.remove(video_tmp_file_output_path)
-            if self.stop_requested:
-                GLib.idle_add(lambda: self.emit('video-export-stopped'))
+        if paused:
+            GLib.idle_add(lambda: self.emit('video-export-paused', job.item))
+            return
 
-        exporter_thread = threading.Thread(target=run_export, daemon=True)
-        exporter_thread.start()
+        if success:
+            try:
+                job.video_writer.concat(video_tmp_file_output_path)
+                audio_utils.combine_audio_video_files(video_metadata, video_tmp_file_output_path, restore_file_path)
+                job.video_writer.remove_work_directory()
+            except Exception as e:
+                error_message = "".join(traceback.format_exception_only(e))
+
+        if error_message is not None:
+            self._remove_video_tmp_file(job)
+            GLib.idle_add(lambda: self.emit('video-export-failed', job.item, error_message))
+        elif not success:
+            self._remove_video_tmp_file(job)
+            GLib.idle_add(lambda: self.emit('video-export-stopped', job.item))
+        else:
+            def on_success():
+                progress = job.progress_calculator.get_progress()
+                progress.complete()
+                self.emit('video-export-progress', job.item, progress)
+                self.emit('video-export-finished', job.item)
+            GLib.idle_add(on_success)
 
     def show_export_dialog(self, dismissed_callback):
         def on_dialog_result(dialog, result):
@@ -595,3 +660,5 @@ class ExportView(Gtk.Widget):
 
     def close(self):
         self.stop_requested = True
+        for job in self.jobs:
+            job.stop_requested = True
@@ -2,6 +2,9 @@
 # SPDX-License-Identifier: AGPL-3.0
 
 import logging
+import math
+import os
+import threading
 from dataclasses import dataclass
 
 from lada import LOG_LEVEL
@@ -9,12 +12,13 @@ from lada.utils import VideoMetadata
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=LOG_LEVEL)
-from lada import RESTORATION_MODEL_NAMES_TO_FILES, DETECTION_MODEL_NAMES_TO_FILES
+from lada import RESTORATION_MODEL_NAMES_TO_FILES, DETECTION_MODEL_NAMES_TO_FILES, get_available_restoration_models, get_available_detection_models
+from lada.gui.model_cache import ModelCache
 from lada.restorationpipeline.frame_restorer import FrameRestorer
-from lada.restorationpipeline import load_models
+from lada.restorationpipeline import load_detection_model, load_restoration_model
+from lada.restorationpipeline.mosaic_presence_scanner import MosaicPresenceScanner
 from lada.utils import video_utils
 
-import gc
 import torch
 
 @dataclass
@@ -49,70 +53,103 @@ class FrameRestorerOptions:
         return FrameRestorerOptions(self.mosaic_restoration_model_name, self.mosaic_detection_model_name, self.video_metadata, self.device, self.max_clip_length, self.mosaic_detection, passthrough)
 
 class FrameRestorerProvider:
-    def __init__(self):
-        self.models_cache: None | dict = None
+    def __init__(self, model_cache_bytes: int = 4096 * 1024 * 1024):
+        # keeps several detection and restoration models loaded so switching between them doesn't need to load them again
+        self.model_cache = ModelCache(model_cache_bytes)
         self.options: FrameRestorerOptions | None = None
+        # set by the preview while it scans the open file. FrameRestorers of the same file and detection model will make use of its results
+        self.mosaic_presence_scanner: MosaicPresenceScanner | None = None
+        self.lock = threading.RLock()
 
     def init(self, options):
-        if self.options is not None:
-            if self.options.device != options.device:
-                self._clear_cache()
-        self.options = options
-
-    def get(self):
-        assert self.options is not None, "IllegalState: get called but options are not initialized. Call init before using get"
+        with self.lock:
+            self.options = options
+
+    def set_model_cache_size(self, model_cache_bytes: int):
+        self.model_cache.set_max_bytes(model_cache_bytes)
+
+    def get(self, options: FrameRestorerOptions | None = None):
+        """
+        Creates a FrameRestorer for the options set via init. Exports pass their own options instead, so they don't change the ones used by the preview.
+        """
+        with self.lock:
+            if options is None:
+                options = self.options
+        return self._get(options)
+
+    def preload(self, options: FrameRestorerOptions):
+        """
+        Loads the models next to the selected ones in the model lists in the background, as these are the ones the user most likely
+        switches to when comparing models. Models are only preloaded as long as they fit into the model cache without evicting others.
+        """
+        if options.passthrough or options.mosaic_restoration_model_name is None:
+            return
+        self.model_cache.cancel_preloads()
+        for mosaic_restoration_model_name in _get_neighbors(get_available_restoration_models(), options.mosaic_restoration_model_name):
+            mosaic_restoration_model_path = RESTORATION_MODEL_NAMES_TO_FILES[mosaic_restoration_model_name]
+            self.model_cache.preload(*self._get_restoration_model_loader(mosaic_restoration_model_name, options.device, options.max_clip_length),
+                                     estimated_bytes=os.path.getsize(mosaic_restoration_model_path))
+        for mosaic_detection_model_name in _get_neighbors(get_available_detection_models(), options.mosaic_detection_model_name):
+            mosaic_detection_model_path = DETECTION_MODEL_NAMES_TO_FILES[mosaic_detection_model_name]
+            self.model_cache.preload(*self._get_detection_model_loader(mosaic_detection_model_name, options.device),
+                                     estimated_bytes=os.path.getsize(mosaic_detection_model_path))
+
+    def _get(self, options: FrameRestorerOptions | None):
+        assert options is not None, "IllegalState: get called but options are not initialized. Call init before using get"
         # === [修改] 增加判断：如果 passthrough 为真，或者模型名称为 None，都进入直通模式 ===
-        if self.options.passthrough or self.options.mosaic_restoration_model_name is None:
+        if options.passthrough or options.mosaic_restoration_model_name is None:
             # 返回直通恢复器（只读取视频，不进行 AI 处理）
-            return PassthroughFrameRestorer(self.options.video_metadata.video_file)
+            return PassthroughFrameRestorer(options.video_metadata.video_file)
         # === [修改结束] ===
 
-        is_empty_cache = self.models_cache is None
-        # ... (后面代码保持不变)
-        cache_miss = False
-        if is_empty_cache:
-            cache_miss = True
-        else:
-            if self.models_cache["mosaic_restoration_model_name"] != self.options.mosaic_restoration_model_name:
-                cache_miss = True
-                logger.info(f"model {self.options.mosaic_restoration_model_name} not found in cache. Loading...")
-            if self.models_cache["mosaic_detection_model_name"] != self.options.mosaic_detection_model_name:
-                cache_miss = True
-                logger.info(f"model {self.options.mosaic_detection_model_name} not found in cache. Loading...")
-
-        if cache_miss:
-            self._clear_cache()
-
-            mosaic_restoration_model_path = RESTORATION_MODEL_NAMES_TO_FILES[self.options.mosaic_restoration_model_name]
-            mosaic_detection_path = DETECTION_MODEL_NAMES_TO_FILES[self.options.mosaic_detection_model_name]
-            mosaic_detection_model, mosaic_restoration_model, mosaic_restoration_model_preferred_pad_mode = load_models(
-                torch.device(self.options.device), self.options.mosaic_restoration_model_name, mosaic_restoration_model_path, None,
-                mosaic_detection_path, fp16=torch.cuda.is_available(), clip_length=self.options.max_clip_length
-            )
-
-            self.models_cache = dict(mosaic_restoration_model_name=self.options.mosaic_restoration_model_name,
-                                     mosaic_detection_model_name=self.options.mosaic_detection_model_name,
-                                     mosaic_detection_model=mosaic_detection_model,
-                                     mosaic_restoration_model=mosaic_restoration_model,
-                                     mosaic_restoration_model_preferred_pad_mode=mosaic_restoration_model_preferred_pad_mode)
-
-        return FrameRestorer(self.options.device, self.options.video_metadata.video_file, self.options.max_clip_length,
-                             self.options.mosaic_restoration_model_name,
-                             self.models_cache["mosaic_detection_model"], self.models_cache["mosaic_restoration_model"],
-                             self.models_cache["mosaic_restoration_model_preferred_pad_mode"],
-                             mosaic_detection=self.options.mosaic_detection)
-
-    def _clear_cache(self):
-        if self.models_cache is None:
-            return
-        if "mosaic_detection_model" in self.models_cache: del self.models_cache["mosaic_detection_model"]
-        if "mosaic_restoration_model" in self.models_cache: del self.models_cache["mosaic_restoration_model"]
-        gc.collect()
-        try:
-            torch.cuda.empty_cache()
-        except:
-            pass
-        self.models_cache = None
+        mosaic_detection_model = self.model_cache.get(*self._get_detection_model_loader(options.mosaic_detection_model_name, options.device))
+        mosaic_restoration_model, mosaic_restoration_model_preferred_pad_mode, clip_length = self.model_cache.get(
+            *self._get_restoration_model_loader(options.mosaic_restoration_model_name, options.device, options.max_clip_length),
+            # buffers of BasicvsrppMosaicRestorer are preallocated for the clip length it has been loaded with, it can't restore longer clips
+            is_usable=lambda value: value[2] >= options.max_clip_length)
+
+        frame_restorer = FrameRestorer(options.device, options.video_metadata.video_file, options.max_clip_length,
+                             options.mosaic_restoration_model_name,
+                             mosaic_detection_model, mosaic_restoration_model,
+                             mosaic_restoration_model_preferred_pad_mode,
+                             mosaic_detection=options.mosaic_detection)
+        mosaic_presence_scanner = self.mosaic_presence_scanner
+        if (mosaic_presence_scanner is not None and mosaic_presence_scanner.video_file == options.video_metadata.video_file
+                and mosaic_presence_scanner.mosaic_detection_model_name == options.mosaic_detection_model_name):
+            frame_restorer.set_mosaic_presence_scanner(mosaic_presence_scanner)
+        return frame_restorer
+
+    def get_mosaic_presence_scanner_model(self, mosaic_detection_model_name: str, device: str):
+        """
+        Detection model for MosaicPresenceScanner. It's cached separately from the one used by FrameRestorers, as both run next to each other
+        and would otherwise serialize their inference.
+        """
+        key, load = self._get_detection_model_loader(mosaic_detection_model_name, device)
+        return self.model_cache.get(key + ("mosaic_presence_scanner",), load)
+
+    def load_mosaic_detection_model(self, mosaic_detection_model_name: str, device: str):
+        mosaic_detection_path = DETECTION_MODEL_NAMES_TO_FILES[mosaic_detection_model_name]
+        return load_detection_model(torch.device(device), mosaic_detection_path, fp16=torch.cuda.is_available())
+
+    def _get_detection_model_loader(self, mosaic_detection_model_name: str, device: str):
+        key = ("detection", mosaic_detection_model_name, device)
+        return key, lambda: self.load_mosaic_detection_model(mosaic_detection_model_name, device)
+
+    def _get_restoration_model_loader(self, mosaic_restoration_model_name: str, device: str, clip_length: int):
+        key = ("restoration", mosaic_restoration_model_name, device)
+        def load():
+            mosaic_restoration_model_path = RESTORATION_MODEL_NAMES_TO_FILES[mosaic_restoration_model_name]
+            mosaic_restoration_model, pad_mode = load_restoration_model(torch.device(device), mosaic_restoration_model_name, mosaic_restoration_model_path,
+                                                                        None, fp16=torch.cuda.is_available(), clip_length=clip_length)
+            # only BasicvsrppMosaicRestorer depends on the clip length
+            return mosaic_restoration_model, pad_mode, clip_length if mosaic_restoration_model_name.startswith("basicvsrpp") else math.inf
+        return key, load
+
+def _get_neighbors(model_names: list[str], model_name: str) -> list[str]:
+    if model_name not in model_names:
+        return []
+    idx = model_names.index(model_name)
+    return [model_names[i] for i in (idx + 1, idx - 1) if 0 <= i < len(model_names) and model_names[i] != model_name]
 
 class PassthroughFrameRestorer:
     def __init__(self, video_file):
@@ -132,9 +169,22 @@ class PassthroughFrameRestorer:
         self.stopped = True
         self.video_reader.__exit__(None, None, None)
 
+    def seek(self, start_ns):
+        self.video_reader.seek(start_ns)
+        self.frame_restoration_queue = PassthroughFrameRestorer.PassthroughQueue(self)
+
     def get_frame_restoration_queue(self):
         return self.frame_restoration_queue
 
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        result = self.frame_restoration_queue.get()
+        if result is None and not self.stopped:
+            raise StopIteration
+        return result
+
     class PassthroughQueue:
         def __init__(self, frame_restorer):
             self.video_frames_generator = frame_restorer.video_reader.frames()
@@ -13,6 +13,7 @@ gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
 gi.require_version('Gst', '1.0')
 gi.require_version('GstApp', '1.0')
+gi.require_version('GstVideo', '1.0')
 
 from gi.repository import Gtk, Gio, Adw, Gdk, Gst, GObject
 
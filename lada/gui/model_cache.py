@@ -0,0 +1,159 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import gc
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable
+
+import torch
+
+from lada import LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=LOG_LEVEL)
+
+def get_model_bytes(model) -> int:
+    """
+    Memory used by the parameters, buffers and preallocated tensors of a loaded model wrapper like Yolo11SegmentationModel or BasicvsrppMosaicRestorer.
+    """
+    if isinstance(model, torch.nn.Module):
+        tensors = {id(t): t for t in [*model.parameters(), *model.buffers()]}
+        return sum(t.nbytes for t in tensors.values())
+    if isinstance(model, torch.Tensor):
+        return model.nbytes
+    if isinstance(model, (tuple, list)):
+        return sum(get_model_bytes(item) for item in model)
+    if hasattr(model, '__dict__'):
+        return sum(get_model_bytes(value) for value in vars(model).values() if isinstance(value, (torch.nn.Module, torch.Tensor)))
+    return 0
+
+@dataclass
+class _CachedModel:
+    value: Any
+    nbytes: int
+
+class ModelCache:
+    """
+    Loaded models by key, evicted by least-recent use once their memory usage exceeds the budget.
+
+    The most recently used model is never evicted, so a single model bigger than the budget can still be used.
+    Evicted models will only be freed after the FrameRestorers still using them have been stopped.
+    Loading happens outside the lock, concurrent requests for the same key wait for the load in progress instead of loading it twice.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.models: OrderedDict[Hashable, _CachedModel] = OrderedDict()
+        self.loading: dict[Hashable, threading.Event] = {}
+        self.preload_thread: threading.Thread | None = None
+        self.preload_requests: list[tuple[Hashable, Callable[[], Any], int]] = []
+
+    def set_max_bytes(self, max_bytes: int):
+        with self.lock:
+            self.max_bytes = max_bytes
+            evicted = self._evict()
+        self._free(evicted)
+
+    def get(self, key: Hashable, load: Callable[[], Any], is_usable: Callable[[Any], bool] | None = None) -> Any:
+        """
+        Returns the cached model or loads it. If is_usable returns False for the cached model it will be replaced by a newly loaded one.
+        """
+        while True:
+            with self.lock:
+                cached_model = self.models.get(key)
+                if cached_model is not None and (is_usable is None or is_usable(cached_model.value)):
+                    self.models.move_to_end(key)
+                    return cached_model.value
+                loading_event = self.loading.get(key)
+                if loading_event is None:
+                    self.loading[key] = threading.Event()
+                    break
+            loading_event.wait()
+        return self._load(key, load, used=True)
+
+    def preload(self, key: Hashable, load: Callable[[], Any], estimated_bytes: int):
+        """
+        Loads the model in a background thread if it would fit into the budget without evicting anything.
+        """
+        with self.lock:
+            if key in self.models or key in self.loading or any(request[0] == key for request in self.preload_requests):
+                return
+            self.preload_requests.append((key, load, estimated_bytes))
+            if self.preload_thread is None or not self.preload_thread.is_alive():
+                self.preload_thread = threading.Thread(target=self._preload_worker, daemon=True)
+                self.preload_thread.start()
+
+    def cancel_preloads(self):
+        with self.lock:
+            self.preload_requests.clear()
+
+    def get_memory_bytes(self) -> int:
+        with self.lock:
+            return self._get_memory_bytes()
+
+    def clear(self):
+        with self.lock:
+            evicted = list(self.models.values())
+            self.models.clear()
+            self.preload_requests.clear()
+        self._free(evicted)
+
+    def _load(self, key: Hashable, load: Callable[[], Any], used: bool) -> Any:
+        s = time.time()
+        try:
+            value = load()
+            nbytes = get_model_bytes(value)
+            with self.lock:
+                # a cached model which was not usable for the request gets replaced
+                evicted = [self.models.pop(key)] if key in self.models else []
+                self.models[key] = _CachedModel(value, nbytes)
+                if not used:
+                    # preloaded models which have not been used yet are the first to go
+                    self.models.move_to_end(key, last=False)
+                evicted.extend(self._evict())
+            logger.info(f"model cache: loaded {key} ({nbytes // (1024 * 1024)}MB), took {time.time() - s:.2f}s")
+            self._free(evicted)
+            return value
+        finally:
+            with self.lock:
+                self.loading.pop(key).set()
+
+    def _preload_worker(self):
+        while True:
+            with self.lock:
+                if len(self.preload_requests) == 0:
+                    return
+                key, load, estimated_bytes = self.preload_requests.pop(0)
+                # speculative loads should never push out models which have actually been used
+                if key in self.models or key in self.loading or self._get_memory_bytes() + estimated_bytes > self.max_bytes:
+                    continue
+                self.loading[key] = threading.Event()
+            try:
+                self._load(key, load, used=False)
+            except Exception as e:
+                logger.warning(f"model cache: failed to preload {key}: {e}")
+
+    def _get_memory_bytes(self) -> int:
+        return sum(cached_model.nbytes for cached_model in self.models.values())
+
+    def _evict(self) -> list[_CachedModel]:
+        evicted = []
+        while len(self.models) > 1 and self._get_memory_bytes() > self.max_bytes:
+            key, cached_model = self.models.popitem(last=False)
+            logger.info(f"model cache: evicted {key}")
+            evicted.append(cached_model)
+        return evicted
+
+    def _free(self, evicted: list[_CachedModel]):
+        if len(evicted) == 0:
+            return
+        evicted.clear()
+        gc.collect()
+        try:
+            torch.cuda.empty_cache()
+        except Exception as e:
+            logger.warning(f"model cache: could not release cached GPU memory: {e}")
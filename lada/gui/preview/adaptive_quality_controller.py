@@ -0,0 +1,106 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import logging
+import time
+from dataclasses import dataclass
+
+from lada import LOG_LEVEL
+from lada.restorationpipeline.frame_restorer import FrameRestorer
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=LOG_LEVEL)
+
+@dataclass(frozen=True)
+class QualityLevel:
+    max_clip_length: int
+    detection_stride: int
+    min_detection_area: float # ratio of frame area
+
+def get_quality_levels(max_clip_length: int) -> list[QualityLevel]:
+    # ordered from full quality to fastest. Each step gives up as little quality as possible
+    return [
+        QualityLevel(max_clip_length, 1, 0.),
+        QualityLevel(max(1, max_clip_length // 2), 1, 0.),
+        QualityLevel(max(1, max_clip_length // 2), 2, 0.),
+        QualityLevel(max(1, max_clip_length // 4), 2, 0.0025),
+        QualityLevel(max(1, max_clip_length // 4), 3, 0.01),
+    ]
+
+class AdaptiveQualityController:
+    """
+    Lowers restoration quality of the preview step by step if FrameRestorer can't keep up with playback and raises it again once there is headroom.
+
+    Throughput is measured as frames restored per second of time FrameRestorer was not blocked by a full frame_restoration_queue,
+    so it's independent of playback pausing or throttling consumption.
+    """
+    def __init__(self, frame_restorer: FrameRestorer, fps: float, sample_interval=1.0, degrade_ratio=0.95, upgrade_ratio=1.5, degrade_samples=2, upgrade_samples=5):
+        self.frame_restorer = frame_restorer
+        self.fps = fps
+        self.sample_interval = sample_interval
+        self.degrade_ratio = degrade_ratio
+        self.upgrade_ratio = upgrade_ratio
+        self.degrade_samples = degrade_samples
+        self.upgrade_samples = upgrade_samples
+        self.levels = get_quality_levels(frame_restorer.max_clip_length)
+        self.level = 0
+        self.slow_samples = 0
+        self.fast_samples = 0
+        self.last_sample: tuple[float, int, float] | None = None
+
+    def reset(self):
+        """
+        Starts measuring again, e.g. after a seek when FrameRestorer has to fill its queues first. Keeps the current quality level.
+        """
+        self.last_sample = None
+        self.slow_samples = 0
+        self.fast_samples = 0
+
+    def update(self):
+        """
+        Should be called for each frame taken from FrameRestorer. Only samples throughput every sample_interval seconds.
+        """
+        now = time.time()
+        restored_frames_count = self.frame_restorer.restored_frames_count
+        put_wait_time = self.frame_restorer.queue_stats["frame_restoration_queue_wait_time_put"]
+        if self.last_sample is None:
+            self.last_sample = now, restored_frames_count, put_wait_time
+            return
+        last_time, last_restored_frames_count, last_put_wait_time = self.last_sample
+        if now - last_time < self.sample_interval:
+            return
+        self.last_sample = now, restored_frames_count, put_wait_time
+
+        restored_frames = restored_frames_count - last_restored_frames_count
+        if restored_frames <= 0:
+            return
+        busy_time = max(now - last_time - (put_wait_time - last_put_wait_time), 1e-3)
+        restored_fps = restored_frames / busy_time
+
+        if restored_fps < self.fps * self.degrade_ratio:
+            self.slow_samples += 1
+            self.fast_samples = 0
+        elif restored_fps > self.fps * self.upgrade_ratio:
+            self.fast_samples += 1
+            self.slow_samples = 0
+        else:
+            self.slow_samples = 0
+            self.fast_samples = 0
+
+        if self.slow_samples >= self.degrade_samples and self.level < len(self.levels) - 1:
+            logger.debug(f"adaptive quality: restoring at {restored_fps:.1f} fps, playback needs {self.fps:.1f} fps, lowering quality")
+            self.set_level(self.level + 1)
+        elif self.fast_samples >= self.upgrade_samples and self.level > 0:
+            logger.debug(f"adaptive quality: restoring at {restored_fps:.1f} fps, playback needs {self.fps:.1f} fps, raising quality")
+            self.set_level(self.level - 1)
+
+    def set_level(self, level: int):
+        self.level = level
+        quality_level = self.levels[level]
+        logger.debug(f"adaptive quality: level {level}: {quality_level}")
+        self.frame_restorer.set_quality(quality_level.max_clip_length, quality_level.detection_stride, quality_level.min_detection_area)
+        # clips already in flight were detected with previous settings, give the new settings some time to take effect
+        self.reset()
+
+    def is_full_quality(self) -> bool:
+        return self.level == 0
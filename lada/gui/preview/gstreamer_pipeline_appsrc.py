@@ -1,21 +1,40 @@
 # SPDX-FileCopyrightText: Lada Authors
 # SPDX-License-Identifier: AGPL-3.0
 
+import functools
 import logging
 import threading
 import time
+from fractions import Fraction
+from typing import Hashable
 
+import numpy as np
 import torch
-from gi.repository import Gst, GstApp, GObject
+from gi.repository import Gst, GstApp, GstVideo, GObject
 
 from lada import LOG_LEVEL
 from lada.gui.frame_restorer_provider import FrameRestorerProvider
+from lada.gui.preview.adaptive_quality_controller import AdaptiveQualityController
+from lada.gui.preview.restored_frame_cache import RestoredFrameCache
 from lada.utils import video_utils, VideoMetadata, threading_utils
 from lada.restorationpipeline.frame_restorer import FrameRestorer
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=LOG_LEVEL)
 
+@functools.cache
+def is_mapped_buffer_memory_writable() -> bool:
+    # Only the overrides of gst-python expose mapped memory as writable memoryview. With PyGObject alone MapInfo.data
+    # is an immutable copy of the buffer memory and anything we'd write into it would be lost.
+    buf = Gst.Buffer.new_allocate(None, 1, None)
+    ok, map_info = buf.map(Gst.MapFlags.WRITE)
+    if not ok:
+        return False
+    try:
+        return not memoryview(map_info.data).readonly
+    finally:
+        buf.unmap(map_info)
+
 class FrameRestorerAppSrc(GstApp.AppSrc):
     GST_PLUGIN_NAME = 'framerestorerappsrc'
 
@@ -38,6 +57,23 @@ class FrameRestorerAppSrc(GstApp.AppSrc):
                           "VideoMetadata",
                           "Metadata of the video file that should be restored by FrameRestorer",
                           GObject.ParamFlags.READWRITE
+                          ),
+        "restored-frame-cache": (GObject.TYPE_PYOBJECT,
+                          "RestoredFrameCache",
+                          "Cache of restored frames used to replay recently shown frames after seeking",
+                          GObject.ParamFlags.READWRITE
+                          ),
+        "adaptive-quality": (GObject.TYPE_BOOLEAN,
+                          "Adaptive quality",
+                          "Lower restoration quality temporarily if restoration is slower than playback",
+                          False,
+                          GObject.ParamFlags.READWRITE
+                          ),
+        "pre-restoration": (GObject.TYPE_BOOLEAN,
+                          "Pre-restoration",
+                          "Keep restoring ahead of the playhead into the restored frame cache while playback is paused or buffers are full",
+                          False,
+                          GObject.ParamFlags.READWRITE
                           )
     }
 
@@ -45,18 +81,36 @@ class FrameRestorerAppSrc(GstApp.AppSrc):
         super().__init__()
 
         self.video_metadata: VideoMetadata | None = None
-        self.cpu_frame: torch.Tensor | None = None
+        self.video_info: GstVideo.VideoInfo | None = None
+        self.buffer_pool: Gst.BufferPool | None = None
+        # used to pad rows of frames if gst-python is not available and we can't write into pooled buffers directly
+        self.staging_rows: np.ndarray | None = None
+        if not is_mapped_buffer_memory_writable():
+            logger.warning("gst-python is not installed, frames need to be copied once more before passing them to GStreamer")
 
         self.frame_restorer: FrameRestorer | None = None
         self.frame_restorer_provider: FrameRestorerProvider | None = None
         self.frame_restorer_lock: threading.Lock = threading.Lock()
 
+        self.restored_frame_cache: RestoredFrameCache | None = None
+        self.cache_namespace: Hashable | None = None # namespace of frames restored by current frame restorer, None if they should not be cached
+        self.cached_frames_namespace: Hashable | None = None
+        self.cached_frame_pts: int | None = None # next frame to be pushed from cache instead of frame restorer
+        self.previous_frame_pts: int | None = None # last pushed frame, None after seek
+
+        self.adaptive_quality: bool = False
+        self.quality_controller: AdaptiveQualityController | None = None
+
+        self.pre_restoration: bool = False
+        self.pre_restored_first_pts: int | None = None # first frame restored ahead into the cache while idle, played back from cache once we're pushing frames again
+        self.pre_restored_last_pts: int | None = None
 
         self.appsource_thread: threading.Thread | None = None
         self.appsource_thread_should_be_running: bool = False # Variable controlling state of thread. False if stop or shutdown requested or EOF
         self.appsource_thread_stop_requested = False # Variable controlling state of thread. Set based on enough-data / need-data states to trigger start/stop.
         self.appsource_thread_shutdown_requested = False # Variable controlling state of thread. Forced shutdown which overwrites appsource_thread_stop_requested. Set if element set to NULL.
         self.appsource_thread_eof = False # Variable controlling state of thread. Set if FrameRestorer gave out last frame / EOF. Unset if getting seek request.
+        self.appsource_thread_idle = False # Variable controlling state of thread. Set based on enough-data if downstream doesn't need more frames for now. Thread can then restore frames ahead.
 
         self.appsrc_lock: threading.Lock = threading.Lock()
 
@@ -80,6 +134,12 @@ class FrameRestorerAppSrc(GstApp.AppSrc):
             return self.video_metadata
         elif prop.name == 'frame-restorer-provider':
             return self.frame_restorer_provider
+        elif prop.name == 'restored-frame-cache':
+            return self.restored_frame_cache
+        elif prop.name == 'adaptive-quality':
+            return self.adaptive_quality
+        elif prop.name == 'pre-restoration':
+            return self.pre_restoration
         else:
             return super().do_set_property(prop)
 
@@ -95,24 +155,57 @@ class FrameRestorerAppSrc(GstApp.AppSrc):
                     self._set_video_metadata(value)
         elif prop.name == 'frame-restorer-provider':
             self.frame_restorer_provider = value
+        elif prop.name == 'restored-frame-cache':
+            self.restored_frame_cache = value
+        elif prop.name == 'adaptive-quality':
+            with self.frame_restorer_lock:
+                self.adaptive_quality = value
+                if self.quality_controller and not value:
+                    self.quality_controller.set_level(0)
+                    self.quality_controller = None
+                elif self.frame_restorer and value and not self.quality_controller:
+                    self.quality_controller = self._create_quality_controller()
+        elif prop.name == 'pre-restoration':
+            self.pre_restoration = value
         else:
             super().do_set_property(prop, value)
 
     def do_state_changed(self, oldstate: Gst.State, newstate: Gst.State, pending: Gst.State) -> None:
         if newstate == Gst.State.NULL:
             self._stop_appsource_worker(shutdown=True)
+            if self.buffer_pool:
+                self.buffer_pool.set_active(False)
         elif newstate == Gst.State.READY:
             self.appsource_thread_shutdown_requested = False
 
     def _set_video_metadata(self, video_metadata: VideoMetadata):
         self.video_metadata = video_metadata
+        self.cached_frame_pts = None
+        self.previous_frame_pts = None
+        self.pre_restored_first_pts = None
+        self.pre_restored_last_pts = None
         self.frame_duration_ns = (1 / self.video_metadata.video_fps) * Gst.SECOND
         caps = Gst.Caps.from_string(
-            f"video/x-raw,format=BGR,width={GstPaddingHelpers.get_padded_width(self.video_metadata.video_width)},height={self.video_metadata.video_height},framerate={self.video_metadata.video_fps_exact.numerator}/{self.video_metadata.video_fps_exact.denominator}")
+            f"video/x-raw,format=BGR,width={self.video_metadata.video_width},height={self.video_metadata.video_height},framerate={self.video_metadata.video_fps_exact.numerator}/{self.video_metadata.video_fps_exact.denominator}")
         self.set_property('caps', caps)
+        self._set_up_buffer_pool(caps)
         self.set_property('duration', int((self.video_metadata.frames_count * self.frame_duration_ns)))
         logger.debug(f"appsource set video metadata: {video_metadata.video_file}")
 
+    def _set_up_buffer_pool(self, caps: Gst.Caps):
+        # Buffers are recycled once downstream is done with them so we don't need to allocate a new buffer for each frame.
+        # Buffers carry a GstVideoMeta describing their row stride: GStreamer aligns rows of BGR frames to 4 bytes which
+        # we account for by writing each frame into a strided view of the buffer instead of padding the frame itself.
+        if self.buffer_pool:
+            self.buffer_pool.set_active(False)
+        self.video_info = GstVideo.VideoInfo.new_from_caps(caps)
+        self.buffer_pool = GstVideo.VideoBufferPool.new()
+        config = self.buffer_pool.get_config()
+        Gst.BufferPool.config_set_params(config, caps, self.video_info.size, 2, 0)
+        Gst.BufferPool.config_add_option(config, GstVideo.BUFFER_POOL_OPTION_VIDEO_META)
+        self.buffer_pool.set_config(config)
+        self.buffer_pool.set_active(True)
+
     def _on_need_data(self, src, length):
         logger.debug("appsource need-data")
         with self.appsrc_lock:
@@ -133,10 +226,58 @@ class FrameRestorerAppSrc(GstApp.AppSrc):
             return True
         self.appsource_thread_eof = False
         with self.appsrc_lock:
-            self._stop_appsource_worker()
-            self._start_appsource_worker(seek_position=offset_ns)
+            if self.frame_restorer:
+                # keep the frame restorer running, only its position changes
+                self._stop_appsource_thread()
+                restoration_offset_ns = self._replay_cached_frames_from(offset_ns)
+                with self.frame_restorer_lock:
+                    self.frame_restorer.seek(int(restoration_offset_ns))
+                    if self.quality_controller:
+                        self.quality_controller.reset()
+                self._start_appsource_worker()
+            else:
+                restoration_offset_ns = self._replay_cached_frames_from(offset_ns)
+                self._start_appsource_worker(seek_position=restoration_offset_ns)
+            self.current_timestamp_ns = offset_ns
         return True
 
+    def _get_cache_namespace(self) -> Hashable | None:
+        options = self.frame_restorer_provider.options
+        if self.restored_frame_cache is None or options is None or options.passthrough or options.mosaic_restoration_model_name is None:
+            return None
+        return (options.video_metadata.video_file, options.mosaic_restoration_model_name, options.mosaic_detection_model_name,
+                options.max_clip_length, options.mosaic_detection, options.device)
+
+    def _create_quality_controller(self) -> AdaptiveQualityController | None:
+        if not self.adaptive_quality or not isinstance(self.frame_restorer, FrameRestorer):
+            # nothing to adjust for passthrough
+            return None
+        return AdaptiveQualityController(self.frame_restorer, self.video_metadata.video_fps)
+
+    def _pts_to_ns(self, frame_pts: int) -> int:
+        return int((frame_pts * self.video_metadata.time_base) * Gst.SECOND)
+
+    def _replay_cached_frames_from(self, offset_ns) -> int:
+        """
+        If the frame at the seek position is cached we'll push it and the following cached frames first. The frame restorer
+        can then already continue restoring the frames following those. Returns the position the frame restorer should seek to.
+        """
+        self.cached_frame_pts = None
+        self.previous_frame_pts = None
+        self.pre_restored_first_pts = None
+        self.pre_restored_last_pts = None
+        self.cached_frames_namespace = self._get_cache_namespace()
+        if self.cached_frames_namespace is None:
+            return offset_ns
+        seek_pts = int(Fraction(int(offset_ns), Gst.SECOND) / self.video_metadata.time_base)
+        cached_frame_pts = self.restored_frame_cache.find(self.cached_frames_namespace, seek_pts)
+        if cached_frame_pts is None:
+            return offset_ns
+        last_cached_frame_pts = self.restored_frame_cache.get_run_end(self.cached_frames_namespace, cached_frame_pts)
+        self.cached_frame_pts = cached_frame_pts
+        logger.debug(f"appsource seek: replaying cached frames from pts {cached_frame_pts} to {last_cached_frame_pts}")
+        return self._pts_to_ns(last_cached_frame_pts) + round(self.frame_duration_ns)
+
     def _start_appsource_worker(self, seek_position=None):
         with self.frame_restorer_lock:
             if self.appsource_thread_shutdown_requested:
@@ -146,6 +287,7 @@ class FrameRestorerAppSrc(GstApp.AppSrc):
                 logger.debug(f"appsource worker: requested to start but EOF. Will not start")
                 return
             self.appsource_thread_stop_requested = False
+            self.appsource_thread_idle = False
             self.appsource_thread_should_be_running = True
 
             if self.appsource_thread and self.appsource_thread.is_alive():
@@ -160,6 +302,8 @@ class FrameRestorerAppSrc(GstApp.AppSrc):
             if not self.frame_restorer:
                 logger.debug(f"appsource worker: setting up frame restorer")
                 self.frame_restorer = self.frame_restorer_provider.get()
+                self.cache_namespace = self._get_cache_namespace()
+                self.quality_controller = self._create_quality_controller()
                 if seek_position is not None:
                     self.frame_restorer.start(start_ns=int(seek_position))
                     self.current_timestamp_ns = seek_position
@@ -172,14 +316,27 @@ class FrameRestorerAppSrc(GstApp.AppSrc):
     def _request_stop_appsource_worker(self):
         with self.frame_restorer_lock:
             self.appsource_thread_stop_requested = True
+            self.appsource_thread_idle = True
             self.appsource_thread_should_be_running = False
 
+    def _stop_appsource_thread(self):
+        with self.frame_restorer_lock:
+            self.appsource_thread_stop_requested = True
+            self.appsource_thread_idle = False
+            self.appsource_thread_should_be_running = False
+            if self.appsource_thread:
+                # unblock consumer
+                threading_utils.put_closing_queue_marker(self.frame_restorer.get_frame_restoration_queue(), "frame_restorer_thread_queue")
+                self.appsource_thread.join()
+                self.appsource_thread = None
+
     def _stop_appsource_worker(self, shutdown=False):
         with self.frame_restorer_lock:
             start = time.time()
             if shutdown:
                 self.appsource_thread_shutdown_requested =True
             self.appsource_thread_stop_requested = True
+            self.appsource_thread_idle = False
             self.appsource_thread_should_be_running = False
 
             frame_restorer_thread_queue = None
@@ -198,73 +355,152 @@ class FrameRestorerAppSrc(GstApp.AppSrc):
                 # garbage collection
                 threading_utils.empty_out_queue(frame_restorer_thread_queue, "frame_restorer_thread_queue")
                 self.frame_restorer = None
+                self.quality_controller = None
 
             logger.debug(f"appsource worker: stopped, took {time.time() - start}")
 
     def _appsource_worker(self):
         logger.debug("appsource worker: started")
-        eof = False
-        while self.appsource_thread_should_be_running:
-            eof = self._push_next_frame()
-        if eof:
-            logger.debug("appsource worker: stopped itself, EOF")
+        while True:
+            eof = False
+            while self.appsource_thread_should_be_running:
+                eof = self._push_next_frame()
+            if eof:
+                logger.debug("appsource worker: stopped itself, EOF")
+                break
+            # downstream has enough frames for now, use the time to restore frames ahead until we're needed again
+            if not self._can_pre_restore() or not self._pre_restore_next_frame():
+                break
+
+    def _can_pre_restore(self) -> bool:
+        quality_controller = self.quality_controller
+        frame_nbytes = self.video_metadata.video_width * self.video_metadata.video_height * 3
+        return (self.pre_restoration and self.appsource_thread_idle and not self.appsource_thread_shutdown_requested
+                and self.cache_namespace is not None and self.cached_frame_pts is None
+                and (quality_controller is None or quality_controller.is_full_quality())
+                and self.restored_frame_cache.has_capacity_for(frame_nbytes))
+
+    def _pre_restore_next_frame(self) -> bool:
+        """
+        Takes the next frame from FrameRestorer and adds it to the cache instead of pushing it.
+        Returns False if there are no more frames or if we got unblocked via a closing marker.
+        """
+        try:
+            result = next(self.frame_restorer)
+        except StopIteration:
+            logger.debug("appsource worker: pre-restored frames until EOF")
+            return False
+        if result is None:
+            return False
+        frame, frame_pts = result
+        previous_pts = self.pre_restored_last_pts if self.pre_restored_last_pts is not None else self.previous_frame_pts
+        if previous_pts is not None and frame_pts <= previous_pts:
+            # already pushed from cache
+            return True
+        self.restored_frame_cache.put(self.cache_namespace, frame_pts, frame.to(device='cpu'), previous_pts, move_playhead=False)
+        if self.pre_restored_first_pts is None:
+            logger.debug(f"appsource worker: restoring ahead from pts {frame_pts}")
+            self.pre_restored_first_pts = frame_pts
+        self.pre_restored_last_pts = frame_pts
+        return True
+
+    def _next_cached_frame(self) -> tuple[torch.Tensor, int] | None:
+        frame_pts = self.cached_frame_pts
+        frame = self.restored_frame_cache.get(self.cached_frames_namespace, frame_pts)
+        if frame is None:
+            # got evicted in the meantime, continue with frame restorer from here
+            logger.debug(f"appsource worker: cached frame {frame_pts} not available anymore")
+            self.cached_frame_pts = None
+            self.frame_restorer.seek(self._pts_to_ns(frame_pts))
+            return None
+        self.cached_frame_pts = self.restored_frame_cache.get_next_pts(self.cached_frames_namespace, frame_pts)
+        return frame, frame_pts
 
     def _push_next_frame(self) -> bool:
-        result = self.frame_restorer.get_frame_restoration_queue().get()
-        if self.appsource_thread_stop_requested:
-            logger.debug("appsource worker: frame_restoration_queue consumer unblocked")
-        if result is None:
+        if self.pre_restored_first_pts is not None:
+            # continue with the frames restored ahead while we were idle
+            self.cached_frame_pts = self.pre_restored_first_pts
+            self.cached_frames_namespace = self.cache_namespace
+            self.pre_restored_first_pts = None
+            self.pre_restored_last_pts = None
+        if self.cached_frame_pts is not None:
+            result = self._next_cached_frame()
+            if result is not None:
+                self._push_frame(*result)
+                return False
+        try:
+            result = next(self.frame_restorer)
+        except StopIteration:
             self.appsource_thread_should_be_running = False
             if not self.appsource_thread_stop_requested:
                 self.appsource_thread_eof = True
                 self.emit("end-of-stream")
                 return True
             return False
+        if self.appsource_thread_stop_requested:
+            logger.debug("appsource worker: frame_restoration_queue consumer unblocked")
+        if result is None:
+            self.appsource_thread_should_be_running = False
+            return False
         else:
             frame, frame_pts = result
 
-        frame_timestamp_ns = int((frame_pts * self.video_metadata.time_base) * Gst.SECOND)
-        frame = GstPaddingHelpers.pad_frame(frame)
-        if frame.device.type == 'cuda':
-            if self.cpu_frame is None or frame.shape != self.cpu_frame.shape:
-                self.cpu_frame = torch.empty((frame.shape[0], frame.shape[1], frame.shape[2]), dtype=frame.dtype, device='cpu', pin_memory=True)
-            self.cpu_frame.copy_(frame, non_blocking=True)
-            torch.cuda.synchronize()
-            data = self.cpu_frame.numpy().tobytes()
-        else:
-            data = frame.numpy().tobytes()
+        quality_controller = self.quality_controller
+        if quality_controller:
+            quality_controller.update()
+
+        if self.previous_frame_pts is not None and frame_pts <= self.previous_frame_pts:
+            # already pushed from cache
+            return False
+        if self.cache_namespace is not None and (quality_controller is None or quality_controller.is_full_quality()):
+            # frames restored with lowered quality are not cached, they should not be replayed once we're back at full quality
+            frame = frame.to(device='cpu')
+            self.restored_frame_cache.put(self.cache_namespace, frame_pts, frame, self.previous_frame_pts)
+        self._push_frame(frame, frame_pts)
+        return False
 
-        buf = Gst.Buffer.new_allocate(None, len(data), None)
-        buf.fill(0, data)
+    def _push_frame(self, frame: torch.Tensor, frame_pts: int):
+        frame_timestamp_ns = self._pts_to_ns(frame_pts)
+        if is_mapped_buffer_memory_writable():
+            ret, buf = self.buffer_pool.acquire_buffer(None)
+            if ret != Gst.FlowReturn.OK:
+                # pool got deactivated as we're shutting down
+                logger.debug(f"appsource worker: could not acquire buffer: {ret}")
+                return
+            self._write_frame_to_buffer(frame, buf)
+        else:
+            # we can't write into pooled buffers, wrap the frame bytes in a new buffer instead of filling one from a staging copy
+            buf = Gst.Buffer.new_wrapped(self._get_frame_bytes(frame))
         buf.duration = round(self.frame_duration_ns)
         buf.pts = frame_timestamp_ns
         buf.offset = video_utils.offset_ns_to_frame_num(frame_timestamp_ns, self.video_metadata.video_fps_exact)
         self.emit('push-buffer', buf)
         self.current_timestamp_ns = frame_timestamp_ns
+        self.previous_frame_pts = frame_pts
+
+    def _get_frame_bytes(self, frame: torch.Tensor) -> bytes:
+        height, width = frame.shape[:2]
+        stride = self.video_info.stride[0]
+        if stride == width * 3:
+            return frame.cpu().numpy().tobytes()
+        # buffers without GstVideoMeta are expected to use the default stride of video_info, rows need to be padded
+        if self.staging_rows is None or self.staging_rows.shape != (height, stride):
+            self.staging_rows = np.zeros((height, stride), dtype=np.uint8)
+        torch.from_numpy(self.staging_rows[:, :width * 3].reshape(height, width, 3)).copy_(frame)
+        return self.staging_rows.tobytes()
+
+    def _write_frame_to_buffer(self, frame: torch.Tensor, buf: Gst.Buffer):
+        height, width = frame.shape[:2]
+        stride = self.video_info.stride[0]
+        ok, map_info = buf.map(Gst.MapFlags.WRITE)
+        assert ok, "could not map buffer"
+        try:
+            rows = np.frombuffer(map_info.data, dtype=np.uint8, count=stride * height).reshape(height, stride)
+            # only copy of the frame: directly from restored frame (CPU or GPU memory) into the GStreamer buffer
+            torch.from_numpy(rows[:, :width * 3].reshape(height, width, 3)).copy_(frame)
+        finally:
+            buf.unmap(map_info)
 
-        return False
-
-
-class GstPaddingHelpers:
-    # TODO: As we're using BGR format GStreamer expects to receive a 'buffer size = rstride (image) * height' where 'rstride = RU4 (width * 3)'
-    # RU4 here means that it will round up to nearest number divisible by 4. (https://gstreamer.freedesktop.org/documentation/additional/design/mediatype-video-raw.html)
-    # Most common video widths like 1920, 1280, 640 are divisible by 4 so no problem we can allocate a buffer according to numpy shape H*W*C
-    # But if we receive a video with a width which isn't divisible by 4 (I saw this on a file with dimensions 854 x 480) then the pipeline would break as H*W*C is less then expected buffer size given above calculation.
-    # For now let's just add some zero padding. Maybe there are ways to explicitly set the stride size or tell GStreamer about our zero padding but couldn't find anything...
-
-    @staticmethod
-    def pad_frame(frame: torch.Tensor):
-        width = frame.shape[1]
-        # TODO: see reasoning for this zero padding in TODO where we specify appsrc Caps
-        if width % 4 != 0:
-            pad_w = width % 4
-            pad_tensor = torch.zeros((frame.shape[0], pad_w, frame.shape[2]), dtype=frame.dtype, device=frame.device)
-            return torch.cat((frame, pad_tensor), dim=1)
-        return frame
-
-    @staticmethod
-    def get_padded_width(width):
-        return width + width % 4
 
 GObject.type_register(FrameRestorerAppSrc)
 __gstelementfactory__ = (FrameRestorerAppSrc.GST_PLUGIN_NAME,
@@ -12,6 +12,7 @@ from gi.repository import GObject, GLib, Gst, GstApp, Gdk, Gio
 from lada import LOG_LEVEL
 from lada.gui.frame_restorer_provider import FrameRestorerProvider
 from lada.gui.preview.gstreamer_pipeline_appsrc import FrameRestorerAppSrc
+from lada.gui.preview.restored_frame_cache import RestoredFrameCache
 from lada.utils import VideoMetadata, audio_utils
 
 logger = logging.getLogger(__name__)
@@ -22,17 +23,20 @@ class PipelineState(Enum):
     PAUSED = 2
 
 class PipelineManager(GObject.Object):
-    def __init__(self, frame_restorer_provider: FrameRestorerProvider, buffer_queue_min_thresh_time, buffer_queue_max_thresh_time, muted: bool):
+    def __init__(self, frame_restorer_provider: FrameRestorerProvider, restored_frame_cache: RestoredFrameCache, buffer_queue_min_thresh_time, buffer_queue_max_thresh_time, muted: bool, adaptive_quality: bool, pre_restoration: bool):
         super().__init__()
         self.frame_restorer_app_src: FrameRestorerAppSrc | None = None
         self.video_metadata: VideoMetadata | None = None
         self.frame_restorer_provider: FrameRestorerProvider = frame_restorer_provider
+        self.restored_frame_cache: RestoredFrameCache = restored_frame_cache
         self.buffer_queue_min_thresh_time = buffer_queue_min_thresh_time
         self.buffer_queue_max_thresh_time = buffer_queue_max_thresh_time
         self._paintable: Gdk.Paintable | None
         self._state: PipelineState = PipelineState.PAUSED
         self.has_audio: bool = False
         self._muted: bool = muted
+        self._adaptive_quality: bool = adaptive_quality
+        self._pre_restoration: bool = pre_restoration
 
         self.audio_uridecodebin: Gst.UriDecodeBin | None = None
         self.audio_volume = None
@@ -67,6 +71,26 @@ class PipelineManager(GObject.Object):
         if self.audio_volume:
             self.audio_volume.set_property("mute", value)
 
+    @GObject.Property()
+    def adaptive_quality(self):
+        return self._adaptive_quality
+
+    @adaptive_quality.setter
+    def adaptive_quality(self, value):
+        self._adaptive_quality = value
+        if self.frame_restorer_app_src:
+            self.frame_restorer_app_src.set_property('adaptive-quality', value)
+
+    @GObject.Property()
+    def pre_restoration(self):
+        return self._pre_restoration
+
+    @pre_restoration.setter
+    def pre_restoration(self, value):
+        self._pre_restoration = value
+        if self.frame_restorer_app_src:
+            self.frame_restorer_app_src.set_property('pre-restoration', value)
+
     @GObject.Signal(name="waiting-for-data")
     def buffer_queue_underrun(self, waiting_for_data: bool):
         pass
@@ -219,6 +243,9 @@ class PipelineManager(GObject.Object):
         appsrc = FrameRestorerAppSrc()
         appsrc.set_property('video-metadata', self.video_metadata)
         appsrc.set_property('frame-restorer-provider', self.frame_restorer_provider)
+        appsrc.set_property('restored-frame-cache', self.restored_frame_cache)
+        appsrc.set_property('adaptive-quality', self._adaptive_quality)
+        appsrc.set_property('pre-restoration', self._pre_restoration)
         def on_appsrc_end_of_stream(src):
             logger.debug("appsource end-of-stream")
             GLib.idle_add(lambda: self.emit("waiting-for-data", False))
@@ -16,10 +16,13 @@ from lada.gui.frame_restorer_provider import FrameRestorerProvider, FrameRestore
 from lada.gui.preview.fullscreen_mouse_activity_controller import FullscreenMouseActivityController
 from lada.gui.preview.gstreamer_pipeline_manager import PipelineManager, PipelineState
 from lada.gui.preview.headerbar_files_drop_down import HeaderbarFilesDropDown
+from lada.gui.preview.restored_frame_cache import RestoredFrameCache
 from lada.gui.preview.seek_preview_popover import SeekPreviewPopover
 from lada.gui.preview.timeline import Timeline
 from lada.gui.shortcuts import ShortcutsManager
+from lada.restorationpipeline.mosaic_presence_scanner import MosaicPresenceScanner
 from lada.utils import audio_utils, video_utils
+from lada.utils.thumbnail_sprite_index import ThumbnailSpriteIndex
 
 here = pathlib.Path(__file__).parent.resolve()
 
@@ -69,6 +72,7 @@ class PreviewView(Gtk.Widget):
         self._last_seek_preview_timestamp_ns = 0
         self._last_seek_preview_mouse_x = 0.0
         self._video_thumbnailer: video_utils.VideoThumbnailer | None = None
+        self._thumbnail_sprite_index: ThumbnailSpriteIndex | None = None
         self._thumbnailer_lock = threading.Lock()
         self._thread_counter = 0
         self._thread_counter_lock = threading.Lock()
@@ -95,6 +99,9 @@ class PreviewView(Gtk.Widget):
         self.fullscreen_mouse_activity_controller = None
 
         self.pipeline_manager: PipelineManager | None = None
+        self.restored_frame_cache = RestoredFrameCache(0)
+        self.mosaic_presence_scanner: MosaicPresenceScanner | None = None
+        self._mosaic_presence_scanner_lock = threading.Lock()
 
         self.stack_video_preview.set_visible_child_name("spinner")
 
@@ -274,7 +281,19 @@ class PreviewView(Gtk.Widget):
             click_gesture.connect( "pressed", on_click)
             self.box_video_preview.add_controller(click_gesture)
 
+    def update_restored_frame_cache_limits(self):
+        spill_directory = pathlib.Path(self._config.temp_directory) if self._config.preview_cache_disk_size > 0 else None
+        self.restored_frame_cache.set_limits(self._config.preview_cache_size * 1024 * 1024, spill_directory, self._config.preview_cache_disk_size * 1024 * 1024)
+
     def setup_config_signal_handlers(self):
+        self.update_restored_frame_cache_limits()
+        self._config.connect("notify::preview-cache-size", lambda object, spec: self.update_restored_frame_cache_limits())
+        self._config.connect("notify::preview-cache-disk-size", lambda object, spec: self.update_restored_frame_cache_limits())
+        self._config.connect("notify::temp-directory", lambda object, spec: self.update_restored_frame_cache_limits())
+
+        self.frame_restorer_provider.set_model_cache_size(self._config.model_cache_size * 1024 * 1024)
+        self._config.connect("notify::model-cache-size", lambda object, spec: self.frame_restorer_provider.set_model_cache_size(self._config.model_cache_size * 1024 * 1024))
+
         def on_show_mosaic_detections(*args):
             if self._frame_restorer_options:
                 self.frame_restorer_options = self._frame_restorer_options.with_mosaic_detection(self._config.show_mosaic_detections)
@@ -296,6 +315,8 @@ class PreviewView(Gtk.Widget):
 
         def on_mosaic_detection_model(object, spec):
             if self._frame_restorer_options:
+                # new scanner needs to be set up before frame restorer gets recreated with the new model
+                self.start_mosaic_presence_scan()
                 self.frame_restorer_options = self._frame_restorer_options.with_mosaic_detection_model_name(self._config.mosaic_detection_model)
         self._config.connect("notify::mosaic-detection-model", on_mosaic_detection_model)
 
@@ -306,6 +327,59 @@ class PreviewView(Gtk.Widget):
                 self.frame_restorer_options = self._frame_restorer_options.with_max_clip_length(self._config.max_clip_duration)
         self._config.connect("notify::max-clip-duration", on_max_clip_duration)
 
+        def on_adaptive_preview_quality(object, spec):
+            if self.pipeline_manager:
+                self.pipeline_manager.adaptive_quality = self._config.adaptive_preview_quality
+        self._config.connect("notify::adaptive-preview-quality", on_adaptive_preview_quality)
+
+        def on_preview_pre_restoration(object, spec):
+            if self.pipeline_manager:
+                self.pipeline_manager.pre_restoration = self._config.preview_pre_restoration
+        self._config.connect("notify::preview-pre-restoration", on_preview_pre_restoration)
+
+        def on_preview_mosaic_scan(object, spec):
+            if self.video_metadata:
+                self.start_mosaic_presence_scan()
+        self._config.connect("notify::preview-mosaic-scan", on_preview_mosaic_scan)
+
+    def start_mosaic_presence_scan(self):
+        """
+        Scans the open file for mosaics in the background. Results are shown on the timeline and let FrameRestorer skip detection of mosaic-free frames.
+        """
+        self.stop_mosaic_presence_scan()
+        if not self._config.preview_mosaic_scan:
+            return
+        scanner = MosaicPresenceScanner(self.video_metadata.video_file, self._config.mosaic_detection_model)
+        scanner.throttled = self.pipeline_manager is not None and self.pipeline_manager.state == PipelineState.PLAYING
+        with self._mosaic_presence_scanner_lock:
+            self.mosaic_presence_scanner = scanner
+        self.frame_restorer_provider.mosaic_presence_scanner = scanner
+        self.widget_timeline.set_mosaic_presence(scanner.presence)
+
+        device = self._config.device
+        def run():
+            model = self.frame_restorer_provider.get_mosaic_presence_scanner_model(scanner.mosaic_detection_model_name, device)
+            with self._mosaic_presence_scanner_lock:
+                if self.mosaic_presence_scanner is scanner:
+                    scanner.start(model)
+        threading.Thread(target=run, daemon=True).start()
+
+        def update_timeline():
+            if self.mosaic_presence_scanner is not scanner:
+                return False
+            self.widget_timeline.queue_draw()
+            return not (scanner.is_done() or scanner.failed)
+        GLib.timeout_add(1000, update_timeline)
+
+    def stop_mosaic_presence_scan(self):
+        with self._mosaic_presence_scanner_lock:
+            scanner = self.mosaic_presence_scanner
+            self.mosaic_presence_scanner = None
+        self.frame_restorer_provider.mosaic_presence_scanner = None
+        self.widget_timeline.set_mosaic_presence(None)
+        if scanner:
+            threading.Thread(target=scanner.stop, daemon=True).start()
+
     def set_speaker_icon(self, mute: bool):
         icon_name = "speaker-0-symbolic" if mute else "speaker-4-symbolic"
         self.button_image_mute_unmute.set_property("icon-name", icon_name)
@@ -376,6 +450,10 @@ class PreviewView(Gtk.Widget):
         return pointing_rect
 
     def _should_update_seek_preview(self, timestamp_ns: int, mouse_x: float):
+        if self._thumbnail_sprite_index and self._thumbnail_sprite_index.get_thumbnail(timestamp_ns) is not None:
+            # lookups are cheap, no need to limit updates
+            return True
+
         # Calculate movement deltas
         time_delta_ns = abs(timestamp_ns - self._last_seek_preview_timestamp_ns)
         position_delta = abs(mouse_x - self._last_seek_preview_mouse_x)
@@ -399,6 +477,14 @@ class PreviewView(Gtk.Widget):
         self.seek_preview_popover.set_pointing_to(pointing_rect)
         self.seek_preview_popover.popup()
 
+        if self._thumbnail_sprite_index is None:
+            self._start_thumbnail_sprite_index()
+        thumbnail = self._thumbnail_sprite_index.get_thumbnail(timestamp_ns)
+        if thumbnail is not None:
+            self.seek_preview_popover.set_thumbnail(thumbnail)
+            return
+
+        # thumbnail index not ready yet, seek and decode the frame instead
         def generate_thumbnail(current_thread_id):
             with self._thumbnailer_lock:
                 with self._thread_counter_lock:
@@ -417,6 +503,19 @@ class PreviewView(Gtk.Widget):
             self._thread_counter += 1
             threading.Thread(target=generate_thumbnail, args=(self._thread_counter,), daemon=True).start()
 
+    def _start_thumbnail_sprite_index(self):
+        self._stop_thumbnail_sprite_index()
+        cache_directory = pathlib.Path(GLib.get_user_cache_dir()).joinpath('lada').joinpath('thumbnails')
+        self._thumbnail_sprite_index = ThumbnailSpriteIndex(self.video_metadata.video_file, self.file_duration_ns / Gst.SECOND,
+                                                            self._thumbnail_size[0], self._thumbnail_size[1], cache_directory)
+        self._thumbnail_sprite_index.start()
+
+    def _stop_thumbnail_sprite_index(self):
+        if self._thumbnail_sprite_index:
+            # don't wait for the thread, it will stop after the current keyframe
+            self._thumbnail_sprite_index.thread_should_be_running = False
+            self._thumbnail_sprite_index = None
+
     def play_file(self, idx):
         self._show_spinner()
         self._reinit_open_file_async(self.files[idx])
@@ -484,14 +583,19 @@ class PreviewView(Gtk.Widget):
         self.buffer_queue_min_thresh_time_auto = self._buffer_queue_min_thresh_time_auto_min
 
         self.widget_timeline.set_property("duration", self.file_duration_ns)
+        if self.config.seek_preview_enabled:
+            self._start_thumbnail_sprite_index()
+        else:
+            self._stop_thumbnail_sprite_index()
 
         self.frame_restorer_provider.init(self._frame_restorer_options)
+        self.start_mosaic_presence_scan()
 
         if self.pipeline_manager:
             self.pipeline_manager.init_pipeline(self.video_metadata)
         else:
             buffer_queue_min_thresh_time, buffer_queue_max_thresh_time = self.get_gst_buffer_bounds()
-            self.pipeline_manager = PipelineManager(self.frame_restorer_provider, buffer_queue_min_thresh_time, buffer_queue_max_thresh_time, self.config.mute_audio)
+            self.pipeline_manager = PipelineManager(self.frame_restorer_provider, self.restored_frame_cache, buffer_queue_min_thresh_time, buffer_queue_max_thresh_time, self.config.mute_audio, self.config.adaptive_preview_quality, self.config.preview_pre_restoration)
             self.pipeline_manager.init_pipeline(self.video_metadata)
             self.picture_video_preview.set_paintable(self.pipeline_manager.paintable)
             self.pipeline_manager.connect("paintable-size-changed", lambda obj: self.emit("window-resize-requested", self.pipeline_manager.paintable, self.box_playback_controls, self.header_bar))
@@ -507,6 +611,10 @@ class PreviewView(Gtk.Widget):
         self.button_image_play_pause.set_property("icon-name", "media-playback-start-symbolic")
 
     def on_pipeline_state(self, state: PipelineState):
+        mosaic_presence_scanner = self.mosaic_presence_scanner
+        if mosaic_presence_scanner:
+            # leave the device to frame restoration during playback
+            mosaic_presence_scanner.throttled = state == PipelineState.PLAYING
         if state == PipelineState.PLAYING:
             self.button_image_play_pause.set_property("icon-name", "media-playback-pause-symbolic")
         elif state == PipelineState.PAUSED:
@@ -514,6 +622,8 @@ class PreviewView(Gtk.Widget):
         if not self._video_preview_init_done and state == PipelineState.PLAYING:
             self._video_preview_init_done = True
             self._show_video_preview()
+            # models are loaded and playback started, now it's a good time to load the ones the user may want to compare
+            self.frame_restorer_provider.preload(self._frame_restorer_options)
 
     def pause_if_currently_playing(self):
         if not self._video_preview_init_done:
@@ -646,4 +756,8 @@ class PreviewView(Gtk.Widget):
             self.pipeline_manager.close_video_file()
         else:
             GLib.idle_add(self.pipeline_manager.close_video_file)
+        # also removes frames spilled to disk
+        self.restored_frame_cache.close()
+        self.stop_mosaic_presence_scan()
+        self._stop_thumbnail_sprite_index()
     
@@ -0,0 +1,229 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import bisect
+import logging
+import pathlib
+import shutil
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Hashable, Optional
+
+import numpy as np
+import torch
+
+from lada import LOG_LEVEL
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=LOG_LEVEL)
+
+@dataclass
+class _CachedFrame:
+    shape: tuple[int, ...]
+    nbytes: int
+    frame: Optional[torch.Tensor] = None # None if spilled to disk
+    spill_path: Optional[pathlib.Path] = None
+    next_pts: Optional[int] = None # pts of the frame that has been pushed after this one during playback
+
+class RestoredFrameCache:
+    """
+    Bounded cache of restored frames around the playhead so seeking back to or replaying a recently shown passage
+    doesn't need to detect and restore it again.
+
+    Frames are keyed by namespace (video file and restoration settings) and pts. Each frame is linked to the frame following
+    it during playback which allows replaying a contiguous run of cached frames.
+
+    If the memory limit is exceeded frames of other namespaces are evicted first, then the ones farthest away from the playhead.
+    Evicted frames are moved to the spill directory as long as the disk limit allows, otherwise they're dropped.
+    """
+    def __init__(self, max_memory_bytes: int, spill_directory: Optional[pathlib.Path] = None, max_spill_bytes: int = 0):
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_directory = spill_directory
+        self.max_spill_bytes = max_spill_bytes
+        self.lock = threading.Lock()
+        self.frames: dict[Hashable, dict[int, _CachedFrame]] = {}
+        # sorted pts of frames per namespace, separately for frames held in memory and spilled to disk
+        self.memory_pts: dict[Hashable, list[int]] = {}
+        self.spilled_pts: dict[Hashable, list[int]] = {}
+        self.memory_bytes = 0
+        self.spill_bytes = 0
+        self.playhead: tuple[Hashable, int] | None = None
+        self._spill_temp_directory: Optional[pathlib.Path] = None
+        self._spill_file_counter = 0
+
+    def set_limits(self, max_memory_bytes: int, spill_directory: Optional[pathlib.Path] = None, max_spill_bytes: int = 0):
+        with self.lock:
+            if spill_directory != self.spill_directory:
+                self._clear_spilled_frames()
+                self.spill_directory = spill_directory
+            self.max_memory_bytes = max_memory_bytes
+            self.max_spill_bytes = max_spill_bytes
+            self._evict()
+
+    def put(self, namespace: Hashable, pts: int, frame: torch.Tensor, previous_pts: Optional[int] = None, move_playhead: bool = True):
+        """
+        Adds a frame which has just been pushed for playback. previous_pts is the pts of the frame pushed before it, or None after a seek.
+        Frames restored ahead of playback should not move the playhead.
+        """
+        if self.max_memory_bytes <= 0:
+            return
+        with self.lock:
+            namespace_frames = self.frames.setdefault(namespace, {})
+            if previous_pts is not None and previous_pts in namespace_frames:
+                namespace_frames[previous_pts].next_pts = pts
+            if move_playhead:
+                self.playhead = (namespace, pts)
+            if pts in namespace_frames:
+                return
+            # Restored frames are not reused by FrameRestorer so we can keep a reference to frames which are already in RAM
+            cpu_frame = frame if frame.device.type == 'cpu' else frame.to(device='cpu')
+            namespace_frames[pts] = _CachedFrame(shape=tuple(cpu_frame.shape), nbytes=cpu_frame.nbytes, frame=cpu_frame)
+            bisect.insort(self.memory_pts.setdefault(namespace, []), pts)
+            self.memory_bytes += cpu_frame.nbytes
+            self._evict()
+
+    def get(self, namespace: Hashable, pts: int) -> Optional[torch.Tensor]:
+        with self.lock:
+            cached_frame = self.frames.get(namespace, {}).get(pts)
+            if cached_frame is None:
+                return None
+            self.playhead = (namespace, pts)
+            if cached_frame.frame is not None:
+                return cached_frame.frame
+            try:
+                data = np.fromfile(cached_frame.spill_path, dtype=np.uint8)
+            except OSError as e:
+                logger.warning(f"could not read spilled frame {cached_frame.spill_path}: {e}")
+                self._remove(namespace, pts)
+                return None
+            return torch.from_numpy(data.reshape(cached_frame.shape))
+
+    def has_capacity_for(self, nbytes: int) -> bool:
+        """
+        Returns True if a frame of the given size could be added without evicting any frames.
+        """
+        with self.lock:
+            fits_into_memory = self.memory_bytes + nbytes <= self.max_memory_bytes
+            fits_onto_disk = self.spill_directory is not None and self.spill_bytes + nbytes <= self.max_spill_bytes
+            return self.max_memory_bytes > 0 and (fits_into_memory or fits_onto_disk)
+
+    def get_next_pts(self, namespace: Hashable, pts: int) -> Optional[int]:
+        with self.lock:
+            cached_frame = self.frames.get(namespace, {}).get(pts)
+            if cached_frame is None or cached_frame.next_pts not in self.frames[namespace]:
+                return None
+            return cached_frame.next_pts
+
+    def find(self, namespace: Hashable, pts: int) -> Optional[int]:
+        """
+        Returns the pts of the cached frame which would be shown at the given pts, or None if there is no such frame.
+        """
+        with self.lock:
+            namespace_frames = self.frames.get(namespace)
+            if not namespace_frames:
+                return None
+            if pts in namespace_frames:
+                return pts
+            candidates = [self._get_preceding_pts(self.memory_pts.get(namespace, []), pts), self._get_preceding_pts(self.spilled_pts.get(namespace, []), pts)]
+            candidates = [candidate for candidate in candidates if candidate is not None]
+            if len(candidates) == 0:
+                return None
+            candidate = max(candidates)
+            next_pts = namespace_frames[candidate].next_pts
+            return candidate if next_pts is not None and next_pts > pts and next_pts in namespace_frames else None
+
+    def get_run_end(self, namespace: Hashable, pts: int) -> int:
+        """
+        Returns the pts of the last frame of the contiguous run of cached frames starting at the given pts.
+        """
+        with self.lock:
+            namespace_frames = self.frames[namespace]
+            while (next_pts := namespace_frames[pts].next_pts) in namespace_frames:
+                pts = next_pts
+            return pts
+
+    def clear(self):
+        with self.lock:
+            self._clear_spilled_frames()
+            self.frames = {}
+            self.memory_pts = {}
+            self.spilled_pts = {}
+            self.memory_bytes = 0
+            self.playhead = None
+
+    def close(self):
+        self.clear()
+
+    def _get_preceding_pts(self, sorted_pts: list[int], pts: int) -> Optional[int]:
+        idx = bisect.bisect_right(sorted_pts, pts)
+        return sorted_pts[idx - 1] if idx > 0 else None
+
+    def _get_eviction_candidate(self, pts_by_namespace: dict[Hashable, list[int]]) -> Optional[tuple[Hashable, int]]:
+        playhead_namespace, playhead_pts = self.playhead if self.playhead else (None, 0)
+        for namespace, sorted_pts in pts_by_namespace.items():
+            if namespace != playhead_namespace and len(sorted_pts) > 0:
+                return namespace, sorted_pts[0]
+        sorted_pts = pts_by_namespace.get(playhead_namespace)
+        if not sorted_pts:
+            return None
+        first, last = sorted_pts[0], sorted_pts[-1]
+        return playhead_namespace, first if playhead_pts - first > last - playhead_pts else last
+
+    def _evict(self):
+        while self.memory_bytes > self.max_memory_bytes:
+            namespace, pts = self._get_eviction_candidate(self.memory_pts)
+            cached_frame = self.frames[namespace][pts]
+            if self.spill_directory is not None and cached_frame.nbytes <= self.max_spill_bytes:
+                self._spill(namespace, pts, cached_frame)
+            else:
+                self._remove(namespace, pts)
+        while self.spill_bytes > self.max_spill_bytes:
+            namespace, pts = self._get_eviction_candidate(self.spilled_pts)
+            self._remove(namespace, pts)
+
+    def _spill(self, namespace: Hashable, pts: int, cached_frame: _CachedFrame):
+        try:
+            if self._spill_temp_directory is None:
+                self.spill_directory.mkdir(parents=True, exist_ok=True)
+                self._spill_temp_directory = pathlib.Path(tempfile.mkdtemp(prefix="lada_preview_cache_", dir=self.spill_directory))
+            spill_path = self._spill_temp_directory.joinpath(f"{self._spill_file_counter}.raw")
+            self._spill_file_counter += 1
+            cached_frame.frame.numpy().tofile(spill_path)
+        except OSError as e:
+            logger.warning(f"could not spill frame to disk, dropping it instead: {e}")
+            self._remove(namespace, pts)
+            return
+        self.memory_pts[namespace].remove(pts)
+        self.memory_bytes -= cached_frame.nbytes
+        cached_frame.frame = None
+        cached_frame.spill_path = spill_path
+        bisect.insort(self.spilled_pts.setdefault(namespace, []), pts)
+        self.spill_bytes += cached_frame.nbytes
+
+    def _remove(self, namespace: Hashable, pts: int):
+        cached_frame = self.frames[namespace].pop(pts)
+        if cached_frame.frame is not None:
+            self.memory_pts[namespace].remove(pts)
+            self.memory_bytes -= cached_frame.nbytes
+        else:
+            self.spilled_pts[namespace].remove(pts)
+            self.spill_bytes -= cached_frame.nbytes
+            cached_frame.spill_path.unlink(missing_ok=True)
+        if len(self.frames[namespace]) == 0:
+            del self.frames[namespace]
+            self.memory_pts.pop(namespace, None)
+            self.spilled_pts.pop(namespace, None)
+
+    def _clear_spilled_frames(self):
+        for namespace, sorted_pts in list(self.spilled_pts.items()):
+            for pts in list(sorted_pts):
+                self.frames[namespace].pop(pts)
+            if namespace in self.frames and len(self.frames[namespace]) == 0:
+                del self.frames[namespace]
+                self.memory_pts.pop(namespace, None)
+        self.spilled_pts = {}
+        self.spill_bytes = 0
+        if self._spill_temp_directory is not None:
+            shutil.rmtree(self._spill_temp_directory, ignore_errors=True)
+            self._spill_temp_directory = None
@@ -1,12 +1,15 @@
 # SPDX-FileCopyrightText: Lada Authors
 # SPDX-License-Identifier: AGPL-3.0
 
+import math
 import pathlib
 from dataclasses import dataclass
 
+import numpy as np
 from gi.repository import Gtk, GObject, Gdk, Graphene, Gsk, Adw
 
 from lada.gui import utils
+from lada.restorationpipeline.mosaic_presence_scanner import get_mosaic_density
 
 here = pathlib.Path(__file__).parent.resolve()
 
@@ -15,6 +18,7 @@ class TimelineColors:
     timeline_color: Gdk.RGBA()
     playhead_color: Gdk.RGBA()
     cursor_color: Gdk.RGBA()
+    mosaic_density_color: Gdk.RGBA()
 
 @Gtk.Template(string=utils.translate_ui_xml(here / 'timeline.ui'))
 class Timeline(Gtk.Widget):
@@ -58,6 +62,7 @@ class Timeline(Gtk.Widget):
         self._playhead_position = 0
         self.cursor_position_x: int | None = None
         self._duration = 0
+        self._mosaic_presence: np.ndarray | None = None
         self.set_hexpand(True)
 
         self.gesture_drag = Gtk.GestureDrag.new()
@@ -85,6 +90,13 @@ class Timeline(Gtk.Widget):
         self._playhead_position = value
         self.queue_draw()
 
+    def set_mosaic_presence(self, mosaic_presence: np.ndarray | None):
+        """
+        Per-frame mosaic presence as recorded by MosaicPresenceScanner, drawn as density strip. Call queue_draw() to pick up progress of a running scan.
+        """
+        self._mosaic_presence = mosaic_presence
+        self.queue_draw()
+
     def on_drag_end(self, offset_x):
         x = self.drag_start + offset_x
         x = max(0, x)
@@ -139,6 +151,9 @@ class Timeline(Gtk.Widget):
         s.append_color(colors.timeline_color, background_rect)
         s.pop()
 
+        if self._mosaic_presence is not None and len(self._mosaic_presence) > 0:
+            self.snapshot_mosaic_density(s, width, height, colors.mosaic_density_color)
+
         playhead_rect_x = playhead_position_x - (playhead_width // 2)
         if playhead_rect_x < 0:
             playhead_rect_x = 0
@@ -158,6 +173,20 @@ class Timeline(Gtk.Widget):
 
         s.pop()
 
+    def snapshot_mosaic_density(self, s: Gtk.Snapshot, width: int, height: int, mosaic_density_color: Gdk.RGBA):
+        bin_width = 2
+        bins = max(1, width // bin_width)
+        density = get_mosaic_density(self._mosaic_presence, bins)
+        max_alpha = mosaic_density_color.alpha
+        for i, bin_density in enumerate(density):
+            if math.isnan(bin_density) or bin_density == 0.:
+                continue
+            color = mosaic_density_color.copy()
+            # even single frames with mosaics should be visible
+            color.alpha = max_alpha * (0.3 + 0.7 * bin_density)
+            x = i * width / bins
+            s.append_color(color, Graphene.Rect().init(x, 0, width / bins, height))
+
     def get_timeline_colors(self) -> TimelineColors:
         if self._style_manager:
             playhead_color = self._style_manager.get_accent_color()
@@ -175,11 +204,15 @@ class Timeline(Gtk.Widget):
 
         timeline_color = Gdk.RGBA()
         cursor_color = Gdk.RGBA()
+        mosaic_density_color = Gdk.RGBA()
         if uses_dark_scheme:
             timeline_color.parse("#ffffff1a")
             cursor_color.parse("#ffffffff")
+            # Adwaita orange_2 / orange_4
+            mosaic_density_color.parse("#ffa348b3")
         else:
             timeline_color.parse("#0000001a")
             cursor_color.parse("#000000ff")
+            mosaic_density_color.parse("#e66100b3")
 
-        return TimelineColors(timeline_color, playhead_color, cursor_color)
+        return TimelineColors(timeline_color, playhead_color, cursor_color, mosaic_density_color)
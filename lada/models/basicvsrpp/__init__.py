@@ -5,4 +5,5 @@ def register_all_modules():
     from lada.models.basicvsrpp.mmagic import register_all_modules
     register_all_modules()
     from lada.models.basicvsrpp.basicvsrpp_gan import BasicVSRPlusPlusGanNet, BasicVSRPlusPlusGan
-    from lada.models.basicvsrpp.mosaic_video_dataset import MosaicVideoDataset
\ No newline at end of file
+    from lada.models.basicvsrpp.batch_augmentation import MosaicAugmentationDataPreprocessor
+    from lada.models.basicvsrpp.mosaic_video_dataset import MosaicVideoDataset, PackedMosaicVideoDataset
\ No newline at end of file
@@ -0,0 +1,200 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+"""
+Batched on-device counterpart of the augmentations done in MosaicVideoDataset.__getitem__ (mosaic, degradation, repad, flip and rotation).
+
+With option batch_augmentation MosaicVideoDataset only loads GT frames and masks (resized to lq_size) and samples mosaic parameters per clip.
+MosaicAugmentationDataPreprocessor then creates the low-quality inputs for the whole (B, T, C, H, W) batch on the training device.
+"""
+
+import math
+
+import torch
+import torch.nn.functional as F
+from torchvision.transforms.v2 import functional as TF
+
+from lada.models.basicvsrpp.mmagic.data_preprocessor import DataPreprocessor
+from lada.models.basicvsrpp.mmagic.registry import MODELS
+from lada.utils.jpeg_utils import DiffJPEG
+
+MOSAIC_MODS = ['squa_mid', 'squa_avg', 'rect_avg']
+
+def _count_active_lines(active_lines: torch.Tensor) -> torch.Tensor:
+    # number of rows/columns between the first and last block containing mosaic, per frame. active_lines: (T, N)
+    idx = torch.arange(active_lines.shape[-1], device=active_lines.device)
+    first = torch.where(active_lines, idx, active_lines.shape[-1]).amin(dim=-1)
+    last = torch.where(active_lines, idx, -1).amax(dim=-1)
+    return (last - first + 1).clamp(min=0)
+
+def add_mosaic(imgs: torch.Tensor, masks: torch.Tensor, block_size: int, mod: str, rect_ratio: float, feather: int) -> torch.Tensor:
+    """
+    Tensor version of mosaic_utils.addmosaic_clip for all frames of a clip at once.
+    Follows it step by step: reflect padding, incomplete rect blocks at the right edge, feathering only if the mosaic spans
+    more than 4 blocks in each direction and a box blur with cv2.blur's anchor and border handling, quantized like its uint8 output.
+    Only difference: block values and blended pixels stay float instead of being truncated to uint8.
+    imgs: (T, C, H, W) float, masks: (T, 1, H, W) float with 0 or 1 values
+    """
+    n_h = block_size
+    n_w = int(block_size * rect_ratio) if mod == 'rect_avg' else block_size
+    h, w = imgs.shape[-2:]
+    h_step, w_step = math.ceil(h / n_h), math.ceil(w / n_w)
+    pad = block_size
+    imgs_padded = F.pad(imgs, (0, pad, 0, pad), mode='reflect')
+    masks_padded = F.pad(masks, (0, pad, 0, pad), mode='constant', value=0)
+
+    if mod == 'squa_mid':
+        block_values = imgs_padded[..., n_h // 2::n_h, n_w // 2::n_w][..., :h_step, :w_step]
+    else:
+        # the last column of rect blocks can be cut off at the right edge of the padded image, its mean only covers the remaining columns
+        blocks_w = min(w_step * n_w, w + pad)
+        blocks = F.pad(imgs_padded[..., :h_step * n_h, :blocks_w], (0, w_step * n_w - blocks_w))
+        block_sums = F.avg_pool2d(blocks, (n_h, n_w), divisor_override=1)
+        block_widths = (blocks_w - torch.arange(w_step, device=imgs.device) * n_w).clamp(max=n_w)
+        block_values = block_sums / (n_h * block_widths)
+    # a block will be mosaic'd if the mask pixel in the center of the block is set
+    active_blocks = masks_padded[..., n_h // 2::n_h, n_w // 2::n_w][..., :h_step, :w_step] > 0
+
+    def _upsample(blocks):
+        return blocks.repeat_interleave(n_h, dim=-2).repeat_interleave(n_w, dim=-1)[..., :h, :w]
+
+    img_mosaic = torch.where(_upsample(active_blocks), _upsample(block_values), imgs)
+    if feather == -1:
+        return img_mosaic
+
+    min_block_count = 4
+    row_counts = _count_active_lines(active_blocks[:, 0].any(dim=-1))
+    col_counts = _count_active_lines(active_blocks[:, 0].any(dim=-2))
+    feathered_frames = (row_counts > min_block_count) & (col_counts > min_block_count)
+    if not feathered_frames.any():
+        return img_mosaic
+    kernel_size = n_h if feather == 0 else feather
+    # windows of cv2.blur extend one pixel further up and left than down and right for even kernel sizes, borders are reflected (BORDER_REFLECT_101)
+    kernel_pad_before = kernel_size // 2
+    kernel_pad_after = kernel_size - 1 - kernel_pad_before
+    masks_feathered = F.pad(masks[feathered_frames], (kernel_pad_before, kernel_pad_after, kernel_pad_before, kernel_pad_after), mode='reflect')
+    weights = torch.round(F.avg_pool2d(masks_feathered, kernel_size, stride=1) * 255.) / 255.
+    img_mosaic[feathered_frames] = imgs[feathered_frames] * (1 - weights) + img_mosaic[feathered_frames] * weights
+    return img_mosaic
+
+def get_gaussian_kernel(sigma: float, kernel_size: int, device) -> torch.Tensor:
+    x = torch.arange(kernel_size, device=device, dtype=torch.float32) - kernel_size // 2
+    kernel_1d = torch.exp(-x ** 2 / (2 * sigma ** 2))
+    kernel = kernel_1d[:, None] * kernel_1d[None, :]
+    return kernel / kernel.sum()
+
+def zero_pads(imgs: torch.Tensor, pads: torch.Tensor) -> torch.Tensor:
+    """
+    imgs: (B, T, C, H, W), pads: (B, T, 4) with pad top, bottom, left, right of each frame
+    """
+    h, w = imgs.shape[-2:]
+    rows = torch.arange(h, device=imgs.device)[None, None, :]
+    cols = torch.arange(w, device=imgs.device)[None, None, :]
+    keep_rows = (rows >= pads[..., 0:1]) & (rows < h - pads[..., 1:2])
+    keep_cols = (cols >= pads[..., 2:3]) & (cols < w - pads[..., 3:4])
+    keep = keep_rows[..., :, None] & keep_cols[..., None, :]
+    return imgs * keep[:, :, None, :, :]
+
+@MODELS.register_module()
+class MosaicAugmentationDataPreprocessor(DataPreprocessor):
+    """
+    DataPreprocessor which creates low-quality inputs from GT frames and masks of batches returned by MosaicVideoDataset with batch_augmentation enabled.
+    Other batches are passed through to DataPreprocessor unchanged.
+
+    Video codecs can't run on tensors so compression artifacts of the degradation pipeline are created by (non-differentiable) DiffJPEG instead.
+
+    With resize_mosaic enabled frames are upscaled to the original resolution of the clip, mosaic'd there and resized back to lq_size.
+    This matches MosaicVideoDataset where ResizeFrames downscales frames only after the mosaic has been applied, which smooths the block edges.
+    Disable it to save memory and time, the mosaic will then be applied directly on lq_size frames with scaled block sizes and hard block edges.
+    """
+    def __init__(self, degrade=True, resize_mosaic=True, use_hflip=True, rotate_prob=0.3, blur_prob=0.3, noise_prob=0.2, jpeg_prob=0.9, jpeg_range=(30, 95), **kwargs):
+        super().__init__(**kwargs)
+        self.degrade = degrade
+        self.resize_mosaic = resize_mosaic
+        self.use_hflip = use_hflip
+        self.rotate_prob = rotate_prob
+        self.blur_prob = blur_prob
+        self.noise_prob = noise_prob
+        self.jpeg_prob = jpeg_prob
+        self.jpeg_range = jpeg_range
+        self.jpeger = DiffJPEG(differentiable=False)
+
+    def _degrade(self, img_lqs: torch.Tensor) -> torch.Tensor:
+        # img_lqs: (B, T, C, H, W) in [0, 1]. Random parameters are sampled per clip and shared by all of its frames
+        b, t, c, h, w = img_lqs.shape
+        device = img_lqs.device
+        degraded = []
+        for i in range(b):
+            clip = img_lqs[i]
+            if torch.rand(1).item() < self.blur_prob:
+                sigma = float(torch.randint(1, 4, (1,)).item())
+                clip = F.conv2d(F.pad(clip.reshape(t * c, 1, h, w), (6, 6, 6, 6), mode='reflect'), get_gaussian_kernel(sigma, 13, device)[None, None]).reshape(t, c, h, w)
+            if torch.rand(1).item() < self.noise_prob:
+                snr = 50
+                clip = clip + torch.randn_like(clip) * 10 ** (-snr / 20)
+            degraded.append(clip)
+        img_lqs = torch.stack(degraded).clamp(0, 1)
+
+        apply_jpeg = torch.rand(b, device=device) < self.jpeg_prob
+        if apply_jpeg.any():
+            clips = img_lqs[apply_jpeg]
+            n = clips.shape[0]
+            quality = torch.empty(n, device=device).uniform_(*self.jpeg_range).repeat_interleave(t)
+            img_lqs[apply_jpeg] = self.jpeger(clips.reshape(n * t, c, h, w), quality=quality).reshape(n, t, c, h, w).clamp(0, 1)
+        return img_lqs
+
+    def _add_mosaic(self, imgs: torch.Tensor, masks: torch.Tensor, block_size: int, mod: str, rect_ratio: float, feather: int, orig_shape: tuple[int, int]) -> torch.Tensor:
+        # imgs: (T, C, H, W), masks: (T, 1, H, W), block_size and feather refer to orig_shape
+        shape = imgs.shape[-2:]
+        if shape == orig_shape:
+            return add_mosaic(imgs, masks, block_size, mod, rect_ratio, feather)
+        if self.resize_mosaic:
+            imgs_orig = F.interpolate(imgs, size=orig_shape, mode='bilinear', align_corners=False)
+            masks_orig = F.interpolate(masks, size=orig_shape, mode='nearest')
+            img_mosaic = add_mosaic(imgs_orig, masks_orig, block_size, mod, rect_ratio, feather)
+            return F.interpolate(img_mosaic, size=shape, mode='bilinear', align_corners=False).clamp(0, 1)
+        scale = orig_shape[0] / shape[0]
+        block_size = max(1, round(block_size / scale))
+        feather = feather if feather <= 0 else max(1, round(feather / scale))
+        return add_mosaic(imgs, masks, block_size, mod, rect_ratio, feather)
+
+    def augment(self, img_gts: torch.Tensor, masks: torch.Tensor, pads: torch.Tensor, mosaic_params: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        img_gts: (B, T, C, H, W) uint8, masks: (B, T, 1, H, W) uint8, pads: (B, T, 4),
+        mosaic_params: (B, 6) block size, mod index, rect ratio, feather size, original height and width of the clip
+        Returns low-quality and GT frames as (B, T, C, H, W) float tensors in the range [0, 255]
+        """
+        img_gts = img_gts.float() / 255.
+        masks = (masks > 0).float()
+        img_lqs = torch.stack([self._add_mosaic(img_gts[i], masks[i], int(block_size), MOSAIC_MODS[int(mod)], float(rect_ratio), int(feather), (int(orig_h), int(orig_w)))
+                               for i, (block_size, mod, rect_ratio, feather, orig_h, orig_w) in enumerate(mosaic_params.tolist())])
+        if self.degrade:
+            img_lqs = self._degrade(img_lqs)
+
+        img_lqs = zero_pads(img_lqs, pads)
+        img_gts = zero_pads(img_gts, pads)
+
+        b = img_gts.shape[0]
+        if self.use_hflip:
+            flip = torch.rand(b, device=img_gts.device) < 0.5
+            img_lqs = torch.where(flip[:, None, None, None, None], img_lqs.flip(-1), img_lqs)
+            img_gts = torch.where(flip[:, None, None, None, None], img_gts.flip(-1), img_gts)
+
+        for i in range(b):
+            if torch.rand(1).item() < self.rotate_prob:
+                rotation_deg = [-2, -1, 1, 2][torch.randint(0, 4, (1,)).item()]
+                img_lqs[i] = TF.rotate(img_lqs[i], rotation_deg, interpolation=TF.InterpolationMode.BILINEAR)
+                img_gts[i] = TF.rotate(img_gts[i], rotation_deg, interpolation=TF.InterpolationMode.BILINEAR)
+
+        return img_lqs * 255., img_gts * 255.
+
+    def forward(self, data: dict, training: bool = False) -> dict:
+        if 'masks' not in data:
+            return super().forward(data, training)
+        data = self.cast_data(data)
+        with torch.no_grad():
+            img_lqs, img_gts = self.augment(data['inputs'], data.pop('masks'), data.pop('pads'), data.pop('mosaic_params'))
+        for data_sample, img_gt in zip(data['data_samples'], img_gts):
+            data_sample.gt_img = img_gt
+        data['inputs'] = img_lqs
+        return super().forward(data, training)
@@ -3,20 +3,27 @@
 
 import glob
 import os.path
+import sqlite3
 from pathlib import Path
+from typing import Iterator
 
+import cv2
 import numpy as np
 import torch
 import torch.utils.data as data
 
 from lada.models.basicvsrpp.mmagic.data_sample import DataSample
 from lada.models.basicvsrpp.mmagic.registry import DATASETS
+from lada.models.basicvsrpp.batch_augmentation import MOSAIC_MODS
 
 import lada.utils.video_utils as video_utils
 from lada.utils import random_utils, transforms as realesrgan_transforms, image_utils
-from lada.utils.mosaic_utils import addmosaic_base, get_random_parameters_by_block_size
+from lada.utils.mosaic_utils import addmosaic_clip, get_random_parameters_by_block_size
 from lada.utils.image_utils import unpad_image, pad_image_by_pad, repad_image, scale_pad
 from lada.datasetcreation.restoration_dataset_metadata import RestorationDatasetMetadataV2
+from lada.datasetcreation.packed_dataset import PackedDataset
+from lada.datasetcreation import restoration_dataset_index
+from lada.datasetcreation.degradation_cache import DegradationCache
 
 from torchvision.transforms import transforms as torchvision_transforms
 
@@ -41,7 +48,7 @@ class MosaicVideoDataset(data.Dataset):
         self.opt = opt
         self.scale = opt.get('scale', 1)
         self.lq_size = opt.get('lq_size', 256)
-        self.meta_root = Path(opt['metadata_root_dir'])
+        self.meta_root = Path(opt['metadata_root_dir'] if 'metadata_root_dir' in opt else opt['packed_dataset_dir'])
         self.use_hflip = opt.get('use_hflip', False)
         self.degrade = opt.get('degrade', False)
         self.max_frame_count = opt['num_frame']
@@ -51,22 +58,66 @@ class MosaicVideoDataset(data.Dataset):
         self.filter_watermark = opt.get('filter_watermark', False)
         self.filter_nudenet_nsfw = opt.get('filter_nudenet_nsfw', False)
         self.filter_video_quality = opt.get('filter_video_quality', False)
+        self.filter_censoring = opt.get('filter_censoring', False)
+        self.filter_min_resolution = opt.get('filter_min_resolution', None)
+        self.use_metadata_index = opt.get('use_metadata_index', True)
+        # probability of creating low-quality frames on-the-fly instead of sampling a pre-rendered variant of the degradation cache
+        self.degradation_cache_fresh_prob = opt.get('degradation_cache_fresh_prob', 0.0)
+        # only load GT frames and masks, mosaic, degradation and geometric augmentations are done by MosaicAugmentationDataPreprocessor on the whole batch
+        self.batch_augmentation = opt.get('batch_augmentation', False)
         self.filter_watermark_thresh = 0.1
         self.repad = True
         self.rng_random, self.rng_numpy = random_utils.get_rngs(self.repeatable_random)
+        if opt.get('degradation_cache_dir'):
+            assert self.degrade and self.random_mosaic_params, "degradation cache can only be used with options degrade and random_mosaic_params"
+            self.degradation_cache = DegradationCache(opt['degradation_cache_dir'], lq_size=self.lq_size)
+        else:
+            self.degradation_cache = None
+
+        self.metadata = None
+        if self.use_metadata_index and restoration_dataset_index.has_index(self.meta_root):
+            self.metadata = self.query_metadata_index()
+        if self.metadata is None:
+            self.metadata = [meta for meta in self.load_metadata() if self.is_selected(meta)]
+
+    def query_metadata_index(self) -> list[RestorationDatasetMetadataV2] | None:
+        try:
+            with restoration_dataset_index.RestorationDatasetIndex(self.meta_root) as index:
+                # metadata files could have been added, modified or removed since the index was last updated
+                index.update()
+                return index.query(min_frames_count=self.min_frame_count,
+                                   min_resolution=self.filter_min_resolution,
+                                   min_quality=self.filter_video_quality if self.filter_video_quality else None,
+                                   filter_watermark=self.filter_watermark,
+                                   filter_nudenet_nsfw=self.filter_nudenet_nsfw,
+                                   filter_censoring=self.filter_censoring)
+        except sqlite3.Error:
+            # e.g. read-only dataset directory, the index can't be synced so it can't be trusted either
+            return None
+
+    def load_metadata(self) -> Iterator[RestorationDatasetMetadataV2]:
+        for meta_path in glob.glob(os.path.join(self.meta_root, '*.json')):
+            yield RestorationDatasetMetadataV2.from_json_file(meta_path)
 
-        self.metadata = []
-        for meta_path in glob.glob(os.path.join(opt['metadata_root_dir'], '*')):
-            meta = RestorationDatasetMetadataV2.from_json_file(meta_path)
-            if meta.frames_count < self.min_frame_count:
-                continue
-            if self.filter_watermark and meta.watermark_detected:
-                continue
-            if self.filter_nudenet_nsfw and not meta.nudenet_nsfw_detected:
-                continue
-            if self.filter_video_quality and meta.video_quality and meta.video_quality.overall < self.filter_video_quality:
-                continue
-            self.metadata.append(meta)
+    def is_selected(self, meta: RestorationDatasetMetadataV2) -> bool:
+        if meta.frames_count < self.min_frame_count:
+            return False
+        if self.filter_watermark and meta.watermark_detected:
+            return False
+        if self.filter_nudenet_nsfw and not meta.nudenet_nsfw_detected:
+            return False
+        if self.filter_video_quality and meta.video_quality and meta.video_quality.overall < self.filter_video_quality:
+            return False
+        if self.filter_censoring and meta.censoring_detected:
+            return False
+        if self.filter_min_resolution and min(meta.orig_shape) < self.filter_min_resolution:
+            return False
+        return True
+
+    def read_frames(self, meta: RestorationDatasetMetadataV2, stream: str, start_frame_idx: int, end_frame_idx: int) -> list[np.ndarray]:
+        # stream is one of nsfw_video, mask_video, mosaic_nsfw_video or mosaic_mask_video
+        path = str(self.meta_root.joinpath(getattr(meta, f"relative_{stream}_path")))
+        return video_utils.read_video_frames(path, float32=False, start_idx=start_frame_idx, end_idx=end_frame_idx, binary_frames=stream.endswith('mask_video'))
 
     def get_mosaic_params(self, meta: RestorationDatasetMetadataV2):
         if self.random_mosaic_params:
@@ -75,6 +126,21 @@ class MosaicVideoDataset(data.Dataset):
             mosaic_size, mosaic_mod, mosaic_rectangle_ratio, mosaic_feather_size = meta.mosaic.mosaic_size, meta.mosaic.mod, meta.mosaic.rect_ratio, meta.mosaic.feather_size
         return mosaic_size, mosaic_mod, mosaic_rectangle_ratio, mosaic_feather_size
 
+    def create_lq_frames(self, meta: RestorationDatasetMetadataV2, img_gts: list[np.ndarray], mask_gts: list[np.ndarray], pads) -> list[np.ndarray]:
+        mosaic_size, mosaic_mod, mosaic_rectangle_ratio, mosaic_feather_size = self.get_mosaic_params(meta)
+
+        img_lqs, _ = addmosaic_clip([unpad_image(img_gt, pad) for img_gt, pad in zip(img_gts, pads)],
+                                    [unpad_image(mask_gt, pad) for mask_gt, pad in zip(mask_gts, pads)],
+                                    mosaic_size,
+                                    model=mosaic_mod,
+                                    rect_ratio=mosaic_rectangle_ratio,
+                                    feather=mosaic_feather_size)
+        img_lqs = [pad_image_by_pad(img_lq, pad) for img_lq, pad in zip(img_lqs, pads)]
+        if self.degrade:
+            degrade = create_degradation_pipeline(self.lq_size)
+            img_lqs = degrade(img_lqs)
+        return img_lqs
+
     def get_end_frame_index(self, meta):
         if self.max_frame_count == -1:
             # select the full clip
@@ -94,33 +160,24 @@ class MosaicVideoDataset(data.Dataset):
         pads = meta.pad[start_frame_idx:end_frame_idx]
 
         vid_gt_path = str(Path(self.meta_root).joinpath(meta.relative_nsfw_video_path))
-        img_gts = video_utils.read_video_frames(vid_gt_path, float32=False, start_idx=start_frame_idx, end_idx=end_frame_idx)
+        img_gts = self.read_frames(meta, 'nsfw_video', start_frame_idx, end_frame_idx)
 
         h, w = img_gts[0].shape[:2]
         scale_h = h / self.lq_size
         scale_w = w / self.lq_size
         scaled_pads = [scale_pad(pad, scale_h, scale_w) for pad in pads]
 
+        if self.batch_augmentation:
+            return self.get_batch_augmentation_item(meta, img_gts, start_frame_idx, end_frame_idx, scaled_pads, vid_gt_path)
+
+        degraded_variants = self.degradation_cache.get_variants(meta.relative_nsfw_video_path) if self.degradation_cache else None
         if not self.random_mosaic_params:
-            vid_lq_path = str(Path(self.meta_root).joinpath(meta.relative_mosaic_nsfw_video_path))
-            img_lqs = video_utils.read_video_frames(vid_lq_path, float32=False, start_idx=start_frame_idx, end_idx=end_frame_idx)
+            img_lqs = self.read_frames(meta, 'mosaic_nsfw_video', start_frame_idx, end_frame_idx)
+        elif degraded_variants and self.rng_random.random() >= self.degradation_cache_fresh_prob:
+            img_lqs = self.degradation_cache.read_variant_frames(self.rng_random.choice(degraded_variants), start_frame_idx, end_frame_idx)
         else:
-            vid_mask_gt_path = str(Path(self.meta_root).joinpath(meta.relative_mask_video_path))
-            mask_gts = video_utils.read_video_frames(vid_mask_gt_path, float32=False, start_idx=start_frame_idx, end_idx=end_frame_idx, binary_frames=True)
-            mosaic_size, mosaic_mod, mosaic_rectangle_ratio, mosaic_feather_size = self.get_mosaic_params(meta)
-
-            img_lqs = []
-            for img_gt, mask_gt, pad in zip(img_gts, mask_gts, pads):
-                img_lq, mask_lq = addmosaic_base(unpad_image(img_gt, pad),
-                                                 unpad_image(mask_gt, pad),
-                                                 mosaic_size,
-                                                 model=mosaic_mod,
-                                                 rect_ratio=mosaic_rectangle_ratio,
-                                                 feather=mosaic_feather_size)
-                img_lqs.append(pad_image_by_pad(img_lq, pad))
-            if self.degrade:
-                degrade = create_degradation_pipeline(self.lq_size)
-                img_lqs = degrade(img_lqs)
+            mask_gts = self.read_frames(meta, 'mask_video', start_frame_idx, end_frame_idx)
+            img_lqs = self.create_lq_frames(meta, img_gts, mask_gts, pads)
 
         img_gts = video_utils.resize_video_frames(img_gts, self.lq_size)
         img_lqs = video_utils.resize_video_frames(img_lqs, self.lq_size)
@@ -159,5 +216,54 @@ class MosaicVideoDataset(data.Dataset):
         # inputs = tensor (T,C,H,W)
         return {'inputs': inputs, 'data_samples': data_sample}
 
+    def get_batch_augmentation_item(self, meta: RestorationDatasetMetadataV2, img_gts: list[np.ndarray], start_frame_idx: int, end_frame_idx: int, scaled_pads, vid_gt_path: str):
+        mask_gts = self.read_frames(meta, 'mask_video', start_frame_idx, end_frame_idx)
+        h, w = img_gts[0].shape[:2]
+        img_gts = video_utils.resize_video_frames(img_gts, self.lq_size)
+        mask_gts = [cv2.resize(mask, (self.lq_size, self.lq_size), interpolation=cv2.INTER_NEAREST)[..., None] if mask.shape[:2] != (self.lq_size, self.lq_size) else mask for mask in mask_gts]
+
+        mosaic_size, mosaic_mod, mosaic_rectangle_ratio, mosaic_feather_size = self.get_mosaic_params(meta)
+        # mosaic parameters refer to the original resolution of the clip, MosaicAugmentationDataPreprocessor scales them to lq_size
+        mosaic_params = torch.tensor([mosaic_size, MOSAIC_MODS.index(mosaic_mod), mosaic_rectangle_ratio, mosaic_feather_size, h, w], dtype=torch.float32)
+
+        img_gts = torch.stack(image_utils.img2tensor(img_gts, float32=False, bgr2rgb=True), dim=0)
+        mask_gts = torch.stack(image_utils.img2tensor(mask_gts, float32=False, bgr2rgb=False), dim=0)
+
+        data_sample = DataSample(gt_img=img_gts)
+        data_sample.set_predefined_data({
+            'gt_path': vid_gt_path,
+            'gt_channel_order': 'rgb',
+            'gt_color_type': 'color',
+            'key': meta.name,
+            'fps': meta.fps
+        })
+        # inputs = GT tensor (T,C,H,W), will be replaced by low-quality frames in MosaicAugmentationDataPreprocessor
+        return {'inputs': img_gts, 'masks': mask_gts, 'pads': torch.tensor(scaled_pads, dtype=torch.int64), 'mosaic_params': mosaic_params, 'data_samples': data_sample}
+
     def __len__(self):
-        return len(self.metadata)
\ No newline at end of file
+        return len(self.metadata)
+
+@DATASETS.register_module()
+class PackedMosaicVideoDataset(MosaicVideoDataset):
+    """
+    Same as MosaicVideoDataset but reads clips and metadata from a packed dataset (see lada.datasetcreation.packed_dataset)
+    instead of decoding video files. Set option packed_dataset_dir instead of metadata_root_dir.
+    """
+    def __init__(self, **opt):
+        self.packed_dataset = PackedDataset(opt['packed_dataset_dir'])
+        super(PackedMosaicVideoDataset, self).__init__(**opt)
+
+    def query_metadata_index(self) -> list[RestorationDatasetMetadataV2] | None:
+        # the index is only kept for metadata directories, packed datasets store their metadata in the shards
+        return None
+
+    def load_metadata(self) -> Iterator[RestorationDatasetMetadataV2]:
+        # meta.name is the name of the source video and shared by all of its clips, path of the clip is unique though
+        self.packed_clip_indices = {}
+        for clip_idx, clip in enumerate(self.packed_dataset.clips):
+            meta = RestorationDatasetMetadataV2.from_dict(clip.metadata)
+            self.packed_clip_indices[meta.relative_nsfw_video_path] = clip_idx
+            yield meta
+
+    def read_frames(self, meta: RestorationDatasetMetadataV2, stream: str, start_frame_idx: int, end_frame_idx: int) -> list[np.ndarray]:
+        return self.packed_dataset.read_frames(self.packed_clip_indices[meta.relative_nsfw_video_path], stream, start_frame_idx, end_frame_idx)
@@ -5,12 +5,14 @@ import json
 import os.path
 import random
 import glob
+from typing import Iterator
 
 import numpy as np
 import torch
 import torch.utils.data as data
 import lada.utils.video_utils as video_utils
 from lada.utils import image_utils
+from lada.datasetcreation.packed_dataset import PackedDataset
 
 
 class MosaicVideoDataset(data.Dataset):
@@ -18,7 +20,7 @@ class MosaicVideoDataset(data.Dataset):
         super(MosaicVideoDataset, self).__init__()
         self.lq_size = opt.get('lq_size', 256)
         self.gt_size = opt.get('gt_size', 256)
-        self.gt_root, self.lq_root, self.meta_root = opt['dataroot_gt'], opt['dataroot_lq'], opt['dataroot_meta']
+        self.gt_root, self.lq_root, self.meta_root = opt.get('dataroot_gt'), opt.get('dataroot_lq'), opt.get('dataroot_meta')
         self.max_frame_count = opt['num_frame']
         self.min_frame_count = opt['min_num_frame'] if 'min_num_frame' in opt else opt['num_frame']
         self.S = opt.get('S', 3)
@@ -26,16 +28,24 @@ class MosaicVideoDataset(data.Dataset):
 
         self.clip_names = []
         self.total_num_frames = []
+        for clip_name, frame_num in self.load_clips():
+            if frame_num < self.min_frame_count:
+                continue
+            self.clip_names.append(clip_name)
+            self.total_num_frames.append(frame_num)
+
+    def load_clips(self) -> Iterator[tuple[str, int]]:
         for meta_path in glob.glob(os.path.join(self.meta_root, '*')):
             with open(meta_path, 'r') as meta_file:
                 meta_json = json.load(meta_file)
                 filename = f"{os.path.splitext(os.path.basename(meta_path))[0]}.mp4"
-                frame_num = meta_json["frame_count"]
-                if frame_num < self.min_frame_count:
-                    continue
-                self.clip_names.append(filename)
-                self.total_num_frames.append(frame_num)
+                yield filename, meta_json["frame_count"]
 
+    def read_frames(self, index, stream, start_frame_idx, end_frame_idx) -> list[np.ndarray]:
+        # stream is either lq or gt
+        root = self.lq_root if stream == 'lq' else self.gt_root
+        vid_path = os.path.join(root, self.clip_names[index])
+        return video_utils.read_video_frames(vid_path, float32=True, start_idx=start_frame_idx, end_idx=end_frame_idx, normalize_neg1_pos1=True)
 
     def __getitem__(self, index):
         clip_name = self.clip_names[index]
@@ -51,10 +61,8 @@ class MosaicVideoDataset(data.Dataset):
             end_frame_idx = start_frame_idx + self.max_frame_count
 
         # get the neighboring LQ and GT frames
-        vid_lq_path = os.path.join(self.lq_root, clip_name)
-        vid_gt_path = os.path.join(self.gt_root, clip_name)
-        img_lqs = video_utils.read_video_frames(vid_lq_path, float32=True, start_idx=start_frame_idx, end_idx=end_frame_idx, normalize_neg1_pos1=True)
-        img_gts = video_utils.read_video_frames(vid_gt_path, float32=True, start_idx=start_frame_idx, end_idx=end_frame_idx, normalize_neg1_pos1=True)
+        img_lqs = self.read_frames(index, 'lq', start_frame_idx, end_frame_idx)
+        img_gts = self.read_frames(index, 'gt', start_frame_idx, end_frame_idx)
 
         img_gts = torch.stack(image_utils.img2tensor(img_gts), dim=0)
         img_lqs = torch.stack(image_utils.img2tensor(img_lqs), dim=0)
@@ -80,4 +88,23 @@ class MosaicVideoDataset(data.Dataset):
         return img_gts_batch, img_lqs_batch
 
     def __len__(self):
-        return len(self.clip_names)
\ No newline at end of file
+        return len(self.clip_names)
+
+class PackedMosaicVideoDataset(MosaicVideoDataset):
+    """
+    Same as MosaicVideoDataset but reads clips from a packed dataset (see lada.datasetcreation.packed_dataset) with streams lq and gt
+    instead of decoding video files. Set option dataroot_packed instead of dataroot_gt, dataroot_lq and dataroot_meta.
+    """
+    def __init__(self, opt):
+        self.packed_dataset = PackedDataset(opt['dataroot_packed'])
+        super(PackedMosaicVideoDataset, self).__init__(opt)
+
+    def load_clips(self) -> Iterator[tuple[str, int]]:
+        self.packed_clip_indices = {}
+        for clip_idx, clip in enumerate(self.packed_dataset.clips):
+            self.packed_clip_indices[clip.name] = clip_idx
+            yield clip.name, clip.frames_count
+
+    def read_frames(self, index, stream, start_frame_idx, end_frame_idx) -> list[np.ndarray]:
+        frames = self.packed_dataset.get_frames(self.packed_clip_indices[self.clip_names[index]], stream, start_frame_idx, end_frame_idx)
+        return list((frames.astype(np.float32) / 255.0 - 0.5) / 0.5)
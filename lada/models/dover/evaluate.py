@@ -13,14 +13,59 @@ import yaml
 # Importing necessary modules from the DOVER package
 from lada.models.dover.datasets import (
     UnifiedFrameSampler,
+    get_single_view,
     spatial_temporal_view_decomposition,
 )
 from lada.models.dover.models import DOVER
 
 
+BRANCHES = ("technical", "aesthetic")
+
+def get_spatial_fragments_vectorized(video: torch.Tensor, fragments_h=7, fragments_w=7, fsize_h=32, fsize_w=32, aligned=32, **kwargs) -> torch.Tensor:
+    """
+    Same as dover_datasets.get_spatial_fragments (with default options) but gathers all fragments with a single indexing operation
+    instead of copying them one by one. Consumes random numbers in the same order so results are identical for the same seed.
+    video: [C,T,H,W]
+    """
+    size_h = fragments_h * fsize_h
+    size_w = fragments_w * fsize_w
+    if video.shape[1] == 1:
+        aligned = 1
+
+    dur_t, res_h, res_w = video.shape[-3:]
+    ratio = min(res_h / size_h, res_w / size_w)
+    if ratio < 1:
+        ovideo = video
+        video = torch.nn.functional.interpolate(video / 255.0, scale_factor=1 / ratio, mode="bilinear")
+        video = (video * 255.0).type_as(ovideo)
+    assert dur_t % aligned == 0, "Please provide match vclip and align index"
+
+    device = video.device
+    hgrids = torch.tensor([min(res_h // fragments_h * i, res_h - fsize_h) for i in range(fragments_h)], device=device)
+    wgrids = torch.tensor([min(res_w // fragments_w * i, res_w - fsize_w) for i in range(fragments_w)], device=device)
+    hlength, wlength = res_h // fragments_h, res_w // fragments_w
+    rnd_shape = (fragments_h, fragments_w, dur_t // aligned)
+    rnd_h = torch.randint(hlength - fsize_h, rnd_shape) if hlength > fsize_h else torch.zeros(rnd_shape, dtype=torch.int64)
+    rnd_w = torch.randint(wlength - fsize_w, rnd_shape) if wlength > fsize_w else torch.zeros(rnd_shape, dtype=torch.int64)
+    rnd_h, rnd_w = rnd_h.to(device), rnd_w.to(device)
+
+    # view of all fsize_h x fsize_w patches of the video: [C,T,H',W',fsize_h,fsize_w]. Gather the top-left corner of each fragment at once
+    patches = video.unfold(2, fsize_h, 1).unfold(3, fsize_w, 1)
+    t = torch.arange(dur_t, device=device)[:, None, None]
+    t_chunk = t // aligned
+    i = torch.arange(fragments_h, device=device)[None, :, None]
+    j = torch.arange(fragments_w, device=device)[None, None, :]
+    rows = hgrids[i] + rnd_h[i, j, t_chunk]
+    cols = wgrids[j] + rnd_w[i, j, t_chunk]
+    fragments = patches[:, t, rows, cols] # [C,T,fragments_h,fragments_w,fsize_h,fsize_w]
+    return fragments.permute(0, 1, 2, 4, 3, 5).reshape(video.shape[0], dur_t, size_h, size_w).float()
+
 class VideoQualityEvaluator:
-    def __init__(self, device=None):
-        """Setup to load the model and configurations"""
+    def __init__(self, device=None, branches: tuple[str, ...] = BRANCHES):
+        """
+        Setup to load the model and configurations.
+        branches: DOVER branches to run. Only the models of those branches will be loaded.
+        """
         if device is not None:
             self.device = "cuda" if torch.cuda.is_available() else "cpu"
         else:
@@ -31,14 +76,17 @@ class VideoQualityEvaluator:
         with open(config_path, "r") as f:
             self.opt = yaml.safe_load(f)
 
+        assert len(branches) > 0 and all(branch in BRANCHES for branch in branches)
+        self.branches = tuple(branch for branch in BRANCHES if branch in branches)
+
         # Initialize and load the model
-        self.model = DOVER(**self.opt["model"]["args"]).to(self.device)
-        self.model.load_state_dict(
-            torch.load(
-                os.path.join(os.path.dirname(__file__), self.opt["test_load_path"]),
-                map_location=self.device,
-            )
+        model_args = dict(self.opt["model"]["args"], backbone_preserve_keys=",".join(self.branches))
+        self.model = DOVER(**model_args).to(self.device)
+        state_dict = torch.load(
+            os.path.join(os.path.dirname(__file__), self.opt["test_load_path"]),
+            map_location=self.device,
         )
+        self.model.load_state_dict({k: v for k, v in state_dict.items() if k.split("_")[0] in self.branches})
         self.model.eval()
 
         self.mean = torch.FloatTensor([123.675, 116.28, 103.53]).to(self.device)
@@ -48,6 +96,9 @@ class VideoQualityEvaluator:
             self, video, seed: int = 42
     ) -> dict:
         """Predict method to process video and output scores"""
+        if type(video) != str:
+            return self.evaluate_batch([video], seed)[0]
+
         # Set seed for reproducibility
         self.set_seed(seed)
 
@@ -57,23 +108,12 @@ class VideoQualityEvaluator:
         dopt["anno_file"] = None
         dopt["data_prefix"] = os.path.dirname(video_path)
 
-        temporal_samplers = {}
-        for stype, sopt in dopt["sample_types"].items():
-            if "t_frag" not in sopt:
-                temporal_samplers[stype] = UnifiedFrameSampler(
-                    sopt["clip_len"], sopt["num_clips"], sopt["frame_interval"]
-                )
-            else:
-                temporal_samplers[stype] = UnifiedFrameSampler(
-                    sopt["clip_len"] // sopt["t_frag"],
-                    sopt["t_frag"],
-                    sopt["frame_interval"],
-                    sopt["num_clips"],
-                )
+        temporal_samplers = self._get_temporal_samplers()
+        sample_types = {stype: sopt for stype, sopt in dopt["sample_types"].items() if stype in self.branches}
 
         # View Decomposition
         views, _ = spatial_temporal_view_decomposition(
-            video, dopt["sample_types"], temporal_samplers
+            video, sample_types, temporal_samplers
         )
 
         for k, v in views.items():
@@ -86,19 +126,80 @@ class VideoQualityEvaluator:
             )
 
         results = [np.mean(r.cpu().numpy()) for r in self.model(views)]
-        fused_results = self.fuse_results(results)
+        fused_results = self.fuse_results(dict(zip(views.keys(), results)))
 
         return fused_results
 
-    def fuse_results(self, results) -> dict:
-        """Fuse aesthetic and technical results into final scores"""
-        t, a = (results[0] - 0.1107) / 0.07355, (results[1] + 0.08285) / 0.03774
+    def _get_temporal_samplers(self) -> dict[str, UnifiedFrameSampler]:
+        sample_types = self.opt["data"]["val-l1080p"]["args"]["sample_types"]
+        temporal_samplers = {}
+        for stype in self.branches:
+            sopt = sample_types[stype]
+            if "t_frag" not in sopt:
+                temporal_samplers[stype] = UnifiedFrameSampler(sopt["clip_len"], sopt["num_clips"], sopt["frame_interval"])
+            else:
+                temporal_samplers[stype] = UnifiedFrameSampler(sopt["clip_len"] // sopt["t_frag"], sopt["t_frag"], sopt["frame_interval"], sopt["num_clips"])
+        return temporal_samplers
+
+    def evaluate_batch(self, videos: list[list[np.ndarray | torch.Tensor]], seed: int = 42) -> list[dict]:
+        """
+        Scores multiple in-memory clips (list of [H,W,C] uint8 frames each) with a single model call per branch.
+        Each clip is sampled as if it would have been passed to evaluate() on its own so scores are the same.
+        """
+        sample_types = self.opt["data"]["val-l1080p"]["args"]["sample_types"]
+        temporal_samplers = self._get_temporal_samplers()
+        views = {stype: [] for stype in self.branches}
+        for video in videos:
+            # Set seed for reproducibility
+            self.set_seed(seed)
+            frame_inds = {stype: temporal_samplers[stype](len(video)) for stype in self.branches}
+            unique_frame_inds = np.unique(np.concatenate(list(frame_inds.values())))
+            # only the sampled frames are copied to the device, and each of them only once
+            frames = torch.stack([torch.from_numpy(video[idx]) if type(video[idx]) == np.ndarray else video[idx] for idx in unique_frame_inds]).to(self.device)
+            for stype in self.branches:
+                sopt = sample_types[stype]
+                clip = frames[np.searchsorted(unique_frame_inds, frame_inds[stype])].permute(3, 0, 1, 2)
+                if stype == "technical":
+                    view = get_spatial_fragments_vectorized(clip, **sopt)
+                else:
+                    view = get_single_view(clip, stype, **sopt).float()
+                num_clips = sopt.get("num_clips", 1)
+                views[stype].append(
+                    ((view.permute(1, 2, 3, 0) - self.mean) / self.std)
+                    .permute(3, 0, 1, 2)
+                    .reshape(view.shape[0], num_clips, -1, *view.shape[2:])
+                    .transpose(0, 1)
+                )
+
+        batch_views = {stype: torch.cat(stype_views) for stype, stype_views in views.items()}
+        scores = dict(zip(batch_views.keys(), self.model(batch_views)))
+
+        fused_results = []
+        for idx in range(len(videos)):
+            results = {}
+            for stype in self.branches:
+                num_clips = sample_types[stype].get("num_clips", 1)
+                results[stype] = np.mean(scores[stype][idx * num_clips:(idx + 1) * num_clips].cpu().numpy())
+            fused_results.append(self.fuse_results(results))
+        return fused_results
+
+    def fuse_results(self, results: dict) -> dict:
+        """
+        Fuse aesthetic and technical results into final scores. Score of a branch which has not been evaluated will be None.
+        If only one branch has been evaluated the overall score is estimated by assuming an average score (normalized score 0) for the other branch,
+        so it's on the same scale as the fused score and the same quality thresholds can be used.
+        """
+        fused_results = {"aesthetic": None, "technical": None}
+        t = a = 0.
+        if "technical" in results:
+            t = (results["technical"] - 0.1107) / 0.07355
+            fused_results["technical"] = float(1 / (1 + np.exp(-t)))
+        if "aesthetic" in results:
+            a = (results["aesthetic"] + 0.08285) / 0.03774
+            fused_results["aesthetic"] = float(1 / (1 + np.exp(-a)))
         x = t * 0.6104 + a * 0.3896
-        return {
-            "aesthetic": float(1 / (1 + np.exp(-a))),
-            "technical": float(1 / (1 + np.exp(-t))),
-            "overall": float(1 / (1 + np.exp(-x))),
-        }
+        fused_results["overall"] = float(1 / (1 + np.exp(-x)))
+        return fused_results
 
     def set_seed(self, seed):
         """Set the seed for reproducibility"""
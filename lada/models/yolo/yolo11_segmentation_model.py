@@ -1,6 +1,8 @@
 # SPDX-FileCopyrightText: Lada Authors
 # SPDX-License-Identifier: AGPL-3.0
 
+import threading
+
 import torch
 from ultralytics.utils.checks import check_imgsz
 from ultralytics.utils import nms, ops
@@ -41,20 +43,28 @@ class Yolo11SegmentationModel:
         self.dtype = torch.float16 if fp16 else torch.float32
         self.cpu_buffer = None
         self.inference_buffer = None
+        # buffers are shared, serializes inference if the model is used by multiple FrameRestorers at the same time
+        self.lock = threading.Lock()
 
     def preallocate_buffers(self, batch_size: int, img_shape: tuple[int, int, int]):
         self.cpu_buffer = torch.empty(batch_size, *img_shape, dtype=torch.uint8, device='cpu', pin_memory=self.is_cuda_device)
         self.inference_buffer = torch.empty(batch_size, *img_shape, dtype=self.dtype, device=self.device, memory_format=torch.channels_last)
 
     def preprocess(self, imgs: list[torch.Tensor]) -> list[torch.Tensor]:
-        if self.letterbox is None or imgs[0].shape[:2] != self.letterbox.original_shape:
-            self.letterbox = PyTorchLetterBox(self.imgsz, imgs[0].shape[:2], stride=self.stride)
-        return [self.letterbox(im.permute(2, 0, 1).unsqueeze(0)).squeeze(0) for im in imgs]
+        letterbox = self.letterbox
+        if letterbox is None or imgs[0].shape[:2] != letterbox.original_shape:
+            letterbox = PyTorchLetterBox(self.imgsz, imgs[0].shape[:2], stride=self.stride)
+            self.letterbox = letterbox
+        return [letterbox(im.permute(2, 0, 1).unsqueeze(0)).squeeze(0) for im in imgs]
 
     def inference(self, image_batch: torch.Tensor):
         return self.model(image_batch, augment=False, visualize=False, embed=None)
 
     def inference_and_postprocess(self, imgs: list[torch.Tensor], orig_imgs: list[torch.Tensor]) -> list[Results]:
+        with self.lock:
+            return self._inference_and_postprocess(imgs, orig_imgs)
+
+    def _inference_and_postprocess(self, imgs: list[torch.Tensor], orig_imgs: list[torch.Tensor]) -> list[Results]:
         if self.cpu_buffer is None or imgs[0].shape != self.cpu_buffer.shape:
             self.preallocate_buffers(len(imgs), imgs[0].shape)
 
@@ -10,6 +10,18 @@ def load_models(
     mosaic_detection_model_path: str,
     fp16: bool,
     clip_length: int):
+    mosaic_restoration_model, pad_mode = load_restoration_model(device, mosaic_restoration_model_name, mosaic_restoration_model_path,
+                                                                mosaic_restoration_config_path, fp16, clip_length)
+    mosaic_detection_model = load_detection_model(device, mosaic_detection_model_path, fp16)
+    return mosaic_detection_model, mosaic_restoration_model, pad_mode
+
+def load_restoration_model(
+    device: torch.device,
+    mosaic_restoration_model_name: str,
+    mosaic_restoration_model_path: str,
+    mosaic_restoration_config_path: str | None,
+    fp16: bool,
+    clip_length: int):
     if mosaic_restoration_model_name.startswith("deepmosaics"):
         from lada.models.deepmosaics.models import loadmodel
         from lada.restorationpipeline.deepmosaics_mosaic_restorer import DeepmosaicsMosaicRestorer
@@ -24,6 +36,8 @@ def load_models(
         pad_mode = 'zero'
     else:
         raise NotImplementedError()
+    return mosaic_restoration_model, pad_mode
+
+def load_detection_model(device: torch.device, mosaic_detection_model_path: str, fp16: bool) -> Yolo11SegmentationModel:
     # setting classes=[0] will consider only for class id = 0 as detections (nsfw mosaics) therefore filtering out sfw mosaics (heads, faces)
-    mosaic_detection_model = Yolo11SegmentationModel(mosaic_detection_model_path, device, classes=[0], conf=0.2, fp16=fp16)
-    return mosaic_detection_model, mosaic_restoration_model, pad_mode
+    return Yolo11SegmentationModel(mosaic_detection_model_path, device, classes=[0], conf=0.2, fp16=fp16)
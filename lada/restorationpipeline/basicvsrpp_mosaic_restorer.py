@@ -1,3 +1,5 @@
+import threading
+
 import torch
 
 from lada.models.basicvsrpp.basicvsrpp_gan import BasicVSRPlusPlusGan
@@ -10,8 +12,14 @@ class BasicvsrppMosaicRestorer:
         self.cpu_buffer = torch.empty(1, clip_length, 3, 256, 256, dtype=torch.uint8, device='cpu', pin_memory=is_cuda_device)
         self.dtype = torch.float16 if fp16 else torch.float32
         self.inference_buffer = torch.empty(1, clip_length, 3, 256, 256, dtype=self.dtype, device=device, memory_format=torch.channels_last_3d)
+        # buffers are shared, serializes restoration if the model is used by multiple FrameRestorers at the same time
+        self.lock = threading.Lock()
 
     def restore(self, video: list[torch.Tensor], max_frames=-1) -> list[torch.Tensor]:
+        with self.lock:
+            return self._restore(video, max_frames)
+
+    def _restore(self, video: list[torch.Tensor], max_frames=-1) -> list[torch.Tensor]:
         input_frame_count = len(video)
         input_frame_shape = video[0].shape
         with torch.inference_mode():
@@ -17,10 +17,14 @@ from lada.utils import image_utils, video_utils, threading_utils, mask_utils
 from lada.utils import visualization_utils
 from lada.restorationpipeline.mosaic_detector import MosaicDetector
 from lada.restorationpipeline.mosaic_detector import Clip
+from lada.restorationpipeline.mosaic_presence_scanner import MosaicPresenceScanner
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=LOG_LEVEL)
 
+class _SeekRequested(Exception):
+    pass
+
 class FrameRestorer:
     def __init__(self, device, video_file, max_clip_length, mosaic_restoration_model_name,
                  mosaic_detection_model, mosaic_restoration_model, preferred_pad_mode,
@@ -69,6 +73,14 @@ class FrameRestorer:
         self.frame_restoration_thread_should_be_running = False
         self.stop_requested = False
 
+        # Incremented on each seek. Queue items are tagged with the generation they have been created in so consumers can skip outdated items
+        self.generation = 0
+        self.seek_condition = threading.Condition()
+        # items of a newer generation received by the frame restoration worker before it noticed the seek
+        self.deferred_queue_items = {}
+        # number of frames handed to frame_restoration_queue, used together with its put wait time to measure restoration throughput
+        self.restored_frames_count = 0
+
         self.queue_stats = {}
         self.queue_stats["restored_clip_queue_max_size"] = 0
         self.queue_stats["restored_clip_queue_wait_time_put"] = 0
@@ -86,9 +98,12 @@ class FrameRestorer:
         assert self.frame_detection_queue.empty()
         assert self.frame_restoration_queue.empty()
 
-        self.start_ns = start_ns
-        self.start_frame = video_utils.offset_ns_to_frame_num(self.start_ns, self.video_meta_data.video_fps_exact)
-        self.stop_requested = False
+        with self.seek_condition:
+            self.start_ns = start_ns
+            self.start_frame = video_utils.offset_ns_to_frame_num(self.start_ns, self.video_meta_data.video_fps_exact)
+            self.stop_requested = False
+            self.eof = False
+        self.deferred_queue_items = {}
         self.frame_restoration_thread_should_be_running = True
         self.clip_restoration_thread_should_be_running = True
 
@@ -99,12 +114,60 @@ class FrameRestorer:
         self.clip_restoration_thread.start()
         self.frame_restoration_thread.start()
 
+    def seek(self, start_ns):
+        """
+        Continues restoration at the given position without stopping worker threads or reloading the video.
+        Items still queued or in flight from before the seek keep their old generation and will be skipped by all workers.
+        Must not be called while a consumer is reading restored frames.
+        """
+        assert self.frame_restoration_thread is not None, "Illegal State: Tried to seek FrameRestorer which is not running. You need to start it first"
+        # Nobody is reading so all remaining elements are outdated (or a closing marker used to unblock the consumer).
+        # Drain before switching to the new generation so we don't throw away frames of the new position.
+        threading_utils.empty_out_queue(self.frame_restoration_queue, "frame_restoration_queue")
+        with self.seek_condition:
+            self.generation += 1
+            self.start_ns = start_ns
+            self.start_frame = video_utils.offset_ns_to_frame_num(self.start_ns, self.video_meta_data.video_fps_exact)
+            self.eof = False
+            # unblock frame restoration worker waiting for a seek after EOF
+            self.seek_condition.notify_all()
+        self.mosaic_detector.seek(start_ns, self.generation)
+        logger.debug(f"FrameRestorer: seek to frame {self.start_frame}, generation {self.generation}")
+
+    def set_quality(self, max_clip_length, detection_stride=1, min_detection_area=0.):
+        """
+        Lowers (or restores) restoration quality while running. Shorter clips are restored faster but are more prone to flickering,
+        a detection stride > 1 runs the detection model only on every n-th frame and mosaics smaller than min_detection_area
+        (ratio of frame area) will not be restored at all.
+        Takes effect for clips and frames detected after the call, max_clip_length cannot exceed the value FrameRestorer has been created with.
+        """
+        self.mosaic_detector.max_clip_length = max(1, min(max_clip_length, self.max_clip_length))
+        self.mosaic_detector.detection_stride = max(1, detection_stride)
+        self.mosaic_detector.min_detection_area = min_detection_area
+
+    def set_mosaic_presence_scanner(self, mosaic_presence_scanner: MosaicPresenceScanner | None):
+        """
+        MosaicPresenceScanner of the same file (which may still be running). Frames known to be mosaic-free will be passed through without running detection.
+        """
+        self.mosaic_detector.mosaic_presence_scanner = mosaic_presence_scanner
+
+    def _get_position(self) -> tuple[int, int, int]:
+        with self.seek_condition:
+            return self.generation, self.start_ns, self.start_frame
+
+    def _wait_for_seek(self, generation):
+        with self.seek_condition:
+            self.seek_condition.wait_for(lambda: self.stop_requested or self.generation != generation)
+
     def stop(self):
         logger.debug("FrameRestorer: stopping...")
         start = time.time()
-        self.stop_requested = True
-        self.clip_restoration_thread_should_be_running = False
-        self.frame_restoration_thread_should_be_running = False
+        with self.seek_condition:
+            self.stop_requested = True
+            self.clip_restoration_thread_should_be_running = False
+            self.frame_restoration_thread_should_be_running = False
+            # unblock frame restoration worker waiting for a seek after EOF
+            self.seek_condition.notify_all()
 
         self.mosaic_detector.stop()
 
@@ -230,63 +293,73 @@ class FrameRestorer:
 
     def _clip_restoration_worker(self):
         logger.debug("clip restoration worker: started")
-        eof = False
         while self.clip_restoration_thread_should_be_running:
             s = time.time()
-            clip = self.mosaic_clip_queue.get()
+            elem = self.mosaic_clip_queue.get()
             self.queue_stats["mosaic_clip_queue_wait_time_get"] += time.time() - s
             if self.stop_requested:
                 logger.debug("clip restoration worker: mosaic_clip_queue consumer unblocked")
+            if elem is None:
+                # closing marker, we're stopping
+                break
+            generation, clip = elem
+            if generation != self.generation:
+                # clip detected before a seek
+                continue
             if clip is None:
-                if not self.stop_requested:
-                    eof = True
-                    self.clip_restoration_thread_should_be_running = False
-                    self.queue_stats["restored_clip_queue_max_size"] = max(self.restored_clip_queue.qsize()+1, self.queue_stats["restored_clip_queue_max_size"])
-                    s = time.time()
-                    self.restored_clip_queue.put(None)
-                    self.queue_stats["restored_clip_queue_wait_time_put"] += time.time() -s
-                    logger.debug("clip restoration worker: restored_clip_queue producer unblocked")
+                self.queue_stats["restored_clip_queue_max_size"] = max(self.restored_clip_queue.qsize()+1, self.queue_stats["restored_clip_queue_max_size"])
+                s = time.time()
+                self.restored_clip_queue.put((generation, None))
+                self.queue_stats["restored_clip_queue_wait_time_put"] += time.time() -s
+                logger.debug("clip restoration worker: EOF")
             else:
                 self._restore_clip(clip)
                 self.queue_stats["restored_clip_queue_max_size"] = max(self.restored_clip_queue.qsize()+1, self.queue_stats["restored_clip_queue_max_size"])
                 s = time.time()
-                self.restored_clip_queue.put(clip)
+                self.restored_clip_queue.put((generation, clip))
                 self.queue_stats["restored_clip_queue_wait_time_put"] += time.time() - s
                 if self.stop_requested:
                     logger.debug("clip restoration worker: restored_clip_queue producer unblocked")
-        if eof:
-            logger.debug("clip restoration worker: stopped itself, EOF")
 
-    def _read_next_frame(self, video_frames_generator, expected_frame_num) -> Optional[tuple[bool, np.ndarray, int]]:
+    def _get_queue_item(self, q: queue.Queue, generation: int, debug_queue_name: str) -> Optional[tuple]:
+        """
+        Returns the next item of the given generation or None if we're stopping. Items created before a seek will be skipped.
+        Raises _SeekRequested if an item of a newer generation has been received. It will be returned again once the worker continues at the new position.
+        """
+        elem = self.deferred_queue_items.pop(debug_queue_name, None)
+        while elem is None or elem[0] != generation:
+            if elem is not None and elem[0] == self.generation:
+                self.deferred_queue_items[debug_queue_name] = elem
+                raise _SeekRequested()
+            s = time.time()
+            elem = q.get()
+            self.queue_stats[f"{debug_queue_name}_wait_time_get"] += time.time() - s
+            if self.stop_requested:
+                logger.debug(f"frame restoration worker: {debug_queue_name} consumer unblocked")
+            if elem is None:
+                return None
+        return elem
+
+    def _read_next_frame(self, video_frames_generator, expected_frame_num, generation) -> Optional[tuple[bool, np.ndarray, int]]:
         try:
             frame, frame_pts = next(video_frames_generator)
         except StopIteration:
-            s = time.time()
-            elem = self.frame_detection_queue.get()
-            self.queue_stats["frame_detection_queue_wait_time_get"] += time.time() - s
-            if self.stop_requested:
-                logger.debug("frame restoration worker: frame_detection_queue consumer unblocked")
-            assert elem is None, f"Illegal state: Expected to read None (EOF marker) from detection queue but received f{elem}"
+            elem = self._get_queue_item(self.frame_detection_queue, generation, "frame_detection_queue")
+            assert elem is None or elem[1] is None, f"Illegal state: Expected to read None (EOF marker) from detection queue but received f{elem}"
             return None
-        s = time.time()
-        elem = self.frame_detection_queue.get()
-        self.queue_stats["frame_detection_queue_wait_time_get"] += time.time() - s
-        if self.stop_requested:
-            logger.debug("frame restoration worker: frame_detection_queue consumer unblocked")
+        elem = self._get_queue_item(self.frame_detection_queue, generation, "frame_detection_queue")
+        if elem is None:
             return None
-        assert elem is not None, "Illegal state: Expected to read detection result from detection queue but received None (EOF marker)"
-        detection_frame_num, mosaic_detected = elem
+        assert elem[1] is not None, "Illegal state: Expected to read detection result from detection queue but received None (EOF marker)"
+        detection_frame_num, mosaic_detected = elem[1]
         assert self.stop_requested or detection_frame_num == expected_frame_num, f"frame detection queue out of sync: received {detection_frame_num} expected {expected_frame_num}"
         return mosaic_detected, frame, frame_pts
 
-    def _read_next_clip(self, current_frame_num, clip_buffer) -> bool:
-        s = time.time()
-        clip = self.restored_clip_queue.get()
-        self.queue_stats["restored_clip_queue_wait_time_get"] += time.time() - s
-        if self.stop_requested:
-            logger.debug("frame restoration worker: restored_clip_queue consumer unblocked")
-        if clip is None:
+    def _read_next_clip(self, current_frame_num, clip_buffer, generation) -> bool:
+        elem = self._get_queue_item(self.restored_clip_queue, generation, "restored_clip_queue")
+        if elem is None or elem[1] is None:
             return False
+        clip = elem[1]
         assert self.stop_requested or clip.frame_start >= current_frame_num, "clip queue out of sync!"
         clip_buffer.append(clip)
         return True
@@ -294,56 +367,65 @@ class FrameRestorer:
     def _frame_restoration_worker(self):
         logger.debug("frame restoration worker: started")
         with video_utils.VideoReader(self.video_meta_data.video_file) as video_reader:
-            if self.start_ns > 0:
-                video_reader.seek(self.start_ns)
-
-            video_frames_generator = video_reader.frames()
-
-            frame_num = self.start_frame
-            clips_remaining = True
-            clip_buffer = []
-
+            generation = None
             while self.frame_restoration_thread_should_be_running:
-                _frame_result = self._read_next_frame(video_frames_generator, frame_num)
-                if _frame_result is None:
-                    if not self.stop_requested:
-                        self.eof = True
-                        self.frame_restoration_thread_should_be_running = False
-                        self.frame_restoration_queue.put(None)
-                    break
-                else:
-                    mosaic_detected, frame, frame_pts = _frame_result
-                if mosaic_detected:
-                    # As we don't know how many clips starting with the current frame we'll read and buffer restored clips until we receive a clip
-                    # that starts after the current frame. This makes sure that we've gather all restored clips necessary to restore the current frame.
-                    while clips_remaining and not self._contains_at_least_one_clip_starting_after_frame_num(frame_num, clip_buffer):
-                        clips_remaining = self._read_next_clip(frame_num, clip_buffer)
-
-                    self._restore_frame(frame, frame_num, clip_buffer)
-                    self.queue_stats["frame_restoration_queue_max_size"] = max(self.frame_restoration_queue.qsize()+1, self.queue_stats["frame_restoration_queue_max_size"])
-                    s = time.time()
-                    self.frame_restoration_queue.put((frame, frame_pts))
-                    self.queue_stats["frame_restoration_queue_wait_time_put"] += time.time() -s
-                    if self.stop_requested:
-                        logger.debug("frame restoration worker: frame_restoration_queue producer unblocked")
-                    self._collect_garbage(clip_buffer)
-                else:
-                    self.queue_stats["frame_restoration_queue_max_size"] = max(self.frame_restoration_queue.qsize()+1, self.queue_stats["frame_restoration_queue_max_size"])
-                    s = time.time()
-                    self.frame_restoration_queue.put((frame, frame_pts))
-                    self.queue_stats["frame_restoration_queue_wait_time_put"] += time.time() - s
-                    if self.stop_requested:
-                        logger.debug("frame restoration worker: frame_restoration_queue producer unblocked")
+                if generation != self.generation:
+                    is_seek = generation is not None
+                    generation, start_ns, frame_num = self._get_position()
+                    if start_ns > 0 or is_seek:
+                        video_reader.seek(start_ns)
+                    video_frames_generator = video_reader.frames()
+                    clips_remaining = True
+                    clip_buffer = []
+                    if is_seek:
+                        logger.debug(f"frame restoration worker: continuing at frame {frame_num}, generation {generation}")
+
+                try:
+                    _frame_result = self._read_next_frame(video_frames_generator, frame_num, generation)
+                    if _frame_result is None:
+                        if not self.stop_requested:
+                            with self.seek_condition:
+                                if generation == self.generation:
+                                    self.eof = True
+                            self.frame_restoration_queue.put((generation, None))
+                            logger.debug("frame restoration worker: EOF, waiting for seek")
+                            self._wait_for_seek(generation)
+                        continue
+                    else:
+                        mosaic_detected, frame, frame_pts = _frame_result
+                    if mosaic_detected:
+                        # As we don't know how many clips starting with the current frame we'll read and buffer restored clips until we receive a clip
+                        # that starts after the current frame. This makes sure that we've gather all restored clips necessary to restore the current frame.
+                        while clips_remaining and not self._contains_at_least_one_clip_starting_after_frame_num(frame_num, clip_buffer):
+                            clips_remaining = self._read_next_clip(frame_num, clip_buffer, generation)
+
+                        self._restore_frame(frame, frame_num, clip_buffer)
+                        self.queue_stats["frame_restoration_queue_max_size"] = max(self.frame_restoration_queue.qsize()+1, self.queue_stats["frame_restoration_queue_max_size"])
+                        s = time.time()
+                        self.frame_restoration_queue.put((generation, (frame, frame_pts)))
+                        self.queue_stats["frame_restoration_queue_wait_time_put"] += time.time() -s
+                        self.restored_frames_count += 1
+                        if self.stop_requested:
+                            logger.debug("frame restoration worker: frame_restoration_queue producer unblocked")
+                        self._collect_garbage(clip_buffer)
+                    else:
+                        self.queue_stats["frame_restoration_queue_max_size"] = max(self.frame_restoration_queue.qsize()+1, self.queue_stats["frame_restoration_queue_max_size"])
+                        s = time.time()
+                        self.frame_restoration_queue.put((generation, (frame, frame_pts)))
+                        self.queue_stats["frame_restoration_queue_wait_time_put"] += time.time() - s
+                        self.restored_frames_count += 1
+                        if self.stop_requested:
+                            logger.debug("frame restoration worker: frame_restoration_queue producer unblocked")
+                except _SeekRequested:
+                    continue
                 frame_num += 1
-            if self.eof:
-                logger.debug("frame restoration worker: stopped itself, EOF")
 
     def __iter__(self):
         return self
 
     def __next__(self) -> tuple[np.ndarray, int] | None:
         """
-        returns None if being called while FrameRestorer is being stopped
+        returns None if being called while FrameRestorer is being stopped or if the consumer got unblocked via a closing marker
         """
         if self.eof and self.frame_restoration_queue.empty():
             raise StopIteration
@@ -354,9 +436,16 @@ class FrameRestorer:
                 self.queue_stats["frame_restoration_queue_wait_time_get"] += time.time() -s
                 if self.stop_requested:
                     logger.debug("frame_restoration_queue consumer unblocked")
-                if elem is None and not self.stop_requested:
+                if elem is None:
+                    # closing marker, we're stopping or consumer got unblocked for a seek
+                    return None
+                generation, frame_result = elem
+                if generation != self.generation:
+                    # frame restored before a seek
+                    continue
+                if frame_result is None:
                     raise StopIteration
-                return elem
+                return frame_result
 
     def get_frame_restoration_queue(self):
         return self.frame_restoration_queue
\ No newline at end of file
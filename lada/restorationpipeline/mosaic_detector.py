@@ -16,6 +16,7 @@ from lada.utils import VideoMetadata, threading_utils
 from lada.utils import image_utils
 from lada.utils.box_utils import box_overlap
 from lada.models.yolo.yolo11_segmentation_model import Yolo11SegmentationModel
+from lada.restorationpipeline.mosaic_presence_scanner import MosaicPresenceScanner
 from lada.utils.scene_utils import crop_to_box_v3
 from lada.utils import video_utils
 from lada import LOG_LEVEL
@@ -194,6 +195,16 @@ class MosaicDetector:
         self.inference_worker_thread_should_be_running = False
         self.stop_requested = False
         self.batch_size = batch_size
+        # Incremented on each seek. Queue items are tagged with the generation they have been created in so consumers can skip outdated items
+        self.generation = 0
+        self.seek_condition = threading.Condition()
+        # Can be changed while running to trade detection quality for speed.
+        # Only every detection_stride-th frame will be run through the model, frames in between reuse the last detections.
+        self.detection_stride = 1
+        # Detections covering less than this ratio of the frame area will be ignored and left as is
+        self.min_detection_area = 0.
+        # detection will be skipped for frames this scanner found to be mosaic-free
+        self.mosaic_presence_scanner: MosaicPresenceScanner | None = None
 
         self.queue_stats = {}
         self.queue_stats["frame_detection_queue_wait_time_put"] = 0
@@ -211,9 +222,10 @@ class MosaicDetector:
         assert self.frame_feeder_queue.empty()
         assert self.inference_queue.empty()
 
-        self.start_ns = start_ns
-        self.start_frame = video_utils.offset_ns_to_frame_num(self.start_ns, self.video_meta_data.video_fps_exact)
-        self.stop_requested = False
+        with self.seek_condition:
+            self.start_ns = start_ns
+            self.start_frame = video_utils.offset_ns_to_frame_num(self.start_ns, self.video_meta_data.video_fps_exact)
+            self.stop_requested = False
         self.frame_detector_thread_should_be_running = True
         self.frame_feeder_thread_should_be_running = True
         self.inference_worker_thread_should_be_running = True
@@ -230,9 +242,12 @@ class MosaicDetector:
     def stop(self):
         logger.debug("MosaicDetector: stopping...")
         start = time.time()
-        self.stop_requested = True
-        self.frame_detector_thread_should_be_running = False
-        self.frame_feeder_thread_should_be_running = False
+        with self.seek_condition:
+            self.stop_requested = True
+            self.frame_detector_thread_should_be_running = False
+            self.frame_feeder_thread_should_be_running = False
+            # unblock frame feeder waiting for a seek after EOF
+            self.seek_condition.notify_all()
 
         # unblock producer
         threading_utils.empty_out_queue(self.frame_feeder_queue, "frame_feeder_queue")
@@ -272,7 +287,27 @@ class MosaicDetector:
 
         logger.debug(f"MosaicDetector: stopped, took: {time.time() - start}")
 
-    def _create_clips_for_completed_scenes(self, scenes, frame_num, eof):
+    def seek(self, start_ns, generation):
+        """
+        Continues reading and detecting frames at the given position while keeping worker threads running.
+        Items queued before the seek keep their old generation and will be skipped by consumers.
+        """
+        with self.seek_condition:
+            self.start_ns = start_ns
+            self.start_frame = video_utils.offset_ns_to_frame_num(self.start_ns, self.video_meta_data.video_fps_exact)
+            self.generation = generation
+            self.seek_condition.notify_all()
+        logger.debug(f"MosaicDetector: seek to frame {self.start_frame}, generation {generation}")
+
+    def _get_position(self) -> tuple[int, int, int]:
+        with self.seek_condition:
+            return self.generation, self.start_ns, self.start_frame
+
+    def _wait_for_seek(self, generation):
+        with self.seek_condition:
+            self.seek_condition.wait_for(lambda: self.stop_requested or self.generation != generation)
+
+    def _create_clips_for_completed_scenes(self, scenes, frame_num, eof, generation):
         completed_scenes = []
         for current_scene in scenes:
             if (current_scene.frame_end < frame_num or len(current_scene) >= self.max_clip_length or eof) and current_scene not in completed_scenes:
@@ -286,7 +321,7 @@ class MosaicDetector:
             clip = Clip(completed_scene, self.clip_size, self.pad_mode, self.clip_counter)
             self.queue_stats["mosaic_clip_queue_max_size"] = max(self.mosaic_clip_queue.qsize()+1, self.queue_stats["mosaic_clip_queue_max_size"])
             s = time.time()
-            self.mosaic_clip_queue.put(clip)
+            self.mosaic_clip_queue.put((generation, clip))
             self.queue_stats["mosaic_clip_queue_wait_time_put"] += time.time() - s
             if self.stop_requested:
                 logger.debug("frame detector worker: mosaic_clip_queue producer unblocked")
@@ -295,19 +330,33 @@ class MosaicDetector:
             scenes.remove(completed_scene)
             self.clip_counter += 1
 
-    def _create_or_append_scenes_based_on_prediction_result(self, results: Results, scenes: list[Scene], frame_num):
-        mosaic_detected = len(results.boxes) > 0
+    def _is_known_mosaic_free(self, pts) -> bool:
+        # looked up by pts as frame numbers after a seek are only estimated from the seek position, see offset_ns_to_frame_num
+        mosaic_presence_scanner = self.mosaic_presence_scanner
+        return mosaic_presence_scanner is not None and mosaic_presence_scanner.is_known_mosaic_free(pts)
+
+    def _get_detections(self, results: Results) -> list[tuple[Mask, Box]]:
+        detections = []
+        frame_area = results.orig_shape[0] * results.orig_shape[1]
+        for i in range(len(results.boxes)):
+            box = convert_yolo_box(results.boxes[i], results.orig_shape)
+            t, l, b, r = box
+            if self.min_detection_area > 0. and (b - t + 1) * (r - l + 1) < self.min_detection_area * frame_area:
+                continue
+            mask = convert_yolo_mask_tensor(results.masks[i], results.orig_shape)
+            detections.append((mask, box))
+        return detections
+
+    def _create_or_append_scenes_based_on_detections(self, frame: Image, detections: list[tuple[Mask, Box]], scenes: list[Scene], frame_num, generation):
+        mosaic_detected = len(detections) > 0
         self.queue_stats["frame_detection_queue_max_size"] = max(self.frame_detection_queue.qsize()+1, self.queue_stats["frame_detection_queue_max_size"])
         s = time.time()
-        self.frame_detection_queue.put((frame_num, mosaic_detected))
+        self.frame_detection_queue.put((generation, (frame_num, mosaic_detected)))
         self.queue_stats["frame_detection_queue_wait_time_put"] += time.time() - s
         if self.stop_requested:
             logger.debug("frame detector worker: frame_detection_queue producer unblocked")
             return
-        for i in range(len(results.boxes)):
-            mask = convert_yolo_mask_tensor(results.masks[i], results.orig_shape)
-            box = convert_yolo_box(results.boxes[i], results.orig_shape)
-
+        for mask, box in detections:
             current_scene = None
             for scene in scenes:
                 if scene.belongs(box):
@@ -316,36 +365,42 @@ class MosaicDetector:
                         current_scene.merge_mask_box(mask, box)
                     else:
                         current_scene = scene
-                        current_scene.add_frame(frame_num, results.orig_img, mask, box)
+                        current_scene.add_frame(frame_num, frame, mask, box)
                     break
             if current_scene is None:
                 current_scene = Scene(self.video_file, self.video_meta_data)
                 scenes.append(current_scene)
-                current_scene.add_frame(frame_num, results.orig_img, mask, box)
+                current_scene.add_frame(frame_num, frame, mask, box)
 
     def _frame_feeder_worker(self):
         logger.debug("frame feeder: started")
         with video_utils.VideoReader(self.video_file) as video_reader:
-            if self.start_ns > 0:
-                video_reader.seek(self.start_ns)
-            video_frames_generator = video_reader.frames()
-            frame_num = self.start_frame
-            eof = False
+            generation = None
             while self.frame_feeder_thread_should_be_running:
+                if generation != self.generation:
+                    is_seek = generation is not None
+                    generation, start_ns, frame_num = self._get_position()
+                    if start_ns > 0 or is_seek:
+                        video_reader.seek(start_ns)
+                    video_frames_generator = video_reader.frames()
+                    if is_seek:
+                        logger.debug(f"frame feeder worker: continuing at frame {frame_num}, generation {generation}")
+                eof = False
+                frames = []
+                frames_pts = []
                 try:
-                    frames = []
                     for i in range(self.batch_size):
-                        frame, _ = next(video_frames_generator)
+                        frame, pts = next(video_frames_generator)
                         frames.append(frame)
+                        frames_pts.append(pts)
                 except StopIteration:
                     eof = True
-                    self.frame_feeder_thread_should_be_running = False
                 if len(frames) > 0:
                     frames_batch = self.model.preprocess(frames)
-                    data = (frames_batch, frames, frame_num)
+                    data = (frames_batch, frames, frame_num, frames_pts)
                     self.queue_stats["frame_feeder_queue_max_size"] = max(self.frame_feeder_queue.qsize()+1, self.queue_stats["frame_feeder_queue_max_size"])
                     s = time.time()
-                    self.frame_feeder_queue.put(data)
+                    self.frame_feeder_queue.put((generation, data))
                     self.queue_stats["frame_feeder_queue_wait_time_put"] += time.time() - s
                     if self.stop_requested:
                         logger.debug("frame feeder worker: frame_feeder_queue producer unblocked")
@@ -354,16 +409,16 @@ class MosaicDetector:
                 if eof:
                     self.queue_stats["frame_feeder_queue_max_size"] = max(self.frame_feeder_queue.qsize()+1, self.queue_stats["frame_feeder_queue_max_size"])
                     s = time.time()
-                    self.frame_feeder_queue.put(None)
+                    self.frame_feeder_queue.put((generation, None))
                     self.queue_stats["frame_feeder_queue_wait_time_put"] += time.time() - s
                     if self.stop_requested:
                         logger.debug("frame feeder worker: frame_feeder_queue producer unblocked")
-            if eof and not self.stop_requested:
-                logger.debug("frame feeder worker: stopped itself, EOF")
+                        break
+                    logger.debug("frame feeder worker: EOF, waiting for seek")
+                    self._wait_for_seek(generation)
 
     def _frame_inference_worker(self):
         logger.debug("frame inference worker: started")
-        eof = False
         while self.inference_worker_thread_should_be_running:
             s = time.time()
             frames_data = self.frame_feeder_queue.get()
@@ -371,33 +426,50 @@ class MosaicDetector:
             if self.stop_requested:
                 logger.debug("inference worker: frame_feeder_queue consumer unblocked")
             if frames_data is None:
-                eof = True
-                self.inference_worker_thread_should_be_running = False
+                # closing marker, we're stopping
+                break
+            generation, frames_data = frames_data
+            if generation != self.generation:
+                # frames read before a seek
+                continue
+            if frames_data is None:
                 self.queue_stats["inference_queue_max_size"] = max(self.inference_queue.qsize()+1, self.queue_stats["inference_queue_max_size"])
                 s = time.time()
-                self.inference_queue.put(None)
+                self.inference_queue.put((generation, None))
                 self.queue_stats["inference_queue_wait_time_put"] += time.time() -s
                 if self.stop_requested:
                     logger.debug("inference worker: inference_queue producer unblocked")
-                break
-            frames_batch, frames, frame_num = frames_data
-
-            batch_prediction_results = self.model.inference_and_postprocess(frames_batch, frames)
+                logger.debug("inference worker: EOF")
+                continue
+            frames_batch, frames, frame_num, frames_pts = frames_data
+
+            detection_stride = self.detection_stride
+            # evaluated once per frame, the scanner may find out more about these frames before they reach the frame detector
+            mosaic_free = [self._is_known_mosaic_free(pts) for pts in frames_pts]
+            indices = [i for i in range(len(frames)) if (frame_num + i) % detection_stride == 0 and not mosaic_free[i]]
+            if len(indices) == len(frames):
+                batch_prediction_results = self.model.inference_and_postprocess(frames_batch, frames)
+            else:
+                # None results tell the detector to reuse the detections of the previous frame or that the frame is known to be mosaic-free
+                batch_prediction_results = [None] * len(frames)
+                if len(indices) > 0:
+                    results = self.model.inference_and_postprocess([frames_batch[i] for i in indices], [frames[i] for i in indices])
+                    for i, result in zip(indices, results):
+                        batch_prediction_results[i] = result
 
             self.queue_stats["inference_queue_max_size"] = max(self.inference_queue.qsize()+1, self.queue_stats["inference_queue_max_size"])
             s = time.time()
-            self.inference_queue.put((batch_prediction_results, frames_batch, frame_num))
+            self.inference_queue.put((generation, (batch_prediction_results, frames, frame_num, mosaic_free)))
             self.queue_stats["inference_queue_wait_time_put"] += time.time() - s
             if self.stop_requested:
                 logger.debug("inference worker: inference_queue producer unblocked")
-        if eof:
-            logger.debug("inference worker: stopped itself, EOF")
 
     def _frame_detector_worker(self):
         logger.debug("frame detector worker: started")
         scenes: list[Scene] = []
-        frame_num = self.start_frame
-        eof = False
+        generation = None
+        frame_num = None
+        detections = []
         while self.frame_detector_thread_should_be_running:
             s = time.time()
             inference_data = self.inference_queue.get()
@@ -405,29 +477,45 @@ class MosaicDetector:
             if self.stop_requested:
                 logger.debug("frame detector worker: inference_queue consumer unblocked")
             if inference_data is None:
-                eof = True
-            if eof:
-                self._create_clips_for_completed_scenes(scenes, frame_num, eof=True)
+                # closing marker, we're stopping
+                break
+            inference_data_generation, inference_data = inference_data
+            if inference_data_generation != self.generation:
+                # frames read before a seek
+                continue
+            if inference_data_generation != generation:
+                # first batch after start or seek. Scenes of the previous position can be dropped, they will never be completed
+                generation = inference_data_generation
+                scenes = []
+                detections = []
+                frame_num = inference_data[2] if inference_data is not None else None
+            if inference_data is None:
+                self._create_clips_for_completed_scenes(scenes, frame_num, eof=True, generation=generation)
                 self.queue_stats["frame_detection_queue_max_size"] = max(self.frame_detection_queue.qsize()+1, self.queue_stats["frame_detection_queue_max_size"])
                 s = time.time()
-                self.frame_detection_queue.put(None)
+                self.frame_detection_queue.put((generation, None))
                 self.queue_stats["frame_detection_queue_wait_time_put"] += time.time() - s
                 if self.stop_requested:
                     logger.debug("frame detector worker: frame_detection_queue producer unblocked")
                 self.queue_stats["mosaic_clip_queue_max_size"] = max(self.mosaic_clip_queue.qsize()+1, self.queue_stats["mosaic_clip_queue_max_size"])
                 s = time.time()
-                self.mosaic_clip_queue.put(None)
+                self.mosaic_clip_queue.put((generation, None))
                 self.queue_stats["mosaic_clip_queue_wait_time_put"] += time.time() - s
                 if self.stop_requested:
                     logger.debug("frame detector worker: mosaic_clip_queue producer unblocked")
-                self.frame_detector_thread_should_be_running = False
+                logger.debug("frame detector worker: EOF")
             else:
-                batch_prediction_results, preprocessed_frames, _frame_num = inference_data
+                batch_prediction_results, frames, _frame_num, mosaic_free = inference_data
                 assert frame_num == _frame_num, "frame detector worker out of sync with frame reader"
-                assert len(preprocessed_frames) == len(batch_prediction_results)
-                for i, results in enumerate(batch_prediction_results):
-                    self._create_or_append_scenes_based_on_prediction_result(results, scenes, frame_num)
-                    self._create_clips_for_completed_scenes(scenes, frame_num, eof=False)
+                assert len(frames) == len(batch_prediction_results)
+                for frame, results, is_mosaic_free in zip(frames, batch_prediction_results, mosaic_free):
+                    if generation != self.generation:
+                        # seek requested, no need to finish this batch
+                        break
+                    if is_mosaic_free:
+                        detections = []
+                    elif results is not None:
+                        detections = self._get_detections(results)
+                    self._create_or_append_scenes_based_on_detections(frame, detections, scenes, frame_num, generation)
+                    self._create_clips_for_completed_scenes(scenes, frame_num, eof=False, generation=generation)
                     frame_num += 1
-        if eof:
-            logger.debug("frame detector worker: stopped itself, EOF")
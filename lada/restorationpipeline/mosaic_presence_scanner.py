@@ -0,0 +1,134 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import logging
+import threading
+import time
+
+import numpy as np
+
+from lada import LOG_LEVEL
+from lada.models.yolo.yolo11_segmentation_model import Yolo11SegmentationModel
+from lada.utils import video_utils
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=LOG_LEVEL)
+
+MOSAIC_PRESENCE_UNKNOWN = -1
+MOSAIC_PRESENCE_NONE = 0
+MOSAIC_PRESENCE_DETECTED = 1
+
+def get_mosaic_density(presence: np.ndarray, bins: int) -> np.ndarray:
+    """
+    Ratio of frames with detected mosaics for each of the given number of evenly sized bins. NaN for bins which have not been scanned yet.
+    """
+    edges = np.linspace(0, len(presence), bins + 1).astype(int)
+    detected = np.concatenate([[0], np.cumsum(presence == MOSAIC_PRESENCE_DETECTED)])
+    scanned = np.concatenate([[0], np.cumsum(presence != MOSAIC_PRESENCE_UNKNOWN)])
+    detected_in_bin = detected[edges[1:]] - detected[edges[:-1]]
+    scanned_in_bin = scanned[edges[1:]] - scanned[edges[:-1]]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(scanned_in_bin > 0, detected_in_bin / scanned_in_bin, np.nan)
+
+class MosaicPresenceScanner:
+    """
+    Runs the detection model over the whole file in a background thread and records for each frame whether it contains a mosaic.
+
+    Scanning happens independently of restoration and can be throttled while restoration needs the device.
+    MosaicDetector can skip detection of frames known to be mosaic-free which makes those spans play at decoding speed.
+    """
+    def __init__(self, video_file, mosaic_detection_model_name: str, batch_size=4):
+        self.model: Yolo11SegmentationModel | None = None
+        self.mosaic_detection_model_name = mosaic_detection_model_name
+        self.video_file = video_file
+        self.batch_size = batch_size
+        self.video_meta_data = video_utils.get_video_meta_data(video_file)
+        # written only by the scanner thread, single elements go from unknown to none/detected so readers don't need a lock
+        self.presence = np.full(self.video_meta_data.frames_count, MOSAIC_PRESENCE_UNKNOWN, dtype=np.int8)
+        # pts of each scanned frame. Readers which seek can't know the frame number of a frame, only its pts.
+        # Frames not scanned yet are set to the max value so the array is always sorted
+        self.presence_pts = np.full(self.video_meta_data.frames_count, np.iinfo(np.int64).max, dtype=np.int64)
+        self._last_pts = np.iinfo(np.int64).min
+        self.scanned_frames = 0
+        self.failed = False
+        self.throttled = False
+        self.throttle_factor = 3. # while throttled sleep this many times the duration of the last batch, to use only a fraction of the device
+        self.scanner_thread: threading.Thread | None = None
+        self.scanner_thread_should_be_running = False
+
+    def start(self, model: Yolo11SegmentationModel):
+        """
+        The model should not be shared with a running FrameRestorer, their inference would be serialized.
+        """
+        assert self.scanner_thread is None, "Illegal State: Tried to start MosaicPresenceScanner when it's already running"
+        self.model = model
+        self.scanner_thread_should_be_running = True
+        self.scanner_thread = threading.Thread(target=self._scanner_worker, daemon=True)
+        self.scanner_thread.start()
+
+    def stop(self):
+        self.scanner_thread_should_be_running = False
+        if self.scanner_thread:
+            self.scanner_thread.join()
+        self.scanner_thread = None
+
+    def is_done(self) -> bool:
+        return self.scanned_frames >= len(self.presence)
+
+    def is_known_mosaic_free(self, pts: int | None) -> bool:
+        if pts is None:
+            return False
+        frame_num = np.searchsorted(self.presence_pts, pts)
+        return frame_num < len(self.presence) and self.presence_pts[frame_num] == pts and self.presence[frame_num] == MOSAIC_PRESENCE_NONE
+
+    def _record_frame(self, frame_num: int, pts: int | None, mosaic_detected: bool):
+        # metadata frame count is only an estimate for some containers
+        if frame_num >= len(self.presence):
+            return
+        if pts is not None and pts > self._last_pts:
+            self._last_pts = pts
+        # Frames without pts (or out of order) can't be looked up. They repeat the preceding pts to keep presence_pts sorted,
+        # searchsorted will still find the first frame with that pts.
+        self.presence_pts[frame_num] = self._last_pts
+        self.presence[frame_num] = MOSAIC_PRESENCE_DETECTED if mosaic_detected else MOSAIC_PRESENCE_NONE
+
+    def _scanner_worker(self):
+        logger.debug(f"mosaic presence scanner: started scanning {self.video_file}")
+        try:
+            self._scan()
+        except Exception as e:
+            self.failed = True
+            logger.error(f"mosaic presence scanner: failed to scan {self.video_file}: {e}")
+
+    def _scan(self):
+        start = time.time()
+        frame_num = 0
+        with video_utils.VideoReader(self.video_file) as video_reader:
+            video_frames_generator = video_reader.frames()
+            eof = False
+            while self.scanner_thread_should_be_running and not eof:
+                s = time.time()
+                frames = []
+                frames_pts = []
+                try:
+                    for i in range(self.batch_size):
+                        frame, pts = next(video_frames_generator)
+                        frames.append(frame)
+                        frames_pts.append(pts)
+                except StopIteration:
+                    eof = True
+                if len(frames) == 0:
+                    break
+                batch_prediction_results = self.model.inference_and_postprocess(self.model.preprocess(frames), frames)
+                for results, pts in zip(batch_prediction_results, frames_pts):
+                    self._record_frame(frame_num, pts, len(results.boxes) > 0)
+                    frame_num += 1
+                self.scanned_frames = frame_num
+                if self.throttled:
+                    time.sleep(self.throttle_factor * (time.time() - s))
+        if eof:
+            # nothing left to scan even if frame count estimate was too high
+            self.scanned_frames = len(self.presence)
+            logger.debug(f"mosaic presence scanner: scanned {frame_num} frames, took {time.time() - start:.0f}s")
+        else:
+            logger.debug("mosaic presence scanner: stopped")
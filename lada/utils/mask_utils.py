@@ -9,8 +9,8 @@ from lada.utils import Box, Mask, box_utils
 from lada.utils import image_utils
 
 def get_box(mask: Mask) -> Box:
-    points = cv2.findNonZero(mask)
-    return box_utils.convert_from_opencv(cv2.boundingRect(points))
+    # boundingRect of a single channel image is much cheaper than collecting all non-zero points via findNonZero first
+    return box_utils.convert_from_opencv(cv2.boundingRect(mask))
 
 def morph(mask: Mask, iterations=1, operator=cv2.MORPH_DILATE) -> Mask:
     if get_mask_area(mask) < 0.01:
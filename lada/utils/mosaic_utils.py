@@ -11,6 +11,9 @@ import numpy as np
 from lada.utils import image_utils, random_utils
 from lada.utils import visualization_utils
 
+# filters like cv2.blur accept at most 128 channels in recent OpenCV builds, some older builds even less
+_CV_MAX_FILTER_CHANNELS = 32
+
 
 def get_mask_area_by_contour(mask):
     mask = cv2.threshold(mask,127,255,0)[1]
@@ -29,17 +32,108 @@ def get_mask_area_by_bounding_box(mask):
         area = 0
     return area
 
-def _mosaic_get_block_data_fun(model):
-    if model=='squa_avg':
-        return lambda img, i, j, n_h, n_w, h_start, w_start: img[i*n_h+h_start:(i+1)*n_h+h_start,j*n_w+w_start:(j+1)*n_w+w_start,:].mean(axis=(0,1))
-    elif model=='squa_mid':
-        return lambda img, i, j, n_h, n_w, h_start, w_start: img[i*n_h+n_h//2+h_start,j*n_w+n_w//2+w_start,:]
+def _mosaic_block_values(imgs_padded, h_step, w_step, n_h, n_w, model, max_w):
+    # imgs_padded: (T, H+pad, W+pad, C). Returns one value per block: (T, h_step, w_step, C)
+    if model in ('squa_avg', 'rect_avg'):
+        # Block sums are exact so sum / count gives the same result as calling ndarray.mean() on each block.
+        # Rows always fit into the padded image but the last column of rect blocks can be cut off at its right edge, therefore only rows are reshaped.
+        t, _, _, c = imgs_padded.shape
+        blocks = imgs_padded[:, :h_step * n_h, :min(w_step * n_w, max_w), :]
+        sums = blocks.reshape(t, h_step, n_h, blocks.shape[2], c).sum(axis=2, dtype=np.int64)
+        col_starts = np.arange(w_step) * n_w
+        sums = np.add.reduceat(sums, col_starts, axis=2)
+        counts = n_h * np.diff(np.append(col_starts, blocks.shape[2]))
+        # truncate like assigning the float mean to an uint8 image would
+        return (sums / counts[None, None, :, None]).astype(imgs_padded.dtype)
+    elif model == 'squa_mid':
+        rows = np.arange(h_step) * n_h + n_h // 2
+        cols = np.arange(w_step) * n_w + n_w // 2
+        return imgs_padded[:, rows[:, None], cols[None, :], :]
     elif model == 'squa_random':
-        return lambda img, i, j, n_h, n_w, h_start, w_start: img[h_start+int(i*n_h-n_h/2+n_h*random.random()),w_start+int(j*n_w-n_w/2+n_w*random.random()),:]
-    elif model =='rect_avg':
-        return lambda img, i, j, n_h, n_w, h_start, w_start: img[i*n_h+h_start:(i+1)*n_h+h_start,j*n_w+w_start:(j+1)*n_w+w_start,:].mean(axis=(0,1))
+        t = imgs_padded.shape[0]
+        rows = np.arange(h_step)[None, :, None] * n_h - n_h / 2 + n_h * np.random.random((t, h_step, w_step))
+        cols = np.arange(w_step)[None, None, :] * n_w - n_w / 2 + n_w * np.random.random((t, h_step, w_step))
+        frames = np.arange(t)[:, None, None]
+        return imgs_padded[frames, np.trunc(rows).astype(np.int64), np.trunc(cols).astype(np.int64), :]
     raise Exception()
 
+def _upsample_blocks(blocks, n_h, n_w, h, w):
+    # nearest-neighbour upsampling of per-block values (T, h_step, w_step, C) to pixel resolution (T, H, W, C).
+    # Frames are stacked vertically so the whole clip can be resized with a single OpenCV call
+    t, h_step, w_step, c = blocks.shape
+    upsampled = cv2.resize(blocks.reshape(t * h_step, w_step, c), (w_step * n_w, t * h_step * n_h), interpolation=cv2.INTER_NEAREST_EXACT)
+    return np.ascontiguousarray(upsampled.reshape(t, h_step * n_h, w_step * n_w, c)[:, :h, :w])
+
+def _copy_where(src, dst, where):
+    # like np.copyto(dst, src, where=where) but much faster for (T, H, W, C) images and (T, H, W, 1) masks
+    t, h, w, c = dst.shape
+    out = cv2.copyTo(src.reshape(t * h, w, c), where.reshape(t * h, w).view(np.uint8), dst.reshape(t * h, w, c))
+    return out.reshape(t, h, w, c)
+
+def _count_active_lines(active_lines):
+    # number of rows/columns between the first and last block containing mosaic, per frame
+    first = np.argmax(active_lines, axis=1)
+    last = active_lines.shape[1] - 1 - np.argmax(active_lines[:, ::-1], axis=1)
+    return np.where(active_lines.any(axis=1), last - first + 1, 0)
+
+def _feather_frames(imgs, img_mosaics, masks, kernel_size):
+    # OpenCV filters each channel independently so we can blur many masks at once by stacking them as channels
+    h, w = masks.shape[1:3]
+    stacked_masks = np.ascontiguousarray(masks[..., 0].transpose(1, 2, 0))
+    blurred_masks = np.concatenate([cv2.blur(stacked_masks[:, :, i:i + _CV_MAX_FILTER_CHANNELS], (kernel_size, kernel_size)).reshape(h, w, -1)
+                                    for i in range(0, stacked_masks.shape[2], _CV_MAX_FILTER_CHANNELS)], axis=2)
+    blurred_masks = np.ascontiguousarray(blurred_masks.transpose(2, 0, 1))
+    # Blending yields the original pixel where the blurred mask is 0 and the mosaic pixel where it is 255 so only the feathered edge needs to be blended
+    stacked_blurred_masks = blurred_masks.reshape(-1, w)
+    feathered = _copy_where(imgs, img_mosaics.copy(), cv2.compare(stacked_blurred_masks, 0, cv2.CMP_EQ))
+    edge = np.nonzero(cv2.inRange(stacked_blurred_masks, 1, 254).reshape(blurred_masks.shape))
+    weights = blurred_masks[edge][:, None] / 255.0
+    feathered[edge] = (imgs[edge] * (1 - weights) + img_mosaics[edge] * weights).astype(np.uint8)
+    return feathered
+
+def _addmosaic_frames(imgs, masks, n, model, rect_ratio, feather, reuse_input_mask_value, incomplete_blocks):
+    n = int(n)
+    rect_ratio = 1.0 if model != 'rect_avg' else rect_ratio
+    n_h = n
+    n_w = int(n * rect_ratio)
+    h, w = imgs.shape[1:3]
+    h_step = math.ceil(h / n_h)
+    w_step = math.ceil(w / n_w)
+    assert imgs.shape[:3] == masks.shape[:3]
+    imgs = np.ascontiguousarray(imgs)
+    masks = np.ascontiguousarray(masks)
+    pad = n
+    imgs_padded = np.pad(imgs, ((0,0),(0,pad),(0,pad),(0,0)), mode='reflect')
+    masks_padded = np.pad(masks, ((0,0),(0,pad),(0,pad),(0,0)), mode='constant', constant_values=0)
+
+    # a block will be mosaic'd if the mask pixel in the center of the block is set
+    block_mask_vals = masks_padded[:, (np.arange(h_step) * n_h + n_h // 2)[:, None], (np.arange(w_step) * n_w + n_w // 2)[None, :], :]
+    active_blocks = block_mask_vals[..., 0] != 0
+    if not reuse_input_mask_value:
+        block_mask_vals = np.where(active_blocks[..., None], 255, 0).astype(masks.dtype)
+
+    block_values = _mosaic_block_values(imgs_padded, h_step, w_step, n_h, n_w, model, w + pad)
+    active = _upsample_blocks(active_blocks[..., None].astype(np.uint8), n_h, n_w, h, w)
+    if incomplete_blocks:
+        active = active & (masks != 0)
+    img_mosaic = _copy_where(_upsample_blocks(block_values, n_h, n_w, h, w), imgs.copy(), active)
+    mask_mosaic = _copy_where(_upsample_blocks(block_mask_vals, n_h, n_w, h, w), np.zeros_like(masks), active)
+
+    if feather == -1:
+        return img_mosaic, mask_mosaic
+
+    min_block_count = 4
+    row_counts = _count_active_lines(active_blocks.any(axis=2))
+    col_counts = _count_active_lines(active_blocks.any(axis=1))
+    feathered_frames = (row_counts > min_block_count) & (col_counts > min_block_count)
+    if feathered_frames.any():
+        _masks = masks[feathered_frames]
+        if reuse_input_mask_value:
+            _masks = np.where(_masks > 0, 255, _masks).astype(masks.dtype)
+        kernel_size = n if feather == 0 else feather
+        img_mosaic[feathered_frames] = _feather_frames(imgs[feathered_frames], img_mosaic[feathered_frames], _masks, kernel_size)
+
+    return img_mosaic, mask_mosaic
 
 def addmosaic_base(img, mask, n, model='squa_avg', rect_ratio=1.6, feather=0, reuse_input_mask_value=False, incomplete_blocks=False):
     '''
@@ -51,71 +145,21 @@ def addmosaic_base(img, mask, n, model='squa_avg', rect_ratio=1.6, feather=0, re
     feather : feather size, -1->no 0->auto
     reuse_input_mask_value: if False mosaic mask value will be 255, otherwise the value from (input) mask is used
     '''
-    n = int(n)
-    rect_ratio = 1.0 if model != 'rect_avg' else rect_ratio
-    n_h = n
-    n_w = int(n * rect_ratio)
-    h_start = 0
-    w_start = 0
-    pix_mid_h = n_h // 2 + h_start
-    pix_mid_w = n_w // 2 + w_start
-    h, w = img.shape[:2]
-    h_step = math.ceil((h - h_start) / n_h)
-    w_step = math.ceil((w - w_start) / n_w)
-    assert img.shape[:2] == mask.shape[:2]
-    get_block_data = _mosaic_get_block_data_fun(model)
-    pad = n
-    img_padded = np.pad(img,((0,pad),(0,pad),(0,0)), mode='reflect')
-    mask_padded = np.pad(mask,((0,pad),(0,pad),(0,0)), mode='constant', constant_values=0)
-    img_mosaic = img.copy()
-    mask_mosaic = np.zeros_like(mask, dtype=mask.dtype)
-
-    min_h, max_h = img.shape[1], 0
-    min_w, max_w = img.shape[0], 0
-
-    for i in range(h_step):
-        for j in range(w_step):
-            if mask_val := mask_padded[i * n_h + pix_mid_h, j * n_w + pix_mid_w]:
-                if not reuse_input_mask_value: mask_val = 255
-                min_h, max_h = min(min_h, i), max(max_h, i)
-                min_w, max_w = min(min_w, j), max(max_w, j)
-                y_start = i * n_h + h_start
-                y_end = (i + 1) * n_h + h_start
-                x_start = j * n_w + w_start
-                x_end = (j + 1) * n_w + w_start
-                if incomplete_blocks:
-                    img_block = img[y_start:y_end, x_start:x_end,:]
-                    mask_block = mask[y_start:y_end, x_start:x_end,:]
-                    img_mosaic_block = get_block_data(img_padded, i, j, n_h, n_w, h_start, w_start)
-                    mask_block_indices = mask_block == 0
-                    img_mosaic_block = np.where(mask_block_indices, img_block, img_mosaic_block)
-                    mask_mosaic_block = np.where(mask_block_indices, 0, mask_val)
-                    img_mosaic[y_start:y_end, x_start:x_end,:] = img_mosaic_block
-                    mask_mosaic[y_start:y_end, x_start:x_end,:] = mask_mosaic_block
-                else:
-                    img_mosaic[y_start:y_end, x_start:x_end,:] = get_block_data(img_padded, i, j, n_h, n_w, h_start, w_start)
-                    mask_mosaic[y_start:y_end, x_start:x_end,:] = mask_val
-
-    row_count = max_h - min_h + 1
-    col_count = max_w - min_w + 1
-    min_block_count = 4
+    img_mosaic, mask_mosaic = _addmosaic_frames(img[None], mask[None], n, model, rect_ratio, feather, reuse_input_mask_value, incomplete_blocks)
+    return img_mosaic[0], mask_mosaic[0]
 
-    if feather != -1 and row_count > min_block_count and col_count > min_block_count:
-        if reuse_input_mask_value:
-            _mask = mask.copy()
-            _mask[_mask > 0] = 255
-        else:
-            _mask = mask
-        if feather == 0:
-            blurred_mask = (cv2.blur(_mask, (n, n)))
-        else:
-            blurred_mask = (cv2.blur(_mask, (feather, feather)))
-        blurred_mask = blurred_mask / 255.0
-        for i in range(3):
-            img_mosaic[:, :, i] = (img[:, :, i] * (1 - blurred_mask) + img_mosaic[:, :, i] * blurred_mask)
-        img_mosaic = img_mosaic.astype(np.uint8)
-
-    return img_mosaic, mask_mosaic
+def addmosaic_clip(imgs, masks, n, model='squa_avg', rect_ratio=1.6, feather=0, reuse_input_mask_value=False, incomplete_blocks=False):
+    '''
+    Same as addmosaic_base but for a list of frames. All frames will be processed at once if they are of the same size.
+    Returns a list of mosaic images and a list of mosaic masks.
+    '''
+    if len(imgs) == 0:
+        return [], []
+    if any(img.shape != imgs[0].shape for img in imgs) or any(mask.shape != masks[0].shape for mask in masks):
+        results = [addmosaic_base(img, mask, n, model, rect_ratio, feather, reuse_input_mask_value, incomplete_blocks) for img, mask in zip(imgs, masks)]
+        return [img_mosaic for img_mosaic, _ in results], [mask_mosaic for _, mask_mosaic in results]
+    img_mosaics, mask_mosaics = _addmosaic_frames(np.stack(imgs), np.stack(masks), n, model, rect_ratio, feather, reuse_input_mask_value, incomplete_blocks)
+    return list(img_mosaics), list(mask_mosaics)
 
 def get_mosaic_block_size_v1(mask_img, area_type ='normal'):
     h,w = mask_img.shape[:2]
@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: AGPL-3.0
 
 import random
+from contextlib import contextmanager
 
 import numpy as np
 
@@ -15,4 +16,19 @@ def get_rngs(repeatable) -> tuple[random, np.random]:
     else:
         rng_random = random
         rng_numpy = np.random
-    return rng_random, rng_numpy
\ No newline at end of file
+    return rng_random, rng_numpy
+
+@contextmanager
+def seeded_global_rngs(seed: int):
+    """
+    Seeds the global generators of random and numpy for code that doesn't take its own generators and restores their previous state on exit.
+    """
+    random_state = random.getstate()
+    numpy_state = np.random.get_state()
+    random.seed(seed)
+    np.random.seed(seed)
+    try:
+        yield
+    finally:
+        random.setstate(random_state)
+        np.random.set_state(numpy_state)
@@ -1,11 +1,50 @@
 # SPDX-FileCopyrightText: Lada Authors
 # SPDX-License-Identifier: AGPL-3.0
 
-import math
+import numpy as np
 
 from lada.utils import Box, Mask, Image
 
 
+def get_crop_boxes_v3(boxes: list[Box] | np.ndarray, img_shape: tuple[int, int], target_size: tuple[int, int], max_box_expansion_factor=1.0, border_size=0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Determines the boxes crop_to_box_v3 would crop for all given boxes at once.
+    Returns cropped boxes as array of shape (N, 4) and their scale factors of shape (N,)
+    """
+    target_width, target_height = target_size
+    img_height, img_width = img_shape[:2]
+    t, l, b, r = np.asarray(boxes, dtype=np.int64).reshape(-1, 4).T
+    width, height = r - l + 1,  b - t + 1
+    border_size = np.maximum(20, (np.maximum(width, height) * border_size).astype(np.int64)) if border_size > 0. else 0
+    t, l, b, r = np.maximum(0, t-border_size), np.maximum(0, l-border_size), np.minimum(img_height-1, b+border_size), np.minimum(img_width-1, r+border_size)
+    width, height = r - l + 1,  b - t + 1
+    # we ignore upscaling for now as we first want to try expanding the box.
+    down_scale_factor = np.minimum(np.minimum(target_width / width, target_height / height), 1.0)
+    missing_width, missing_height = ((target_width - (width * down_scale_factor)) / down_scale_factor).astype(np.int64), ((target_height - (height * down_scale_factor)) / down_scale_factor).astype(np.int64)
+
+    available_width_l = l
+    available_width_r = (img_width-1) - r
+    available_height_t = t
+    available_height_b = (img_height-1) - b
+
+    budget_width = (max_box_expansion_factor * width).astype(np.int64)
+    budget_height = (max_box_expansion_factor * height).astype(np.int64)
+
+    expand_width_lr = np.minimum.reduce([available_width_l, available_width_r, missing_width//2, budget_width])
+    expand_width_l = np.minimum.reduce([available_width_l - expand_width_lr, missing_width - expand_width_lr * 2, budget_width - expand_width_lr])
+    expand_width_r = np.minimum.reduce([available_width_r - expand_width_lr, missing_width - expand_width_lr * 2 - expand_width_l, budget_width - expand_width_lr - expand_width_l])
+
+    expand_height_tb = np.minimum.reduce([available_height_t, available_height_b, missing_height//2, budget_height])
+    expand_height_t = np.minimum.reduce([available_height_t - expand_height_tb, missing_height - expand_height_tb * 2, budget_height - expand_height_tb])
+    expand_height_b = np.minimum.reduce([available_height_b - expand_height_tb, missing_height - expand_height_tb * 2 - expand_height_t, budget_height - expand_height_tb - expand_height_t])
+
+    # floor(x/2) and ceil(x/2)
+    l, r = (l - expand_width_lr // 2 - expand_width_l,
+            r - (-expand_width_lr // 2) + expand_width_r)
+    t, b = (t - expand_height_tb // 2 - expand_height_t,
+            b - (-expand_height_tb // 2) + expand_height_b)
+    return np.stack((t, l, b, r), axis=-1), down_scale_factor
+
 def crop_to_box_v3(box: Box, img: Image, mask_img: Mask, target_size: tuple[int, int], max_box_expansion_factor=1.0, border_size=0):
     """
     Crops Mask and Image by using Box. Will try to grow Box to better fit target size
@@ -22,48 +61,13 @@ def crop_to_box_v3(box: Box, img: Image, mask_img: Mask, target_size: tuple[int,
     -------
     img, mask_img, cropped_box, scale_factor
     """
-    target_width, target_height = target_size
-    t, l, b, r = box
-    width, height = r - l + 1,  b - t + 1
-    border_size = max(20, int(max(width, height) * border_size)) if border_size > 0. else 0
-    t, l, b, r = max(0, t-border_size), max(0, l-border_size), min(img.shape[0]-1, b+border_size), min(img.shape[1]-1, r+border_size)
-    width, height = r - l + 1,  b - t + 1
-    down_scale_factor = min(target_width / width, target_height / height)
-    if down_scale_factor > 1.0:
-        # we ignore upscaling for now as we first want to try expanding the box.
-        down_scale_factor = 1.0
-    missing_width, missing_height = int((target_width - (width * down_scale_factor)) / down_scale_factor), int((target_height - (height * down_scale_factor)) / down_scale_factor)
-
-    available_width_l = l
-    available_width_r = (img.shape[1]-1) - r
-    available_height_t = t
-    available_height_b = (img.shape[0]-1) - b
-
-    budget_width = int(max_box_expansion_factor * width)
-    budget_height = int(max_box_expansion_factor * height)
-
-    expand_width_lr = min(available_width_l, available_width_r, missing_width//2, budget_width)
-    expand_width_l = min(available_width_l - expand_width_lr, missing_width - expand_width_lr * 2, budget_width - expand_width_lr)
-    expand_width_r = min(available_width_r - expand_width_lr, missing_width - expand_width_lr * 2 - expand_width_l, budget_width - expand_width_lr - expand_width_l)
-
-    expand_height_tb = min(available_height_t, available_height_b, missing_height//2, budget_height)
-    expand_height_t = min(available_height_t - expand_height_tb, missing_height - expand_height_tb * 2, budget_height - expand_height_tb)
-    expand_height_b = min(available_height_b - expand_height_tb, missing_height - expand_height_tb * 2 - expand_height_t, budget_height - expand_height_tb - expand_height_t)
-
-    l, r = (l - math.floor(expand_width_lr/2) - expand_width_l,
-            r + math.ceil(expand_width_lr/2) + expand_width_r)
-    t, b = (t - math.floor(expand_height_tb/2) - expand_height_t,
-            b + math.ceil(expand_height_tb/2) + expand_height_b)
+    cropped_boxes, scale_factors = get_crop_boxes_v3([box], img.shape, target_size, max_box_expansion_factor, border_size)
+    cropped_box = tuple(cropped_boxes[0].tolist())
+    scale_factor = float(scale_factors[0])
+    t, l, b, r = cropped_box
     img = img[t:b + 1, l:r + 1]
     mask_img = mask_img[t:b + 1, l:r + 1]
 
-    width, height = r - l + 1,  b - t + 1
-    if down_scale_factor <= 1.0:
-        scale_factor = down_scale_factor
-    else:
-        scale_factor = min(target_width / width, target_height / height)
-
-    cropped_box = t, l, b, r
     assert img.shape[:2] == mask_img.shape[:2] == (cropped_box[2]-cropped_box[0]+1, cropped_box[3]-cropped_box[1]+1)
     return img, mask_img, cropped_box, scale_factor
 
@@ -0,0 +1,223 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import hashlib
+import json
+import logging
+import math
+import os
+import pathlib
+import shutil
+import subprocess
+
+from lada.utils import VideoMetadata, os_utils, video_utils
+
+logger = logging.getLogger(__name__)
+
+def _get_output_path_hash(output_path: pathlib.Path) -> str:
+    # exports of files with the same name into different directories can run at the same time, their files must not collide
+    return hashlib.sha1(str(output_path).encode('utf-8')).hexdigest()[:8]
+
+def get_work_directory(output_path: str) -> pathlib.Path:
+    # next to the output file instead of the temp directory, which is often cleared on reboot
+    output_path = pathlib.Path(output_path).absolute()
+    return output_path.with_name(f".{output_path.name}.{_get_output_path_hash(output_path)}.segments")
+
+def get_temp_output_path(output_path: str, temp_directory: str) -> str:
+    """
+    Path in temp_directory the joined segments are written to before audio is added and the result is moved to output_path.
+    """
+    output_path = pathlib.Path(output_path).absolute()
+    return os.path.join(temp_directory, f"{output_path.stem}.{_get_output_path_hash(output_path)}.tmp{output_path.suffix}")
+
+def _plan_segments(video_metadata: VideoMetadata, segment_duration_s: float) -> list[dict]:
+    index = video_utils.get_keyframe_index(video_metadata.video_file)
+    if index is None or segment_duration_s <= 0:
+        # without timestamps we can't continue within the file, there will be just a single segment
+        return [dict(start_pts=None, start_frame=0)]
+    frame_pts, keyframe_indices = index
+    segment_frames = max(1, round(segment_duration_s * video_metadata.video_fps))
+    segments = [dict(start_pts=int(frame_pts[0]), start_frame=0)]
+    for keyframe_idx in keyframe_indices:
+        # segments must start at keyframes of the source so restoration can resume there without decoding preceding frames
+        if keyframe_idx >= segments[-1]['start_frame'] + segment_frames:
+            segments.append(dict(start_pts=int(frame_pts[keyframe_idx]), start_frame=int(keyframe_idx)))
+    return segments
+
+def _fsync_file(path):
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+class SegmentedVideoWriter:
+    """
+    Drop-in replacement for VideoWriter which makes exports crash-safe.
+
+    The video is encoded in segments starting at keyframes of the source file, each by its own encoder, so every segment is a
+    closed GOP and can be joined without reencoding. Completed segments are recorded in a journal in the work directory.
+    If an export gets interrupted, e.g. by a crash or reboot, the next export of the same file with the same settings continues
+    at the first segment which has not been completed.
+
+    Frames before the start of the first pending segment are ignored, so the caller can start restoration at
+    get_resume_timestamp_ns() and write whatever it receives.
+    """
+    JOURNAL_VERSION = 1
+    JOURNAL_FILE_NAME = "journal.json"
+
+    def __init__(self, video_metadata: VideoMetadata, output_path: str, codec, crf=None, preset=None, custom_encoder_options=None,
+                 settings: dict | None = None, segment_duration_s=60., resume=True, work_directory: pathlib.Path | None = None):
+        self.video_metadata = video_metadata
+        self.codec = codec
+        self.crf = crf
+        self.preset = preset
+        self.custom_encoder_options = custom_encoder_options
+        self.work_directory = work_directory if work_directory is not None else get_work_directory(output_path)
+        self.segment_file_extension = os.path.splitext(output_path)[1]
+        stat = os.stat(video_metadata.video_file)
+        self.fingerprint = dict(video_file=os.path.abspath(video_metadata.video_file), video_file_size=stat.st_size, video_file_mtime_ns=stat.st_mtime_ns,
+                                codec=codec, crf=crf, preset=preset, custom_encoder_options=custom_encoder_options, segment_duration_s=segment_duration_s,
+                                settings=settings or {})
+
+        journal = self._load_journal() if resume else None
+        if journal is None:
+            shutil.rmtree(self.work_directory, ignore_errors=True)
+            self.work_directory.mkdir(parents=True)
+            self.segments = _plan_segments(video_metadata, segment_duration_s)
+            self.completed_segment_files: dict[int, str | None] = {}
+            self._save_journal()
+        else:
+            self.segments = journal['segments']
+            self.completed_segment_files = {int(idx): file_name for idx, file_name in journal['completed'].items()}
+            self._remove_incomplete_segment_files()
+            logger.info(f"Resuming export from journal {self.work_directory}: {len(self.completed_segment_files)} of {len(self.segments)} segments already completed")
+
+        self.segment_idx = self._get_first_pending_segment_idx()
+        self.video_writer: video_utils.VideoWriter | None = None
+
+    def get_resume_timestamp_ns(self) -> int:
+        if self.segment_idx is None or self.segment_idx == 0:
+            return 0
+        start_pts = self.segments[self.segment_idx]['start_pts']
+        # round up so the keyframe is not missed when seeking backward to the nearest keyframe
+        return math.ceil(start_pts * self.video_metadata.time_base * 1_000_000_000)
+
+    def get_resume_frame_num(self) -> int:
+        if self.segment_idx is None:
+            return self.video_metadata.frames_count
+        return self.segments[self.segment_idx]['start_frame']
+
+    def is_complete(self) -> bool:
+        return self.segment_idx is None
+
+    def write(self, frame, frame_pts=None, bgr2rgb=False):
+        if self.segment_idx is None:
+            return
+        start_pts = self.segments[self.segment_idx]['start_pts']
+        if start_pts is not None and frame_pts is not None and frame_pts < start_pts:
+            # restoration started at a keyframe before the segment
+            return
+        while self.segment_idx + 1 < len(self.segments) and frame_pts is not None and frame_pts >= self.segments[self.segment_idx + 1]['start_pts']:
+            self._complete_segment()
+        if self.video_writer is None:
+            self.video_writer = video_utils.VideoWriter(
+                str(self._get_segment_path(self.segment_idx, partial=True)), self.video_metadata.video_width, self.video_metadata.video_height,
+                self.video_metadata.video_fps_exact, self.codec, crf=self.crf, preset=self.preset, time_base=self.video_metadata.time_base,
+                custom_encoder_options=self.custom_encoder_options)
+        self.video_writer.write(frame, frame_pts, bgr2rgb=bgr2rgb)
+
+    def release(self):
+        """
+        To be called once all frames have been written. Completes the current and all remaining segments.
+        """
+        while self.segment_idx is not None:
+            self._complete_segment()
+
+    def abort(self):
+        """
+        To be called if the export is stopped or failed. Completed segments are kept so the export can be resumed later.
+        """
+        if self.video_writer is not None:
+            try:
+                self.video_writer.release()
+            except Exception as e:
+                logger.warning(f"Error closing video writer of incomplete segment: {e}")
+            self.video_writer = None
+        self._remove_incomplete_segment_files()
+
+    def concat(self, output_path: str, moov_front=False):
+        """
+        Joins all completed segments into a single video file without reencoding.
+        """
+        assert self.is_complete(), "Illegal State: Tried to concat segments of an incomplete export"
+        segment_files = [self.work_directory.joinpath(file_name) for idx, file_name in sorted(self.completed_segment_files.items()) if file_name is not None]
+        if len(segment_files) == 0:
+            raise Exception("Export did not produce any frames")
+        concat_list_path = self.work_directory.joinpath("concat.txt")
+        with open(concat_list_path, 'w', encoding='utf-8') as f:
+            for segment_file in segment_files:
+                escaped_path = str(segment_file).replace("'", "'\\''")
+                f.write(f"file '{escaped_path}'\n")
+        cmd = ["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", str(concat_list_path), "-map", "0:v:0", "-c", "copy"]
+        if moov_front:
+            cmd += ["-movflags", "+frag_keyframe+empty_moov+faststart"]
+        cmd += [output_path]
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, startupinfo=os_utils.get_subprocess_startup_info())
+        if result.returncode != 0:
+            raise Exception(f"error joining segments: {result.stderr.decode('utf-8', errors='ignore').strip()}. Code: {result.returncode}, cmd: {cmd}")
+
+    def remove_work_directory(self):
+        shutil.rmtree(self.work_directory, ignore_errors=True)
+
+    def _get_segment_path(self, segment_idx: int, partial=False) -> pathlib.Path:
+        return self.work_directory.joinpath(f"segment_{segment_idx:05d}{'.part' if partial else ''}{self.segment_file_extension}")
+
+    def _get_first_pending_segment_idx(self) -> int | None:
+        for segment_idx in range(len(self.segments)):
+            if segment_idx not in self.completed_segment_files:
+                return segment_idx
+        return None
+
+    def _complete_segment(self):
+        segment_file_name = None
+        if self.video_writer is not None:
+            self.video_writer.release()
+            self.video_writer = None
+            partial_path = self._get_segment_path(self.segment_idx, partial=True)
+            segment_path = self._get_segment_path(self.segment_idx)
+            _fsync_file(partial_path)
+            os.replace(partial_path, segment_path)
+            segment_file_name = segment_path.name
+        # segments without any frames (e.g. frame count of the index was off at the end) are recorded as completed without a file
+        self.completed_segment_files[self.segment_idx] = segment_file_name
+        self._save_journal()
+        self.segment_idx = self._get_first_pending_segment_idx()
+
+    def _remove_incomplete_segment_files(self):
+        for path in self.work_directory.glob(f"segment_*.part{self.segment_file_extension}"):
+            path.unlink(missing_ok=True)
+
+    def _load_journal(self) -> dict | None:
+        journal_path = self.work_directory.joinpath(self.JOURNAL_FILE_NAME)
+        try:
+            with open(journal_path, 'r', encoding='utf-8') as f:
+                journal = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if journal.get('version') != self.JOURNAL_VERSION or journal.get('fingerprint') != self.fingerprint:
+            logger.info(f"Discarding journal {journal_path}, it belongs to a different file or settings")
+            return None
+        for file_name in journal['completed'].values():
+            if file_name is not None and not self.work_directory.joinpath(file_name).is_file():
+                logger.warning(f"Discarding journal {journal_path}, segment {file_name} is missing")
+                return None
+        return journal
+
+    def _save_journal(self):
+        journal = dict(version=self.JOURNAL_VERSION, fingerprint=self.fingerprint, segments=self.segments,
+                       completed={str(idx): file_name for idx, file_name in self.completed_segment_files.items()})
+        journal_path = self.work_directory.joinpath(self.JOURNAL_FILE_NAME)
+        tmp_journal_path = journal_path.with_name(journal_path.name + ".tmp")
+        with open(tmp_journal_path, 'w', encoding='utf-8') as f:
+            json.dump(journal, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_journal_path, journal_path)
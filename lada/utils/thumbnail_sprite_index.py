@@ -0,0 +1,184 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import hashlib
+import json
+import logging
+import math
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+import time
+
+import av
+import cv2
+import numpy as np
+
+from lada.utils import Image
+
+logger = logging.getLogger(__name__)
+
+class ThumbnailSpriteIndex:
+    """
+    Thumbnails of a video file at a fixed interval, generated in a background thread by decoding only keyframes.
+
+    Thumbnails are packed into sprite sheets (JPEG) and cached on disk per file so that opening the same file again
+    doesn't need to decode anything. Lookups are served from memory and don't block, they return None for thumbnails
+    which have not been generated yet.
+    """
+    VERSION = 1
+    STALE_TMP_DIRECTORY_AGE_S = 3600
+
+    def __init__(self, video_file: str, duration_s: float, thumb_width: int, thumb_height: int, cache_directory: pathlib.Path | None,
+                 min_interval_s=1., max_thumbnails=500, sheet_columns=10, sheet_rows=10, max_cached_files=50):
+        self.video_file = video_file
+        self.thumb_width = thumb_width
+        self.thumb_height = thumb_height
+        self.count = max(1, min(max_thumbnails, math.ceil(duration_s / min_interval_s)))
+        self.interval_s = max(duration_s, 1e-3) / self.count
+        self.sheet_columns = sheet_columns
+        self.sheet_rows = sheet_rows
+        self.max_cached_files = max_cached_files
+        self.cache_directory = cache_directory
+        self.thumbnails = np.zeros((self.count, thumb_height, thumb_width, 3), dtype=np.uint8)
+        self.available = np.zeros(self.count, dtype=bool)
+        self.done = False
+        self.thread: threading.Thread | None = None
+        self.thread_should_be_running = False
+
+    def start(self):
+        self.thread_should_be_running = True
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.thread_should_be_running = False
+        if self.thread:
+            self.thread.join()
+        self.thread = None
+
+    def get_thumbnail(self, timestamp_ns: int) -> Image | None:
+        idx = min(max(0, round(timestamp_ns / 1_000_000_000 / self.interval_s)), self.count - 1)
+        if not self.available[idx]:
+            return None
+        return self.thumbnails[idx]
+
+    def _get_cache_entry_directory(self) -> pathlib.Path | None:
+        if self.cache_directory is None:
+            return None
+        stat = os.stat(self.video_file)
+        key = f"{os.path.abspath(self.video_file)}|{stat.st_size}|{stat.st_mtime_ns}|{self.count}|{self.thumb_width}x{self.thumb_height}|{self.VERSION}"
+        return self.cache_directory.joinpath(hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def _worker(self):
+        start = time.time()
+        try:
+            cache_entry_directory = self._get_cache_entry_directory()
+            if cache_entry_directory is not None and self._load(cache_entry_directory):
+                logger.debug(f"thumbnail index: loaded {self.count} thumbnails of {self.video_file} from cache, took {time.time() - start:.2f}s")
+            elif self._generate():
+                logger.debug(f"thumbnail index: generated {self.count} thumbnails of {self.video_file}, took {time.time() - start:.2f}s")
+                if cache_entry_directory is not None:
+                    self._save(cache_entry_directory)
+        except Exception as e:
+            logger.error(f"thumbnail index: failed to create thumbnails of {self.video_file}: {e}")
+
+    def _generate(self) -> bool:
+        with av.open(self.video_file, metadata_errors='ignore') as container:
+            stream = container.streams.video[0]
+            # decoder drops all non-keyframes, we don't need to decode whole GOPs to get a frame close to each thumbnail timestamp
+            stream.codec_context.skip_frame = 'NONKEY'
+            for frame in container.decode(stream):
+                if not self.thread_should_be_running:
+                    return False
+                if frame.time is None:
+                    continue
+                idx = min(round(frame.time / self.interval_s), self.count - 1)
+                if self.available[idx]:
+                    continue
+                self.thumbnails[idx] = frame.reformat(width=self.thumb_width, height=self.thumb_height, format='bgr24').to_ndarray()
+                self.available[idx] = True
+                # use it for preceding slots without a keyframe of their own until we find the next keyframe
+                previous_idx = idx - 1
+                while previous_idx >= 0 and not self.available[previous_idx]:
+                    self.thumbnails[previous_idx] = self.thumbnails[idx]
+                    self.available[previous_idx] = True
+                    previous_idx -= 1
+        # slots after the last keyframe
+        available_indices = np.flatnonzero(self.available)
+        if len(available_indices) == 0:
+            return False
+        last_idx = available_indices[-1]
+        self.thumbnails[last_idx + 1:] = self.thumbnails[last_idx]
+        self.available[:] = True
+        self.done = True
+        return True
+
+    def _save(self, cache_entry_directory: pathlib.Path):
+        thumbs_per_sheet = self.sheet_columns * self.sheet_rows
+        tmp_directory = None
+        try:
+            self.cache_directory.mkdir(parents=True, exist_ok=True)
+            # each worker writes into its own directory, a worker of a previous index of the same file may still be running
+            tmp_directory = pathlib.Path(tempfile.mkdtemp(prefix=cache_entry_directory.name + ".", suffix=".tmp", dir=self.cache_directory))
+            for sheet_idx in range(math.ceil(self.count / thumbs_per_sheet)):
+                sheet = np.zeros((self.sheet_rows * self.thumb_height, self.sheet_columns * self.thumb_width, 3), dtype=np.uint8)
+                for i, thumbnail in enumerate(self.thumbnails[sheet_idx * thumbs_per_sheet:(sheet_idx + 1) * thumbs_per_sheet]):
+                    row, column = divmod(i, self.sheet_columns)
+                    sheet[row * self.thumb_height:(row + 1) * self.thumb_height, column * self.thumb_width:(column + 1) * self.thumb_width] = thumbnail
+                if not cv2.imwrite(str(tmp_directory.joinpath(f"sheet_{sheet_idx}.jpg")), sheet, [int(cv2.IMWRITE_JPEG_QUALITY), 85]):
+                    raise OSError("could not write sprite sheet")
+            with open(tmp_directory.joinpath("index.json"), 'w') as f:
+                json.dump(dict(count=self.count, interval_s=self.interval_s, thumb_width=self.thumb_width, thumb_height=self.thumb_height,
+                               sheet_columns=self.sheet_columns, sheet_rows=self.sheet_rows), f)
+            # only complete entries should ever be visible under the final name
+            shutil.rmtree(cache_entry_directory, ignore_errors=True)
+            os.replace(tmp_directory, cache_entry_directory)
+        except OSError as e:
+            logger.warning(f"thumbnail index: could not write thumbnails to cache {cache_entry_directory}: {e}")
+            if tmp_directory is not None:
+                shutil.rmtree(tmp_directory, ignore_errors=True)
+            return
+        self._prune_cache()
+
+    def _load(self, cache_entry_directory: pathlib.Path) -> bool:
+        index_file = cache_entry_directory.joinpath("index.json")
+        if not index_file.exists():
+            return False
+        with open(index_file, 'r') as f:
+            index = json.load(f)
+        sheet_columns, sheet_rows = index['sheet_columns'], index['sheet_rows']
+        if index['count'] != self.count or index['thumb_width'] != self.thumb_width or index['thumb_height'] != self.thumb_height:
+            return False
+        thumbs_per_sheet = sheet_columns * sheet_rows
+        for sheet_idx in range(math.ceil(self.count / thumbs_per_sheet)):
+            sheet = cv2.imread(str(cache_entry_directory.joinpath(f"sheet_{sheet_idx}.jpg")))
+            if sheet is None:
+                return False
+            for i in range(sheet_idx * thumbs_per_sheet, min(self.count, (sheet_idx + 1) * thumbs_per_sheet)):
+                row, column = divmod(i - sheet_idx * thumbs_per_sheet, sheet_columns)
+                self.thumbnails[i] = sheet[row * self.thumb_height:(row + 1) * self.thumb_height, column * self.thumb_width:(column + 1) * self.thumb_width]
+        self.available[:] = True
+        self.done = True
+        # keep recently used entries when pruning
+        os.utime(cache_entry_directory)
+        return True
+
+    def _prune_cache(self):
+        cache_entries = []
+        for entry in self.cache_directory.iterdir():
+            if not entry.is_dir():
+                continue
+            if entry.name.endswith(".tmp"):
+                # leftovers of crashed workers. Recent ones may still be written by running workers
+                if time.time() - entry.stat().st_mtime > self.STALE_TMP_DIRECTORY_AGE_S:
+                    shutil.rmtree(entry, ignore_errors=True)
+                continue
+            cache_entries.append(entry)
+        if len(cache_entries) <= self.max_cached_files:
+            return
+        cache_entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for cache_entry in cache_entries[:len(cache_entries) - self.max_cached_files]:
+            shutil.rmtree(cache_entry, ignore_errors=True)
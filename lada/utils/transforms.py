@@ -307,19 +307,14 @@ class Mosaic(torch.nn.Module):
         mosaic_size = int(base_block_size * self.mosaic_block_size_scale_factor)
         mosaic_feather_size = int(mosaic_size * self.feather_size_scale_factor) if self.should_apply_feathering else -1
 
-        img_lqs = []
-        mask_lqs = []
-        for img_gt, mask_gt in zip(imgs_gt, masks_gt):
-            mask_gt = mask_utils.dilate_mask(mask_gt, iterations=self.mask_dilation_iterations)
-            img_lq, mask_lq = mosaic_utils.addmosaic_base(img_gt,
-                                                          mask_gt,
-                                                          mosaic_size,
-                                                          model=self.mosaic_mod,
-                                                          rect_ratio=self.mosaic_rectangle_ratio,
-                                                          feather=mosaic_feather_size,
-                                                          reuse_input_mask_value=self.reuse_input_mask_value,
-                                                          incomplete_blocks=self.should_enable_incomplete_blocks)
-            img_lqs.append(img_lq)
-            mask_lqs.append(mask_lq)
+        masks_gt = [mask_utils.dilate_mask(mask_gt, iterations=self.mask_dilation_iterations) for mask_gt in masks_gt]
+        img_lqs, mask_lqs = mosaic_utils.addmosaic_clip(imgs_gt,
+                                                        masks_gt,
+                                                        mosaic_size,
+                                                        model=self.mosaic_mod,
+                                                        rect_ratio=self.mosaic_rectangle_ratio,
+                                                        feather=mosaic_feather_size,
+                                                        reuse_input_mask_value=self.reuse_input_mask_value,
+                                                        incomplete_blocks=self.should_enable_incomplete_blocks)
 
         return (img_lqs[0], mask_lqs[0], mosaic_size) if single_image else (img_lqs, mask_lqs, mosaic_size)
\ No newline at end of file
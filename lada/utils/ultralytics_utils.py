@@ -38,6 +38,14 @@ def convert_yolo_boxes(yolo_box: UltralyticsBoxes, img_shape) -> list[Box]:
         boxes.append(box)
     return boxes
 
+def convert_yolo_detections(yolo_boxes: UltralyticsBoxes, img_shape) -> list[tuple[float, int, Box]]:
+    """
+    Returns confidence, class id and box of each detection
+    """
+    confidences = yolo_boxes.conf.tolist()
+    class_ids = [int(cls) for cls in yolo_boxes.cls.tolist()]
+    return list(zip(confidences, class_ids, convert_yolo_boxes(yolo_boxes, img_shape)))
+
 def scale_and_unpad_image(masks, im0_shape):
     h0, w0 = im0_shape[:2]
     h1, w1, _ = masks.shape
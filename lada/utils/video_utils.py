@@ -7,6 +7,7 @@ import os
 import re
 import subprocess
 from contextlib import contextmanager
+from functools import lru_cache
 from fractions import Fraction
 from typing import Callable, Iterator, Tuple
 from collections import deque
@@ -21,26 +22,82 @@ from lada.utils import Image, Mask, VideoMetadata, os_utils
 
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=4096)
+def _get_keyframe_index(path: str, mtime_ns: int) -> tuple[np.ndarray, np.ndarray] | None:
+    # Demuxing is much cheaper than decoding. We only need packet headers to find out pts of each frame and where keyframes are located.
+    with av.open(path, metadata_errors='ignore') as container:
+        stream = container.streams.video[0]
+        frame_pts = []
+        is_keyframe = []
+        for packet in container.demux(stream):
+            if packet.size == 0:
+                continue
+            if packet.pts is None:
+                # e.g. raw bitstreams without container timestamps. we can't seek reliably in those
+                return None
+            frame_pts.append(packet.pts)
+            is_keyframe.append(packet.is_keyframe)
+    frame_pts = np.array(frame_pts, dtype=np.int64)
+    display_order = np.argsort(frame_pts, kind='stable')
+    keyframe_indices = np.flatnonzero(np.array(is_keyframe, dtype=bool)[display_order])
+    return frame_pts[display_order], keyframe_indices
+
+def get_keyframe_index(path: str) -> tuple[np.ndarray, np.ndarray] | None:
+    """
+    Returns pts of all frames of the first video stream in presentation order and the frame indices of its keyframes.
+    Index is cached per process. Returns None if file can't be indexed, e.g. because of missing timestamps.
+    """
+    return _get_keyframe_index(path, os.stat(path).st_mtime_ns)
+
+def _decode_frames(container: av.container.InputContainer, path: str, start_idx: int = 0) -> Iterator[tuple[int, av.VideoFrame]]:
+    """
+    Decodes the first video stream from frame start_idx on and yields each frame together with its frame number.
+    Seeks to the nearest keyframe before start_idx if the file can be indexed, otherwise all frames before it are decoded and dropped.
+    """
+    stream = container.streams.video[0]
+    frame_num = 0
+    start_pts = None
+    if start_idx > 0 and (index := get_keyframe_index(path)) is not None:
+        frame_pts, keyframe_indices = index
+        if start_idx >= len(frame_pts):
+            return
+        keyframe_position = np.searchsorted(keyframe_indices, start_idx, side='right') - 1
+        if keyframe_position >= 0:
+            container.seek(int(frame_pts[keyframe_indices[keyframe_position]]), stream=stream, backward=True)
+            start_pts = frame_pts[start_idx]
+            frame_num = start_idx
+    for frame in container.decode(stream):
+        if start_pts is not None:
+            if frame.pts is not None and frame.pts < start_pts:
+                continue
+            start_pts = None
+        elif frame_num < start_idx:
+            frame_num += 1
+            continue
+        yield frame_num, frame
+        frame_num += 1
+
 def read_video_frames(path: str, float32: bool = True, start_idx: int = 0, end_idx: int | None = None, normalize_neg1_pos1 = False, binary_frames=False) -> list[np.ndarray]:
-    with VideoReaderOpenCV(path) as video_reader:
-        frames = []
-        i = 0
-        while video_reader.isOpened():
-            ret, frame = video_reader.read()
-            if ret and (end_idx is None or i < end_idx):
-                if binary_frames:
-                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                    frame = np.expand_dims(frame, axis=-1)
-                if i >= start_idx:
-                    if float32:
-                        if normalize_neg1_pos1:
-                            frame = (frame.astype(np.float32) / 255.0 - 0.5) / 0.5
-                        else:
-                            frame = frame.astype(np.float32) / 255.
-                    frames.append(frame)
-                i += 1
-            else:
+    """
+    Reads frames [start_idx, end_idx) of the given video file as BGR (or grayscale if binary_frames is set) images.
+    For start_idx > 0 we seek to the nearest keyframe instead of decoding all frames before the requested window.
+    """
+    frames = []
+    with av.open(path, metadata_errors='ignore') as container:
+        container.streams.video[0].thread_type = 'AUTO'
+        for i, frame in _decode_frames(container, path, start_idx):
+            if end_idx is not None and i >= end_idx:
                 break
+            if binary_frames:
+                img = np.expand_dims(frame.to_ndarray(format='gray'), axis=-1)
+            else:
+                img = frame.to_ndarray(format='bgr24')
+            if float32:
+                if normalize_neg1_pos1:
+                    img = (img.astype(np.float32) / 255.0 - 0.5) / 0.5
+                else:
+                    img = img.astype(np.float32) / 255.
+            frames.append(img)
     return frames
 
 def resize_video_frames(frames: list, size: int | tuple[int, int]):
@@ -88,8 +145,14 @@ class VideoReader:
     def __exit__(self, exc_type, exc_value, traceback):
         self.container.close()
 
-    def frames(self) -> Iterator[Tuple[torch.Tensor, int]]:
-        for frame in self.container.decode(video=0):
+    def frames(self, stride: int = 1, start_frame: int = 0) -> Iterator[Tuple[torch.Tensor, int]]:
+        """
+        stride: only every n-th frame will be converted to an RGB image and returned
+        start_frame: frames before this frame number will be skipped. Seeks to the nearest keyframe if the file can be indexed
+        """
+        for frame_num, frame in _decode_frames(self.container, self.file, start_frame):
+            if frame_num % stride != 0:
+                continue
             nd_frame = frame.to_ndarray(format='bgr24')
             torch_frame = torch.from_numpy(nd_frame)
             yield torch_frame, frame.pts
@@ -150,55 +213,49 @@ def offset_ns_to_frame_num(offset_ns, video_fps_exact):
 
 def write_frames_to_video_file(frames: list[Image], output_path, fps: int | float | Fraction, codec='x264', preset='medium', crf=None):
     assert frames[0].ndim == 3
-    width = frames[0].shape[1]
-    height = frames[0].shape[0]
-    ffmpeg_output = [
-        'nice', '-n', '19', 'ffmpeg', '-y',
-        '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-r', f"{fps.numerator}/{fps.denominator}" if type(fps) == Fraction else str(fps),
-        '-i', '-', '-an', '-preset', preset
-    ]
-    if codec == 'x265':
-        ffmpeg_output.extend(['-tag:v', 'hvc1', '-vcodec', 'libx265', '-crf', str(crf) if crf else '18'])
-    elif codec == 'x264':
-        ffmpeg_output.extend(['-vcodec', 'libx264', '-crf', str(crf) if crf else '15'])
-    ffmpeg_output.append(output_path)
-
-    ffmpeg_process = subprocess.Popen(ffmpeg_output, stdin=subprocess.PIPE, stderr=subprocess.PIPE, stdout=subprocess.PIPE, startupinfo=os_utils.get_subprocess_startup_info())
-    for frame in frames:
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        ffmpeg_process.stdin.write(frame.tobytes())
-    ffmpeg_process.stdin.close()
-    ffmpeg_process.wait()
-    if ffmpeg_process.returncode != 0:
-        print(f"ERROR when writing video via ffmpeg to file: {output_path}, return code: {ffmpeg_process.returncode}")
-        print(f"stderr: {ffmpeg_process.stderr.read()}")
+    height, width = frames[0].shape[:2]
+    with av.open(output_path, 'w') as container:
+        if codec == 'x265':
+            stream = container.add_stream('libx265', rate=Fraction(fps).limit_denominator(1001), options={'preset': preset, 'crf': str(crf) if crf else '18', 'x265-params': 'log_level=error'})
+            stream.codec_tag = 'hvc1'
+        else:
+            stream = container.add_stream('libx264', rate=Fraction(fps).limit_denominator(1001), options={'preset': preset, 'crf': str(crf) if crf else '15'})
+        stream.width = width
+        stream.height = height
+        # same pixel format ffmpeg would pick for rgb24 input
+        stream.pix_fmt = 'yuv444p'
+        for frame in frames:
+            for packet in stream.encode(av.VideoFrame.from_ndarray(frame, format='bgr24')):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
 
 def write_masks_to_video_file(frames: list[Mask], output_path, fps: int | float | Fraction):
-    #assert frames[0].ndim == 2
-    width = frames[0].shape[1]
-    height = frames[0].shape[0]
-    ffmpeg_output = [
-        'nice', '-n', '19', 'ffmpeg', '-y',
-        '-f', 'rawvideo', '-pix_fmt', 'gray', '-s', f'{width}x{height}', '-r', f"{fps.numerator}/{fps.denominator}" if type(fps) == Fraction else str(fps),
-        '-i', '-', '-an', '-vcodec', 'ffv1', '-level', '3', '-tag:v', 'ffv1',  output_path
-    ]
-
-    ffmpeg_process = subprocess.Popen(ffmpeg_output, stdin=subprocess.PIPE, stderr=subprocess.PIPE, startupinfo=os_utils.get_subprocess_startup_info())
-    for frame in frames:
-        try:
-            ffmpeg_process.stdin.write(frame.tobytes())
-        except Exception as e:
-            print(f"ERROR when writing video via ffmpeg to file: {output_path}")
-            print(f"exception: {e}")
-            print(f"stderr: {ffmpeg_process.stderr.read()}")
-            print(f"stdout: {ffmpeg_process.stdout.read()}")
-            raise e
-    ffmpeg_process.stdin.close()
-    ffmpeg_process.wait()
-    if ffmpeg_process.returncode != 0:
-        print(f"ERROR when writing video via ffmpeg to file: {output_path}, return code: {ffmpeg_process.returncode}")
-        print(f"stderr: {ffmpeg_process.stderr.read()}")
-        print(f"stdout: {ffmpeg_process.stdout.read()}")
+    height, width = frames[0].shape[:2]
+    with av.open(output_path, 'w') as container:
+        stream = container.add_stream('ffv1', rate=Fraction(fps).limit_denominator(1001), options={'level': '3'})
+        stream.width = width
+        stream.height = height
+        stream.pix_fmt = 'gray'
+        for frame in frames:
+            for packet in stream.encode(av.VideoFrame.from_ndarray(np.ascontiguousarray(frame.reshape(height, width)), format='gray')):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+
+def write_frames_to_lossless_video_file(frames: list[Image], output_path, fps: int | float | Fraction):
+    # ffv1 stores bgr frames without any color conversion so frames read back via read_video_frames() are bit-exact
+    height, width = frames[0].shape[:2]
+    with av.open(output_path, 'w') as container:
+        stream = container.add_stream('ffv1', rate=Fraction(fps).limit_denominator(1001))
+        stream.width = width
+        stream.height = height
+        stream.pix_fmt = 'bgr0'
+        for frame in frames:
+            for packet in stream.encode(av.VideoFrame.from_ndarray(frame, format='bgr24')):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
 
 def process_video_v3(input_path, output_path, frame_processor: Callable[[Image], Image]):
     video_metadata = get_video_meta_data(input_path)
@@ -0,0 +1,58 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import argparse
+from multiprocessing import Pool
+from pathlib import Path
+
+from tqdm import tqdm
+
+from lada.datasetcreation.degradation_cache import DegradationCache, get_variant_seed
+from lada.models.basicvsrpp.mosaic_video_dataset import MosaicVideoDataset
+
+dataset: MosaicVideoDataset = None
+cache: DegradationCache = None
+
+def parse_args():
+    parser = argparse.ArgumentParser("Pre-render mosaic + degraded low-quality variants of each clip of a mosaic restoration dataset. Use with option degradation_cache_dir of MosaicVideoDataset of BasicVSR++")
+    parser.add_argument('--workers', type=int, default=4, help="Set number of multiprocessing workers")
+    parser.add_argument('--metadata-root-dir', type=Path, required=True, help="metadata directory of a dataset created by create-mosaic-restoration-dataset.py (e.g. datasets/mosaic_removal_vid/train/crop_unscaled_meta)")
+    parser.add_argument('--output-dir', type=Path, required=True, help="directory where degradation cache should be stored. If it already exists missing variants will be added")
+    parser.add_argument('--variants', type=int, default=4, help="number of low-quality variants per clip")
+    parser.add_argument('--lq-size', type=int, default=256, help="needs to match lq_size of dataset")
+    parser.add_argument('--seed', type=int, default=42, help="base seed used to derive seeds for each variant")
+    return parser.parse_args()
+
+def init_worker(metadata_root_dir: Path, output_dir: Path, lq_size: int):
+    global dataset, cache
+    dataset = MosaicVideoDataset(metadata_root_dir=metadata_root_dir, lq_size=lq_size, num_frame=-1, min_num_frame=0, degrade=True, random_mosaic_params=True)
+    cache = DegradationCache(output_dir, lq_size=lq_size)
+
+def render_variant(input):
+    meta, variant_idx, seed = input
+    img_gts = dataset.read_frames(meta, 'nsfw_video', 0, None)
+    mask_gts = dataset.read_frames(meta, 'mask_video', 0, None)
+    variant = cache.render_variant(meta.relative_nsfw_video_path, variant_idx, seed, lambda: dataset.create_lq_frames(meta, img_gts, mask_gts, meta.pad), meta.fps)
+    return meta.relative_nsfw_video_path, variant
+
+def main():
+    args = parse_args()
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    init_worker(args.metadata_root_dir, args.output_dir, args.lq_size)
+
+    jobs = []
+    for meta in dataset.metadata:
+        clip_key = meta.relative_nsfw_video_path
+        for variant_idx in cache.get_missing_variant_indices(clip_key, args.variants):
+            jobs.append((meta, variant_idx, get_variant_seed(clip_key, variant_idx, args.seed)))
+
+    with Pool(args.workers, initializer=init_worker, initargs=(args.metadata_root_dir, args.output_dir, args.lq_size)) as pool:
+        for i, (clip_key, variant) in enumerate(tqdm(pool.imap_unordered(render_variant, jobs), total=len(jobs))):
+            cache.add_variant(clip_key, variant)
+            if i % 1000 == 999:
+                cache.save()
+    cache.save()
+
+if __name__ == '__main__':
+    main()
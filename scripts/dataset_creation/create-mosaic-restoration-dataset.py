@@ -11,10 +11,14 @@ from lada.models.dover.evaluate import VideoQualityEvaluator
 from lada.datasetcreation.detectors.mosaic_classifier import MosaicClassifier
 from lada.datasetcreation.nsfw_scene_detector import NsfwDetector, FileProcessingOptions
 from lada.datasetcreation.nsfw_scene_processor import SceneProcessingOptions, SceneProcessor
+from lada.datasetcreation.scene_analyzer_scheduler import SceneAnalyzerScheduler
+from lada.datasetcreation.dataset_writer import DatasetWriter
+from lada.datasetcreation.progress_journal import ProgressJournal
 from lada.datasetcreation.detectors.nudenet_nsfw_detector import NudeNetNsfwDetector
 from lada.utils.threading_utils import wait_until_completed, clean_up_completed_futures
 from lada.datasetcreation.detectors.watermark_detector import WatermarkDetector
 from lada.models.yolo.yolo import Yolo
+from lada.models.yolo.yolo11_segmentation_model import Yolo11SegmentationModel
 
 def parse_args():
     parser = argparse.ArgumentParser("Create mosaic restoration dataset")
@@ -23,8 +27,13 @@ def parse_args():
     input = parser.add_argument_group('Input')
     input.add_argument('--input', type=Path, help="path to a video file or a directory containing NSFW videos")
     input.add_argument('--start-index', type=int, default=0, help="Can be used to continue a previous run. Note the index number next to last processed file name")
+    input.add_argument('--resume-scenes', default=True, action=argparse.BooleanOptionalAction, help="record completed scenes in progress_journal.jsonl in output root. Files which have been interrupted will continue after their last completed scene instead of being processed from the start")
     input.add_argument('--stride-length', default=0, type=int, help="skip frames in between long videos to prevent sampling too many scenes from a single file. value is in seconds")
     input.add_argument('--skip-4k', default=True, action=argparse.BooleanOptionalAction, help="skip videos of 4K resolution or higher. Processing those will use a lot of RAM")
+    input.add_argument('--frame-stride', type=int, default=1, help="only analyze every n-th frame of each video. Scenes will be made up of those frames only and saved with a correspondingly lower frame rate")
+    input.add_argument('--deduplicate', default=False, action=argparse.BooleanOptionalAction, help="skip files and scenes which are near-duplicates of already processed ones (e.g. re-encoded copies of the same source). Uses perceptual hashes of sampled frames stored in perceptual_hashes.txt in output root")
+    input.add_argument('--deduplicate-max-distance', type=int, default=6, help="maximum number of differing bits of two 64-bit frame hashes to be considered a match. Higher values will skip more files and scenes")
+    input.add_argument('--parallel-files', type=int, default=1, help="number of video files analyzed concurrently by NSFW detection. Each of them will load its own instance of the NSFW detection model")
 
 
     output = parser.add_argument_group('Output')
@@ -42,25 +51,31 @@ def parse_args():
                         help="Store frames of all videos in output root directory instead of using sub directories per clip")
     output.add_argument('--save-as-images', default=False, action=argparse.BooleanOptionalAction,
                         help="Save as images instead of videos")
+    output.add_argument('--writer-workers', type=int, default=4, help="number of threads encoding and writing clips, images and metadata files")
+    output.add_argument('--writer-queue-size', type=int, default=32, help="maximum number of files queued up for writing. Scene processing will block once the queue is full")
 
     nsfw_detection = parser.add_argument_group('NSFW detection')
     nsfw_detection.add_argument('--model', type=str, default="model_weights/lada_nsfw_detection_model_v1.3.pt",
                         help="path to NSFW detection model")
     nsfw_detection.add_argument('--model-device', type=str, default="cuda", help="device to run the YOLO model on. E.g. 'cuda' or 'cuda:0'")
+    nsfw_detection.add_argument('--batch-size', type=int, default=4, help="number of frames passed to the NSFW detection model at once")
 
     scene_duration_filter = parser.add_argument_group('Scene duration filter')
     scene_duration_filter.add_argument('--scene-min-length', type=int, default=2.,
                         help="minimal length of a scene in number of frames in order to be detected (in seconds)")
     scene_duration_filter.add_argument('--scene-max-length', type=int, default=8,
                         help="maximum length of a scene in number of frames. Scenes longer than that will be cut (in seconds)")
-    scene_duration_filter.add_argument('--scene-max-memory', default=6144, type=int, help="limits maximum scene length based on approximate memory consumption of the scene. Value should be given in Megabytes (MB)")
+    scene_duration_filter.add_argument('--scene-max-memory', default=6144, type=int, help="RAM budget of a scene. Frames and masks of longer scenes will be spilled to memory-mapped temporary files. Value should be given in Megabytes (MB)")
+    scene_duration_filter.add_argument('--scene-spill-dir', type=Path, default=None, help="directory for temporary files of scenes exceeding --scene-max-memory. Defaults to .scene_spill in output root. Avoid directories on tmpfs like /tmp on many systems as their content is held in RAM as well")
 
     video_quality_evaluation = parser.add_argument_group('Scene video quality evaluation')
     video_quality_evaluation.add_argument('--add-video-quality-metadata', default=True, action=argparse.BooleanOptionalAction, help="If enabled will evaluate video quality and add its results to metadata")
     video_quality_evaluation.add_argument('--enable-video-quality-filter', default=False, action=argparse.BooleanOptionalAction, help="If enabled and scene quality is below scene-min-quality it will be skipped and not land in the dataset.")
     video_quality_evaluation.add_argument('--video-quality-model-device', type=str, default="cuda", help="device to run the video quality model on. E.g. 'cuda' or 'cuda:0'")
+    video_quality_evaluation.add_argument('--video-quality-branch', type=str, default="both", choices=["both", "technical", "aesthetic"],
+                        help="DOVER branches used for video quality evaluation. If only a single branch is used the overall score is an estimate assuming average quality for the other branch, the score of the other branch will be missing in metadata")
     video_quality_evaluation.add_argument('--min-video-quality', type=float, default=0.1,
-                        help="minimum quality of a scene as determined by quality estimation model DOVER. Range between 0 and 1 were 1 is highest quality. If scene quality is below this threshold it will be skipped and not land in the dataset.")
+                        help="minimum quality of a scene as determined by quality estimation model DOVER. Range between 0 and 1 were 1 is highest quality. If scene quality is below this threshold it will be skipped and not land in the dataset. Compared to the overall score, see --video-quality-branch")
 
     mosaic_creation = parser.add_argument_group('Mosaic creation')
     mosaic_creation.add_argument('--save-mosaic', default=False, action=argparse.BooleanOptionalAction,
@@ -98,9 +113,7 @@ def main():
 
     scenes_executor = concurrent_futures.ThreadPoolExecutor(max_workers=args.workers)
 
-    nsfw_detection_model = Yolo(args.model)
-
-    video_quality_evaluator = VideoQualityEvaluator(device=args.video_quality_model_device) if args.add_video_quality_metadata or args.enable_video_quality_filter else None
+    video_quality_evaluator = VideoQualityEvaluator(device=args.video_quality_model_device, branches=("technical", "aesthetic") if args.video_quality_branch == "both" else (args.video_quality_branch,)) if args.add_video_quality_metadata or args.enable_video_quality_filter else None
     watermark_detector = WatermarkDetector(Yolo(args.watermark_model_path), device=args.model_device) if args.add_watermark_metadata or args.enable_watermark_filter else None
     nudenet_nsfw_detector = NudeNetNsfwDetector(Yolo(args.nudenet_nsfw_model_path), device=args.model_device) if args.add_nudenet_nsfw_metadata or args.enable_nudenet_nsfw_filter else None
     censor_detector = MosaicClassifier(Yolo(args.censor_model_path), device=args.model_device) if args.add_censor_metadata or args.enable_censor_filter else None
@@ -121,7 +134,12 @@ def main():
                                                     scene_max_memory=args.scene_max_memory,
                                                     scene_min_length=args.scene_min_length,
                                                     random_extend_masks=True,
-                                                    skip4k=args.skip_4k)
+                                                    skip4k=args.skip_4k,
+                                                    frame_stride=args.frame_stride,
+                                                    parallel_files=args.parallel_files,
+                                                    spill_dir=args.scene_spill_dir,
+                                                    deduplicate=args.deduplicate,
+                                                    deduplicate_max_distance=args.deduplicate_max_distance)
 
     scene_processing_options = SceneProcessingOptions(output_dir=output_dir,
                                                   save_flat=args.flat,
@@ -138,14 +156,20 @@ def main():
                                                   nudenet_nsfw_detection=SceneProcessingOptions.NudeNetNsfwDetectionProcessingOptions(args.enable_nudenet_nsfw_filter, args.add_nudenet_nsfw_metadata),
                                                   censor_detection = SceneProcessingOptions.CensorDetectionProcessingOptions(args.enable_censor_filter, args.add_censor_metadata))
 
-    nsfw_detector = NsfwDetector(nsfw_detection_model=nsfw_detection_model, device=args.model_device,
+    progress_journal = ProgressJournal(output_dir.joinpath("progress_journal.jsonl")) if args.resume_scenes else None
+    nsfw_detector = NsfwDetector(nsfw_detection_model_factory=lambda: Yolo11SegmentationModel(args.model, args.model_device), batch_size=args.batch_size,
                                  file_queue=file_queue,
                                  frame_queue=queue.Queue(50),
                                  scene_queue=queue.Queue(2),
-                                 file_processing_options=file_processing_options)
-    scene_processor = SceneProcessor(video_quality_evaluator, watermark_detector, nudenet_nsfw_detector, censor_detector)
+                                 file_processing_options=file_processing_options,
+                                 progress_journal=progress_journal)
+    scene_analyzer_scheduler = SceneAnalyzerScheduler(watermark_detector, nudenet_nsfw_detector, censor_detector, device=args.model_device)
+    dataset_writer = DatasetWriter(workers=args.writer_workers, max_queued_jobs=args.writer_queue_size)
+    scene_processor = SceneProcessor(video_quality_evaluator, scene_analyzer_scheduler, dataset_writer, progress_journal, nsfw_detector.perceptual_hash_index)
 
     try:
+        scene_analyzer_scheduler.start()
+        dataset_writer.start()
         nsfw_detector.start()
         nsfw_detector.add_files(video_files)
         scene_futures = []
@@ -163,6 +187,8 @@ def main():
         wait_until_completed(scene_futures)
     finally:
         nsfw_detector.stop()
+        scene_analyzer_scheduler.stop()
+        dataset_writer.stop()
 
     scenes_executor.shutdown(wait=True)
 
@@ -0,0 +1,22 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import argparse
+from pathlib import Path
+
+from lada.datasetcreation.restoration_dataset_index import RestorationDatasetIndex, get_index_path
+
+def parse_args():
+    parser = argparse.ArgumentParser("Create or update metadata index of a mosaic restoration dataset. Only new or modified metadata files will be read")
+    parser.add_argument('metadata_root_dirs', type=Path, nargs='+', help="metadata directories of a dataset created by create-mosaic-restoration-dataset.py (e.g. datasets/mosaic_removal_vid/train/crop_unscaled_meta)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    for metadata_root_dir in args.metadata_root_dirs:
+        with RestorationDatasetIndex(metadata_root_dir) as index:
+            added, removed = index.update()
+            print(f"{get_index_path(metadata_root_dir)}: added/updated {added}, removed {removed}, total {len(index)} clips")
+
+if __name__ == '__main__':
+    main()
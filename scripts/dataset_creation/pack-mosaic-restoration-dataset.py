@@ -0,0 +1,72 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import argparse
+import json
+import os
+from multiprocessing import Pool
+from pathlib import Path
+
+from tqdm import tqdm
+
+from lada.datasetcreation.packed_dataset import PackedDatasetWriter
+from lada.datasetcreation.restoration_dataset_metadata import RestorationDatasetMetadataV2
+from lada.utils import video_utils
+
+BASICVSRPP_STREAMS = ['nsfw_video', 'mask_video', 'mosaic_nsfw_video', 'mosaic_mask_video']
+
+def parse_args():
+    parser = argparse.ArgumentParser("Pack mosaic restoration dataset into memory-mapped shards so that training doesn't need to decode videos")
+    parser.add_argument('--workers', type=int, default=4, help="Set number of multiprocessing workers used for decoding")
+    input = parser.add_argument_group('Input').add_mutually_exclusive_group(required=True)
+    input.add_argument('--metadata-root-dir', type=Path, help="metadata directory of a dataset created by create-mosaic-restoration-dataset.py (e.g. datasets/mosaic_removal_vid/train/crop_unscaled_meta). Use with PackedMosaicVideoDataset of BasicVSR++")
+    input.add_argument('--deepmosaics-root-dir', type=Path, help="directory containing img, mosaic and meta sub directories (e.g. datasets/mosaic_removal_vid/train). Use with PackedMosaicVideoDataset of DeepMosaics")
+    output = parser.add_argument_group('Output')
+    output.add_argument('--output-dir', type=Path, required=True, help="directory where packed dataset should be stored")
+    output.add_argument('--shard-size', type=int, default=4096, help="maximum size of a single shard file in Megabytes (MB)")
+    output.add_argument('--skip-mosaic', default=False, action='store_true', help="Do not pack pre-generated mosaic clips. Saves disk space if mosaics are created on-the-fly while training (random_mosaic_params), datasets using random_mosaic_params=False can't be trained on such a pack")
+    return parser.parse_args()
+
+def load_basicvsrpp_clip(input):
+    meta_path, skip_mosaic = input
+    meta = RestorationDatasetMetadataV2.from_json_file(str(meta_path))
+    streams = {}
+    for stream in BASICVSRPP_STREAMS:
+        relative_path = getattr(meta, f"relative_{stream}_path")
+        if relative_path is None or (skip_mosaic and stream.startswith('mosaic')):
+            continue
+        path = str(meta_path.parent.joinpath(relative_path))
+        streams[stream] = video_utils.read_video_frames(path, float32=False, binary_frames=stream.endswith('mask_video'))
+    return meta_path.stem, streams, meta.to_dict()
+
+def load_deepmosaics_clip(input):
+    meta_path, _ = input
+    with open(meta_path, 'r') as meta_file:
+        meta_json = json.load(meta_file)
+    root_dir = meta_path.parent.parent
+    clip_name = f"{os.path.splitext(meta_path.name)[0]}.mp4"
+    streams = {
+        'gt': video_utils.read_video_frames(str(root_dir / 'img' / clip_name), float32=False),
+        'lq': video_utils.read_video_frames(str(root_dir / 'mosaic' / clip_name), float32=False),
+    }
+    return clip_name, streams, meta_json
+
+def main():
+    args = parse_args()
+
+    if args.metadata_root_dir:
+        meta_paths = sorted(args.metadata_root_dir.glob("*.json"))
+        load_clip = load_basicvsrpp_clip
+    else:
+        meta_paths = sorted((args.deepmosaics_root_dir / 'meta').glob("*"))
+        load_clip = load_deepmosaics_clip
+
+    with PackedDatasetWriter(args.output_dir, shard_size_mb=args.shard_size) as writer, Pool(args.workers) as pool:
+        for name, streams, metadata in tqdm(pool.imap(load_clip, [(meta_path, args.skip_mosaic) for meta_path in meta_paths]), total=len(meta_paths)):
+            if any(len(frames) == 0 for frames in streams.values()):
+                print(f"Skipping clip {name}, could not read frames")
+                continue
+            writer.add_clip(name, streams, metadata)
+
+if __name__ == '__main__':
+    main()
@@ -15,7 +15,7 @@ from lada.models.deepmosaics.util import image_processing as impro
 from lada.models.deepmosaics.models import BVDNet,model_util
 from skimage.metrics import structural_similarity
 from torch.utils.tensorboard import SummaryWriter
-from lada.models.deepmosaics.mosaic_video_dataset import MosaicVideoDataset
+from lada.models.deepmosaics.mosaic_video_dataset import MosaicVideoDataset, PackedMosaicVideoDataset
 
 
 parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -47,6 +47,7 @@ parser.add_argument('--showresult_num',type=int,default=6, help='')
 parser.add_argument('--pretrained_G_model_path',type=str, help='')
 parser.add_argument('--pretrained_D_model_path',type=str, help='')
 parser.add_argument('--gpu_id',type=str, default="0")
+parser.add_argument('--packed_dataset_root',type=str, help='if specified, read train and val clips from packed datasets in <root>/train and <root>/val instead of decoding video files. See pack-mosaic-restoration-dataset.py')
 
 
 def ImageQualityEvaluation(tensor1,tensor2):
@@ -129,7 +130,11 @@ train_set_options = {
     "S": opt["S"],
     "T": opt["T"]
 }
-train_set = MosaicVideoDataset(train_set_options)
+if opt["packed_dataset_root"]:
+    train_set_options["dataroot_packed"] = os.path.join(opt["packed_dataset_root"], "train")
+    train_set = PackedMosaicVideoDataset(train_set_options)
+else:
+    train_set = MosaicVideoDataset(train_set_options)
 train_loader = DataLoader(train_set,
                           batch_size=train_set_options['dataloader_batch_size'],
                           shuffle=train_set_options['dataloader_shuffle'],
@@ -154,7 +159,11 @@ val_set_options = {
     "S": opt["S"],
     "T": opt["T"]
 }
-val_set = MosaicVideoDataset(val_set_options)
+if opt["packed_dataset_root"]:
+    val_set_options["dataroot_packed"] = os.path.join(opt["packed_dataset_root"], "val")
+    val_set = PackedMosaicVideoDataset(val_set_options)
+else:
+    val_set = MosaicVideoDataset(val_set_options)
 val_loader = DataLoader(val_set,
                           batch_size=val_set_options['dataloader_batch_size'],
                           shuffle=val_set_options['dataloader_shuffle'],
@@ -0,0 +1,18 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import shutil
+
+import pytest
+
+from lada.utils import video_utils
+from tests.utils import get_video_meta_data_without_ffprobe
+
+@pytest.fixture
+def video_meta_data_reader(monkeypatch):
+    """
+    Falls back to reading metadata via PyAV on machines without ffprobe.
+    """
+    if shutil.which('ffprobe') is None:
+        monkeypatch.setattr(video_utils, 'get_video_meta_data', get_video_meta_data_without_ffprobe)
+    return video_utils.get_video_meta_data
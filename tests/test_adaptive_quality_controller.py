@@ -0,0 +1,119 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+import lada.gui.preview.adaptive_quality_controller as adaptive_quality_controller
+from lada.gui.preview.adaptive_quality_controller import AdaptiveQualityController, QualityLevel, get_quality_levels
+from lada.restorationpipeline.frame_restorer import FrameRestorer
+from tests.utils import create_video
+
+FPS = 25
+MAX_CLIP_LENGTH = 8
+
+class _FakeFrameRestorer:
+    def __init__(self):
+        self.max_clip_length = MAX_CLIP_LENGTH
+        self.restored_frames_count = 0
+        self.queue_stats = {"frame_restoration_queue_wait_time_put": 0.}
+        self.qualities = []
+
+    def set_quality(self, max_clip_length, detection_stride=1, min_detection_area=0.):
+        self.qualities.append(QualityLevel(max_clip_length, detection_stride, min_detection_area))
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(adaptive_quality_controller, "time", clock)
+    return clock
+
+def _sample(controller: AdaptiveQualityController, clock: _Clock, restored_fps: float, samples=1, put_wait_time=0.):
+    for _ in range(samples):
+        clock.now += 1.
+        controller.frame_restorer.restored_frames_count += round(restored_fps)
+        controller.frame_restorer.queue_stats["frame_restoration_queue_wait_time_put"] += put_wait_time
+        controller.update()
+
+def test_quality_is_lowered_if_restoration_is_too_slow(clock):
+    frame_restorer = _FakeFrameRestorer()
+    controller = AdaptiveQualityController(frame_restorer, FPS)
+    levels = get_quality_levels(MAX_CLIP_LENGTH)
+
+    # first call only starts measuring
+    _sample(controller, clock, 10)
+    _sample(controller, clock, 10)
+    assert controller.level == 0 and frame_restorer.qualities == []
+    _sample(controller, clock, 10)
+    assert controller.level == 1 and frame_restorer.qualities == [levels[1]]
+    assert not controller.is_full_quality()
+
+    # measuring starts again after each change
+    _sample(controller, clock, 10, samples=2)
+    assert controller.level == 1
+    _sample(controller, clock, 10)
+    assert controller.level == 2
+
+    # a sample at playback speed resets the count of slow samples
+    _sample(controller, clock, 10, samples=2)
+    _sample(controller, clock, FPS)
+    _sample(controller, clock, 10)
+    assert controller.level == 2
+
+def test_time_blocked_by_full_queue_is_not_counted(clock):
+    frame_restorer = _FakeFrameRestorer()
+    controller = AdaptiveQualityController(frame_restorer, FPS)
+    # 20 frames in half a second of work are fast enough
+    _sample(controller, clock, 20, samples=10, put_wait_time=0.5)
+    assert controller.level == 0 and frame_restorer.qualities == []
+
+def test_quality_is_raised_again_once_there_is_headroom(clock):
+    frame_restorer = _FakeFrameRestorer()
+    controller = AdaptiveQualityController(frame_restorer, FPS)
+    levels = get_quality_levels(MAX_CLIP_LENGTH)
+    controller.set_level(2)
+
+    _sample(controller, clock, 2 * FPS, samples=5)
+    assert controller.level == 2
+    _sample(controller, clock, 2 * FPS)
+    assert controller.level == 1
+    _sample(controller, clock, 2 * FPS, samples=6)
+    assert controller.level == 0 and controller.is_full_quality()
+    assert frame_restorer.qualities == [levels[2], levels[1], levels[0]]
+
+def test_quality_level_is_clamped(clock):
+    frame_restorer = _FakeFrameRestorer()
+    controller = AdaptiveQualityController(frame_restorer, FPS)
+    levels = get_quality_levels(MAX_CLIP_LENGTH)
+
+    _sample(controller, clock, 1, samples=3 * len(levels) * 2)
+    assert controller.level == len(levels) - 1
+    assert frame_restorer.qualities == levels[1:]
+
+    _sample(controller, clock, 10 * FPS, samples=6 * len(levels) * 2)
+    assert controller.level == 0
+    assert frame_restorer.qualities == levels[1:] + levels[-2::-1]
+
+def test_frame_restorer_applies_quality_to_mosaic_detector(tmp_path, video_meta_data_reader):
+    video_file = create_video(tmp_path / "input.mp4")
+    frame_restorer = FrameRestorer('cpu', video_file, MAX_CLIP_LENGTH, "basicvsrpp", None, SimpleNamespace(dtype=torch.float32), 'reflect')
+    mosaic_detector = frame_restorer.mosaic_detector
+    assert (mosaic_detector.max_clip_length, mosaic_detector.detection_stride, mosaic_detector.min_detection_area) == (MAX_CLIP_LENGTH, 1, 0.)
+
+    frame_restorer.set_quality(4, 2, 0.01)
+    assert (mosaic_detector.max_clip_length, mosaic_detector.detection_stride, mosaic_detector.min_detection_area) == (4, 2, 0.01)
+
+    # clip length can't exceed the length queues have been sized for
+    frame_restorer.set_quality(2 * MAX_CLIP_LENGTH, 0, 0.)
+    assert (mosaic_detector.max_clip_length, mosaic_detector.detection_stride, mosaic_detector.min_detection_area) == (MAX_CLIP_LENGTH, 1, 0.)
+    frame_restorer.set_quality(0)
+    assert mosaic_detector.max_clip_length == 1
@@ -0,0 +1,74 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import cv2
+import numpy as np
+import pytest
+import torch
+
+from lada.models.basicvsrpp.batch_augmentation import MosaicAugmentationDataPreprocessor, add_mosaic, zero_pads
+from lada.utils import mosaic_utils
+
+def _create_clip(h: int, w: int, frames_count=4):
+    rng = np.random.default_rng(0)
+    # smooth content, the mosaic of noise would be too sensitive to block alignment
+    imgs = [cv2.resize(rng.integers(0, 256, (16, 16, 3), dtype=np.uint8), (w, h), interpolation=cv2.INTER_CUBIC) for _ in range(frames_count)]
+    masks = []
+    for i in range(frames_count):
+        mask = np.zeros((h, w, 1), dtype=np.uint8)
+        mask[h // 6 + i:h - h // 5, w // 5:w - w // 8 - i] = 255
+        masks.append(mask)
+    return imgs, masks
+
+def _to_tensor(frames: list[np.ndarray]) -> torch.Tensor:
+    return torch.from_numpy(np.stack(frames)).permute(0, 3, 1, 2).float() / 255.
+
+def _to_frames(tensor: torch.Tensor) -> np.ndarray:
+    return (tensor * 255.).permute(0, 2, 3, 1).numpy()
+
+@pytest.mark.parametrize("mod", ['squa_avg', 'squa_mid', 'rect_avg'])
+@pytest.mark.parametrize("block_size", [6, 7])
+@pytest.mark.parametrize("feather", [-1, 0, 3, 4])
+def test_add_mosaic_matches_addmosaic_clip(mod, block_size, feather):
+    # frame size not divisible by the block size and masks reaching the bottom right edge, so incomplete blocks are mosaic'd from padding
+    h, w = 90, 130
+    rng = np.random.default_rng(0)
+    imgs = [rng.integers(0, 256, (h, w, 3), dtype=np.uint8) for _ in range(3)]
+    masks = []
+    for i in range(3):
+        mask = np.zeros((h, w, 1), dtype=np.uint8)
+        mask[10 + i:, 20:w - 4 * i] = 255
+        masks.append(mask)
+    # mosaic spanning too few blocks is not feathered
+    masks[2][:] = 0
+    masks[2][h - 3 * block_size:, :] = 255
+    expected, _ = mosaic_utils.addmosaic_clip(imgs, masks, block_size, mod, rect_ratio=1.6, feather=feather)
+    img_mosaic = add_mosaic(_to_tensor(imgs), _to_tensor(masks), block_size, mod, 1.6, feather)
+    # addmosaic_clip truncates block means and blended pixels to uint8, add_mosaic keeps them as floats
+    assert np.abs(_to_frames(img_mosaic) - np.stack(expected)).max() < 2.5
+
+def test_resize_mosaic_matches_mosaic_applied_before_resizing_frames():
+    h, w, lq_size = 256, 256, 128
+    imgs, masks = _create_clip(h, w)
+    # MosaicVideoDataset: mosaic at original resolution, then ResizeFrames
+    expected, _ = mosaic_utils.addmosaic_clip(imgs, masks, 7, 'squa_avg', feather=-1)
+    expected = np.stack([cv2.resize(img, (lq_size, lq_size), interpolation=cv2.INTER_LINEAR) for img in expected])
+    img_gts = _to_tensor([cv2.resize(img, (lq_size, lq_size), interpolation=cv2.INTER_LINEAR) for img in imgs])
+    mask_gts = _to_tensor([cv2.resize(mask, (lq_size, lq_size), interpolation=cv2.INTER_NEAREST)[..., None] for mask in masks])
+
+    errors = {}
+    for resize_mosaic in (True, False):
+        preprocessor = MosaicAugmentationDataPreprocessor(resize_mosaic=resize_mosaic)
+        img_lqs = preprocessor._add_mosaic(img_gts, mask_gts, 7, 'squa_avg', 1.0, -1, (h, w))
+        assert img_lqs.shape == img_gts.shape
+        errors[resize_mosaic] = np.abs(_to_frames(img_lqs) - expected).mean()
+    assert errors[True] < 1.5
+    assert errors[True] < errors[False]
+
+def test_zero_pads():
+    imgs = torch.ones(1, 2, 3, 8, 8)
+    pads = torch.tensor([[[1, 2, 3, 0], [0, 0, 0, 0]]])
+    padded = zero_pads(imgs, pads)
+    assert padded[0, 0, :, 1:6, 3:].eq(1).all()
+    assert padded[0, 0].sum() == 3 * 5 * 5
+    assert padded[0, 1].eq(1).all()
@@ -0,0 +1,84 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import os
+import sys
+import threading
+
+import pytest
+
+from lada.datasetcreation.dataset_writer import DatasetWriter
+from lada.datasetcreation.restoration_dataset_index import RestorationDatasetIndex
+from lada.utils import video_utils
+from tests.test_restoration_dataset_index import _create_meta
+from tests.utils import create_frame, get_frame_num
+
+@pytest.fixture
+def dataset_writer_factory():
+    dataset_writers = []
+    def _create(**kwargs) -> DatasetWriter:
+        dataset_writer = DatasetWriter(**kwargs)
+        dataset_writer.start()
+        dataset_writers.append(dataset_writer)
+        return dataset_writer
+    yield _create
+    for dataset_writer in dataset_writers:
+        dataset_writer.stop()
+
+def test_jobs_run_in_parallel_workers(dataset_writer_factory):
+    dataset_writer = dataset_writer_factory(workers=3)
+    # only passes if all three jobs are running at the same time
+    barrier = threading.Barrier(3, timeout=10)
+    futures = [dataset_writer._submit(lambda i: (barrier.wait(), threading.get_ident())[1], i) for i in range(3)]
+    assert len({future.result() for future in futures}) == 3
+
+def test_writing_blocks_if_job_queue_is_full(dataset_writer_factory):
+    dataset_writer = dataset_writer_factory(workers=1, max_queued_jobs=1)
+    job_started, continue_job = threading.Event(), threading.Event()
+    def _job(name):
+        job_started.set()
+        continue_job.wait()
+    dataset_writer._submit(_job, "a")
+    job_started.wait()
+    dataset_writer._submit(lambda name: None, "b")
+
+    submit_thread = threading.Thread(target=lambda: dataset_writer._submit(lambda name: None, "c"))
+    submit_thread.start()
+    submit_thread.join(timeout=0.2)
+    assert submit_thread.is_alive()
+    continue_job.set()
+    submit_thread.join(timeout=10)
+    assert not submit_thread.is_alive()
+
+def test_errors_are_propagated_through_futures(tmp_path, dataset_writer_factory):
+    dataset_writer = dataset_writer_factory(workers=1)
+    (tmp_path / "file").write_text("")
+    failed_write = dataset_writer.write_video(tmp_path / "file" / "a.mp4", [create_frame(0, 64, 48)], 25)
+    write = dataset_writer.write_video(tmp_path / "a.mp4", [create_frame(i, 64, 48) for i in range(4)], 25)
+    with pytest.raises(OSError):
+        failed_write.result()
+    # worker keeps running after a failed job
+    assert write.result() is None
+    assert [get_frame_num(frame) for frame in video_utils.read_video_frames(str(tmp_path / "a.mp4"), float32=False)] == list(range(4))
+
+def test_pending_index_entries_are_flushed_on_stop(tmp_path):
+    dataset_writer = DatasetWriter(workers=2, index_batch_size=4)
+    dataset_writer.start()
+    for future in [dataset_writer.write_metadata(tmp_path / f"{i}.json", _create_meta(str(i))) for i in range(6)]:
+        future.result()
+    with RestorationDatasetIndex(tmp_path, read_only=True) as index:
+        assert len(index) == 4
+    assert len(dataset_writer.pending_index_entries[tmp_path.absolute()]) == 2
+
+    dataset_writer.stop()
+    assert dataset_writer.pending_index_entries == {} and dataset_writer.indexes == {}
+    with RestorationDatasetIndex(tmp_path, read_only=True) as index:
+        assert sorted(meta.name for meta in index.query()) == [str(i) for i in range(6)]
+
+@pytest.mark.skipif(sys.platform != 'linux', reason="priority of threads can only be changed on Linux")
+def test_workers_run_at_lower_priority(dataset_writer_factory):
+    niceness = os.getpriority(os.PRIO_PROCESS, threading.get_native_id())
+    dataset_writer = dataset_writer_factory(workers=1, worker_nice_increment=5)
+    worker_niceness = dataset_writer._submit(lambda name: os.getpriority(os.PRIO_PROCESS, threading.get_native_id()), "niceness").result()
+    assert worker_niceness == min(19, niceness + 5)
+    assert os.getpriority(os.PRIO_PROCESS, threading.get_native_id()) == niceness
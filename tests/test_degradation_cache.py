@@ -0,0 +1,83 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import random
+
+import numpy as np
+import pytest
+
+from lada.datasetcreation.degradation_cache import DegradationCache, get_variant_seed
+from lada.models.basicvsrpp.mosaic_video_dataset import MosaicVideoDataset
+from lada.utils import video_utils
+from tests.test_restoration_dataset_index import _create_meta, _write_meta
+from tests.utils import create_video
+
+FRAMES_COUNT = 8
+LQ_SIZE = 64
+
+@pytest.fixture
+def dataset_dir(tmp_path):
+    (tmp_path / "meta").mkdir()
+    (tmp_path / "mask").mkdir()
+    (tmp_path / "img").mkdir()
+    create_video(tmp_path / "img" / "a.mp4", frames_count=FRAMES_COUNT, gop_size=4, width=64, height=64)
+    mask = np.zeros((64, 64, 1), dtype=np.uint8)
+    mask[16:48, 16:48] = 255
+    video_utils.write_masks_to_video_file([mask] * FRAMES_COUNT, str(tmp_path / "mask" / "a.mkv"), 25)
+    _write_meta(tmp_path / "meta", _create_meta("a", frames_count=FRAMES_COUNT, orig_shape=(64, 64)))
+    return tmp_path
+
+def _create_dataset(dataset_dir, **kwargs) -> MosaicVideoDataset:
+    return MosaicVideoDataset(metadata_root_dir=str(dataset_dir / "meta"), num_frame=4, lq_size=LQ_SIZE, degrade=True, use_metadata_index=False, **kwargs)
+
+def _render_variant(dataset: MosaicVideoDataset, cache: DegradationCache, variant_idx: int, seed: int):
+    meta = dataset.metadata[0]
+    img_gts = dataset.read_frames(meta, 'nsfw_video', 0, None)
+    mask_gts = dataset.read_frames(meta, 'mask_video', 0, None)
+    variant = cache.render_variant(meta.relative_nsfw_video_path, variant_idx, seed, lambda: dataset.create_lq_frames(meta, img_gts, mask_gts, meta.pad), meta.fps)
+    cache.add_variant(meta.relative_nsfw_video_path, variant)
+    return variant
+
+def test_same_seed_renders_same_variant(dataset_dir):
+    dataset = _create_dataset(dataset_dir)
+    clip_key = dataset.metadata[0].relative_nsfw_video_path
+    seed = get_variant_seed(clip_key, 0, 42)
+    caches = [DegradationCache(dataset_dir / f"cache_{i}", lq_size=LQ_SIZE) for i in range(3)]
+    for cache in caches:
+        cache.root_dir.mkdir()
+
+    random.seed(1)
+    np.random.seed(1)
+    expected_random_values = random.random(), np.random.random()
+    random.seed(1)
+    np.random.seed(1)
+    variants = [_render_variant(dataset, caches[0], 0, seed), _render_variant(dataset, caches[1], 0, seed),
+                _render_variant(dataset, caches[2], 0, get_variant_seed(clip_key, 1, 42))]
+    # global generators are left as they were
+    assert (random.random(), np.random.random()) == expected_random_values
+
+    frames = [cache.read_variant_frames(variant) for cache, variant in zip(caches, variants)]
+    assert len(frames[0]) == FRAMES_COUNT
+    assert all(np.array_equal(frame, other_frame) for frame, other_frame in zip(frames[0], frames[1]))
+    assert not all(np.array_equal(frame, other_frame) for frame, other_frame in zip(frames[0], frames[2]))
+
+def test_cached_variants_are_not_rendered_again(dataset_dir, monkeypatch):
+    dataset = _create_dataset(dataset_dir)
+    clip_key = dataset.metadata[0].relative_nsfw_video_path
+    cache = DegradationCache(dataset_dir / "cache", lq_size=LQ_SIZE)
+    cache.root_dir.mkdir()
+    assert cache.get_missing_variant_indices(clip_key, 3) == [0, 1, 2]
+    for variant_idx in (0, 2):
+        _render_variant(dataset, cache, variant_idx, get_variant_seed(clip_key, variant_idx, 42))
+    cache.save()
+
+    cache = DegradationCache(dataset_dir / "cache")
+    assert cache.get_missing_variant_indices(clip_key, 3) == [1]
+
+    # samples of the dataset are read from cached variants instead of creating low-quality frames
+    dataset = _create_dataset(dataset_dir, degradation_cache_dir=str(dataset_dir / "cache"))
+    def _create_lq_frames(*args):
+        raise AssertionError("low-quality frames should be read from the degradation cache")
+    monkeypatch.setattr(dataset, "create_lq_frames", _create_lq_frames)
+    for _ in range(5):
+        assert dataset[0]['inputs'].shape == (4, 3, LQ_SIZE, LQ_SIZE)
@@ -0,0 +1,45 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import math
+
+import pytest
+import torch
+
+from lada.models.dover.datasets.dover_datasets import get_spatial_fragments
+from lada.models.dover.evaluate import VideoQualityEvaluator, get_spatial_fragments_vectorized
+
+# raw model outputs of an average clip, they are normalized to a score of 0 before fusing
+AVERAGE_TECHNICAL = 0.1107
+AVERAGE_AESTHETIC = -0.08285
+
+def _fuse_results(results: dict) -> dict:
+    # fuse_results doesn't need the model
+    return VideoQualityEvaluator.fuse_results(None, results)
+
+def test_fuse_results_of_both_branches():
+    fused_results = _fuse_results({"technical": 0.2, "aesthetic": -0.05})
+    t = (0.2 - 0.1107) / 0.07355
+    a = (-0.05 + 0.08285) / 0.03774
+    assert fused_results["technical"] == pytest.approx(1 / (1 + math.exp(-t)))
+    assert fused_results["aesthetic"] == pytest.approx(1 / (1 + math.exp(-a)))
+    assert fused_results["overall"] == pytest.approx(1 / (1 + math.exp(-(0.6104 * t + 0.3896 * a))))
+
+@pytest.mark.parametrize("branch, other_branch, average_other_branch", [("technical", "aesthetic", AVERAGE_AESTHETIC), ("aesthetic", "technical", AVERAGE_TECHNICAL)])
+def test_single_branch_overall_score_is_on_the_scale_of_both_branches(branch, other_branch, average_other_branch):
+    for score in (-0.2, 0.0, 0.15):
+        fused_results = _fuse_results({branch: score})
+        assert fused_results[other_branch] is None
+        # same overall score as if the other branch would have rated the clip as average
+        assert fused_results["overall"] == pytest.approx(_fuse_results({branch: score, other_branch: average_other_branch})["overall"])
+
+@pytest.mark.parametrize("shape, dtype, aligned", [((3, 32, 360, 640), torch.uint8, 32), ((3, 32, 150, 200), torch.uint8, 32), ((3, 1, 300, 300), torch.float32, 32),
+                                                   ((3, 16, 224, 224), torch.float32, 8)])
+def test_spatial_fragments_vectorized_matches_get_spatial_fragments(shape, dtype, aligned):
+    video = torch.randint(0, 256, shape, generator=torch.Generator().manual_seed(0)).to(dtype)
+    torch.manual_seed(42)
+    expected = get_spatial_fragments(video, aligned=aligned)
+    torch.manual_seed(42)
+    fragments = get_spatial_fragments_vectorized(video, aligned=aligned)
+    assert fragments.shape == (3, shape[1], 224, 224)
+    assert torch.equal(fragments, expected.float())
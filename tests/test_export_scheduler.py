@@ -0,0 +1,61 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+from fractions import Fraction
+
+import pytest
+
+from lada.gui.export.export_scheduler import ExportScheduler, estimate_export_memory_bytes
+from lada.utils import VideoMetadata
+
+MB = 1024 * 1024
+
+def _create_video_metadata(width: int, height: int) -> VideoMetadata:
+    return VideoMetadata(video_file="a.mp4", video_height=height, video_width=width, video_fps=30., average_fps=30., video_fps_exact=Fraction(30),
+                         codec_name='h264', frames_count=1000, duration=1000/30, time_base=Fraction(1, 30), start_pts=0)
+
+def test_estimate_grows_with_resolution_and_clip_length():
+    estimate_1080p = estimate_export_memory_bytes(_create_video_metadata(1920, 1080), 180)
+    assert estimate_1080p > 3 * 512 * MB
+    assert estimate_export_memory_bytes(_create_video_metadata(3840, 2160), 180) > estimate_1080p
+    assert estimate_export_memory_bytes(_create_video_metadata(1920, 1080), 60) < estimate_1080p
+    assert estimate_export_memory_bytes(_create_video_metadata(1920, 1080), 181) - estimate_1080p == 1920 * 1080 * 3
+
+def test_exports_are_limited_by_slots_and_memory_budget():
+    scheduler = ExportScheduler(max_slots=3, memory_budget_bytes=1000 * MB)
+    assert scheduler.is_idle()
+    assert scheduler.try_acquire("a", 400 * MB)
+    assert scheduler.try_acquire("b", 400 * MB)
+    assert not scheduler.try_acquire("c", 400 * MB)
+    assert scheduler.try_acquire("c", 200 * MB)
+    assert scheduler.get_reserved_memory_bytes() == 1000 * MB
+    assert not scheduler.try_acquire("d", 0)
+
+    scheduler.release("a")
+    scheduler.release("a")
+    assert scheduler.try_acquire("d", 400 * MB)
+    for key in ("b", "c", "d"):
+        scheduler.release(key)
+    assert scheduler.is_idle() and scheduler.get_reserved_memory_bytes() == 0
+
+def test_export_is_always_started_if_nothing_is_running():
+    scheduler = ExportScheduler(max_slots=2, memory_budget_bytes=100 * MB)
+    assert scheduler.try_acquire("a", 1000 * MB)
+    assert not scheduler.try_acquire("b", 1 * MB)
+
+def test_new_limits_keep_running_exports():
+    scheduler = ExportScheduler(max_slots=2, memory_budget_bytes=1000 * MB)
+    assert scheduler.try_acquire("a", 400 * MB)
+    assert scheduler.try_acquire("b", 400 * MB)
+    scheduler.set_limits(max_slots=1, memory_budget_bytes=1000 * MB)
+    assert scheduler.reservations == {"a": 400 * MB, "b": 400 * MB}
+    scheduler.release("a")
+    assert not scheduler.try_acquire("c", 100 * MB)
+    scheduler.set_limits(max_slots=3, memory_budget_bytes=1000 * MB)
+    assert scheduler.try_acquire("c", 100 * MB)
+
+def test_acquiring_twice_is_illegal():
+    scheduler = ExportScheduler(max_slots=2, memory_budget_bytes=1000 * MB)
+    scheduler.try_acquire("a", 0)
+    with pytest.raises(AssertionError):
+        scheduler.try_acquire("a", 0)
@@ -0,0 +1,167 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import queue
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+
+from lada.restorationpipeline.frame_restorer import FrameRestorer, _SeekRequested
+from lada.restorationpipeline.mosaic_detector import MosaicDetector
+from tests.utils import create_frame, create_video, get_frame_num
+
+FRAMES_COUNT = 64
+FPS = 25
+WIDTH, HEIGHT = 64, 48
+MOSAIC_FRAMES = set(range(20, 28)) | set(range(40, 44))
+# small enough to not change the frame number encoded in the columns of the frame
+MOSAIC_BOX = 0, 0, 8, 8
+
+class _FakeDetectionModel:
+    """
+    Detects a mosaic at MOSAIC_BOX in MOSAIC_FRAMES. Can be blocked in inference to seek while a batch is being detected.
+    """
+    def __init__(self):
+        self.block = False
+        self.blocked = threading.Event()
+        self.continue_inference = threading.Event()
+
+    def preprocess(self, frames):
+        return frames
+
+    def inference_and_postprocess(self, frames_batch, frames):
+        if self.block:
+            self.block = False
+            self.blocked.set()
+            self.continue_inference.wait()
+        return [self._create_results(get_frame_num(frame.numpy())) for frame in frames]
+
+    def _create_results(self, frame_num):
+        if frame_num not in MOSAIC_FRAMES:
+            return SimpleNamespace(boxes=[], masks=[], orig_shape=(HEIGHT, WIDTH))
+        t, l, b, r = MOSAIC_BOX
+        mask = torch.zeros((1, HEIGHT, WIDTH))
+        mask[:, t:b + 1, l:r + 1] = 1
+        return SimpleNamespace(boxes=[SimpleNamespace(xyxy=torch.tensor([[l, t, r, b]], dtype=torch.float32))], masks=[SimpleNamespace(data=mask)],
+                               orig_shape=(HEIGHT, WIDTH))
+
+def _frame_num_to_ns(frame_num) -> int:
+    return frame_num * 1_000_000_000 // FPS
+
+def _is_restored(frame: np.ndarray) -> bool:
+    # mosaic detections are drawn onto the frame as we don't restore with a real model
+    t, l, b, r = MOSAIC_BOX
+    expected = create_frame(get_frame_num(frame), WIDTH, HEIGHT)[t:b + 1, l:r + 1]
+    return np.abs(frame[t:b + 1, l:r + 1].astype(np.int32) - expected).mean() > 20
+
+def _read_until_eof(frame_restorer: FrameRestorer) -> list[int]:
+    frame_nums = []
+    for frame, _ in frame_restorer:
+        frame = frame.numpy()
+        frame_num = get_frame_num(frame)
+        assert _is_restored(frame) == (frame_num in MOSAIC_FRAMES), f"frame {frame_num}"
+        frame_nums.append(frame_num)
+    return frame_nums
+
+@pytest.fixture
+def video_file(tmp_path, video_meta_data_reader):
+    # seek positions used by the tests are keyframes so the reader will continue exactly at the requested frame
+    return create_video(tmp_path / "input.mp4", frames_count=FRAMES_COUNT, gop_size=16, fps=FPS, width=WIDTH, height=HEIGHT)
+
+@pytest.fixture
+def model():
+    return _FakeDetectionModel()
+
+@pytest.fixture
+def frame_restorer(video_file, model):
+    frame_restorer = FrameRestorer('cpu', video_file, 8, "basicvsrpp", model, SimpleNamespace(dtype=torch.float32), 'reflect', mosaic_detection=True)
+    yield frame_restorer
+    frame_restorer.stop()
+
+def test_restores_all_frames(frame_restorer):
+    frame_restorer.start()
+    assert _read_until_eof(frame_restorer) == list(range(FRAMES_COUNT))
+
+def test_seek_during_detection(frame_restorer, model):
+    model.block = True
+    frame_restorer.start()
+    model.blocked.wait()
+    frame_restorer.seek(_frame_num_to_ns(32))
+    model.continue_inference.set()
+    assert _read_until_eof(frame_restorer) == list(range(32, FRAMES_COUNT))
+
+def test_seek_after_eof_drains_frame_restoration_queue(frame_restorer):
+    frame_restorer.start()
+    assert _read_until_eof(frame_restorer) == list(range(FRAMES_COUNT))
+    frame_restorer.seek(_frame_num_to_ns(16))
+    # nothing is read until the worker reached EOF again, the queue is full of restored frames of this position
+    while frame_restorer.frame_restoration_queue.qsize() < FRAMES_COUNT - 16 + 1:
+        time.sleep(0.01)
+    assert frame_restorer.eof
+
+    frame_restorer.seek(_frame_num_to_ns(48))
+    with frame_restorer.frame_restoration_queue.mutex:
+        assert all(elem[0] == frame_restorer.generation for elem in frame_restorer.frame_restoration_queue.queue)
+    assert _read_until_eof(frame_restorer) == list(range(48, FRAMES_COUNT))
+
+def test_seeks_back_to_back(frame_restorer):
+    frame_restorer.start()
+    frame_nums = [get_frame_num(next(frame_restorer)[0].numpy()) for _ in range(10)]
+    assert frame_nums == list(range(10))
+    frame_restorer.seek(_frame_num_to_ns(48))
+    frame_restorer.seek(_frame_num_to_ns(16))
+    assert frame_restorer.generation == 2
+    assert _read_until_eof(frame_restorer) == list(range(16, FRAMES_COUNT))
+
+def test_items_of_previous_generations_are_skipped(video_file, model):
+    frame_restorer = FrameRestorer('cpu', video_file, 8, "basicvsrpp", model, SimpleNamespace(dtype=torch.float32), 'reflect')
+    frame_restorer.generation = 2
+    q = queue.Queue()
+    for elem in [(0, "a"), (1, "b"), (2, "c")]:
+        q.put(elem)
+    assert frame_restorer._get_queue_item(q, 2, "frame_detection_queue") == (2, "c")
+
+    # worker still at generation 1 receives an item of the current generation: it has to switch to the new position first
+    for elem in [(1, "b"), (2, "c")]:
+        q.put(elem)
+    assert frame_restorer._get_queue_item(q, 1, "frame_detection_queue") == (1, "b")
+    with pytest.raises(_SeekRequested):
+        frame_restorer._get_queue_item(q, 1, "frame_detection_queue")
+    assert frame_restorer._get_queue_item(q, 2, "frame_detection_queue") == (2, "c")
+    assert q.empty() and frame_restorer.deferred_queue_items == {}
+
+    q.put(None)
+    assert frame_restorer._get_queue_item(q, 2, "frame_detection_queue") is None
+
+    # consumer skips frames restored before a seek
+    for elem in [(1, ("old frame", 0)), (2, ("frame", 1)), (2, None)]:
+        frame_restorer.frame_restoration_queue.put(elem)
+    assert next(frame_restorer) == ("frame", 1)
+    with pytest.raises(StopIteration):
+        next(frame_restorer)
+
+def test_mosaic_detector_seek_during_detection(video_file, model):
+    frame_detection_queue, mosaic_clip_queue = queue.Queue(), queue.Queue()
+    mosaic_detector = MosaicDetector(model, video_file, frame_detection_queue, mosaic_clip_queue, max_clip_length=8)
+    model.block = True
+    mosaic_detector.start(0)
+    model.blocked.wait()
+    mosaic_detector.seek(_frame_num_to_ns(32), 1)
+    model.continue_inference.set()
+
+    detected_frame_nums = []
+    while (elem := frame_detection_queue.get()) != (1, None):
+        if elem[0] == 1:
+            detected_frame_nums.append(elem[1])
+    clip_starts = []
+    while (elem := mosaic_clip_queue.get()) != (1, None):
+        if elem[0] == 1:
+            clip_starts.append((elem[1].frame_start, elem[1].frame_end))
+    mosaic_detector.stop()
+
+    assert detected_frame_nums == [(frame_num, frame_num in MOSAIC_FRAMES) for frame_num in range(32, FRAMES_COUNT)]
+    assert clip_starts == [(40, 43)]
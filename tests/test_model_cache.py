@@ -0,0 +1,126 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import threading
+
+import torch
+
+from lada.gui.frame_restorer_provider import FrameRestorerProvider
+from lada.gui.model_cache import ModelCache, get_model_bytes
+
+def _create_model(nbytes: int) -> torch.Tensor:
+    return torch.zeros(nbytes, dtype=torch.uint8)
+
+class _Loader:
+    def __init__(self, nbytes: int):
+        self.nbytes = nbytes
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return _create_model(self.nbytes)
+
+def test_get_model_bytes():
+    linear = torch.nn.Linear(10, 10)
+    module = torch.nn.Sequential(linear, linear)
+    module.register_buffer("buffer", torch.zeros(5))
+    assert get_model_bytes(module) == (10 * 10 + 10 + 5) * 4
+
+    class _ModelWrapper:
+        def __init__(self):
+            self.model = module
+            self.preallocated = torch.zeros(8, dtype=torch.uint8)
+            self.device = 'cpu'
+    assert get_model_bytes(_ModelWrapper()) == get_model_bytes(module) + 8
+    assert get_model_bytes((_create_model(3), _create_model(4))) == 7
+    assert get_model_bytes("not a model") == 0
+
+def test_least_recently_used_models_are_evicted():
+    cache = ModelCache(max_bytes=100)
+    loaders = {key: _Loader(40) for key in "abc"}
+    model_a = cache.get("a", loaders["a"])
+    assert cache.get("a", loaders["a"]) is model_a and loaders["a"].calls == 1
+    cache.get("b", loaders["b"])
+    cache.get("a", loaders["a"])
+    cache.get("c", loaders["c"])
+    assert list(cache.models) == ["a", "c"]
+    assert cache.get_memory_bytes() == 80
+
+    # the most recently used model is kept even if it exceeds the budget on its own
+    cache.get("d", _Loader(500))
+    assert list(cache.models) == ["d"]
+
+    cache.set_max_bytes(0)
+    assert list(cache.models) == ["d"]
+    cache.clear()
+    assert cache.get_memory_bytes() == 0
+
+def test_unusable_model_is_replaced():
+    cache = ModelCache(max_bytes=100)
+    loader = _Loader(10)
+    model = cache.get("a", loader)
+    assert cache.get("a", loader, is_usable=lambda cached_model: cached_model is model) is model
+    new_model = cache.get("a", loader, is_usable=lambda cached_model: False)
+    assert new_model is not model and loader.calls == 2
+    assert list(cache.models) == ["a"] and cache.get_memory_bytes() == 10
+
+def test_concurrent_requests_load_model_once():
+    cache = ModelCache(max_bytes=100)
+    loading_started, continue_loading = threading.Event(), threading.Event()
+    calls = []
+
+    def _load():
+        calls.append(1)
+        loading_started.set()
+        continue_loading.wait()
+        return _create_model(10)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("a", _load))) for _ in range(3)]
+    threads[0].start()
+    loading_started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    continue_loading.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert len(results) == 3 and all(result is results[0] for result in results)
+
+def test_preloaded_models_never_evict_used_ones():
+    cache = ModelCache(max_bytes=100)
+    cache.get("a", _Loader(60))
+    preload_loader = _Loader(30)
+    cache.preload("b", preload_loader, estimated_bytes=30)
+    cache.preload_thread.join()
+    assert list(cache.models) == ["b", "a"]
+
+    # would exceed the budget
+    cache.preload("c", _Loader(30), estimated_bytes=50)
+    cache.preload_thread.join()
+    assert "c" not in cache.models
+
+    # preloaded but unused models are evicted first
+    cache.get("d", _Loader(30))
+    assert list(cache.models) == ["a", "d"]
+
+    cache.cancel_preloads()
+    assert cache.preload_requests == []
+
+def test_failing_preload_does_not_block_later_loads():
+    cache = ModelCache(max_bytes=100)
+
+    def _load():
+        raise RuntimeError("could not load model")
+    cache.preload("a", _load, estimated_bytes=10)
+    cache.preload_thread.join()
+    assert cache.loading == {} and cache.models == {}
+    assert cache.get("a", _Loader(10)) is not None
+
+def test_mosaic_presence_scanner_model_is_cached_separately(monkeypatch):
+    frame_restorer_provider = FrameRestorerProvider()
+    monkeypatch.setattr(frame_restorer_provider, "load_mosaic_detection_model", lambda mosaic_detection_model_name, device: _create_model(10))
+    scanner_model = frame_restorer_provider.get_mosaic_presence_scanner_model("v4", "cpu")
+    assert frame_restorer_provider.get_mosaic_presence_scanner_model("v4", "cpu") is scanner_model
+    key, load = frame_restorer_provider._get_detection_model_loader("v4", "cpu")
+    assert frame_restorer_provider.model_cache.get(key, load) is not scanner_model
@@ -0,0 +1,48 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import queue
+from types import SimpleNamespace
+
+from lada.restorationpipeline.mosaic_detector import MosaicDetector
+from lada.restorationpipeline.mosaic_presence_scanner import MosaicPresenceScanner
+from lada.utils import video_utils
+from tests.utils import create_video, get_frame_num
+
+FRAMES_COUNT = 64
+MOSAIC_FRAMES = set(range(20, 28)) | set(range(40, 44))
+
+class _FakeDetectionModel:
+    def __init__(self, report_detections: bool):
+        # MosaicDetector doesn't get any detections so the test is independent of masks, the presence scanner only counts boxes
+        self.report_detections = report_detections
+        self.inferred_frame_nums = []
+
+    def preprocess(self, frames):
+        return frames
+
+    def inference_and_postprocess(self, frames_batch, frames):
+        frame_nums = [get_frame_num(frame) for frame in frames]
+        self.inferred_frame_nums.extend(frame_nums)
+        return [SimpleNamespace(boxes=[0] if self.report_detections and frame_num in MOSAIC_FRAMES else [], orig_shape=frame.shape[:2])
+                for frame_num, frame in zip(frame_nums, frames)]
+
+def test_frames_with_mosaics_are_detected_after_seek_between_keyframes(tmp_path, video_meta_data_reader):
+    video_file = create_video(tmp_path.joinpath("video.mp4"), frames_count=FRAMES_COUNT, gop_size=16)
+    scanner = MosaicPresenceScanner(video_file, "test")
+    scanner.start(_FakeDetectionModel(report_detections=True))
+    scanner.scanner_thread.join()
+
+    # seek right before the first mosaic frame, the reader will continue at the preceding keyframe
+    video_meta_data = video_utils.get_video_meta_data(video_file)
+    start_ns = int((min(MOSAIC_FRAMES) - 1) / video_meta_data.video_fps_exact * 1_000_000_000)
+    model = _FakeDetectionModel(report_detections=False)
+    frame_detection_queue = queue.Queue()
+    mosaic_detector = MosaicDetector(model, video_file, frame_detection_queue, queue.Queue())
+    mosaic_detector.mosaic_presence_scanner = scanner
+    mosaic_detector.start(start_ns)
+    while frame_detection_queue.get()[1] is not None:
+        pass
+    mosaic_detector.stop()
+
+    assert set(model.inferred_frame_nums) == {frame_num for frame_num in MOSAIC_FRAMES}
@@ -0,0 +1,78 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+from types import SimpleNamespace
+
+import numpy as np
+
+from lada.restorationpipeline.mosaic_presence_scanner import MosaicPresenceScanner, MOSAIC_PRESENCE_DETECTED, MOSAIC_PRESENCE_NONE, get_mosaic_density
+from lada.utils import video_utils
+from tests.utils import create_video, get_frame_num
+
+FRAMES_COUNT = 64
+MOSAIC_FRAMES = set(range(20, 28)) | set(range(40, 44))
+
+class _FakeDetectionModel:
+    def preprocess(self, frames):
+        return frames
+
+    def inference_and_postprocess(self, frames_batch, frames):
+        return [SimpleNamespace(boxes=[0] if get_frame_num(frame) in MOSAIC_FRAMES else []) for frame in frames]
+
+def _scan(video_file) -> MosaicPresenceScanner:
+    scanner = MosaicPresenceScanner(video_file, "test")
+    scanner.start(_FakeDetectionModel())
+    scanner.scanner_thread.join()
+    return scanner
+
+def test_scanner_records_presence_per_frame(tmp_path, video_meta_data_reader):
+    scanner = _scan(create_video(tmp_path.joinpath("video.mp4"), frames_count=FRAMES_COUNT))
+    assert scanner.is_done()
+    expected = [MOSAIC_PRESENCE_DETECTED if frame_num in MOSAIC_FRAMES else MOSAIC_PRESENCE_NONE for frame_num in range(FRAMES_COUNT)]
+    np.testing.assert_array_equal(scanner.presence, expected)
+
+def test_presence_lookup_by_pts_after_seek_between_keyframes(tmp_path, video_meta_data_reader):
+    video_file = create_video(tmp_path.joinpath("video.mp4"), frames_count=FRAMES_COUNT, gop_size=16)
+    scanner = _scan(video_file)
+    video_meta_data = video_utils.get_video_meta_data(video_file)
+    # seek right before the first mosaic frame, the reader will continue at the preceding keyframe
+    start_frame = min(MOSAIC_FRAMES) - 1
+    start_ns = int(start_frame / video_meta_data.video_fps_exact * 1_000_000_000)
+    with video_utils.VideoReader(video_file) as video_reader:
+        video_reader.seek(start_ns)
+        frames = list(video_reader.frames())
+    assert get_frame_num(frames[0][0]) < start_frame
+    for frame, pts in frames:
+        frame_num = get_frame_num(frame)
+        assert scanner.is_known_mosaic_free(pts) == (frame_num not in MOSAIC_FRAMES)
+
+def test_unknown_pts_is_not_mosaic_free(tmp_path, video_meta_data_reader):
+    scanner = MosaicPresenceScanner(create_video(tmp_path.joinpath("video.mp4"), frames_count=FRAMES_COUNT), "test")
+    assert not scanner.is_known_mosaic_free(0)
+    assert not scanner.is_known_mosaic_free(None)
+
+def test_mosaic_density():
+    presence = np.array([MOSAIC_PRESENCE_DETECTED, MOSAIC_PRESENCE_NONE, MOSAIC_PRESENCE_NONE, -1], dtype=np.int8)
+    density = get_mosaic_density(presence, 2)
+    assert density[0] == 0.5
+    assert density[1] == 0.
+
+def test_frames_without_pts_keep_lookup_sorted(tmp_path, video_meta_data_reader):
+    scanner = MosaicPresenceScanner(create_video(tmp_path.joinpath("video.mp4"), frames_count=FRAMES_COUNT), "test")
+    for frame_num, pts in enumerate([None, 0, 512, None, 1536, 1024, 2048]):
+        scanner._record_frame(frame_num, pts, mosaic_detected=frame_num == 4)
+    assert np.all(scanner.presence_pts[1:] >= scanner.presence_pts[:-1])
+    assert scanner.is_known_mosaic_free(0) and scanner.is_known_mosaic_free(512) and scanner.is_known_mosaic_free(2048)
+    assert not scanner.is_known_mosaic_free(1536)
+    # out of order pts can't be looked up
+    assert not scanner.is_known_mosaic_free(1024)
+
+def test_scan_failure_is_recorded(tmp_path, video_meta_data_reader):
+    class _FailingDetectionModel(_FakeDetectionModel):
+        def inference_and_postprocess(self, frames_batch, frames):
+            raise RuntimeError("inference failed")
+    scanner = MosaicPresenceScanner(create_video(tmp_path.joinpath("video.mp4"), frames_count=FRAMES_COUNT), "test")
+    scanner.start(_FailingDetectionModel())
+    scanner.scanner_thread.join()
+    assert scanner.failed and not scanner.is_done()
+    scanner.stop()
@@ -0,0 +1,81 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import math
+
+import cv2
+import numpy as np
+import pytest
+
+from lada.utils import mosaic_utils
+
+def _addmosaic_base_reference(img, mask, n, model, rect_ratio=1.6, feather=0, reuse_input_mask_value=False, incomplete_blocks=False):
+    # block by block implementation addmosaic_base was vectorized from
+    n = int(n)
+    rect_ratio = 1.0 if model != 'rect_avg' else rect_ratio
+    n_h = n
+    n_w = int(n * rect_ratio)
+    h, w = img.shape[:2]
+    h_step = math.ceil(h / n_h)
+    w_step = math.ceil(w / n_w)
+    img_padded = np.pad(img, ((0, n), (0, n), (0, 0)), mode='reflect')
+    mask_padded = np.pad(mask, ((0, n), (0, n), (0, 0)), mode='constant', constant_values=0)
+    img_mosaic = img.copy()
+    mask_mosaic = np.zeros_like(mask)
+    min_h, max_h = img.shape[1], 0
+    min_w, max_w = img.shape[0], 0
+    for i in range(h_step):
+        for j in range(w_step):
+            if mask_val := mask_padded[i * n_h + n_h // 2, j * n_w + n_w // 2]:
+                if not reuse_input_mask_value: mask_val = 255
+                min_h, max_h = min(min_h, i), max(max_h, i)
+                min_w, max_w = min(min_w, j), max(max_w, j)
+                if model == 'squa_mid':
+                    block_value = img_padded[i * n_h + n_h // 2, j * n_w + n_w // 2, :]
+                else:
+                    block_value = img_padded[i * n_h:(i + 1) * n_h, j * n_w:(j + 1) * n_w, :].mean(axis=(0, 1))
+                y_slice, x_slice = slice(i * n_h, (i + 1) * n_h), slice(j * n_w, (j + 1) * n_w)
+                if incomplete_blocks:
+                    mask_block_indices = mask[y_slice, x_slice, :] == 0
+                    img_mosaic[y_slice, x_slice, :] = np.where(mask_block_indices, img[y_slice, x_slice, :], block_value)
+                    mask_mosaic[y_slice, x_slice, :] = np.where(mask_block_indices, 0, mask_val)
+                else:
+                    img_mosaic[y_slice, x_slice, :] = block_value
+                    mask_mosaic[y_slice, x_slice, :] = mask_val
+    if feather != -1 and max_h - min_h + 1 > 4 and max_w - min_w + 1 > 4:
+        _mask = np.where(mask > 0, 255, mask).astype(mask.dtype) if reuse_input_mask_value else mask
+        blurred_mask = cv2.blur(_mask, (n, n) if feather == 0 else (feather, feather)) / 255.0
+        for i in range(3):
+            img_mosaic[:, :, i] = (img[:, :, i] * (1 - blurred_mask) + img_mosaic[:, :, i] * blurred_mask)
+    return img_mosaic, mask_mosaic
+
+def _create_frame(rng, h=96, w=128):
+    img = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+    mask = np.zeros((h, w, 1), dtype=np.uint8)
+    y, x = rng.integers(0, h // 3), rng.integers(0, w // 3)
+    mask[y:y + h // 2, x:x + w // 2] = rng.integers(1, 256)
+    return img, mask
+
+@pytest.mark.parametrize("model", ['squa_avg', 'squa_mid', 'rect_avg'])
+@pytest.mark.parametrize("feather", [-1, 0, 3])
+@pytest.mark.parametrize("reuse_input_mask_value", [False, True])
+@pytest.mark.parametrize("incomplete_blocks", [False, True])
+def test_addmosaic_base_matches_reference(model, feather, reuse_input_mask_value, incomplete_blocks):
+    rng = np.random.default_rng(0)
+    for _ in range(3):
+        img, mask = _create_frame(rng)
+        img_mosaic, mask_mosaic = mosaic_utils.addmosaic_base(img, mask, 7, model, feather=feather, reuse_input_mask_value=reuse_input_mask_value, incomplete_blocks=incomplete_blocks)
+        expected_img_mosaic, expected_mask_mosaic = _addmosaic_base_reference(img, mask, 7, model, feather=feather, reuse_input_mask_value=reuse_input_mask_value, incomplete_blocks=incomplete_blocks)
+        np.testing.assert_array_equal(mask_mosaic, expected_mask_mosaic)
+        np.testing.assert_array_equal(img_mosaic, expected_img_mosaic)
+
+def test_addmosaic_clip_longer_than_filter_channel_limit_matches_single_frames():
+    rng = np.random.default_rng(0)
+    frames = [_create_frame(rng) for _ in range(200)]
+    imgs, masks = [img for img, _ in frames], [mask for _, mask in frames]
+    img_mosaics, mask_mosaics = mosaic_utils.addmosaic_clip(imgs, masks, 7, 'squa_avg', feather=0)
+    assert len(img_mosaics) == len(imgs)
+    for img, mask, img_mosaic, mask_mosaic in zip(imgs, masks, img_mosaics, mask_mosaics):
+        expected_img_mosaic, expected_mask_mosaic = mosaic_utils.addmosaic_base(img, mask, 7, 'squa_avg', feather=0)
+        np.testing.assert_array_equal(img_mosaic, expected_img_mosaic)
+        np.testing.assert_array_equal(mask_mosaic, expected_mask_mosaic)
@@ -0,0 +1,66 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import pickle
+
+import numpy as np
+import pytest
+
+from lada.datasetcreation.packed_dataset import PackedDataset, PackedDatasetWriter
+
+def _create_frames(seed: int, frames_count: int, h=24, w=32, c=3) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, (frames_count, h, w, c), dtype=np.uint8)
+
+def test_clips_round_trip(tmp_path):
+    clips = {f"clip_{i}": {'nsfw_video': _create_frames(i, 5 + i), 'mask_video': _create_frames(100 + i, 5 + i, c=1)} for i in range(3)}
+    with PackedDatasetWriter(tmp_path) as writer:
+        for name, streams in clips.items():
+            writer.add_clip(name, {'nsfw_video': list(streams['nsfw_video']), 'mask_video': streams['mask_video']}, {'name': name})
+
+    packed_dataset = PackedDataset(tmp_path)
+    assert len(packed_dataset) == len(clips)
+    for clip_idx, (name, streams) in enumerate(clips.items()):
+        clip = packed_dataset.clips[clip_idx]
+        assert clip.name == name and clip.metadata == {'name': name} and clip.frames_count == len(streams['nsfw_video'])
+        for stream_name, frames in streams.items():
+            np.testing.assert_array_equal(packed_dataset.get_frames(clip_idx, stream_name), frames)
+        assert not packed_dataset.has_stream(clip_idx, 'mosaic_nsfw_video')
+
+def test_frame_windows(tmp_path):
+    frames = _create_frames(0, 10)
+    with PackedDatasetWriter(tmp_path) as writer:
+        writer.add_clip("clip", {'nsfw_video': frames}, {})
+    packed_dataset = PackedDataset(tmp_path)
+
+    np.testing.assert_array_equal(packed_dataset.get_frames(0, 'nsfw_video', 3, 7), frames[3:7])
+    np.testing.assert_array_equal(packed_dataset.get_frames(0, 'nsfw_video', 8, 20), frames[8:])
+    assert len(packed_dataset.get_frames(0, 'nsfw_video', 7, 3)) == 0
+    assert not packed_dataset.get_frames(0, 'nsfw_video').flags.writeable
+    read_frames = packed_dataset.read_frames(0, 'nsfw_video', 2, 4)
+    assert len(read_frames) == 2 and read_frames[0].flags.writeable
+    np.testing.assert_array_equal(read_frames[1], frames[3])
+
+def test_clips_are_split_into_shards(tmp_path):
+    clip_size = _create_frames(0, 100).nbytes
+    with PackedDatasetWriter(tmp_path, shard_size_mb=1) as writer:
+        for i in range(1024 * 1024 // clip_size + 2):
+            writer.add_clip(f"clip_{i}", {'nsfw_video': _create_frames(i, 100)}, {})
+    packed_dataset = PackedDataset(tmp_path)
+    shards = [clip.streams['nsfw_video'].shard for clip in packed_dataset.clips]
+    assert shards == sorted(shards) and shards[-1] == 1
+    assert all((tmp_path / shard_filename).stat().st_size <= 1024 * 1024 for shard_filename in packed_dataset.shard_filenames)
+    np.testing.assert_array_equal(packed_dataset.get_frames(len(shards) - 1, 'nsfw_video'), _create_frames(len(shards) - 1, 100))
+
+def test_streams_of_a_clip_must_have_the_same_length(tmp_path):
+    with PackedDatasetWriter(tmp_path) as writer:
+        with pytest.raises(AssertionError):
+            writer.add_clip("clip", {'nsfw_video': _create_frames(0, 5), 'mask_video': _create_frames(1, 4, c=1)}, {})
+
+def test_memory_maps_are_not_pickled(tmp_path):
+    with PackedDatasetWriter(tmp_path) as writer:
+        writer.add_clip("clip", {'nsfw_video': _create_frames(0, 5)}, {})
+    packed_dataset = PackedDataset(tmp_path)
+    packed_dataset.get_frames(0, 'nsfw_video')
+    unpickled = pickle.loads(pickle.dumps(packed_dataset))
+    assert unpickled._shards == {}
+    np.testing.assert_array_equal(unpickled.get_frames(0, 'nsfw_video'), _create_frames(0, 5))
@@ -0,0 +1,112 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import concurrent.futures as concurrent_futures
+import queue
+from fractions import Fraction
+
+import cv2
+import numpy as np
+
+from lada.datasetcreation.nsfw_scene_detector import NsfwDetector, FileProcessingOptions, Scene
+from lada.datasetcreation.nsfw_scene_processor import SceneProcessor
+from lada.datasetcreation.perceptual_hash_index import PerceptualHashIndex, dhash, hash_frames, _hamming_distances
+from lada.utils import VideoMetadata
+
+def _create_image(seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return cv2.resize(rng.integers(0, 256, (8, 8, 3), dtype=np.uint8), (160, 120), interpolation=cv2.INTER_LINEAR)
+
+def _hamming_distances_reference(hashes, other_hashes):
+    return np.array([[bin(int(h) ^ int(other_h)).count('1') for other_h in other_hashes] for h in hashes])
+
+def test_dhash_is_robust_against_rescaling_and_ignores_flat_images():
+    image = _create_image(0)
+    distance = bin(dhash(image) ^ dhash(cv2.resize(image, (320, 240)))).count('1')
+    assert distance <= 2
+    assert dhash(np.full((120, 160, 3), 17, dtype=np.uint8)) is None
+
+def test_hamming_distances_match_reference():
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, np.iinfo(np.uint64).max, 16, dtype=np.uint64, endpoint=True)
+    other_hashes = rng.integers(0, np.iinfo(np.uint64).max, 100, dtype=np.uint64, endpoint=True)
+    np.testing.assert_array_equal(_hamming_distances(hashes, other_hashes), _hamming_distances_reference(hashes, other_hashes))
+
+def test_find_duplicate(tmp_path):
+    index = PerceptualHashIndex(tmp_path / "hashes.txt", max_distance=2)
+    rng = np.random.default_rng(0)
+    hashes = [int(h) for h in rng.integers(0, np.iinfo(np.uint64).max, 10, dtype=np.uint64, endpoint=True)]
+    # many unrelated entries to make sure matches are found across compare chunks
+    for i in range(10_000):
+        index.add('scene', f"other:{i}", [int(h) for h in rng.integers(0, np.iinfo(np.uint64).max, 8, dtype=np.uint64, endpoint=True)], group="other")
+    index.add('scene', "a.mp4:0", hashes, group="a.mp4")
+
+    near_duplicate_hashes = [h ^ 0b11 for h in hashes[:8]] + [0, 1]
+    assert index.find_duplicate('scene', "b.mp4:0", near_duplicate_hashes, group="b.mp4") == "a.mp4:0"
+    # less than min_match_ratio of the hashes have a counterpart
+    assert index.find_duplicate('scene', "b.mp4:0", hashes[:7] + [0, 1, 2], group="b.mp4") is None
+    assert index.find_duplicate('scene', "b.mp4:0", [h ^ 0b111 for h in hashes], group="b.mp4") is None
+    # same entry or same group
+    assert index.find_duplicate('scene', "a.mp4:0", hashes) is None
+    assert index.find_duplicate('scene', "a.mp4:100", hashes, group="a.mp4") is None
+    # kinds are separate
+    assert index.find_duplicate('file', "b.mp4", hashes) is None
+
+def test_index_is_persisted(tmp_path):
+    index = PerceptualHashIndex(tmp_path / "hashes.txt")
+    hashes = hash_frames([_create_image(i) for i in range(8)])
+    assert index.check_and_add('file', "a.mp4", hashes) is None
+    index.add('scene', "a.mp4:0", hashes, group="a.mp4")
+
+    index = PerceptualHashIndex(tmp_path / "hashes.txt")
+    assert index.check_and_add('file', "b.mp4", hashes) == "a.mp4"
+    assert index.find_duplicate('scene', "a.mp4:100", hashes, group="a.mp4") is None
+    assert index.find_duplicate('scene', "b.mp4:0", hashes, group="b.mp4") == "a.mp4:0"
+
+def _create_scene(video_file: str, frame_start: int, images: list[np.ndarray]) -> Scene:
+    video_metadata = VideoMetadata(video_file=video_file, video_height=120, video_width=160, video_fps=30., average_fps=30., video_fps_exact=Fraction(30),
+                                   codec_name='h264', frames_count=1000, duration=1000/30, time_base=Fraction(1, 30), start_pts=0)
+    scene = Scene(video_metadata, 0, scene_min_length=1, scene_max_length=len(images))
+    for i, image in enumerate(images):
+        scene._tmp_data.append((image, np.zeros(image.shape[:2] + (1,), dtype=np.uint8), (0, 0, 10, 10)))
+    scene.frame_start, scene.frame_end = frame_start, frame_start + len(images) - 1
+    return scene
+
+def test_scenes_are_only_deduplicated_against_saved_scenes_of_other_files(tmp_path):
+    file_processing_options = FileProcessingOptions(input_dir=str(tmp_path), output_dir=tmp_path, start_index=0, stride_length=0, scene_min_length=0, scene_max_length=10,
+                                                    scene_max_memory=None, random_extend_masks=False, skip4k=False, deduplicate=True)
+    nsfw_detector = NsfwDetector(lambda: None, queue.Queue(), queue.Queue(), queue.Queue(), file_processing_options, random_extend_masks=False)
+    images = [_create_image(i) for i in range(8)]
+    for video_file in ("a.mp4", "b.mp4"):
+        nsfw_detector._init_new_file(_create_scene(video_file, 0, images).video_meta_data)
+
+    # consecutive chunks of the same shot look alike but are different parts of the file
+    scene = nsfw_detector._process_completed_scene(_create_scene("a.mp4", 0, images))
+    assert scene is not None
+    assert nsfw_detector._process_completed_scene(_create_scene("a.mp4", 100, images)) is not None
+    # scene of a.mp4 has not been saved yet (e.g. it could still be filtered by quality), so nothing to deduplicate against
+    assert nsfw_detector._process_completed_scene(_create_scene("b.mp4", 0, images)) is not None
+
+    nsfw_detector.perceptual_hash_index.add('scene', scene.key, scene.perceptual_hashes, group="a.mp4")
+    assert nsfw_detector._process_completed_scene(_create_scene("b.mp4", 100, images)) is None
+    assert nsfw_detector._process_completed_scene(_create_scene("a.mp4", 200, images)) is not None
+
+def test_scene_processor_adds_hashes_once_scene_is_written(tmp_path):
+    index = PerceptualHashIndex(tmp_path / "hashes.txt")
+    scene_processor = SceneProcessor(None, None, None, perceptual_hash_index=index)
+    images = [_create_image(i) for i in range(8)]
+
+    failed_scene = _create_scene("a.mp4", 0, images)
+    failed_scene.perceptual_hashes = hash_frames(images)
+    failed_write = concurrent_futures.Future()
+    scene_processor._record_scene_once_written(failed_scene, tmp_path, [(tmp_path / "a.mp4", failed_write)])
+    failed_write.set_exception(OSError())
+    assert "a.mp4:0" not in index.entries['scene']
+
+    scene = _create_scene("a.mp4", 100, images)
+    scene.perceptual_hashes = hash_frames(images)
+    write = concurrent_futures.Future()
+    scene_processor._record_scene_once_written(scene, tmp_path, [(tmp_path / "a.mp4", write)])
+    assert "a.mp4:100" not in index.entries['scene']
+    write.set_result(None)
+    assert "a.mp4:100" in index.entries['scene']
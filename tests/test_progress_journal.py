@@ -0,0 +1,88 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import concurrent.futures as concurrent_futures
+import queue
+from fractions import Fraction
+
+import numpy as np
+
+from lada.datasetcreation.nsfw_scene_detector import NsfwDetector, FileProcessingOptions, Scene
+from lada.datasetcreation.nsfw_scene_processor import SceneProcessor
+from lada.datasetcreation.progress_journal import ProgressJournal, CompletedScene
+from lada.utils import VideoMetadata
+
+def _create_video_metadata(video_file: str) -> VideoMetadata:
+    return VideoMetadata(video_file=video_file, video_height=120, video_width=160, video_fps=30., average_fps=30., video_fps_exact=Fraction(30),
+                         codec_name='h264', frames_count=1000, duration=1000/30, time_base=Fraction(1, 30), start_pts=0)
+
+def test_journal_is_persisted(tmp_path):
+    journal_file = tmp_path / "output" / "progress_journal.jsonl"
+    journal = ProgressJournal(journal_file)
+    journal.record_scene(CompletedScene("a.mp4", 1, 0, 99, ["img/a-000001.mp4"]))
+    journal.record_scene(CompletedScene("a.mp4", 2, 100, 199, []))
+    journal.record_scene(CompletedScene("b.mp4", 1, 0, 49, []))
+
+    journal = ProgressJournal(journal_file)
+    assert journal.get_resume_point("a.mp4") == CompletedScene("a.mp4", 2, 100, 199, [])
+    assert journal.get_resume_point("b.mp4").frame_end == 49
+    assert journal.get_resume_point("c.mp4") is None
+
+def test_resume_point_stops_at_first_missing_scene(tmp_path):
+    journal = ProgressJournal(tmp_path / "progress_journal.jsonl")
+    journal.record_scene(CompletedScene("a.mp4", 2, 100, 199, []))
+    assert journal.get_resume_point("a.mp4") is None
+    journal.record_scene(CompletedScene("a.mp4", 1, 0, 99, []))
+    journal.record_scene(CompletedScene("a.mp4", 4, 300, 399, []))
+    assert journal.get_resume_point("a.mp4").scene_id == 2
+
+def test_incomplete_last_line_is_ignored(tmp_path):
+    journal_file = tmp_path / "progress_journal.jsonl"
+    ProgressJournal(journal_file).record_scene(CompletedScene("a.mp4", 1, 0, 99, []))
+    with open(journal_file, 'a', encoding='utf-8') as f:
+        f.write('{"video_file": "a.mp4", "scene_id": 2, "fra')
+    assert ProgressJournal(journal_file).get_resume_point("a.mp4").scene_id == 1
+
+def test_scene_processor_records_scenes_once_written(tmp_path):
+    journal = ProgressJournal(tmp_path / "progress_journal.jsonl")
+    scene_processor = SceneProcessor(None, None, None, progress_journal=journal)
+    video_metadata = _create_video_metadata("a.mp4")
+
+    # filtered out scenes have nothing to write
+    filtered_scene = Scene(video_metadata, 1, scene_min_length=1, scene_max_length=10)
+    filtered_scene.frame_start, filtered_scene.frame_end = 0, 99
+    scene_processor._record_scene_once_written(filtered_scene, tmp_path, [])
+    assert journal.get_resume_point("a.mp4") == CompletedScene("a.mp4", 1, 0, 99, [])
+
+    scene = Scene(video_metadata, 2, scene_min_length=1, scene_max_length=10)
+    scene.frame_start, scene.frame_end = 100, 199
+    writes = [concurrent_futures.Future(), concurrent_futures.Future()]
+    scene_processor._record_scene_once_written(scene, tmp_path, [(tmp_path / "img" / "a.mp4", writes[0]), (tmp_path / "mask" / "a.mkv", writes[1])])
+    writes[0].set_result(None)
+    assert journal.get_resume_point("a.mp4").scene_id == 1
+    writes[1].set_result(None)
+    assert journal.get_resume_point("a.mp4") == CompletedScene("a.mp4", 2, 100, 199, ["img/a.mp4", "mask/a.mkv"])
+
+    failed_scene = Scene(video_metadata, 3, scene_min_length=1, scene_max_length=10)
+    failed_scene.frame_start, failed_scene.frame_end = 200, 299
+    failed_write = concurrent_futures.Future()
+    scene_processor._record_scene_once_written(failed_scene, tmp_path, [(tmp_path / "img" / "b.mp4", failed_write)])
+    failed_write.set_exception(OSError())
+    assert journal.get_resume_point("a.mp4").scene_id == 2
+
+def test_detector_continues_after_resume_point(tmp_path):
+    journal = ProgressJournal(tmp_path / "progress_journal.jsonl")
+    for scene_id, frame_start in ((1, 0), (2, 100)):
+        journal.record_scene(CompletedScene("a.mp4", scene_id, frame_start, frame_start + 99, []))
+    file_processing_options = FileProcessingOptions(input_dir=str(tmp_path), output_dir=tmp_path, start_index=0, stride_length=0, scene_min_length=0, scene_max_length=10,
+                                                    scene_max_memory=None, random_extend_masks=False, skip4k=False, deduplicate=False, frame_stride=2)
+    nsfw_detector = NsfwDetector(lambda: None, queue.Queue(), queue.Queue(), queue.Queue(), file_processing_options, random_extend_masks=False,
+                                 progress_journal=journal)
+
+    nsfw_detector._init_new_file(_create_video_metadata("a.mp4"))
+    assert nsfw_detector.start_frame["a.mp4"] == 201
+    assert nsfw_detector.scenes_counter["a.mp4"] == 2
+    assert nsfw_detector.previous_completed_scene_frame_end["a.mp4"] == 199
+
+    nsfw_detector._init_new_file(_create_video_metadata("b.mp4"))
+    assert nsfw_detector.start_frame["b.mp4"] == 0 and nsfw_detector.scenes_counter["b.mp4"] == 0
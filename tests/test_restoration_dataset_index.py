@@ -0,0 +1,72 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import os
+
+from lada.datasetcreation.dataset_writer import DatasetWriter
+from lada.datasetcreation.restoration_dataset_index import RestorationDatasetIndex, has_index
+from lada.datasetcreation.restoration_dataset_metadata import RestorationDatasetMetadataV2, MosaicBlockSizeV2, VisualQualityScoreV1
+from lada.models.basicvsrpp.mosaic_video_dataset import MosaicVideoDataset
+
+def _create_meta(name: str, frames_count: int = 30, orig_shape=(720, 1280), quality: float | None = None, watermark_detected: bool = False) -> RestorationDatasetMetadataV2:
+    return RestorationDatasetMetadataV2(
+        name=name, fps=30, frames_count=frames_count, orig_shape=orig_shape, scene_shape=(256, 256),
+        base_mosaic_block_size=MosaicBlockSizeV2(10., 10., 10., 10.), pad=[(0, 0, 0, 0)] * frames_count,
+        relative_nsfw_video_path=f"../img/{name}.mp4", relative_mask_video_path=f"../mask/{name}.mkv",
+        relative_mosaic_nsfw_video_path=None, relative_mosaic_mask_video_path=None, mosaic=None,
+        video_quality=VisualQualityScoreV1(quality, quality, quality) if quality is not None else None,
+        watermark_detected=watermark_detected, nudenet_nsfw_detected=True, nudenet_nsfw_detected_classes=None, censoring_detected=False)
+
+def _write_meta(metadata_root_dir, meta: RestorationDatasetMetadataV2):
+    path = metadata_root_dir / f"{meta.name}.json"
+    meta.to_json_file(path)
+    return path
+
+def test_query_filters(tmp_path):
+    metas = [_create_meta("short", frames_count=10), _create_meta("low_res", orig_shape=(240, 320)), _create_meta("low_quality", quality=0.1),
+             _create_meta("watermark", watermark_detected=True), _create_meta("unscored"), _create_meta("good", quality=0.9)]
+    with RestorationDatasetIndex(tmp_path) as index:
+        index.add_all([(_write_meta(tmp_path, meta), meta) for meta in metas])
+        assert len(index) == len(metas)
+        selected = index.query(min_frames_count=20, min_resolution=480, min_quality=0.5, filter_watermark=True)
+    assert [meta.name for meta in selected] == ["good", "unscored"]
+    assert selected[0].to_dict() == RestorationDatasetMetadataV2.from_json_file(str(tmp_path / "good.json")).to_dict()
+
+def test_update_syncs_with_files_on_disk(tmp_path):
+    paths = {name: _write_meta(tmp_path, _create_meta(name)) for name in ("a", "b", "c")}
+    with RestorationDatasetIndex(tmp_path) as index:
+        assert index.update() == (3, 0)
+        assert index.update() == (0, 0)
+
+        os.remove(paths["a"])
+        _write_meta(tmp_path, _create_meta("d"))
+        modified_meta = _create_meta("b", frames_count=50)
+        _write_meta(tmp_path, modified_meta)
+        os.utime(paths["b"], ns=(0, 0))
+        assert index.update() == (2, 1)
+        assert {meta.name: meta.frames_count for meta in index.query()} == {"b": 50, "c": 30, "d": 30}
+
+def test_dataset_resyncs_stale_index(tmp_path):
+    for name in ("a", "b"):
+        _write_meta(tmp_path, _create_meta(name))
+    with RestorationDatasetIndex(tmp_path) as index:
+        index.update()
+    os.remove(tmp_path / "a.json")
+    _write_meta(tmp_path, _create_meta("c"))
+
+    dataset = MosaicVideoDataset(metadata_root_dir=str(tmp_path), num_frame=30)
+    assert sorted(meta.name for meta in dataset.metadata) == ["b", "c"]
+
+def test_dataset_writer_adds_metadata_to_index_in_batches(tmp_path):
+    dataset_writer = DatasetWriter(workers=2, index_batch_size=4)
+    dataset_writer.start()
+    futures = [dataset_writer.write_metadata(tmp_path / f"{i}.json", _create_meta(str(i))) for i in range(10)]
+    for future in futures:
+        future.result()
+    # one connection for all writes into the same metadata directory
+    assert list(dataset_writer.indexes) == [tmp_path.absolute()]
+    dataset_writer.stop()
+
+    assert has_index(tmp_path)
+    with RestorationDatasetIndex(tmp_path, read_only=True) as index:
+        assert len(index) == 10
@@ -0,0 +1,113 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import torch
+
+from lada.gui.preview.restored_frame_cache import RestoredFrameCache
+
+FRAME_SHAPE = (4, 8, 3)
+FRAME_BYTES = 4 * 8 * 3
+PTS_STEP = 40
+
+def _create_frame(value: int) -> torch.Tensor:
+    return torch.full(FRAME_SHAPE, value, dtype=torch.uint8)
+
+def _play(cache: RestoredFrameCache, namespace, frame_nums, move_playhead=True):
+    previous_pts = None
+    for frame_num in frame_nums:
+        pts = frame_num * PTS_STEP
+        cache.put(namespace, pts, _create_frame(frame_num), previous_pts, move_playhead=move_playhead)
+        previous_pts = pts
+
+def test_contiguous_runs_can_be_replayed():
+    cache = RestoredFrameCache(max_memory_bytes=100 * FRAME_BYTES)
+    _play(cache, "a", range(0, 5))
+    # seek
+    _play(cache, "a", range(10, 12))
+
+    assert torch.equal(cache.get("a", 2 * PTS_STEP), _create_frame(2))
+    assert cache.get_next_pts("a", 2 * PTS_STEP) == 3 * PTS_STEP
+    assert cache.get_run_end("a", 0) == 4 * PTS_STEP
+    assert cache.get_next_pts("a", 4 * PTS_STEP) is None
+    # pts in between two frames of a run is shown by the preceding frame
+    assert cache.find("a", 2 * PTS_STEP + 10) == 2 * PTS_STEP
+    # but not after the last frame of a run or in another namespace
+    assert cache.find("a", 4 * PTS_STEP + 10) is None
+    assert cache.find("a", 7 * PTS_STEP) is None
+    assert cache.find("b", 2 * PTS_STEP) is None
+
+def test_frames_farthest_from_playhead_are_evicted_first():
+    cache = RestoredFrameCache(max_memory_bytes=5 * FRAME_BYTES)
+    _play(cache, "a", range(0, 5))
+    _play(cache, "b", range(0, 3), move_playhead=False)
+    # frames of namespaces other than the one of the playhead are evicted first
+    assert cache.memory_bytes <= 5 * FRAME_BYTES
+    assert "b" not in cache.frames and len(cache.frames["a"]) == 5
+
+    assert cache.get("a", 4 * PTS_STEP) is not None
+    _play(cache, "a", [5])
+    assert sorted(cache.frames["a"]) == [pts * PTS_STEP for pts in range(1, 6)]
+    cache.get("a", 1 * PTS_STEP)
+    _play(cache, "a", [6], move_playhead=False)
+    assert 6 * PTS_STEP not in cache.frames["a"]
+
+def test_evicted_frames_are_spilled_to_disk(tmp_path):
+    cache = RestoredFrameCache(max_memory_bytes=2 * FRAME_BYTES, spill_directory=tmp_path, max_spill_bytes=3 * FRAME_BYTES)
+    assert cache.has_capacity_for(FRAME_BYTES)
+    _play(cache, "a", range(0, 8))
+    assert cache.memory_bytes == 2 * FRAME_BYTES and cache.spill_bytes == 3 * FRAME_BYTES
+    assert not cache.has_capacity_for(FRAME_BYTES)
+    assert sorted(cache.frames["a"]) == [pts * PTS_STEP for pts in range(3, 8)]
+    spilled_frame_files = list(tmp_path.glob("lada_preview_cache_*/*.raw"))
+    assert len(spilled_frame_files) == 3
+
+    assert torch.equal(cache.get("a", 3 * PTS_STEP), _create_frame(3))
+    assert cache.get_run_end("a", 3 * PTS_STEP) == 7 * PTS_STEP
+
+    # spilled frames can't be read anymore, they're dropped
+    spilled_frame_files[0].unlink()
+    assert sum(cache.get("a", pts * PTS_STEP) is None for pts in range(3, 6)) == 1
+
+    cache.close()
+    assert cache.frames == {} and cache.spill_bytes == 0
+    assert list(tmp_path.iterdir()) == []
+
+def test_pre_restored_frames_are_served_from_cache(tmp_path):
+    cache = RestoredFrameCache(max_memory_bytes=4 * FRAME_BYTES, spill_directory=tmp_path, max_spill_bytes=6 * FRAME_BYTES)
+    _play(cache, "a", range(0, 3))
+
+    # restoring ahead while paused doesn't move the playhead and stops once frames would have to be evicted
+    frame_num, previous_pts = 3, 2 * PTS_STEP
+    while cache.has_capacity_for(FRAME_BYTES):
+        cache.put("a", frame_num * PTS_STEP, _create_frame(frame_num), previous_pts, move_playhead=False)
+        frame_num, previous_pts = frame_num + 1, frame_num * PTS_STEP
+    assert frame_num == 10
+    assert cache.memory_bytes == 4 * FRAME_BYTES and cache.spill_bytes == 6 * FRAME_BYTES
+    assert cache.playhead == ("a", 2 * PTS_STEP)
+
+    # playback continues with the frames following the last played one
+    served_frame_nums = []
+    pts = cache.get_next_pts("a", 2 * PTS_STEP)
+    while pts is not None:
+        served_frame_nums.append(cache.get("a", pts)[0, 0, 0].item())
+        pts = cache.get_next_pts("a", pts)
+    assert served_frame_nums == list(range(3, 10))
+    assert cache.find("a", 0) == 0 and cache.get_run_end("a", 0) == 9 * PTS_STEP
+    cache.close()
+
+def test_set_limits_evicts_and_changing_spill_directory_drops_spilled_frames(tmp_path):
+    cache = RestoredFrameCache(max_memory_bytes=2 * FRAME_BYTES, spill_directory=tmp_path / "a", max_spill_bytes=10 * FRAME_BYTES)
+    _play(cache, "a", range(0, 6))
+    assert cache.spill_bytes == 4 * FRAME_BYTES
+
+    cache.set_limits(2 * FRAME_BYTES, tmp_path / "b", 10 * FRAME_BYTES)
+    assert cache.spill_bytes == 0 and sorted(cache.frames["a"]) == [4 * PTS_STEP, 5 * PTS_STEP]
+    assert list((tmp_path / "a").iterdir()) == []
+
+    cache.set_limits(FRAME_BYTES, None, 0)
+    assert list(cache.frames["a"]) == [5 * PTS_STEP]
+
+    cache.set_limits(0)
+    assert cache.frames == {}
+    _play(cache, "a", [0])
+    assert cache.frames == {} and not cache.has_capacity_for(FRAME_BYTES)
@@ -0,0 +1,19 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import concurrent.futures as concurrent_futures
+
+import numpy as np
+import torch
+
+from lada.datasetcreation.scene_analyzer_scheduler import SceneAnalyzerScheduler, _SceneAnalysisRequest
+
+def test_letterbox_pads_with_ultralytics_pad_value():
+    scheduler = SceneAnalyzerScheduler(None, None, None, device='cpu')
+    image = np.full((120, 320, 3), 255, dtype=np.uint8)
+    request = _SceneAnalysisRequest(images=[image], boxes=[None], future=concurrent_futures.Future())
+    letterboxed_image = scheduler._letterbox(request, 0)
+    assert letterboxed_image.shape == (3, scheduler.imgsz, scheduler.imgsz)
+    assert letterboxed_image.dtype == torch.float32
+    torch.testing.assert_close(letterboxed_image[:, 0, 0], torch.full((3,), 114 / 255))
+    torch.testing.assert_close(letterboxed_image[:, scheduler.imgsz // 2, scheduler.imgsz // 2], torch.ones(3))
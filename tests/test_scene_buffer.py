@@ -0,0 +1,54 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import os
+import queue
+
+import numpy as np
+
+from lada.datasetcreation.nsfw_scene_detector import NsfwDetector, FileProcessingOptions
+from lada.datasetcreation.scene_buffer import SceneBuffer
+
+def _create_frame(value: int) -> tuple[np.ndarray, np.ndarray]:
+    return np.full((16, 24, 3), value, dtype=np.uint8), np.full((16, 24, 1), value, dtype=np.uint8)
+
+def test_frames_are_kept_in_ram_without_budget():
+    scene_buffer = SceneBuffer(max_length=10, ram_budget=None)
+    for i in range(10):
+        frame, mask = _create_frame(i)
+        stored_frame, stored_mask = scene_buffer.append(frame, mask)
+        assert stored_frame is frame and stored_mask is mask
+    assert scene_buffer.spilled_frames_count == 0
+
+def test_frames_exceeding_budget_are_spilled(tmp_path):
+    frame_size = sum(array.nbytes for array in _create_frame(0))
+    scene_buffer = SceneBuffer(max_length=10, ram_budget=3 * frame_size + 1, spill_dir=str(tmp_path))
+    stored = [scene_buffer.append(*_create_frame(i)) for i in range(10)]
+    assert len(scene_buffer) == 10
+    assert scene_buffer.ram_frames_count == 3 and scene_buffer.spilled_frames_count == 7
+    assert not isinstance(stored[2][0], np.memmap) and isinstance(stored[3][0], np.memmap)
+    for i, (frame, mask) in enumerate(stored):
+        np.testing.assert_array_equal(frame, _create_frame(i)[0])
+        np.testing.assert_array_equal(mask, _create_frame(i)[1])
+    if os.name == 'posix':
+        # spill files are unlinked right away
+        assert list(tmp_path.iterdir()) == []
+
+def test_detector_spills_into_output_dir_by_default_and_cleans_up(tmp_path):
+    output_dir = tmp_path / "output"
+    file_processing_options = FileProcessingOptions(input_dir=str(tmp_path), output_dir=output_dir, start_index=0, stride_length=0, scene_min_length=0, scene_max_length=10,
+                                                    scene_max_memory=1, random_extend_masks=False, skip4k=False)
+    nsfw_detector = NsfwDetector(lambda: None, queue.Queue(), queue.Queue(), queue.Queue(), file_processing_options, random_extend_masks=False)
+    nsfw_detector.start()
+    try:
+        spill_dir = nsfw_detector.spill_dir
+        assert spill_dir.parent == output_dir / ".scene_spill"
+        scene_buffer = SceneBuffer(max_length=2, ram_budget=0, spill_dir=str(spill_dir))
+        frame, _ = scene_buffer.append(*_create_frame(1))
+        assert isinstance(frame, np.memmap)
+    finally:
+        nsfw_detector.stop()
+    assert not spill_dir.exists()
+    assert not (output_dir / ".scene_spill").exists()
+    # memory-mapping stays usable
+    assert frame[0, 0, 0] == 1
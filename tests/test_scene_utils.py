@@ -0,0 +1,146 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import math
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+
+from lada.datasetcreation.nsfw_scene_detector import SmoothSceneBoxes
+from lada.utils import box_utils, mask_utils
+from lada.utils.scene_utils import crop_to_box_v3, get_crop_boxes_v3
+
+# Reference implementations: per-element loops as they were before vectorizing
+
+def _filter_reference(data, window, func):
+    pad_size = (window - 1) // 2
+    padded_data = np.pad(data, pad_size, 'edge')
+    filtered_data = np.zeros_like(data)
+    for i in range(len(data)):
+        filtered_data[i] = func(padded_data[i:i + window])
+    return filtered_data
+
+def _smooth_boxes_reference(boxes: np.ndarray, window: int, smooth_function: str) -> np.ndarray:
+    boxes = boxes.copy()
+    for i, position in enumerate(('t', 'l', 'b', 'r')):
+        if smooth_function == 'median':
+            func = np.median
+        elif smooth_function == 'mean':
+            func = np.mean
+        else:
+            func = np.max if position in ('b', 'r') else np.min
+        boxes[:, i] = _filter_reference(boxes[:, i], window, func)
+    return boxes
+
+def _crop_box_reference(box, img_shape, target_size, max_box_expansion_factor=1.0, border_size=0):
+    target_width, target_height = target_size
+    t, l, b, r = box
+    width, height = r - l + 1,  b - t + 1
+    border_size = max(20, int(max(width, height) * border_size)) if border_size > 0. else 0
+    t, l, b, r = max(0, t-border_size), max(0, l-border_size), min(img_shape[0]-1, b+border_size), min(img_shape[1]-1, r+border_size)
+    width, height = r - l + 1,  b - t + 1
+    down_scale_factor = min(target_width / width, target_height / height, 1.0)
+    missing_width, missing_height = int((target_width - (width * down_scale_factor)) / down_scale_factor), int((target_height - (height * down_scale_factor)) / down_scale_factor)
+
+    available_width_l = l
+    available_width_r = (img_shape[1]-1) - r
+    available_height_t = t
+    available_height_b = (img_shape[0]-1) - b
+
+    budget_width = int(max_box_expansion_factor * width)
+    budget_height = int(max_box_expansion_factor * height)
+
+    expand_width_lr = min(available_width_l, available_width_r, missing_width//2, budget_width)
+    expand_width_l = min(available_width_l - expand_width_lr, missing_width - expand_width_lr * 2, budget_width - expand_width_lr)
+    expand_width_r = min(available_width_r - expand_width_lr, missing_width - expand_width_lr * 2 - expand_width_l, budget_width - expand_width_lr - expand_width_l)
+
+    expand_height_tb = min(available_height_t, available_height_b, missing_height//2, budget_height)
+    expand_height_t = min(available_height_t - expand_height_tb, missing_height - expand_height_tb * 2, budget_height - expand_height_tb)
+    expand_height_b = min(available_height_b - expand_height_tb, missing_height - expand_height_tb * 2 - expand_height_t, budget_height - expand_height_tb - expand_height_t)
+
+    l, r = (l - math.floor(expand_width_lr/2) - expand_width_l,
+            r + math.ceil(expand_width_lr/2) + expand_width_r)
+    t, b = (t - math.floor(expand_height_tb/2) - expand_height_t,
+            b + math.ceil(expand_height_tb/2) + expand_height_b)
+    return (t, l, b, r), down_scale_factor
+
+def _get_box_reference(mask):
+    return box_utils.convert_from_opencv(cv2.boundingRect(cv2.findNonZero(mask)))
+
+def _create_boxes(rng: np.random.Generator, count: int, img_shape=(720, 1280)) -> np.ndarray:
+    img_height, img_width = img_shape
+    t = rng.integers(0, img_height - 1, count)
+    l = rng.integers(0, img_width - 1, count)
+    b = np.minimum(img_height - 1, t + rng.integers(0, img_height // 2, count))
+    r = np.minimum(img_width - 1, l + rng.integers(0, img_width // 2, count))
+    return np.stack((t, l, b, r), axis=-1)
+
+class _Scene:
+    def __init__(self, boxes, fps):
+        self.boxes = boxes.tolist()
+        self.video_meta_data = SimpleNamespace(video_fps=fps)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def get_boxes(self):
+        return self.boxes
+
+@pytest.mark.parametrize("smooth_function", ['median', 'mean', 'min_max'])
+@pytest.mark.parametrize("frames_count", [1, 2, 7, 60])
+def test_smooth_boxes_matches_reference(smooth_function, frames_count):
+    rng = np.random.default_rng(frames_count)
+    boxes = _create_boxes(rng, frames_count)
+    fps = 30.
+    window_in_seconds = 0.5
+    window = min(math.ceil(window_in_seconds * fps), frames_count)
+    window -= 1 if window % 2 == 0 else 0
+
+    smoothed_boxes = SmoothSceneBoxes.smooth_boxes(_Scene(boxes, fps), window_in_seconds, smooth_function)
+    expected = _smooth_boxes_reference(boxes, window, smooth_function) if window >= 1 else boxes
+    assert smoothed_boxes == expected.tolist()
+
+@pytest.mark.parametrize("filter_name", ['median_filter', 'mean_filter'])
+def test_filters_keep_dtype_of_1d_input(filter_name):
+    data = np.random.default_rng(0).integers(0, 1000, 50)
+    func = np.median if filter_name == 'median_filter' else np.mean
+    filtered_data = getattr(SmoothSceneBoxes, filter_name)(data, 9)
+    assert filtered_data.dtype == data.dtype
+    np.testing.assert_array_equal(filtered_data, _filter_reference(data, 9, func))
+
+@pytest.mark.parametrize("border_size", [0, 0.06, 0.3])
+@pytest.mark.parametrize("max_box_expansion_factor", [1.0, 0.2])
+def test_crop_boxes_match_reference(border_size, max_box_expansion_factor):
+    img_shape = (720, 1280)
+    target_size = (256, 256)
+    boxes = _create_boxes(np.random.default_rng(0), 500, img_shape)
+    boxes[:10, 2:] = boxes[:10, :2] # 1x1 boxes
+
+    cropped_boxes, scale_factors = get_crop_boxes_v3(boxes, img_shape, target_size, max_box_expansion_factor, border_size)
+    for box, cropped_box, scale_factor in zip(boxes.tolist(), cropped_boxes.tolist(), scale_factors.tolist()):
+        expected_box, expected_scale_factor = _crop_box_reference(box, img_shape, target_size, max_box_expansion_factor, border_size)
+        assert tuple(cropped_box) == expected_box
+        assert scale_factor == expected_scale_factor
+
+def test_crop_to_box_v3():
+    img = np.random.default_rng(0).integers(0, 256, (480, 640, 3), dtype=np.uint8)
+    mask = np.zeros((480, 640, 1), dtype=np.uint8)
+    box = (100, 200, 149, 299)
+    cropped_img, cropped_mask, cropped_box, scale_factor = crop_to_box_v3(box, img, mask, (256, 256), border_size=0.06)
+    expected_box, expected_scale_factor = _crop_box_reference(box, img.shape, (256, 256), border_size=0.06)
+    assert cropped_box == expected_box and isinstance(cropped_box[0], int)
+    assert scale_factor == expected_scale_factor and isinstance(scale_factor, float)
+    t, l, b, r = expected_box
+    np.testing.assert_array_equal(cropped_img, img[t:b + 1, l:r + 1])
+    assert cropped_mask.shape[:2] == cropped_img.shape[:2]
+
+def test_get_box_matches_reference():
+    rng = np.random.default_rng(0)
+    for box in _create_boxes(rng, 50, (120, 160)).tolist():
+        t, l, b, r = box
+        mask = np.zeros((120, 160, 1), dtype=np.uint8)
+        mask[t:b + 1, l:r + 1] = rng.integers(0, 2, (b - t + 1, r - l + 1, 1), dtype=np.uint8) * 255
+        mask[t, l] = mask[b, r] = 255
+        assert mask_utils.get_box(mask) == _get_box_reference(mask)
@@ -0,0 +1,148 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import shlex
+import shutil
+import subprocess
+
+import pytest
+
+import lada.cli.main as cli_main
+import lada.utils.segmented_video_writer as segmented_video_writer
+from lada.utils import video_utils
+from lada.utils.segmented_video_writer import SegmentedVideoWriter, get_temp_output_path, get_work_directory
+from tests.utils import create_video, get_frame_num
+
+FRAMES_COUNT = 64
+FPS = 25
+# with keyframes every 16 frames segments will start at frames 0 and 32
+SEGMENT_DURATION_S = 20 / FPS
+
+def _create_writer(video_file, output_path, **kwargs) -> SegmentedVideoWriter:
+    video_metadata = video_utils.get_video_meta_data(video_file)
+    return SegmentedVideoWriter(video_metadata, str(output_path), codec='libx264', crf=10, segment_duration_s=SEGMENT_DURATION_S, **kwargs)
+
+def _write(video_writer: SegmentedVideoWriter, video_file, start_ns=0, stop_frame_num=None):
+    with video_utils.VideoReader(video_file) as video_reader:
+        if start_ns > 0:
+            video_reader.seek(start_ns)
+        for frame, pts in video_reader.frames():
+            if stop_frame_num is not None and get_frame_num(frame) >= stop_frame_num:
+                return
+            video_writer.write(frame, pts)
+
+def _read_segment_frame_nums(video_writer: SegmentedVideoWriter) -> list[int]:
+    frame_nums = []
+    for _, file_name in sorted(video_writer.completed_segment_files.items()):
+        with video_utils.VideoReader(str(video_writer.work_directory / file_name)) as video_reader:
+            frame_nums.extend(get_frame_num(frame) for frame, _ in video_reader.frames())
+    return frame_nums
+
+@pytest.fixture
+def video_file(tmp_path, video_meta_data_reader):
+    return create_video(tmp_path / "input.mp4", frames_count=FRAMES_COUNT, gop_size=16, fps=FPS)
+
+def test_segments_start_at_keyframes(tmp_path, video_file):
+    video_writer = _create_writer(video_file, tmp_path / "output.mp4")
+    assert [segment['start_frame'] for segment in video_writer.segments] == [0, 32]
+    assert video_writer.work_directory.parent == tmp_path
+    assert video_writer.work_directory.name.startswith(".output.mp4.") and video_writer.work_directory.name.endswith(".segments")
+    assert video_writer.get_resume_frame_num() == 0 and video_writer.get_resume_timestamp_ns() == 0
+
+    _write(video_writer, video_file)
+    video_writer.release()
+    assert video_writer.is_complete()
+    assert _read_segment_frame_nums(video_writer) == list(range(FRAMES_COUNT))
+
+def test_outputs_with_the_same_name_get_their_own_work_files(tmp_path):
+    output_paths = [str(tmp_path / "a" / "output.mp4"), str(tmp_path / "b" / "output.mp4")]
+    assert get_work_directory(output_paths[0]).name != get_work_directory(output_paths[1]).name
+    assert get_temp_output_path(output_paths[0], str(tmp_path)) != get_temp_output_path(output_paths[1], str(tmp_path))
+    assert get_temp_output_path(output_paths[0], str(tmp_path)) == get_temp_output_path(output_paths[0], str(tmp_path))
+    assert get_temp_output_path(output_paths[0], str(tmp_path)).endswith(".tmp.mp4")
+
+def test_interrupted_export_is_resumed_at_first_incomplete_segment(tmp_path, video_file):
+    video_writer = _create_writer(video_file, tmp_path / "output.mp4")
+    _write(video_writer, video_file, stop_frame_num=40)
+    video_writer.abort()
+    assert list(video_writer.completed_segment_files) == [0]
+    assert list(video_writer.work_directory.glob("*.part.mp4")) == []
+
+    video_writer = _create_writer(video_file, tmp_path / "output.mp4")
+    assert video_writer.get_resume_frame_num() == 32
+    # restoration may start before the segment, frames before it are ignored
+    _write(video_writer, video_file, start_ns=video_writer.get_resume_timestamp_ns() - 10 * 1_000_000_000 // FPS)
+    video_writer.release()
+    assert _read_segment_frame_nums(video_writer) == list(range(FRAMES_COUNT))
+
+@pytest.mark.parametrize("kwargs", [dict(resume=False), dict(settings={'max_clip_length': 10})])
+def test_journal_is_discarded_if_not_resuming_or_settings_changed(tmp_path, video_file, kwargs):
+    video_writer = _create_writer(video_file, tmp_path / "output.mp4")
+    _write(video_writer, video_file, stop_frame_num=40)
+    video_writer.abort()
+
+    video_writer = _create_writer(video_file, tmp_path / "output.mp4", **kwargs)
+    assert video_writer.get_resume_frame_num() == 0
+    assert video_writer.completed_segment_files == {}
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="ffmpeg is needed to join segments")
+def test_concat(tmp_path, video_file):
+    video_writer = _create_writer(video_file, tmp_path / "output.mp4")
+    _write(video_writer, video_file)
+    video_writer.release()
+    video_writer.concat(str(tmp_path / "output.mp4"))
+    with video_utils.VideoReader(str(tmp_path / "output.mp4")) as video_reader:
+        assert [get_frame_num(frame) for frame, _ in video_reader.frames()] == list(range(FRAMES_COUNT))
+
+def test_concat_list_and_command(tmp_path, video_file, monkeypatch):
+    # quotes in paths have to be escaped in the list read by the ffmpeg concat demuxer
+    output_path = tmp_path / "it's here" / "output.mp4"
+    output_path.parent.mkdir()
+    video_writer = _create_writer(video_file, output_path)
+    _write(video_writer, video_file)
+    video_writer.release()
+
+    cmds = []
+    def _run(cmd, **kwargs):
+        cmds.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, b"", b"")
+    monkeypatch.setattr(segmented_video_writer.subprocess, "run", _run)
+    video_writer.concat(str(output_path), moov_front=True)
+    concat_list_path = video_writer.work_directory / "concat.txt"
+    assert cmds == [["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", str(concat_list_path), "-map", "0:v:0", "-c", "copy",
+                     "-movflags", "+frag_keyframe+empty_moov+faststart", str(output_path)]]
+
+    segment_files = []
+    for line in concat_list_path.read_text(encoding='utf-8').splitlines():
+        directive, segment_file = shlex.split(line)
+        assert directive == "file"
+        segment_files.append(segment_file)
+    assert segment_files == [str(video_writer.work_directory / file_name) for _, file_name in sorted(video_writer.completed_segment_files.items())]
+    frame_nums = []
+    for segment_file in segment_files:
+        with video_utils.VideoReader(segment_file) as video_reader:
+            frame_nums.extend(get_frame_num(frame) for frame, _ in video_reader.frames())
+    assert frame_nums == list(range(FRAMES_COUNT))
+
+    monkeypatch.setattr(segmented_video_writer.subprocess, "run", lambda cmd, **kwargs: subprocess.CompletedProcess(cmd, 1, b"", b"invalid data"))
+    with pytest.raises(Exception, match="invalid data"):
+        video_writer.concat(str(output_path))
+
+def test_cli_does_not_create_frame_restorer_if_export_is_already_complete(tmp_path, video_file, monkeypatch):
+    output_path = tmp_path / "output.mp4"
+    video_writer = _create_writer(video_file, output_path, settings={})
+    _write(video_writer, video_file)
+    video_writer.release()
+
+    class _FailingFrameRestorer:
+        def __init__(self, *args, **kwargs):
+            raise AssertionError("export is complete, there is nothing to restore")
+    concatenated = []
+    monkeypatch.setattr(cli_main, "FrameRestorer", _FailingFrameRestorer)
+    monkeypatch.setattr(cli_main, "get_video_meta_data", video_utils.get_video_meta_data)
+    monkeypatch.setattr(SegmentedVideoWriter, "concat", lambda self, path, moov_front=False: concatenated.append(path))
+    monkeypatch.setattr(cli_main.audio_utils, "combine_audio_video_files", lambda *args: None)
+    cli_main.process_video_file(video_file, str(output_path), None, None, None, None, None, None, 'libx264', 10, False, None, None,
+                                SEGMENT_DURATION_S, True, {})
+    assert len(concatenated) == 1
+    assert not video_writer.work_directory.exists()
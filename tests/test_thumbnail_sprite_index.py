@@ -0,0 +1,83 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import os
+
+from lada.utils.thumbnail_sprite_index import ThumbnailSpriteIndex
+from tests.utils import create_video, get_frame_num
+
+FPS = 25
+FRAMES_COUNT = 64
+DURATION_S = FRAMES_COUNT / FPS
+# keyframes every 16 frames, so every second thumbnail has a keyframe of its own
+INTERVAL_S = 8 / FPS
+EXPECTED_FRAME_NUMS = [0, 16, 16, 32, 32, 48, 48, 48]
+
+def _create_index(video_file, cache_directory, **kwargs) -> ThumbnailSpriteIndex:
+    return ThumbnailSpriteIndex(video_file, DURATION_S, 64, 48, cache_directory, min_interval_s=INTERVAL_S, sheet_columns=3, sheet_rows=2, **kwargs)
+
+def _run(index: ThumbnailSpriteIndex) -> ThumbnailSpriteIndex:
+    index.start()
+    index.thread.join()
+    return index
+
+def _get_frame_nums(index: ThumbnailSpriteIndex) -> list[int]:
+    return [get_frame_num(index.get_thumbnail(round(i * INTERVAL_S * 1_000_000_000))) for i in range(index.count)]
+
+def test_thumbnails_are_generated_from_keyframes(tmp_path):
+    video_file = create_video(tmp_path / "input.mp4", frames_count=FRAMES_COUNT, gop_size=16, fps=FPS)
+    index = _create_index(video_file, None)
+    assert index.count == len(EXPECTED_FRAME_NUMS)
+    assert index.get_thumbnail(0) is None
+
+    _run(index)
+    assert index.done
+    assert _get_frame_nums(index) == EXPECTED_FRAME_NUMS
+    # timestamps are mapped to the closest thumbnail and clamped
+    assert get_frame_num(index.get_thumbnail(round(2.6 * INTERVAL_S * 1_000_000_000))) == 32
+    assert get_frame_num(index.get_thumbnail(10 * 1_000_000_000)) == 48
+
+def test_thumbnails_are_cached_as_sprite_sheets(tmp_path, monkeypatch):
+    video_file = create_video(tmp_path / "input.mp4", frames_count=FRAMES_COUNT, gop_size=16, fps=FPS)
+    cache_directory = tmp_path / "cache"
+    _run(_create_index(video_file, cache_directory))
+    cache_entries = list(cache_directory.iterdir())
+    assert len(cache_entries) == 1
+    # 8 thumbnails, 6 per sheet
+    assert sorted(path.name for path in cache_entries[0].iterdir()) == ["index.json", "sheet_0.jpg", "sheet_1.jpg"]
+
+    def _generate(self):
+        raise AssertionError("thumbnails should be loaded from cache")
+    monkeypatch.setattr(ThumbnailSpriteIndex, "_generate", _generate)
+    index = _run(_create_index(video_file, cache_directory))
+    assert index.done
+    assert _get_frame_nums(index) == EXPECTED_FRAME_NUMS
+
+def test_least_recently_used_cache_entries_are_pruned(tmp_path):
+    cache_directory = tmp_path / "cache"
+    for name in ("a", "b", "c"):
+        video_file = create_video(tmp_path / f"{name}.mp4", frames_count=FRAMES_COUNT, gop_size=16, fps=FPS)
+        _run(_create_index(video_file, cache_directory, max_cached_files=2))
+    cache_entries = sorted(cache_directory.iterdir())
+    assert len(cache_entries) == 2
+    assert all(not entry.name.endswith(".tmp") for entry in cache_entries)
+    assert _create_index(str(tmp_path / "a.mp4"), cache_directory)._get_cache_entry_directory() not in cache_entries
+
+def test_workers_of_the_same_file_write_into_their_own_directories(tmp_path):
+    video_file = create_video(tmp_path / "input.mp4", frames_count=FRAMES_COUNT, gop_size=16, fps=FPS)
+    cache_directory = tmp_path / "cache"
+    indexes = [_create_index(video_file, cache_directory) for _ in range(2)]
+    cache_entry_directory = indexes[0]._get_cache_entry_directory()
+    # a worker which is still writing and leftovers of a crashed one
+    running_tmp_directory = cache_directory / f"{cache_entry_directory.name}.running.tmp"
+    stale_tmp_directory = cache_directory / f"{cache_entry_directory.name}.crashed.tmp"
+    for directory in (running_tmp_directory, stale_tmp_directory):
+        directory.mkdir(parents=True)
+        (directory / "index.json").write_text("{}")
+    os.utime(stale_tmp_directory, (0, 0))
+
+    for index in indexes:
+        _run(index)
+    assert sorted(path.name for path in cache_directory.iterdir()) == sorted([cache_entry_directory.name, running_tmp_directory.name])
+    assert (running_tmp_directory / "index.json").read_text() == "{}"
+    assert _get_frame_nums(_run(_create_index(video_file, cache_directory))) == EXPECTED_FRAME_NUMS
@@ -0,0 +1,47 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+import numpy as np
+import pytest
+
+from lada.utils import video_utils
+from tests.utils import create_video, get_frame_num
+
+FRAMES_COUNT = 64
+
+@pytest.fixture(params=[("mp4", 0), ("mp4", 2), ("mkv", 2)], ids=["mp4", "mp4-bframes", "mkv-bframes"])
+def video_file(tmp_path, request):
+    extension, b_frames = request.param
+    return create_video(tmp_path / f"input.{extension}", frames_count=FRAMES_COUNT, gop_size=16, b_frames=b_frames)
+
+def test_keyframe_index(video_file):
+    frame_pts, keyframe_indices = video_utils.get_keyframe_index(video_file)
+    assert len(frame_pts) == FRAMES_COUNT
+    assert np.all(np.diff(frame_pts) > 0)
+    assert keyframe_indices.tolist() == [0, 16, 32, 48]
+
+@pytest.mark.parametrize("start_idx,end_idx", [(0, None), (0, 10), (5, 12), (16, 20), (31, 33), (47, None), (63, None), (64, None), (80, 90)])
+def test_read_window_matches_decoding_from_start(video_file, start_idx, end_idx):
+    all_frames = video_utils.read_video_frames(video_file, float32=False)
+    assert [get_frame_num(frame) for frame in all_frames] == list(range(FRAMES_COUNT))
+
+    frames = video_utils.read_video_frames(video_file, float32=False, start_idx=start_idx, end_idx=end_idx)
+    expected_frames = all_frames[start_idx:end_idx]
+    assert len(frames) == len(expected_frames)
+    for frame, expected_frame in zip(frames, expected_frames):
+        np.testing.assert_array_equal(frame, expected_frame)
+
+def test_read_window_without_keyframe_index_decodes_from_start(video_file, monkeypatch):
+    expected_frames = video_utils.read_video_frames(video_file, start_idx=20, end_idx=24, binary_frames=True)
+    monkeypatch.setattr(video_utils, "get_keyframe_index", lambda path: None)
+    frames = video_utils.read_video_frames(video_file, start_idx=20, end_idx=24, binary_frames=True)
+    assert len(frames) == 4 and frames[0].shape == (48, 64, 1) and frames[0].dtype == np.float32
+    for frame, expected_frame in zip(frames, expected_frames):
+        np.testing.assert_array_equal(frame, expected_frame)
+
+@pytest.mark.parametrize("start_frame,stride", [(0, 1), (20, 1), (20, 3), (63, 2)])
+def test_video_reader_frames_from_start_frame(video_file, start_frame, stride):
+    with video_utils.VideoReader(video_file) as video_reader:
+        frame_nums = [get_frame_num(frame.numpy()) for frame, _ in video_reader.frames(stride=stride, start_frame=start_frame)]
+    # stride applies to frame numbers of the file, not to the frames after start_frame
+    assert frame_nums == [frame_num for frame_num in range(start_frame, FRAMES_COUNT) if frame_num % stride == 0]
@@ -0,0 +1,48 @@
+# SPDX-FileCopyrightText: Lada Authors
+# SPDX-License-Identifier: AGPL-3.0
+
+from fractions import Fraction
+
+import av
+import numpy as np
+
+from lada.utils import VideoMetadata, video_utils
+
+def create_frame(frame_num: int, width: int, height: int) -> np.ndarray:
+    # frame number is encoded in binary as black and white columns so it survives lossy encoding
+    img = np.zeros((height, width, 3), dtype=np.uint8)
+    column_width = width // 8
+    for bit in range(8):
+        if frame_num & (1 << bit):
+            img[:, bit * column_width:(bit + 1) * column_width] = 255
+    return img
+
+def get_frame_num(frame) -> int:
+    frame = np.asarray(frame)
+    column_width = frame.shape[1] // 8
+    return sum(1 << bit for bit in range(8) if frame[:, bit * column_width:(bit + 1) * column_width].mean() > 127)
+
+def create_video(path, frames_count=64, gop_size=16, fps=25, width=64, height=48, b_frames=0) -> str:
+    with av.open(str(path), 'w') as container:
+        stream = container.add_stream('libx264', rate=fps)
+        stream.width = width
+        stream.height = height
+        stream.pix_fmt = 'yuv420p'
+        stream.codec_context.gop_size = gop_size
+        stream.codec_context.options = {'bf': str(b_frames), 'sc_threshold': '0', 'keyint_min': str(gop_size), 'crf': '10'}
+        for frame_num in range(frames_count):
+            img = create_frame(frame_num, width, height)
+            for packet in stream.encode(av.VideoFrame.from_ndarray(img, format='bgr24')):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+    return str(path)
+
+def get_video_meta_data_without_ffprobe(path) -> VideoMetadata:
+    with av.open(str(path)) as container:
+        stream = container.streams.video[0]
+        frames_count = sum(1 for _ in container.decode(stream))
+        fps = Fraction(stream.average_rate)
+        return VideoMetadata(video_file=str(path), video_height=stream.height, video_width=stream.width, video_fps=float(fps), average_fps=float(fps),
+                             video_fps_exact=fps, codec_name=stream.codec_context.name, frames_count=frames_count, duration=frames_count / float(fps),
+                             time_base=stream.time_base, start_pts=0)